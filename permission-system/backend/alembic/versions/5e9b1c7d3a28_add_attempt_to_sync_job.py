@@ -0,0 +1,25 @@
+"""Add attempt to sync_job
+
+Revision ID: 5e9b1c7d3a28
+Revises: a7c3e9f2d416
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e9b1c7d3a28'
+down_revision = 'a7c3e9f2d416'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('sync_job', sa.Column('attempt', sa.Integer(), server_default='0', nullable=False,
+                                        comment='领取次数，任务被重新领取后原worker的进度和结果不再写入'))
+
+
+def downgrade():
+    op.drop_column('sync_job', 'attempt')
@@ -0,0 +1,58 @@
+"""Add sync_watermarks and permission_tombstones tables
+
+Revision ID: 9d4f2b7e6a31
+Revises: 112770c519e2
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4f2b7e6a31'
+down_revision = '112770c519e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_watermarks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('module', sa.String(length=50), nullable=False),
+    sa.Column('watermark', sa.DateTime(timezone=True), nullable=True, comment='最近一次成功同步开始时的数据库时间'),
+    sa.Column('last_run_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_status', sa.String(length=20), nullable=True),
+    sa.Column('last_synced', sa.Integer(), nullable=True, comment='最近一次同步处理的记录数'),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('module')
+    )
+    op.create_index(op.f('ix_sync_watermarks_id'), 'sync_watermarks', ['id'], unique=False)
+    op.create_table('permission_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('module', sa.String(length=50), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False, comment='原权限记录的关键字段(JSON)'),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('synced_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_permission_tombstones_id'), 'permission_tombstones', ['id'], unique=False)
+    op.create_index('ix_permission_tombstones_module_synced_at', 'permission_tombstones', ['module', 'synced_at'], unique=False)
+    # 增量同步按update_time筛选变更记录
+    op.create_index('ix_table_permissions_update_time', 'table_permissions', ['update_time'], unique=False)
+    op.create_index('ix_column_permissions_update_time', 'column_permissions', ['update_time'], unique=False)
+    op.create_index('ix_row_permissions_update_time', 'row_permissions', ['update_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_row_permissions_update_time', table_name='row_permissions')
+    op.drop_index('ix_column_permissions_update_time', table_name='column_permissions')
+    op.drop_index('ix_table_permissions_update_time', table_name='table_permissions')
+    op.drop_index('ix_permission_tombstones_module_synced_at', table_name='permission_tombstones')
+    op.drop_index(op.f('ix_permission_tombstones_id'), table_name='permission_tombstones')
+    op.drop_table('permission_tombstones')
+    op.drop_index(op.f('ix_sync_watermarks_id'), table_name='sync_watermarks')
+    op.drop_table('sync_watermarks')
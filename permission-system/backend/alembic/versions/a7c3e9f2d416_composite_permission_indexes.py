@@ -0,0 +1,56 @@
+"""Replace single-column permission indexes with composite indexes
+
+Revision ID: a7c3e9f2d416
+Revises: f1d6a3b8c245
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e9f2d416'
+down_revision = 'f1d6a3b8c245'
+branch_labels = None
+depends_on = None
+
+PERMISSION_TABLES = ('table_permissions', 'column_permissions', 'row_permissions')
+
+# 被替代的单列索引：
+# - id与主键索引重复
+# - db_name、(db_name, table_name)、(db_name, table_name, col_name)查询由唯一约束的索引前缀覆盖
+# - 各字段的等值和前缀查询由text_pattern_ops索引覆盖，包含查询由pg_trgm索引覆盖
+REDUNDANT_COLUMNS = {
+    'table_permissions': ['id', 'db_name', 'table_name', 'user_name', 'role_name'],
+    'column_permissions': ['id', 'db_name', 'table_name', 'col_name', 'user_name', 'role_name'],
+    'row_permissions': ['id', 'db_name', 'table_name', 'user_name', 'role_name'],
+}
+
+# 按用户/角色查询并按更新时间排序
+COMPOSITE_INDEXES = [
+    ('user_name', 'update_time'),
+    ('role_name', 'update_time'),
+]
+
+
+def upgrade():
+    # 权限表数据量大，并发建删索引避免长时间锁表；先建新索引再删旧索引
+    with op.get_context().autocommit_block():
+        for table in PERMISSION_TABLES:
+            for columns in COMPOSITE_INDEXES:
+                op.create_index(f"ix_{table}_{'_'.join(columns)}", table, list(columns), unique=False,
+                                postgresql_concurrently=True, if_not_exists=True)
+            for column in REDUNDANT_COLUMNS[table]:
+                op.drop_index(f'ix_{table}_{column}', table_name=table,
+                              postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in PERMISSION_TABLES:
+            for column in REDUNDANT_COLUMNS[table]:
+                op.create_index(f'ix_{table}_{column}', table, [column], unique=False,
+                                postgresql_concurrently=True, if_not_exists=True)
+            for columns in COMPOSITE_INDEXES:
+                op.drop_index(f"ix_{table}_{'_'.join(columns)}", table_name=table,
+                              postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,47 @@
+"""Add sync_outbox table
+
+Revision ID: b3e8c5d1f472
+Revises: 9d4f2b7e6a31
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8c5d1f472'
+down_revision = '9d4f2b7e6a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('module', sa.String(length=50), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=20), nullable=False, comment='grant/revoke'),
+    sa.Column('payload', sa.Text(), nullable=True, comment='回收时原权限记录的关键字段(JSON)'),
+    sa.Column('status', sa.String(length=20), server_default='pending', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True, comment='最早可执行时间，重试时按退避推后'),
+    sa.Column('locked_by', sa.String(length=100), nullable=True),
+    sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=True, comment='最近一次执行耗时（秒）'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_outbox_id'), 'sync_outbox', ['id'], unique=False)
+    op.create_index('ix_sync_outbox_status_available_at', 'sync_outbox', ['status', 'available_at'], unique=False)
+    op.create_index('ix_sync_outbox_module_record_id', 'sync_outbox', ['module', 'record_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sync_outbox_module_record_id', table_name='sync_outbox')
+    op.drop_index('ix_sync_outbox_status_available_at', table_name='sync_outbox')
+    op.drop_index(op.f('ix_sync_outbox_id'), table_name='sync_outbox')
+    op.drop_table('sync_outbox')
@@ -0,0 +1,45 @@
+"""Add sync_history table
+
+Revision ID: c6a1f0e9b584
+Revises: b3e8c5d1f472
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6a1f0e9b584'
+down_revision = 'b3e8c5d1f472'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('module_name', sa.String(length=50), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('duration', sa.Float(), nullable=False, comment='总耗时（秒），包含重试等待'),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('attempt_log', sa.Text(), nullable=True, comment='每次尝试的耗时与结果(JSON)'),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_history_id'), 'sync_history', ['id'], unique=False)
+    op.create_index('ix_sync_history_started_at', 'sync_history', ['started_at'], unique=False)
+    op.create_index('ix_sync_history_module_action_started_at', 'sync_history', ['module_name', 'action', 'started_at'], unique=False)
+    op.create_index('ix_sync_history_module_record_id', 'sync_history', ['module_name', 'record_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sync_history_module_record_id', table_name='sync_history')
+    op.drop_index('ix_sync_history_module_action_started_at', table_name='sync_history')
+    op.drop_index('ix_sync_history_started_at', table_name='sync_history')
+    op.drop_index(op.f('ix_sync_history_id'), table_name='sync_history')
+    op.drop_table('sync_history')
@@ -0,0 +1,51 @@
+"""Add sync_job table
+
+Revision ID: d82f4a6c3e17
+Revises: c6a1f0e9b584
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd82f4a6c3e17'
+down_revision = 'c6a1f0e9b584'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('module', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), server_default='pending', nullable=False),
+    sa.Column('options', sa.Text(), nullable=True, comment='同步参数(JSON)，如prune、incremental'),
+    sa.Column('phase', sa.String(length=50), nullable=True, comment='当前阶段'),
+    sa.Column('records', sa.Integer(), nullable=True, comment='参与同步的记录数'),
+    sa.Column('total', sa.Integer(), nullable=True, comment='需要执行的变更数'),
+    sa.Column('done', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('failed', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('result', sa.Text(), nullable=True, comment='同步结果摘要(JSON)'),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('cancel_requested', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+    sa.Column('created_by', sa.String(length=100), nullable=True),
+    sa.Column('worker_id', sa.String(length=100), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True, comment='执行中的worker最近一次写入进度的时间'),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_job_id'), 'sync_job', ['id'], unique=False)
+    op.create_index('ix_sync_job_created_at', 'sync_job', ['created_at'], unique=False)
+    op.create_index('uq_sync_job_active_module', 'sync_job', ['module'], unique=True,
+                    postgresql_where=sa.text("status IN ('pending', 'running')"))
+
+
+def downgrade():
+    op.drop_index('uq_sync_job_active_module', table_name='sync_job')
+    op.drop_index('ix_sync_job_created_at', table_name='sync_job')
+    op.drop_index(op.f('ix_sync_job_id'), table_name='sync_job')
+    op.drop_table('sync_job')
@@ -0,0 +1,25 @@
+"""Add collapsed to sync_outbox
+
+Revision ID: e4b7c2a9d05f
+Revises: d82f4a6c3e17
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c2a9d05f'
+down_revision = 'd82f4a6c3e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('sync_outbox', sa.Column('collapsed', sa.Integer(), server_default='0', nullable=False,
+                                           comment='执行前合并进来的后续变更数'))
+
+
+def downgrade():
+    op.drop_column('sync_outbox', 'collapsed')
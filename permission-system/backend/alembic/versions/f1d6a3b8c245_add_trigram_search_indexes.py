@@ -0,0 +1,53 @@
+"""Add pg_trgm and prefix search indexes
+
+Revision ID: f1d6a3b8c245
+Revises: e4b7c2a9d05f
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1d6a3b8c245'
+down_revision = 'e4b7c2a9d05f'
+branch_labels = None
+depends_on = None
+
+# 列表筛选字段：包含匹配用pg_trgm GIN索引，前缀匹配用text_pattern_ops B树索引
+SEARCH_COLUMNS = {
+    'table_permissions': ['db_name', 'table_name', 'user_name', 'role_name'],
+    'column_permissions': ['db_name', 'table_name', 'col_name', 'user_name', 'role_name'],
+    'row_permissions': ['db_name', 'table_name', 'user_name', 'role_name'],
+    'hdfs_quotas': ['db_name'],
+    'ldap_users': ['username', 'role_name', 'department_name'],
+}
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # pg_trgm在PostgreSQL 13及以上为可信扩展，数据库所有者即可创建
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # 权限表数据量大，并发建索引避免长时间锁表；CONCURRENTLY不能在事务中执行
+    with op.get_context().autocommit_block():
+        for table, columns in SEARCH_COLUMNS.items():
+            for column in columns:
+                op.create_index(f'ix_{table}_{column}_trgm', table, [column], unique=False,
+                                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+                                postgresql_concurrently=True, if_not_exists=True)
+                op.create_index(f'ix_{table}_{column}_pattern', table, [column], unique=False,
+                                postgresql_ops={column: 'text_pattern_ops'},
+                                postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for table, columns in SEARCH_COLUMNS.items():
+            for column in columns:
+                op.drop_index(f'ix_{table}_{column}_pattern', table_name=table,
+                              postgresql_concurrently=True, if_exists=True)
+                op.drop_index(f'ix_{table}_{column}_trgm', table_name=table,
+                              postgresql_concurrently=True, if_exists=True)
@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api import auth, table_perm, column_perm, row_perm, hdfs_quota, ldap_user, role, department
+from app.api import auth, table_perm, column_perm, row_perm, hdfs_quota, ldap_user, role, department, ranger, sync_history, sync_jobs
 
 api_router = APIRouter()
 
@@ -12,3 +12,6 @@ api_router.include_router(hdfs_quota.router, prefix="/hdfs-quotas", tags=["hdfs-
 api_router.include_router(ldap_user.router, prefix="/ldap", tags=["ldap-users"])
 api_router.include_router(role.router, prefix="/roles", tags=["roles"])
 api_router.include_router(department.router, prefix="/departments", tags=["departments"])
+api_router.include_router(ranger.router, prefix="/ranger", tags=["ranger"])
+api_router.include_router(sync_history.router, prefix="/sync-history", tags=["sync-history"])
+api_router.include_router(sync_jobs.router, prefix="/sync-jobs", tags=["sync-jobs"])
@@ -4,11 +4,13 @@ from typing import Any
 from fastapi import APIRouter, Body, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY
 from app.core.security import verify_password, get_password_hash, create_access_token
-from app.core.db import get_db
+from app.core.db import get_async_db, get_db
 from app.models.models import User
 from app.schemas.schemas import UserCreate, UserOut, Token, UserLogin
 
@@ -17,13 +19,16 @@ router = APIRouter()
 # OAuth2密码模式，用于令牌获取
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """根据JWT令牌获取当前用户"""
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无效的凭证",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _username_from_token(token: str) -> str:
+    """校验JWT令牌并返回其中的用户名"""
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -31,10 +36,14 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
+    return username
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """根据JWT令牌获取当前用户"""
+    username = _username_from_token(token)
     user = db.query(User).filter(User.username == username).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
 def get_current_active_user(current_user: User = Depends(get_current_user)):
@@ -43,6 +52,20 @@ def get_current_active_user(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="用户已被禁用")
     return current_user
 
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """get_current_user的异步版本，只读接口使用，不占用线程池"""
+    username = _username_from_token(token)
+    user = await db.scalar(select(User).where(User.username == username))
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+async def get_current_active_user_async(current_user: User = Depends(get_current_user_async)):
+    """获取当前活跃用户（异步）"""
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="用户已被禁用")
+    return current_user
+
 def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
     """获取当前管理员用户"""
     if not current_user.is_admin:
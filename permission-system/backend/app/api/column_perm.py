@@ -1,35 +1,51 @@
 from typing import List, Optional, Any
 from fastapi import Body
 import argparse
-from app.utils.youcash_ranger_v2 import run as ranger_run
+from app.utils.youcash_ranger_v2 import run as ranger_run, get_ranger_manager, to_ranger_mask_type
+from app.utils.ranger_reconcile import reconcile
+from app.utils.ranger_coalesce import ACTION_REVOKE, sync_records
+from app.utils.ranger_async import async_reconcile, get_async_ranger_client
+from app.utils.ranger_incremental import add_tombstone, tombstone_if_changed
+from app.utils.ranger_limiter import LANE_BATCH, sync_lane
+from app.utils.sync_outbox import ACTION_UPDATE, enqueue_created, enqueue_sync
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from app.utils.sync_helpers import with_sync_retry
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.auth import get_current_active_user
-from app.core.db import get_db
+from app.api.auth import get_current_active_user, get_current_active_user_async
+from app.api.sync_jobs import start_sync_job
+from app.core.db import get_async_db, get_db
 from app.models.models import User, ColumnPermission
 from app.schemas.schemas import (
     ColumnPermissionCreate, ColumnPermissionUpdate, ColumnPermissionOut,
     ColumnPermissionFilter, PaginatedResponse, ColumnPermissionBatchCreate
 )
-from app.utils.helpers import get_paginated_results, check_unique_constraint, create_item, update_item, delete_item
+from app.utils.helpers import get_paginated_results_async, check_unique_constraint, create_item, update_item, delete_item, bulk_create_items
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 查重字段，单条创建、更新和批量创建使用相同的字段
+CONSTRAINT_FIELDS = ("db_name", "table_name", "col_name", "user_name", "role_name")
+
 def run_ranger_command(payload: dict):
     # 记录执行参数
     logger.info(f"[字段权限模块] 执行命令参数: {payload}")
 
-    if payload['action'] == 'sync_column_permission':
+    if payload['action'] == 'sync_column_permissions':
         logger.info(f"[字段权限模块] 开始同步{payload['total']}条字段权限")
         return
 
     try:
+        mask_type = to_ranger_mask_type(payload['mask_type'])
+        if mask_type is None:
+            logger.info(f"[字段权限模块] 脱敏类型为[{payload['mask_type']}]，无需同步mask策略")
+            return
         args = argparse.Namespace(
             command=payload['action'],
             policy_type="mask",
@@ -38,7 +54,7 @@ def run_ranger_command(payload: dict):
             database=payload['db_name'],
             table=payload['table_name'],
             columns=[payload['col_name']],
-            mask_type=payload['mask_type'],
+            mask_type=mask_type,
             users=[payload['user_name']],
             groups=[],
             roles=[payload['role_name']],
@@ -54,19 +70,50 @@ def run_ranger_command(payload: dict):
         raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
     
 
+def sync_created_column_permissions(db: Session, permission_ids: List[int], response: Response) -> dict:
+    """只同步本次批量创建的字段权限
+
+    同一策略上的授权合并为一次写入，各(服务, catalog)目标并发执行；
+    Ranger请求数、写入次数和失败记录数通过响应头返回，失败的记录写入同步发件箱由sync-worker重试
+    """
+    permissions = db.query(ColumnPermission).filter(ColumnPermission.id.in_(permission_ids)).all()
+    logger.info(f"[字段权限模块] 批量同步本次创建的{len(permissions)}条记录")
+    try:
+        # 批量导入走batch通道，不占用界面单条操作的线程和Ranger请求名额
+        with sync_lane(LANE_BATCH):
+            result = sync_records("column", permissions, get_ranger_manager())
+        failed_ids = set(result["failed_ids"])
+    except Exception as e:
+        logger.error(f"[字段权限模块] 批量同步失败: {e}")
+        result = {"ranger_calls": 0, "writes": 0}
+        failed_ids = set(permission_ids)
+    if failed_ids:
+        for permission in permissions:
+            if permission.id in failed_ids:
+                enqueue_sync(db, "column", permission)
+        db.commit()
+        logger.warning(f"[字段权限模块] {len(failed_ids)}条记录同步失败，已加入同步发件箱重试")
+    logger.info(f"[字段权限模块] 批量同步完成: Ranger请求{result['ranger_calls']}次, 写入{result['writes']}次, "
+                f"失败{len(failed_ids)}条")
+    response.headers["X-Ranger-Calls"] = str(result["ranger_calls"])
+    response.headers["X-Ranger-Writes"] = str(result["writes"])
+    response.headers["X-Sync-Failed"] = str(len(failed_ids))
+    return result
+
 @router.post("/batch", response_model=List[ColumnPermissionOut])
 def batch_create_column_permissions(
     *,
     db: Session = Depends(get_db),
     batch_data: Any = Body(...),  # 使用Any类型和Body，以便接受多种格式
-    background_tasks: BackgroundTasks,
+    response: Response,
     current_user: User = Depends(get_current_active_user)
 ):
     """批量创建字段权限
     
     批量创建字段权限记录，可选批量同步模式
-    - batch_sync=True: 所有记录一次性同步（适合大批量导入）
-    - batch_sync=False: 逐条同步（默认模式）
+    - batch_sync=True: 本次创建的记录按策略合并后一次性同步（适合大批量导入），
+      响应头X-Ranger-Calls返回实际发出的Ranger请求数
+    - batch_sync=False: 逐条写入同步发件箱，由sync-worker同步和重试（默认模式）
     """
     results = []
     errors = []
@@ -100,64 +147,32 @@ def batch_create_column_permissions(
     # 记录同步模式
     logger.info(f"[字段权限模块] 批量创建字段权限，同步模式: {'批量' if batch_sync else '逐条'}")
     
+    # 先校验全部数据，再按自然键一次查询检查重复、一条INSERT写入，不逐条查询和提交
+    valid_rows = []
     for i, permission_item in enumerate(items):
         try:
-            # 尝试创建并验证ColumnPermissionCreate对象
-            try:
-                permission_data = ColumnPermissionCreate.model_validate(permission_item)
-                permission_dict = permission_data.model_dump()
-            except ValidationError as ve:
-                errors.append({
-                    "index": i,
-                    "error": f"数据验证失败: {str(ve)}",
-                    "data": permission_dict
-                })
-                continue
-                
-            # 检查是否存在相同的权限记录
-            constraint_fields = {
-                "db_name": permission_data.db_name,
-                "table_name": permission_data.table_name,
-                "col_name": permission_data.col_name,
-                "mask_type": permission_data.mask_type,
-                "user_name": permission_data.user_name,
-                "role_name": permission_data.role_name
-            }
-            
-            if check_unique_constraint(db, ColumnPermission, constraint_fields):
-                errors.append({
-                    "index": i,
-                    "error": "相同的字段权限记录已存在",
-                    "data": permission_dict
-                })
-                continue
-            
-            # 创建字段权限记录
-            column_permission = create_item(db, ColumnPermission, permission_data.model_dump())
-            results.append(ColumnPermissionOut.model_validate(column_permission))
-            
-            # 根据同步模式处理同步任务
-            if not batch_sync:
-                # 逐条同步模式，立即添加同步任务
-                logger.info(f"[字段权限模块] 逐条同步模式: 添加同步任务，ID={column_permission.id}")
-                background_tasks.add_task(
-                    sync_single_column_permission,
-                    column_permission.id,
-                    db=db
-                )
-            else:
-                # 批量同步模式，收集权限ID以便后续批量同步
-                permissions_to_sync.append(column_permission.id)
-                logger.info(f"[字段权限模块] 批量同步模式: 收集权限ID={column_permission.id}")
-            
-            
-        except Exception as e:
+            valid_rows.append((i, ColumnPermissionCreate.model_validate(permission_item).model_dump()))
+        except ValidationError as ve:
             errors.append({
                 "index": i,
-                "error": str(e),
-                "data": permission_item.model_dump() if hasattr(permission_item, 'model_dump') else permission_item.dict()
+                "error": f"数据验证失败: {str(ve)}",
+                "data": permission_item
             })
     
+    created, duplicates = bulk_create_items(db, ColumnPermission, valid_rows, "相同的字段权限记录已存在", CONSTRAINT_FIELDS)
+    errors = sorted(errors + duplicates, key=lambda error: error["index"])
+    # 响应直接由RETURNING结果生成，提交后不再逐条刷新记录
+    results = [ColumnPermissionOut.model_validate(column_permission) for _, column_permission in created]
+    if not batch_sync:
+        # 逐条同步模式，授权任务写入发件箱，与记录在同一事务中提交，由sync-worker执行和重试
+        enqueue_created(db, "column", [column_permission for _, column_permission in created])
+    db.commit()
+    logger.info(f"[字段权限模块] 批量写入{len(created)}条记录, 失败{len(errors)}条")
+    
+    if batch_sync:
+        # 批量同步模式，收集权限ID以便后续批量同步
+        permissions_to_sync = [column_permission.id for column_permission in results]
+    
     # 如果有错误，回滚并返回错误信息
     if errors and not results:
         raise HTTPException(
@@ -168,20 +183,11 @@ def batch_create_column_permissions(
             }
         )
     
-    # 如果部分成功部分失败，返回成功的结果和错误信息
-    if errors:
-        # 这里我们仍然返回成功创建的记录，但在响应头中添加警告信息
-        return results
-    
-    # 如果使用批量同步模式且有成功创建的记录，启动批量同步任务
+    # 选择了批量同步模式时，只同步本次成功创建的记录（部分失败时同样同步已创建的记录）
     if batch_sync and permissions_to_sync:
-        total_to_sync = len(permissions_to_sync)
-        logger.info(f"[字段权限模块] 批量同步模式，添加批量同步任务，共{total_to_sync}条记录")
-        background_tasks.add_task(
-            sync_all_column_permissions,
-            db=db
-        )
+        sync_created_column_permissions(db, permissions_to_sync, response)
     
+    # 如果部分成功部分失败，返回成功创建的记录
     return results
 
 @router.post("/", response_model=ColumnPermissionOut)
@@ -189,7 +195,6 @@ def create_column_permission(
     *,
     db: Session = Depends(get_db),
     column_permission_in: ColumnPermissionCreate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user)
 ):
     """创建列权限并自动执行同步"""
@@ -208,24 +213,20 @@ def create_column_permission(
             detail="相同的列权限记录已存在"
         )
     
-    # 创建列权限记录
-    column_permission = create_item(db, ColumnPermission, column_permission_in.model_dump())
-    
-    # 添加同步任务到后台执行
-    logger.info(f"[字段权限模块] 添加同步任务: 新建权限记录 ID={column_permission.id}")
-    background_tasks.add_task(
-        sync_single_column_permission,
-        column_permission.id,
-        db=db
-    )
+    # 创建列权限记录，同步任务写入发件箱，与记录在同一事务中提交
+    column_permission = create_item(db, ColumnPermission, column_permission_in.model_dump(), commit=False)
+    enqueue_sync(db, "column", column_permission)
+    db.commit()
+    db.refresh(column_permission)
+    logger.info(f"[字段权限模块] 写入同步任务: 新建权限记录 ID={column_permission.id}")
     
     return ColumnPermissionOut.model_validate(column_permission)
 
 @router.get("/", response_model=PaginatedResponse)
-def get_column_permissions(
-    db: Session = Depends(get_db),
+async def get_column_permissions(
+    db: AsyncSession = Depends(get_async_db),
     params: ColumnPermissionFilter = Depends(),
-    current_user: User = Depends(get_current_active_user),
+    current_user: User = Depends(get_current_active_user_async),
 ):
     """获取列权限列表，支持过滤、分页和排序"""
     filters = {
@@ -247,31 +248,37 @@ def get_column_permissions(
     elif params.sorters:
         sorters_list = [s.model_dump() for s in params.sorters]
 
-    result = get_paginated_results(
+    result = await get_paginated_results_async(
         db, 
         ColumnPermission, 
         page=params.page, 
         page_size=params.page_size, 
         filters=filters,
-        sorters=sorters_list
+        sorters=sorters_list,
+        cursor=params.cursor,
+        with_total=params.with_total,
+        match=params.match
     )
     
     # 转换为JSON响应格式
     return {
         "total": result["total"],
+        "total_estimated": result["total_estimated"],
         "page": result["page"],
         "page_size": result["page_size"],
-        "items": [ColumnPermissionOut.model_validate(item) for item in result["items"]]
+        "items": [ColumnPermissionOut.model_validate(item) for item in result["items"]],
+        "next_cursor": result["next_cursor"],
+        "prev_cursor": result["prev_cursor"]
     }
 
 @router.get("/{permission_id}", response_model=ColumnPermissionOut)
-def get_column_permission(
+async def get_column_permission(
     permission_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ):
     """根据ID获取列权限"""
-    column_permission = db.query(ColumnPermission).filter(ColumnPermission.id == permission_id).first()
+    column_permission = await db.get(ColumnPermission, permission_id)
     if not column_permission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -285,7 +292,6 @@ def update_column_permission(
     permission_id: int,
     db: Session = Depends(get_db),
     column_permission_in: ColumnPermissionUpdate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user)
 ):
     """更新列权限"""
@@ -302,7 +308,7 @@ def update_column_permission(
     if any(update_data.values()):
         # 构建约束检查字段
         constraint_fields = {}
-        for field in ["db_name", "table_name", "col_name", "user_name", "role_name"]:
+        for field in CONSTRAINT_FIELDS:
             if field in update_data and update_data[field] is not None:
                 constraint_fields[field] = update_data[field]
             else:
@@ -314,41 +320,27 @@ def update_column_permission(
                 detail="更新后的列权限与现有记录冲突"
             )
     
-    # 在更新前对原始数据执行删除同步
-    try:
-        # 对原始数据执行删除同步
-        logger.info(f"[字段权限模块] 更新前对原始数据执行删除同步: ID={permission_id}")
-        sync_delete_column_permission(
-            permission_id=permission_id,
-            db_name=column_permission.db_name,
-            table_name=column_permission.table_name,
-            column_name=column_permission.col_name,
-            mask_type=column_permission.mask_type,
-            user_name=column_permission.user_name,
-            role_name=column_permission.role_name
-        )
-    except Exception as e:
-        # 如果删除同步失败，记录错误但不中断更新操作
-        logger.error(f"[字段权限模块] 更新前删除同步失败: {str(e)}")
-    
+    # 授权相关字段变化时记录原值墓碑，并写入一条更新任务：原值的回收与新值的授权合并为每个策略一次写入
+    # 墓碑和同步任务与更新在同一事务中提交，由sync-worker执行
+    if tombstone_if_changed(db, "column", column_permission, update_data):
+        enqueue_sync(db, "column", column_permission, ACTION_UPDATE)
+    else:
+        enqueue_sync(db, "column", column_permission)
+    logger.info(f"[字段权限模块] 写入同步任务: 更新权限记录 ID={permission_id}")
+
     # 更新记录
     updated_column_permission = update_item(db, ColumnPermission, permission_id, update_data)
     
-    # 添加同步任务到后台执行
-    logger.info(f"[字段权限模块] 添加同步任务: 更新权限记录 ID={permission_id}")
-    background_tasks.add_task(
-        sync_single_column_permission,
-        permission_id,
-        db=db
-    )
-    
     return updated_column_permission
 
-def sync_all_column_permissions(*, db: Session):
+def sync_all_column_permissions(*, db: Session, prune: bool = False):
     """同步所有字段权限的内部函数，可以被后台任务调用
-    
+
+    先根据字段权限记录计算期望策略，再与Ranger当前策略对比，只执行差异部分的变更
+
     参数:
         db: 数据库会话（关键字参数）
+        prune: 是否以权限表为准移除Ranger中多余的授权
     """
     # 查询所有字段权限记录
     all_column_permissions = db.query(ColumnPermission).all()
@@ -356,75 +348,125 @@ def sync_all_column_permissions(*, db: Session):
     
     logger.info(f"[字段权限模块] 开始同步所有字段权限，共{total_count}条记录")
     
-    if total_count == 0:
+    if total_count == 0 and not prune:
         logger.warning("[字段权限模块] 无字段权限记录可同步")
         return {"message": "sync ok", "total": 0, "synced": 0}
     
-    # 先通知CLI脚本开始批量同步操作
-    batch_payload = {
-        "action": "sync_column_permissions",
-        "total": total_count
-    }
-    run_ranger_command(batch_payload)
-    
-    # 记录成功和失败的同步操作
-    success_count = 0
-    failed_records = []
-    
-    # 依次同步每条记录
-    for index, perm in enumerate(all_column_permissions):
-        try:
-            # 准备同步参数
-            payload = {
-                "action": "grant",
-                "id": perm.id,
-                "db_name": perm.db_name,
-                "table_name": perm.table_name,
-                "col_name": perm.col_name,
-                "mask_type": perm.mask_type,
-                "user_name": perm.user_name,
-                "role_name": perm.role_name
-            }
-            
-            # 记录同步请求
-            logger.info(f"[字段权限模块] 同步记录 {index+1}/{total_count}: ID={perm.id}, 数据库=[{perm.db_name}], 表=[{perm.table_name}], 字段=[{perm.col_name}], 用户=[{perm.user_name}], 角色=[{perm.role_name}]")
-            
-            # 执行同步命令
-            run_ranger_command(payload)
-            success_count += 1
-            
-        except Exception as e:
-            logger.error(f"[字段权限模块] 同步记录 ID={perm.id} 失败: {str(e)}")
-            failed_records.append({
-                "id": perm.id,
-                "db_name": perm.db_name,
-                "table_name": perm.table_name,
-                "col_name": perm.col_name,
-                "error": str(e)
-            })
+    try:
+        result = reconcile("column", all_column_permissions, get_ranger_manager(), prune=prune)
+    except Exception as e:
+        logger.critical(f"[字段权限模块] 对账失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
+
+    return summarize_sync_result(all_column_permissions, result)
+
+def summarize_sync_result(permissions: List[ColumnPermission], result: dict) -> dict:
+    """把对账结果整理为同步接口的返回格式，失败的变更映射回对应的字段权限记录"""
+    total_count = len(permissions)
+    failed_ids = set(result["failed_ids"])
+    errors = {record_id: error["error"] for error in result["errors"] for record_id in error["record_ids"]}
+    failed_records = [
+        {
+            "id": perm.id,
+            "db_name": perm.db_name,
+            "table_name": perm.table_name,
+            "col_name": perm.col_name,
+            "error": errors[perm.id]
+        }
+        for perm in permissions if perm.id in failed_ids
+    ]
+    logger.info(f"[字段权限模块] 同步完成，计划: {result['plan']}，失败 {len(failed_records)} 条")
     
     # 返回同步结果摘要
     return {
         "message": "sync completed", 
         "total": total_count, 
-        "synced": success_count,
+        "synced": total_count - len(failed_records),
         "failed": len(failed_records),
-        "failed_records": failed_records[:10] if failed_records else []  # 最多显示10条失败记录
+        "failed_records": failed_records[:10] if failed_records else [],  # 最多显示10条失败记录
+        "plan": result["plan"],
+        "errors": result["errors"][:10]
     }
 
-@router.post("/sync", response_model=dict)
+@router.post("/sync", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
 def sync_column_permissions(
     *,
     db: Session = Depends(get_db),
+    prune: bool = Query(False, description="是否移除Ranger中权限表之外的授权"),
+    incremental: bool = Query(False, description="只同步上次成功同步之后变更或删除的记录"),
     current_user: User = Depends(get_current_active_user)
 ):
     """同步所有字段权限API端点
-    
-    自动遍历数据库中的所有字段权限记录，并依次执行同步操作
+
+    创建同步任务后立即返回任务ID，由sync-worker对比字段权限记录与Ranger中的策略并执行差异变更；
+    进度通过 /sync-jobs/{job_id} 轮询或 /sync-jobs/{job_id}/events 订阅
+    """
+    return start_sync_job(db, "column", current_user, prune=prune, incremental=incremental)
+
+@router.post("/async/sync", response_model=dict)
+async def sync_column_permissions_async(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    prune: bool = Query(False, description="是否移除Ranger中权限表之外的授权"),
+    current_user: User = Depends(get_current_active_user_async)
+):
+    """同步所有字段权限API端点（异步版本）
+
+    Ranger请求全部在事件循环上并发执行，不占用线程池
     """
-    return sync_all_column_permissions(db=db)
+    all_column_permissions = (await db.execute(select(ColumnPermission))).scalars().all()
+    logger.info(f"[字段权限模块] 开始异步同步所有字段权限，共{len(all_column_permissions)}条记录")
+    if not all_column_permissions and not prune:
+        return {"message": "sync ok", "total": 0, "synced": 0}
+    try:
+        result = await async_reconcile("column", all_column_permissions, get_async_ranger_client(), prune=prune)
+    except Exception as e:
+        logger.critical(f"[字段权限模块] 异步对账失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
+    return summarize_sync_result(all_column_permissions, result)
+
+@router.post("/async/sync/{permission_id}", response_model=dict)
+async def sync_single_column_permission_async(
+    permission_id: int,
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
+):
+    """同步单个字段权限记录（异步版本）"""
+    column_permission = await db.get(ColumnPermission, permission_id)
+    if not column_permission:
+        raise HTTPException(status_code=404, detail="字段权限记录不存在")
+
+    logger.info(f"[字段权限模块] 异步同步单条记录: ID={permission_id}, 数据库=[{column_permission.db_name}], 表=[{column_permission.table_name}], 字段=[{column_permission.col_name}], 脱敏=[{column_permission.mask_type}]")
+    try:
+        result = await async_reconcile("column", [column_permission], get_async_ranger_client())
+    except Exception as e:
+        logger.critical(f"[字段权限模块] 执行命令失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
+    if result["errors"]:
+        detail = "; ".join(f"{error['service']}:{error['error']}" for error in result["errors"])
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {detail}")
+
+    return {
+        "message": "sync ok",
+        "id": permission_id,
+        "db_name": column_permission.db_name,
+        "table_name": column_permission.table_name,
+        "col_name": column_permission.col_name,
+        "mask_type": column_permission.mask_type,
+        "user_name": column_permission.user_name,
+        "role_name": column_permission.role_name,
+        "plan": result["plan"]
+    }
 
 @router.post("/sync/{permission_id}", response_model=dict)
+async def sync_single_column_permission_endpoint(permission_id: int):
+    """同步单个字段权限记录API端点
+
+    失败重试由重试调度器在后台执行，等待期间不占用请求线程
+    """
+    return await sync_single_column_permission.run_async(permission_id)
+
 @with_sync_retry(max_attempts=1, retry_delay=2)
 def sync_single_column_permission(
     permission_id: int,
@@ -512,7 +554,6 @@ def sync_delete_column_permission(*, permission_id: int, db_name: str, table_nam
 def delete_column_permission(
     permission_id: int,
     db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None,
     current_user: User = Depends(get_current_active_user)
 ):
     """删除列权限并同步到外部系统"""
@@ -524,15 +565,9 @@ def delete_column_permission(
             detail="列权限不存在"
         )
     
-    # 保存必要的同步信息
-    db_name = permission.db_name
-    table_name = permission.table_name
-    column_name = permission.col_name
-    mask_type = permission.mask_type
-    user_name = permission.user_name
-    role_name = permission.role_name
-    
-    # 执行删除操作
+    # 执行删除操作，墓碑和回收任务与删除在同一事务中提交
+    add_tombstone(db, "column", permission)
+    enqueue_sync(db, "column", permission, ACTION_REVOKE)
     result = delete_item(db, ColumnPermission, permission_id)
     if not result:
         raise HTTPException(
@@ -540,18 +575,5 @@ def delete_column_permission(
             detail="删除列权限失败"
         )
     
-    # 添加同步任务到后台执行
-    logger.info(f"[列权限模块] 添加删除同步任务: 列权限记录 ID={permission_id}")
-    if background_tasks:
-        background_tasks.add_task(
-            sync_delete_column_permission,
-            permission_id=permission_id,
-            db_name=db_name,
-            table_name=table_name,
-            column_name=column_name,
-            mask_type=mask_type,
-            user_name=user_name,
-            role_name=role_name
-        )
-    
+    logger.info(f"[列权限模块] 写入删除同步任务: 列权限记录 ID={permission_id}")
     return None
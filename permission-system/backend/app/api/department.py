@@ -1,7 +1,9 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.db import get_db
+from app.core.db import get_async_db, get_db
 from app.models.models import Department
 from app.schemas.department import DepartmentCreate, DepartmentResponse, DepartmentUpdate
 import logging
@@ -10,28 +12,28 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/", response_model=List[DepartmentResponse])
-def get_departments(
+async def get_departments(
     name: Optional[str] = Query(None, description="按部门名称筛选"),
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取所有部门"""
     try:
-        query = db.query(Department)
+        query = select(Department)
         if name:
             query = query.filter(Department.name.contains(name))
-        departments = query.offset(skip).limit(limit).all()
+        departments = (await db.scalars(query.offset(skip).limit(limit))).all()
         return departments
     except Exception as e:
         logger.error(f"获取部门列表失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取部门列表失败: {str(e)}")
 
 @router.get("/{department_id}", response_model=DepartmentResponse)
-def get_department(department_id: int, db: Session = Depends(get_db)):
+async def get_department(department_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取部门详情"""
     try:
-        department = db.query(Department).filter(Department.id == department_id).first()
+        department = await db.get(Department, department_id)
         if department is None:
             raise HTTPException(status_code=404, detail="部门不存在")
         return department
@@ -6,11 +6,15 @@ import os
 from typing import List, Dict, Any, Optional
 
 from app.utils.sync_helpers import with_sync_retry
+from app.utils.helpers import get_paginated_results_async
+from app.utils.circuit_breaker import BREAKER_HDFS, get_breaker, is_circuit_open
 logger = logging.getLogger(__name__)
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.db import get_db
+from app.core.db import get_async_db, get_db
 from app.models.models import HdfsQuota, User
 from app.api.auth import get_current_active_user
+from app.api.sync_jobs import start_sync_job
 from app.schemas.schemas import (
     HdfsQuotaCreate, 
     HdfsQuotaUpdate, 
@@ -19,10 +23,22 @@ from app.schemas.schemas import (
     PaginatedResponse
 )
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import asc, desc
 from pydantic import BaseModel, RootModel
 from typing import Dict, Any
 
+HDFS_COMMAND_TIMEOUT = int(os.getenv("HDFS_COMMAND_TIMEOUT", "60"))  # hdfs命令执行超时（秒）
+
+# 以下错误说明NameNode不可用，计入HDFS熔断；配额超限、路径不存在等业务错误不计入
+HDFS_UNAVAILABLE_ERRORS = (
+    "Connection refused",
+    "ConnectException",
+    "UnknownHostException",
+    "SocketTimeoutException",
+    "NoRouteToHostException",
+    "StandbyException",
+    "SafeModeException",
+)
+
 # 批量导入请求和响应模型
 class HdfsQuotaBatchItem(BaseModel):
     db_name: str
@@ -62,7 +78,11 @@ def run_ranger_command(payload: dict) -> None:
     
     try:
         logger.debug(f"[HDFS配额模块] 准备执行命令: {' '.join(command)}")
-        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        with get_breaker(BREAKER_HDFS).guard() as health:
+            result = subprocess.run(command, env=env, capture_output=True, text=True, timeout=HDFS_COMMAND_TIMEOUT)
+            if result.returncode != 0 and any(error in result.stderr for error in HDFS_UNAVAILABLE_ERRORS):
+                health["ok"] = False
+                health["error"] = result.stderr.strip()[-500:]
         logger.info(f"[HDFS配额模块] 命令执行结果: 返回码={result.returncode}, 输出={result.stdout.strip()}, 错误={result.stderr.strip()}")
         
         if result.returncode != 0:
@@ -73,8 +93,8 @@ def run_ranger_command(payload: dict) -> None:
         # 提供更准确的错误信息
         error = f"[HDFS配额模块] 执行命令失败: {str(e)}"
         logger.critical(error)
-        # 确保异常包含完整的错误信息
-        raise HTTPException(status_code=500, detail=error)
+        # 确保异常包含完整的错误信息，熔断中返回503
+        raise HTTPException(status_code=503 if is_circuit_open(e) else 500, detail=error) from e
 
 
 @router.post("", response_model=HdfsQuotaOut)
@@ -111,25 +131,15 @@ def create_hdfs_quota(
 
 
 @router.get("", response_model=PaginatedResponse)
-def get_hdfs_quotas(
+async def get_hdfs_quotas(
     filter_params: HdfsQuotaFilter = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取HDFS配额列表，支持筛选和排序"""
-    query = db.query(HdfsQuota)
-    
-    # 应用过滤条件
-    if filter_params.db_name:
-        query = query.filter(HdfsQuota.db_name.ilike(f"%{filter_params.db_name}%"))
-    
-    # 计算总数
-    total = query.count()
-    
     # 应用排序
     sort_field = filter_params.sort_field
     sort_order = filter_params.sort_order
     
-    
     # 定义前端字段名与模型属性的映射
     field_mapping = {
         'db_name': 'db_name',
@@ -138,39 +148,40 @@ def get_hdfs_quotas(
         'updated_at': 'updated_at'
     }
     
-    # 如果sort_field存在于映射中，则使用映射的属性名
+    # 如果sort_field存在于映射中，则使用映射的属性名，否则默认按创建时间倒序
     mapped_field = field_mapping.get(sort_field)
-    
-    if sort_field and mapped_field and hasattr(HdfsQuota, mapped_field):
-        sort_column = getattr(HdfsQuota, mapped_field)
-        if sort_order == "descend":
-            query = query.order_by(desc(sort_column))
-        else:
-            query = query.order_by(asc(sort_column))
+    if sort_field and mapped_field:
+        sorters = [{'field': mapped_field, 'order': sort_order}]
     else:
-        # 默认按创建时间排序
-        query = query.order_by(desc(HdfsQuota.created_at))
-    
-    # 分页
-    db_items = query.offset((filter_params.page - 1) * filter_params.page_size) \
-                .limit(filter_params.page_size) \
-                .all()
-    
-    # 将SQLAlchemy对象转换为Pydantic对象
-    items = [HdfsQuotaOut.model_validate(item) for item in db_items]
+        sorters = [{'field': 'created_at', 'order': 'descend'}]
+    
+    result = await get_paginated_results_async(
+        db,
+        HdfsQuota,
+        page=filter_params.page,
+        page_size=filter_params.page_size,
+        filters={"db_name": filter_params.db_name or None},
+        sorters=sorters,
+        cursor=filter_params.cursor,
+        with_total=filter_params.with_total,
+        match=filter_params.match
+    )
     
     return {
-        "total": total,
-        "page": filter_params.page,
-        "page_size": filter_params.page_size,
-        "items": items
+        "total": result["total"],
+        "total_estimated": result["total_estimated"],
+        "page": result["page"],
+        "page_size": result["page_size"],
+        "items": [HdfsQuotaOut.model_validate(item) for item in result["items"]],
+        "next_cursor": result["next_cursor"],
+        "prev_cursor": result["prev_cursor"]
     }
 
 
 @router.get("/{hdfs_quota_id}", response_model=HdfsQuotaOut)
-def get_hdfs_quota(hdfs_quota_id: int, db: Session = Depends(get_db)):
+async def get_hdfs_quota(hdfs_quota_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取指定ID的HDFS配额记录"""
-    db_hdfs_quota = db.query(HdfsQuota).filter(HdfsQuota.id == hdfs_quota_id).first()
+    db_hdfs_quota = await db.get(HdfsQuota, hdfs_quota_id)
     if not db_hdfs_quota:
         raise HTTPException(
             status_code=404,
@@ -281,13 +292,8 @@ def delete_hdfs_quota(
     return {"message": "删除成功"}
 
 
-@router.post("/sync", response_model=dict)
-def sync_hdfs_quotas(
-    *,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
-    """同步所有HDFS配额
+def sync_all_hdfs_quotas(*, db: Session):
+    """同步所有HDFS配额的内部函数
     
     自动遍历数据库中的所有HDFS配额记录，并依次执行同步操作
     """
@@ -347,8 +353,28 @@ def sync_hdfs_quotas(
         "failed_records": failed_records[:10] if failed_records else []  # 最多显示10条失败记录
     }
 
+@router.post("/sync", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+def sync_hdfs_quotas(
+    *,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """同步所有HDFS配额
+
+    创建同步任务后立即返回任务ID，由sync-worker依次设置各数据库的配额；
+    进度通过 /sync-jobs/{job_id} 轮询或 /sync-jobs/{job_id}/events 订阅
+    """
+    return start_sync_job(db, "hdfs", current_user)
+
 @router.post("/sync/{quota_id}", response_model=dict)
-@with_sync_retry(max_attempts=3, retry_delay=2)
+async def sync_single_hdfs_quota_endpoint(quota_id: int):
+    """同步单个HDFS配额API端点
+
+    失败重试由重试调度器在后台执行，等待期间不占用请求线程
+    """
+    return await sync_single_hdfs_quota.run_async(quota_id)
+
+@with_sync_retry(max_attempts=3, retry_delay=2, dependency="hdfs")
 def sync_single_hdfs_quota(
     quota_id: int,
     *,
@@ -545,7 +571,7 @@ def batch_import_hdfs_quotas(
             if batch_sync and quotas_to_sync:
                 # 批量同步模式
                 try:
-                    sync_hdfs_quotas(db=db)
+                    sync_all_hdfs_quotas(db=db)
                 except Exception as e:
                     logger.error(f"[HDFS配额模块] 批量同步失败: {str(e)}")
                     sync_errors.append({"error": f"批量同步失败: {str(e)}"})
@@ -1,8 +1,9 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from fastapi import APIRouter, Depends, HTTPException, Query, Body, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from app.core.db import get_db
+from sqlalchemy import or_, and_, select
+from app.core.db import get_async_db, get_db
 from app.models.ldap_user import LdapUser
 from app.schemas.ldap_user import (
     LdapUserCreate, LdapUserUpdate, LdapUserResponse, 
@@ -10,6 +11,9 @@ from app.schemas.ldap_user import (
 )
 from app.utils.ldap_ranger import YoucashUtils
 from app.utils.ldap3_script import LDAPConnection, LDAPUserManager, LDAPGroupManager
+from app.utils.circuit_breaker import is_circuit_open
+from app.utils.count_cache import count_rows_async
+from app.utils.helpers import match_condition
 import os
 import logging
 import argparse
@@ -32,6 +36,8 @@ def get_ldap_connection():
         return LDAPConnection(LDAP_SERVER, USER_DN, DEFAULT_PASSWORD)
     except Exception as e:
         logger.error(f"LDAP连接失败: {str(e)}")
+        if is_circuit_open(e):
+            raise HTTPException(status_code=503, detail=f"LDAP暂不可用: {str(e)}")
         raise HTTPException(status_code=500, detail=f"LDAP连接失败: {str(e)}")
 
 import string
@@ -120,7 +126,7 @@ def create_ldap_user(
         raise HTTPException(status_code=500, detail=f"创建LDAP用户失败: {str(e)}")
 
 @router.get("/ldap-users/", response_model=Dict[str, Any])
-def get_ldap_users(
+async def get_ldap_users(
     username: Optional[str] = None,
     role_name: Optional[str] = None,
     department_name: Optional[str] = None,
@@ -130,25 +136,33 @@ def get_ldap_users(
     order_desc: bool = False,
     page: int = 1,
     page_size: int = 10,
-    db: Session = Depends(get_db)
+    match: Literal['contains', 'prefix', 'exact'] = Query('contains', description="字符串筛选方式：包含/前缀/精确匹配"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取LDAP用户列表，支持筛选和排序"""
-    query = db.query(LdapUser)
+    query = select(LdapUser)
     
     # 应用筛选条件
     if username:
-        query = query.filter(LdapUser.username.ilike(f"%{username}%"))
+        query = query.filter(match_condition(LdapUser.username, username, match))
     if role_name:
-        query = query.filter(LdapUser.role_name.ilike(f"%{role_name}%"))
+        query = query.filter(match_condition(LdapUser.role_name, role_name, match))
     if department_name:
-        query = query.filter(LdapUser.department_name.ilike(f"%{department_name}%"))
+        query = query.filter(match_condition(LdapUser.department_name, department_name, match))
     if hdfs_quota_min is not None:
         query = query.filter(LdapUser.hdfs_quota >= hdfs_quota_min)
     if hdfs_quota_max is not None:
         query = query.filter(LdapUser.hdfs_quota <= hdfs_quota_max)
     
-    # 计算总记录数
-    total = query.count()
+    # 计算总记录数，按筛选条件缓存，无筛选条件的大表使用估算值
+    total, estimated = await count_rows_async(db, query, LdapUser.__tablename__, {
+        "username": username or None,
+        "role_name": role_name or None,
+        "department_name": department_name or None,
+        "hdfs_quota_min": hdfs_quota_min,
+        "hdfs_quota_max": hdfs_quota_max,
+        "match": match if username or role_name or department_name else None
+    })
     
     # 应用排序
     if order_by:
@@ -160,7 +174,7 @@ def get_ldap_users(
     query = query.offset((page - 1) * page_size).limit(page_size)
     
     # 获取原始数据库对象列表
-    users = query.all()
+    users = (await db.scalars(query)).all()
     
     # 手动转换每个数据库对象为Pydantic模型
     serialized_users = []
@@ -180,44 +194,45 @@ def get_ldap_users(
     return {
         "items": serialized_users,
         "total": total,
+        "total_estimated": estimated,
         "page": page,
         "page_size": page_size,
         "pages": (total + page_size - 1) // page_size
     }
 
 @router.get("/ldap-users/roles")
-def get_ldap_roles(
-    db: Session = Depends(get_db)
+async def get_ldap_roles(
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取所有角色名"""
     try:
         # 获取数据库中所有不同的角色名
-        roles = db.query(LdapUser.role_name).distinct().all()
+        roles = (await db.execute(select(LdapUser.role_name).distinct())).all()
         return {"roles": [role[0] for role in roles]}
     except Exception as e:
         logger.error(f"获取角色名失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取角色名失败: {str(e)}")
 
 @router.get("/ldap-users/departments")
-def get_ldap_departments(
-    db: Session = Depends(get_db)
+async def get_ldap_departments(
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取所有部门名"""
     try:
         # 获取数据库中所有不同的部门名
-        departments = db.query(LdapUser.department_name).distinct().all()
+        departments = (await db.execute(select(LdapUser.department_name).distinct())).all()
         return {"departments": [dept[0] for dept in departments]}
     except Exception as e:
         logger.error(f"获取部门名失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取部门名失败: {str(e)}")
 
 @router.get("/ldap-users/{user_id}", response_model=LdapUserResponse)
-def get_ldap_user(
+async def get_ldap_user(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取LDAP用户详情"""
-    user = db.query(LdapUser).filter(LdapUser.id == user_id).first()
+    user = await db.get(LdapUser, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
         
@@ -348,6 +363,8 @@ def sync_ldap_user(
         
         return {"message": f"用户 {db_user.username} 已成功同步"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"同步LDAP用户失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"同步LDAP用户失败: {str(e)}")
@@ -410,6 +427,8 @@ def sync_all_ldap_users(
         
         return sync_results
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"同步所有LDAP用户失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"同步所有LDAP用户失败: {str(e)}")
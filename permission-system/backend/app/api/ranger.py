@@ -0,0 +1,128 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status as http_status
+from sqlalchemy.orm import Session
+
+from app.api.auth import get_current_active_user
+from app.api.sync_jobs import start_sync_job
+from app.core.db import get_db
+from app.models.models import User
+from app.models.ranger_sync import SyncOutbox
+from app.utils.ranger_incremental import RANGER_INCREMENTAL_SYNC_INTERVAL, get_watermarks
+from app.utils.sync_jobs import MODULE_ALL
+from app.utils.sync_outbox import outbox_item_to_dict, outbox_stats, retry_failed
+from app.utils.sync_helpers import get_retry_scheduler, retry_budget_snapshot
+from app.utils.ranger_limiter import RANGER_LIMITER_ENABLED, get_limiter_registry
+from app.utils.ranger_fanout import fanout_snapshot
+from app.utils.circuit_breaker import CIRCUIT_BREAKER_ENABLED, get_breaker_registry
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/limits", response_model=dict)
+def get_ranger_limits(current_user: User = Depends(get_current_active_user)):
+    """查看各Ranger服务当前的限流状态
+
+    包括自适应并发上限、正在执行的请求数、排队数量、令牌桶剩余令牌、各同步通道的排队时间，以及各依赖的重试预算
+    """
+    return {
+        "enabled": RANGER_LIMITER_ENABLED,
+        "services": get_limiter_registry().snapshot(),
+        "lanes": fanout_snapshot(),
+        "retry": {
+            "scheduled": get_retry_scheduler().pending(),
+            "budgets": retry_budget_snapshot()
+        }
+    }
+
+@router.get("/breakers", response_model=dict)
+def get_circuit_breakers(current_user: User = Depends(get_current_active_user)):
+    """查看Ranger各服务、LDAP、HDFS和HiveServer2的熔断状态
+
+    open表示依赖不可用，请求直接失败，权限变更写入同步发件箱，待依赖恢复后再下发
+    """
+    return {
+        "enabled": CIRCUIT_BREAKER_ENABLED,
+        "breakers": get_breaker_registry().snapshot()
+    }
+
+@router.post("/breakers/{name}/reset", response_model=dict)
+def reset_circuit_breaker(name: str, current_user: User = Depends(get_current_active_user)):
+    """手动关闭熔断，确认依赖已恢复时使用，如 ranger:cm_hive、ldap"""
+    breaker = get_breaker_registry().find(name)
+    if breaker is None:
+        raise HTTPException(status_code=404, detail="熔断器不存在")
+    breaker.reset()
+    return breaker.snapshot()
+
+@router.get("/sync-watermarks", response_model=dict)
+def get_sync_watermarks(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    """查看各权限模块增量同步的水位线、最近一次执行结果和待回收的墓碑数量"""
+    return {
+        "interval": RANGER_INCREMENTAL_SYNC_INTERVAL,
+        "modules": get_watermarks(db)
+    }
+
+@router.post("/reconcile-all", response_model=dict, status_code=http_status.HTTP_202_ACCEPTED)
+def reconcile_all_modules(
+    db: Session = Depends(get_db),
+    prune: bool = Query(False, description="是否移除Ranger中权限表之外的授权"),
+    hdfs: bool = Query(True, description="是否同时同步HDFS配额"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """统一对账：表/字段/行权限与HDFS配额在一个任务中完成
+
+    共用一份Ranger策略快照计算变更，按normal、脱敏、行过滤、HDFS配额的顺序执行；
+    与各模块的同步任务互斥，进度通过 /sync-jobs/{job_id} 查看
+    """
+    return start_sync_job(db, MODULE_ALL, current_user, prune=prune, hdfs=hdfs)
+
+@router.get("/outbox", response_model=dict)
+def get_outbox_items(
+    db: Session = Depends(get_db),
+    module: Optional[str] = Query(None, description="table/column/row"),
+    status: Optional[str] = Query(None, description="pending/running/done/failed"),
+    record_id: Optional[int] = Query(None, description="权限记录ID"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_active_user)
+):
+    """查询同步发件箱中的任务状态、执行次数和耗时"""
+    query = db.query(SyncOutbox)
+    if module:
+        query = query.filter(SyncOutbox.module == module)
+    if status:
+        query = query.filter(SyncOutbox.status == status)
+    if record_id is not None:
+        query = query.filter(SyncOutbox.record_id == record_id)
+    total = query.count()
+    items = query.order_by(SyncOutbox.id.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    return {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "items": [outbox_item_to_dict(item) for item in items]
+    }
+
+@router.get("/outbox/stats", response_model=dict)
+def get_outbox_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    """同步发件箱概况：各状态任务数、最早待执行任务的等待时间、平均执行耗时"""
+    return outbox_stats(db)
+
+@router.get("/outbox/{item_id}", response_model=dict)
+def get_outbox_item(item_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+    """查询单个同步任务"""
+    item = db.query(SyncOutbox).filter(SyncOutbox.id == item_id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="同步任务不存在")
+    return outbox_item_to_dict(item)
+
+@router.post("/outbox/retry", response_model=dict)
+def retry_outbox_items(
+    db: Session = Depends(get_db),
+    item_ids: Optional[List[int]] = Body(None, embed=True),
+    current_user: User = Depends(get_current_active_user)
+):
+    """把失败的同步任务重新置为待执行，不传item_ids时重试全部失败任务"""
+    return {"retried": retry_failed(db, item_ids)}
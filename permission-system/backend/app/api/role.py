@@ -1,7 +1,9 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.db import get_db
+from app.core.db import get_async_db, get_db
 from app.models.models import Role
 from app.schemas.role import RoleCreate, RoleResponse, RoleUpdate
 import logging
@@ -10,21 +12,21 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/", response_model=List[RoleResponse])
-def get_roles(
+async def get_roles(
     name: Optional[str] = Query(None, description="按角色名称筛选"),
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取所有角色"""
     try:
-        query = db.query(Role)
+        query = select(Role)
         
         # 如果提供了名称，则进行模糊搜索
         if name:
             query = query.filter(Role.role_name.contains(name))
             
-        roles = query.offset(skip).limit(limit).all()
+        roles = (await db.scalars(query.offset(skip).limit(limit))).all()
         
         # 手动处理字段映射
         result = []
@@ -45,10 +47,10 @@ def get_roles(
 
 
 @router.get("/{role_id}", response_model=RoleResponse)
-def get_role(role_id: int, db: Session = Depends(get_db)):
+async def get_role(role_id: int, db: AsyncSession = Depends(get_async_db)):
     """获取角色详情"""
     try:
-        role = db.query(Role).filter(Role.id == role_id).first()
+        role = await db.get(Role, role_id)
         if role is None:
             raise HTTPException(status_code=404, detail="角色不存在")
         
@@ -1,18 +1,30 @@
 from typing import List, Optional, Dict, Any
+from types import SimpleNamespace
 from fastapi import Body
-from app.utils.youcash_ranger_v2 import run as ranger_run
+from app.utils.youcash_ranger_v2 import run as ranger_run, get_ranger_manager
+from app.utils.ranger_reconcile import reconcile, row_filter_policy_name
+from app.utils.ranger_coalesce import ACTION_REVOKE, get_policy_coalescer, sync_update
+from app.utils.ranger_async import async_reconcile, get_async_ranger_client
+from app.utils.ranger_incremental import TOMBSTONE_FIELDS, add_tombstone, is_live_grant, tombstone_if_changed
+from app.utils.ranger_limiter import LANE_BATCH, sync_lane
+from app.utils.sync_outbox import ACTION_UPDATE, enqueue_sync
+from app.utils.circuit_breaker import CircuitOpenError, get_breaker, is_circuit_open, ranger_breaker_name
 from app.utils.sync_helpers import with_sync_retry
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.auth import get_current_active_user
-from app.core.db import get_db
+from app.api.auth import get_current_active_user, get_current_active_user_async
+from app.api.sync_jobs import start_sync_job
+from app.core.db import get_async_db, get_db
 from app.models.models import User, RowPermission
 from app.schemas.schemas import (
     RowPermissionCreate, RowPermissionUpdate, RowPermissionOut,
     RowPermissionFilter, PaginatedResponse, RowPermissionBatchCreate
 )
-from app.utils.helpers import get_paginated_results, check_unique_constraint, create_item, update_item, delete_item
+from app.utils.helpers import get_paginated_results_async, check_unique_constraint, create_item, update_item, delete_item, bulk_create_items
 import json
 from pydantic import ValidationError
 import subprocess
@@ -23,6 +35,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 查重字段，单条创建、更新和批量创建使用相同的字段
+CONSTRAINT_FIELDS = ("db_name", "table_name", "row_filter", "user_name", "role_name")
+
 def run_ranger_command(payload: dict) -> None:
     """执行Ranger命令的内部函数"""
     # 首先定义 policy_name，确保它在 try-except 块之外也可见
@@ -37,7 +52,7 @@ def run_ranger_command(payload: dict) -> None:
         if not is_batch_sync_action:
             if not all(key in payload and payload[key] is not None for key in required_keys):
                 raise ValueError("Payload for Ranger command must include 'db_name' and 'table_name'")
-            policy_name = f"row_filter_{payload['db_name']}_{payload['table_name']}_{payload.get('user_name', '')}_{payload.get('role_name', '')}".replace(' ', '_')
+            policy_name = row_filter_policy_name(payload['db_name'], payload['table_name'], payload.get('user_name', ''), payload.get('role_name', ''))
 
         # 准备CLI参数
         args = argparse.Namespace(
@@ -108,77 +123,57 @@ def batch_create_row_permissions(
     
     # 记录同步模式
     logger.info(f"[行权限模块] 批量创建行权限，同步模式: {'批量' if batch_sync else '逐条'}")
+    pending_writes = []
     
+    # 先校验全部数据，再按自然键一次查询检查重复、一条INSERT写入，不逐条查询和提交
+    valid_rows = []
     for i, permission_item in enumerate(items):
         try:
-            # 尝试创建并验证RowPermissionCreate对象
-            try:
-                permission_data = RowPermissionCreate.model_validate(permission_item)
-                permission_dict = permission_data.model_dump()
-            except ValidationError as ve:
-                errors.append({
-                    "index": i,
-                    "error": f"数据验证失败: {str(ve)}",
-                    "data": permission_item.dict() if hasattr(permission_item, 'dict') else permission_item
-                })
-                continue
-                
-            # 检查是否存在相同的权限记录
-            constraint_fields = {
-                "db_name": permission_data.db_name,
-                "table_name": permission_data.table_name,
-                "row_filter": permission_data.row_filter,
-                "user_name": permission_data.user_name,
-                "role_name": permission_data.role_name
-            }
-            
-            if check_unique_constraint(db, RowPermission, constraint_fields):
-                # 格式化冲突详情用于错误消息
-                conflict_details = ", ".join([f"{k}='{v}'" for k, v in constraint_fields.items() if v is not None])
-                error_message = f"相同的行权限记录已存在: ({conflict_details})"
-                errors.append({
-                    "index": i,
-                    "error": error_message,
-                    "data": permission_dict
-                })
+            valid_rows.append((i, RowPermissionCreate.model_validate(permission_item).model_dump()))
+        except ValidationError as ve:
+            errors.append({
+                "index": i,
+                "error": f"数据验证失败: {str(ve)}",
+                "data": permission_item
+            })
+    
+    permission_data = dict(valid_rows)
+    created, duplicates = bulk_create_items(db, RowPermission, valid_rows, "相同的行权限记录已存在", CONSTRAINT_FIELDS)
+    errors = sorted(errors + duplicates, key=lambda error: error["index"])
+    # 响应直接由RETURNING结果生成，提交后不再逐条刷新记录
+    results = [RowPermissionOut.model_validate(row_permission) for _, row_permission in created]
+    db.commit()
+    logger.info(f"[行权限模块] 批量写入{len(created)}条记录, 失败{len(errors)}条")
+    
+    for (i, _), row_permission in zip(created, results):
+        if not batch_sync:
+            # 逐条同步模式：提交到写入合并器，循环结束后统一flush并检查结果
+            handle = get_policy_coalescer().submit("row", row_permission)
+            pending_writes.append((i, row_permission, handle, permission_data[i]))
+        else:
+            # 批量同步模式下，收集ID以便后续一次性同步
+            permissions_to_sync.append(row_permission.id)
+    
+    # 逐条同步模式：同一策略的授权合并为一次写入，失败的记录删除并从成功列表中移除
+    if pending_writes:
+        # 批量导入走batch通道，不占用界面单条操作的Ranger请求名额
+        with sync_lane(LANE_BATCH):
+            get_policy_coalescer().flush()
+        failed_ids = set()
+        for i, row_permission, handle, permission_dict in pending_writes:
+            if handle.wait():
                 continue
-            
-            # 创建行权限记录
-            row_permission = create_item(db, RowPermission, permission_data.model_dump())
-            results.append(RowPermissionOut.model_validate(row_permission))
-            
-            # 根据同步模式决定如何操作
-            if not batch_sync:
-                # 逐条同步模式：直接同步并捕获错误
-                try:
-                    sync_single_row_permission(
-                        row_permission.id,
-                        db=db,
-                        module_name="行权限模块",
-                        action="批量创建-逐条同步"
-                    )
-                except HTTPException as http_exc:
-                    # 如果同步失败，记录错误并删除已创建的记录
-                    errors.append({
-                        "index": i,
-                        "error": f"同步失败: {http_exc.detail}",
-                        "data": permission_dict
-                    })
-                    db.delete(row_permission)
-                    db.commit()
-                    # 从成功列表中移除
-                    results.pop()
-            else:
-                # 批量同步模式下，收集ID以便后续一次性同步
-                permissions_to_sync.append(row_permission.id)
-            
-        except Exception as e:
             errors.append({
-                "index": index,
-                "error": str(e),
+                "index": i,
+                "error": f"同步失败: {'; '.join(handle.errors)}",
                 "data": permission_dict
             })
-    
+            failed_ids.add(row_permission.id)
+        if failed_ids:
+            db.query(RowPermission).filter(RowPermission.id.in_(failed_ids)).delete(synchronize_session=False)
+            db.commit()
+            results = [r for r in results if r.id not in failed_ids]
+
     # 如果有错误，回滚并返回错误信息
     if errors and not results:
         raise HTTPException(
@@ -224,14 +219,17 @@ def batch_create_row_permissions(
     return results
 
 @router.post("/", response_model=RowPermissionOut)
-def create_row_permission(
+async def create_row_permission(
     *,
     db: Session = Depends(get_db),
     row_permission_in: RowPermissionCreate,
-    background_tasks: BackgroundTasks,
+    response: Response,
     current_user: User = Depends(get_current_active_user)
 ):
-    """创建行权限并自动执行同步"""
+    """创建行权限并自动执行同步
+
+    同步及失败重试由重试调度器执行并使用其自有会话，等待期间不占用请求线程
+    """
     # 检查是否存在相同的权限记录
     constraint_fields = {
         "db_name": row_permission_in.db_name,
@@ -241,36 +239,43 @@ def create_row_permission(
         "role_name": row_permission_in.role_name
     }
     
-    if check_unique_constraint(db, RowPermission, constraint_fields):
+    if await run_in_threadpool(check_unique_constraint, db, RowPermission, constraint_fields):
         raise HTTPException(
             status_code=400,
             detail="相同的行权限记录已存在"
         )
     
     # 创建行权限记录
-    row_permission = create_item(db, RowPermission, row_permission_in.model_dump())
+    row_permission = await run_in_threadpool(create_item, db, RowPermission, row_permission_in.model_dump())
 
     # 直接同步行权限，确保错误能立即反馈到前端
     try:
-        sync_single_row_permission(
+        await sync_single_row_permission.run_async(
             row_permission.id,
-            db=db,
             module_name="行权限模块",
             action="创建同步"
         )
     except HTTPException as http_exc:
+        if is_circuit_open(http_exc):
+            # Ranger熔断中：保留记录并写入同步发件箱，恢复后由sync-worker同步
+            await run_in_threadpool(defer_row_sync, db, row_permission, response)
+            return RowPermissionOut.model_validate(row_permission)
         # 如果同步失败，删除刚刚创建的记录，并抛出异常
-        db.delete(row_permission)
-        db.commit()
+        await run_in_threadpool(_discard_row_permission, db, row_permission)
         raise http_exc
 
-    return RowPermissionOut.model_validate(row_permission)
+    return await run_in_threadpool(RowPermissionOut.model_validate, row_permission)
+
+def _discard_row_permission(db: Session, row_permission) -> None:
+    """删除同步失败的新建记录"""
+    db.delete(row_permission)
+    db.commit()
 
 @router.get("/", response_model=PaginatedResponse)
-def get_row_permissions(
-    db: Session = Depends(get_db),
+async def get_row_permissions(
+    db: AsyncSession = Depends(get_async_db),
     params: RowPermissionFilter = Depends(),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user_async)
 ):
     """获取行权限列表，支持过滤、分页和排序"""
     filters = {
@@ -293,31 +298,37 @@ def get_row_permissions(
         print(f"DEBUG: 使用sorters参数: {params.sorters}")
         sorters_list = [s.model_dump() for s in params.sorters]
     
-    result = get_paginated_results(
+    result = await get_paginated_results_async(
         db, 
         RowPermission, 
         page=params.page, 
         page_size=params.page_size, 
         filters=filters,
-        sorters=sorters_list
+        sorters=sorters_list,
+        cursor=params.cursor,
+        with_total=params.with_total,
+        match=params.match
     )
     
     # 转换为JSON响应格式
     return {
         "total": result["total"],
+        "total_estimated": result["total_estimated"],
         "page": result["page"],
         "page_size": result["page_size"],
-        "items": [RowPermissionOut.from_orm(item) for item in result["items"]]
+        "items": [RowPermissionOut.from_orm(item) for item in result["items"]],
+        "next_cursor": result["next_cursor"],
+        "prev_cursor": result["prev_cursor"]
     }
 
 @router.get("/{permission_id}", response_model=RowPermissionOut)
-def get_row_permission(
+async def get_row_permission(
     permission_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ):
     """根据ID获取行权限"""
-    row_permission = db.query(RowPermission).filter(RowPermission.id == permission_id).first()
+    row_permission = await db.get(RowPermission, permission_id)
     if not row_permission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -326,15 +337,42 @@ def get_row_permission(
     return row_permission
 
 @router.put("/{permission_id}", response_model=RowPermissionOut)
-def update_row_permission(
+async def update_row_permission(
     *,
     permission_id: int,
     db: Session = Depends(get_db),
     row_permission_in: RowPermissionUpdate,
-    background_tasks: BackgroundTasks,
+    response: Response,
     current_user: User = Depends(get_current_active_user)
 ):
-    """更新行权限"""
+    """更新行权限
+
+    同步及失败重试由重试调度器执行并使用其自有会话，等待期间不占用请求线程
+    """
+    update_data = row_permission_in.model_dump(exclude_unset=True)
+    updated_row_permission, old_values, changed = await run_in_threadpool(
+        _apply_row_permission_update, db, permission_id, update_data
+    )
+
+    # 直接同步新旧值的差异，确保错误能立即反馈到前端
+    try:
+        await sync_update_row_permission.run_async(
+            permission_id,
+            old_values if changed else None,
+            module_name="行权限模块",
+            action="更新同步"
+        )
+    except HTTPException as http_exc:
+        if not is_circuit_open(http_exc):
+            raise
+        # Ranger熔断中：更新已生效，差异同步写入同步发件箱
+        old = SimpleNamespace(id=permission_id, **old_values) if changed else None
+        await run_in_threadpool(defer_row_sync, db, updated_row_permission, response, old)
+
+    return await run_in_threadpool(RowPermissionOut.model_validate, updated_row_permission)
+
+def _apply_row_permission_update(db: Session, permission_id: int, update_data: Dict[str, Any]):
+    """校验并提交行权限更新，返回更新后的记录、授权字段原值及其是否变化"""
     # 检查记录是否存在
     row_permission = db.query(RowPermission).filter(RowPermission.id == permission_id).first()
     if not row_permission:
@@ -344,11 +382,10 @@ def update_row_permission(
         )
     
     # 如果有任何字段有值，则检查唯一约束
-    update_data = row_permission_in.model_dump(exclude_unset=True)
     if any(update_data.values()):
         # 构建约束检查字段
         constraint_fields = {}
-        for field in ["db_name", "table_name", "row_filter", "user_name", "role_name"]:
+        for field in CONSTRAINT_FIELDS:
             if field in update_data and update_data[field] is not None:
                 constraint_fields[field] = update_data[field]
             else:
@@ -360,49 +397,25 @@ def update_row_permission(
                 detail="更新后的行权限与现有记录冲突"
             )
     
-    # 在更新前对原始数据执行删除同步
-    try:
-        # 对原始数据执行删除同步
-        logger.info(f"[行权限模块] 更新前对原始数据执行删除同步: ID={permission_id}")
-        sync_delete_row_permission(
-            permission_id=permission_id,
-            db_name=row_permission.db_name,
-            table_name=row_permission.table_name,
-            row_filter=row_permission.row_filter,
-            user_name=row_permission.user_name,
-            role_name=row_permission.role_name
-        )
-    except Exception as e:
-        # 如果删除同步失败，记录错误但不中断更新操作
-        logger.error(f"[行权限模块] 更新前删除同步失败: {str(e)}")
-    
-    # 更新记录
-    updated_row_permission = update_item(db, RowPermission, permission_id, update_data)
-    
-    # 直接同步行权限，确保错误能立即反馈到前端
-    try:
-        sync_single_row_permission(
-            permission_id,
-            db=db,
-            module_name="行权限模块",
-            action="更新同步"
-        )
-    except HTTPException as http_exc:
-        # 将同步失败的错误直接抛出，以便前端捕获
-        raise http_exc
+    # 授权相关字段变化时保留原值并记录墓碑，墓碑与更新在同一事务中提交
+    old_values = {field: getattr(row_permission, field) for field in TOMBSTONE_FIELDS["row"]}
+    changed = tombstone_if_changed(db, "row", row_permission, update_data)
 
-    return updated_row_permission
+    # 更新记录
+    return update_item(db, RowPermission, permission_id, update_data), old_values, changed
 
-def sync_all_row_permissions(*, db: Session, permission_ids: List[int] = None):
+def sync_all_row_permissions(*, db: Session, permission_ids: List[int] = None, prune: bool = False):
     """同步所有或指定的行权限
 
     - 如果提供了 permission_ids，则只同步这些记录。
     - 如果未提供，则同步数据库中所有的行权限记录。
+    - 先与Ranger当前策略对比，只执行差异部分的变更；prune仅在全量同步时生效。
     - 在同步失败时，会抛出 HTTPException。
     """
     if permission_ids:
         permissions_to_sync = db.query(RowPermission).filter(RowPermission.id.in_(permission_ids)).all()
         log_message = f"开始同步指定的 {len(permissions_to_sync)} 条行权限记录"
+        prune = False
     else:
         permissions_to_sync = db.query(RowPermission).all()
         log_message = f"开始同步所有行权限，共{len(permissions_to_sync)}条记录"
@@ -410,71 +423,137 @@ def sync_all_row_permissions(*, db: Session, permission_ids: List[int] = None):
     total_count = len(permissions_to_sync)
     logger.info(f"[行权限模块] {log_message}")
 
-    if total_count == 0:
+    if total_count == 0 and not prune:
         logger.warning("[行权限模块] 无行权限记录可同步")
         return
 
-    success_count = 0
-    failed_records = []
+    try:
+        result = reconcile("row", permissions_to_sync, get_ranger_manager(), prune=prune)
+    except Exception as e:
+        error_msg = f"执行命令失败: {e}"
+        logger.critical(f"[行权限模块] {error_msg}")
+        raise HTTPException(status_code=500, detail=error_msg)
 
-    for index, perm in enumerate(permissions_to_sync):
-        try:
-            payload = {
-                "action": "grant",
-                "id": perm.id,
-                "db_name": perm.db_name,
-                "table_name": perm.table_name,
-                "row_filter": perm.row_filter,
-                "user_name": perm.user_name,
-                "role_name": perm.role_name
-            }
-            logger.info(f"[行权限模块] 同步记录 {index + 1}/{total_count}: ID={perm.id}")
-            # run_ranger_command(payload)
-            success_count += 1
-        except Exception as e:
-            error_detail = getattr(e, 'detail', str(e))
-            logger.error(f"[行权限模块] 同步记录 ID={perm.id} 失败: {error_detail}")
-            failed_records.append({
-                "id": perm.id,
-                "db_name": perm.db_name,
-                "table_name": perm.table_name,
-                "error": error_detail
-            })
+    return summarize_sync_result(permissions_to_sync, result)
 
-    if failed_records:
+def summarize_sync_result(permissions: List[RowPermission], result: dict) -> dict:
+    """把对账结果整理为同步接口的返回格式，存在失败记录时抛出 HTTPException"""
+    total_count = len(permissions)
+    failed_ids = set(result["failed_ids"])
+    errors = {record_id: error["error"] for error in result["errors"] for record_id in error["record_ids"]}
+    failed_records = [
+        {
+            "id": perm.id,
+            "db_name": perm.db_name,
+            "table_name": perm.table_name,
+            "error": errors[perm.id]
+        }
+        for perm in permissions if perm.id in failed_ids
+    ]
+    success_count = total_count - len(failed_records)
+
+    if result["errors"]:
         error_summary = {
             "message": "批量同步操作完成，但部分记录失败。",
             "total": total_count,
             "succeeded": success_count,
             "failed": len(failed_records),
-            "errors": failed_records
+            "errors": failed_records or result["errors"]
         }
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=error_summary
         )
-    logger.info(f"[行权限模块] 批量同步操作完成，成功 {success_count} 条，失败 {len(failed_records)} 条")
+    logger.info(f"[行权限模块] 批量同步操作完成，计划: {result['plan']}，成功 {success_count} 条")
     return {
         "message": "批量同步操作完成",
         "total": total_count,
         "succeeded": success_count,
         "failed": 0,
-        "errors": []
+        "errors": [],
+        "plan": result["plan"]
     }
 
-@router.post("/sync", response_model=dict)
+@router.post("/sync", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
 def sync_row_permissions(
     *,
     db: Session = Depends(get_db),
+    prune: bool = Query(False, description="是否移除Ranger中权限表之外的授权"),
+    incremental: bool = Query(False, description="只同步上次成功同步之后变更或删除的记录"),
     current_user: User = Depends(get_current_active_user)
 ):
     """同步所有行权限API端点
-    
-    自动遍历数据库中的所有行权限记录，并依次执行同步操作
+
+    创建同步任务后立即返回任务ID，由sync-worker对比行权限记录与Ranger中的策略并执行差异变更；
+    进度通过 /sync-jobs/{job_id} 轮询或 /sync-jobs/{job_id}/events 订阅
+    """
+    return start_sync_job(db, "row", current_user, prune=prune, incremental=incremental)
+
+@router.post("/async/sync", response_model=dict)
+async def sync_row_permissions_async(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    prune: bool = Query(False, description="是否移除Ranger中权限表之外的授权"),
+    current_user: User = Depends(get_current_active_user_async)
+):
+    """同步所有行权限API端点（异步版本）
+
+    Ranger请求全部在事件循环上并发执行，不占用线程池
     """
-    return sync_all_row_permissions(db=db)
+    permissions_to_sync = (await db.execute(select(RowPermission))).scalars().all()
+    logger.info(f"[行权限模块] 开始异步同步所有行权限，共{len(permissions_to_sync)}条记录")
+    if not permissions_to_sync and not prune:
+        logger.warning("[行权限模块] 无行权限记录可同步")
+        return
+    try:
+        result = await async_reconcile("row", permissions_to_sync, get_async_ranger_client(), prune=prune)
+    except Exception as e:
+        error_msg = f"执行命令失败: {e}"
+        logger.critical(f"[行权限模块] {error_msg}")
+        raise HTTPException(status_code=500, detail=error_msg)
+    return summarize_sync_result(permissions_to_sync, result)
+
+@router.post("/async/sync/{permission_id}", response_model=dict)
+async def sync_single_row_permission_async(
+    permission_id: int,
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
+):
+    """同步单个行权限记录（异步版本）"""
+    row_permission = await db.get(RowPermission, permission_id)
+    if not row_permission:
+        raise HTTPException(status_code=404, detail="行权限记录不存在")
+
+    logger.info(f"[行权限模块] 异步同步单条记录: ID={permission_id}, 数据库=[{row_permission.db_name}], 表=[{row_permission.table_name}], 用户=[{row_permission.user_name}], 角色=[{row_permission.role_name}]")
+    try:
+        result = await async_reconcile("row", [row_permission], get_async_ranger_client())
+    except Exception as e:
+        error_msg = f"执行命令失败: {e}"
+        logger.critical(f"[行权限模块] {error_msg}")
+        raise HTTPException(status_code=500, detail=error_msg)
+    if result["errors"]:
+        detail = "; ".join(f"{error['service']}:{error['error']}" for error in result["errors"])
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {detail}")
+
+    return {
+        "message": "sync ok",
+        "id": permission_id,
+        "db_name": row_permission.db_name,
+        "table_name": row_permission.table_name,
+        "user_name": row_permission.user_name,
+        "role_name": row_permission.role_name,
+        "plan": result["plan"]
+    }
 
 @router.post("/sync/{permission_id}", response_model=dict)
+async def sync_single_row_permission_endpoint(permission_id: int):
+    """同步单个行权限记录API端点
+
+    失败重试由重试调度器在后台执行，等待期间不占用请求线程
+    """
+    return await sync_single_row_permission.run_async(permission_id)
+
 @with_sync_retry(max_attempts=3, retry_delay=2)
 def sync_single_row_permission(
     permission_id: int,
@@ -519,6 +598,55 @@ def sync_single_row_permission(
         "role_name": row_permission.role_name
     }
 
+@with_sync_retry(max_attempts=3, retry_delay=2)
+def sync_update_row_permission(
+    permission_id: int,
+    old_values: Optional[Dict[str, Any]] = None,
+    *,
+    db: Session = Depends(get_db),
+    module_name: str = "行权限模块",
+    action: str = "更新同步"
+):
+    """按新旧值的差异同步一条更新后的行权限
+
+    回收原值和授予新值合并为每个受影响策略一次写入，避免先删后授之间的权限空窗；
+    原值仍由其他记录提供或授权字段未变化时只授予新值
+    """
+    row_permission = db.query(RowPermission).filter(RowPermission.id == permission_id).first()
+    if not row_permission:
+        raise HTTPException(status_code=404, detail="行权限记录不存在")
+
+    old_record = None
+    if old_values and not is_live_grant(db, "row", old_values):
+        old_record = SimpleNamespace(id=permission_id, **old_values)
+    logger.info(f"[行权限模块] 差异同步: ID={permission_id}, 原值={old_values if old_record else '无需回收'}, "
+                f"数据库=[{row_permission.db_name}], 表=[{row_permission.table_name}], 用户=[{row_permission.user_name}], 角色=[{row_permission.role_name}]")
+
+    result = sync_update("row", old_record, row_permission, get_ranger_manager())
+    if result["errors"]:
+        if all(e["circuit_open"] for e in result["errors"]):
+            # 请求因熔断没有发出，不再重试
+            breaker = get_breaker(ranger_breaker_name(result["errors"][0]["service"]))
+            raise CircuitOpenError(breaker.name, breaker.retry_after())
+        error = "; ".join(f"{e['service']}:{e['name']}:{e['error']}" for e in result["errors"])
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {error}")
+    return {
+        "message": "sync ok",
+        "id": permission_id,
+        "writes": result["writes"],
+        "ranger_calls": result["ranger_calls"],
+    }
+
+def defer_row_sync(db: Session, row_permission, response: Response, old_record=None) -> None:
+    """依赖熔断时把行权限同步写入同步发件箱，并通过响应头告知前端同步已延后"""
+    if old_record is not None:
+        enqueue_sync(db, "row", old_record, ACTION_UPDATE)
+    else:
+        enqueue_sync(db, "row", row_permission)
+    db.commit()
+    response.headers["X-Sync-Deferred"] = "true"
+    logger.warning(f"[行权限模块] Ranger熔断中，同步已写入同步发件箱: ID={row_permission.id}")
+
 def sync_delete_row_permission(*, permission_id: int, db_name: str, table_name: str, row_filter: str, user_name: Optional[str] = None, role_name: Optional[str] = None):
     """同步删除行权限
     
@@ -556,7 +684,6 @@ def sync_delete_row_permission(*, permission_id: int, db_name: str, table_name:
 def delete_row_permission(
     permission_id: int,
     db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None,
     current_user: User = Depends(get_current_active_user)
 ):
     """删除行权限并同步到外部系统"""
@@ -568,14 +695,9 @@ def delete_row_permission(
             detail="行权限不存在"
         )
     
-    # 保存必要的同步信息
-    db_name = permission.db_name
-    table_name = permission.table_name
-    row_filter = permission.row_filter
-    user_name = permission.user_name
-    role_name = permission.role_name
-    
-    # 执行删除操作
+    # 执行删除操作，墓碑和回收任务与删除在同一事务中提交
+    add_tombstone(db, "row", permission)
+    enqueue_sync(db, "row", permission, ACTION_REVOKE)
     result = delete_item(db, RowPermission, permission_id)
     if not result:
         raise HTTPException(
@@ -583,17 +705,5 @@ def delete_row_permission(
             detail="删除行权限失败"
         )
     
-    # 添加同步任务到后台执行
-    logger.info(f"[行权限模块] 添加删除同步任务: 行权限记录 ID={permission_id}")
-    if background_tasks:
-        background_tasks.add_task(
-            sync_delete_row_permission,
-            permission_id=permission_id,
-            db_name=db_name,
-            table_name=table_name,
-            row_filter=row_filter,
-            user_name=user_name,
-            role_name=role_name
-        )
-    
+    logger.info(f"[行权限模块] 写入删除同步任务: 行权限记录 ID={permission_id}")
     return None
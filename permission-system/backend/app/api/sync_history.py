@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.api.auth import get_current_active_user
+from app.core.db import get_db
+from app.models.models import User
+from app.utils.sync_history import (
+    DURATION_BUCKETS, duration_stats, failing_records, get_history_writer, slowest_records,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+def _time_range(start: Optional[datetime], end: Optional[datetime]):
+    """未指定时间范围时默认统计最近24小时"""
+    end = end or datetime.now()
+    start = start or end - timedelta(days=1)
+    return start, end
+
+@router.get("/stats", response_model=dict)
+def get_sync_history_stats(
+    db: Session = Depends(get_db),
+    start: Optional[datetime] = Query(None, description="开始时间，默认24小时前"),
+    end: Optional[datetime] = Query(None, description="结束时间，默认当前时间"),
+    module_name: Optional[str] = Query(None, description="模块名称，如 表权限模块、HDFS配额模块"),
+    action: Optional[str] = Query(None, description="动作，如 同步、创建同步"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """按模块和动作统计同步耗时直方图、p50/p90/p99以及失败率"""
+    start, end = _time_range(start, end)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "buckets": list(DURATION_BUCKETS),
+        "items": duration_stats(db, start, end, module_name, action),
+        "writer": get_history_writer().stats
+    }
+
+@router.get("/slowest", response_model=dict)
+def get_slowest_syncs(
+    db: Session = Depends(get_db),
+    start: Optional[datetime] = Query(None, description="开始时间，默认24小时前"),
+    end: Optional[datetime] = Query(None, description="结束时间，默认当前时间"),
+    module_name: Optional[str] = Query(None, description="模块名称"),
+    action: Optional[str] = Query(None, description="动作"),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_active_user)
+):
+    """耗时最长的同步记录，包含每次尝试的耗时"""
+    start, end = _time_range(start, end)
+    return {"items": slowest_records(db, start, end, module_name, action, limit)}
+
+@router.get("/failing", response_model=dict)
+def get_failing_syncs(
+    db: Session = Depends(get_db),
+    start: Optional[datetime] = Query(None, description="开始时间，默认24小时前"),
+    end: Optional[datetime] = Query(None, description="结束时间，默认当前时间"),
+    module_name: Optional[str] = Query(None, description="模块名称"),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_active_user)
+):
+    """失败次数最多的权限记录及最近一次错误"""
+    start, end = _time_range(start, end)
+    return {"items": failing_records(db, start, end, module_name, limit)}
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.api.auth import get_current_active_user
+from app.core.db import get_db
+from app.models.models import User
+from app.models.ranger_sync import SyncJob
+from app.utils.sync_jobs import (
+    ACTIVE_STATUSES, SyncJobConflict, create_job, job_to_dict, list_jobs, request_cancel,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# SSE推送进度的检查间隔，以及无变化时发送保活注释的间隔（秒）
+STREAM_INTERVAL = 1.0
+STREAM_KEEPALIVE = 15.0
+
+def start_sync_job(db: Session, module: str, current_user: User, **options) -> dict:
+    """创建全量同步任务并立即返回任务信息，同一模块已有未结束的任务时返回409及该任务"""
+    try:
+        job = create_job(db, module, options, created_by=current_user.username)
+    except SyncJobConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job": job_to_dict(e.job)})
+    return job_to_dict(job)
+
+@router.get("", response_model=dict)
+def get_sync_jobs(
+    db: Session = Depends(get_db),
+    module: Optional[str] = Query(None, description="模块: table/column/row/hdfs"),
+    status: Optional[str] = Query(None, description="状态: pending/running/done/failed/cancelled"),
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_active_user)
+):
+    """查看最近的同步任务"""
+    return {"items": [job_to_dict(job) for job in list_jobs(db, module, status, limit)]}
+
+@router.get("/{job_id}", response_model=dict)
+def get_sync_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """查看同步任务进度：已成功/失败的变更数、速率和预计剩余时间"""
+    job = db.get(SyncJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="同步任务不存在")
+    return job_to_dict(job)
+
+@router.get("/{job_id}/events")
+async def stream_sync_job(
+    job_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """以Server-Sent Events推送同步任务进度
+
+    进度变化时发送progress事件，任务结束后发送end事件并关闭连接
+    """
+    def load():
+        db.expire_all()
+        job = db.get(SyncJob, job_id)
+        return job_to_dict(job) if job is not None else None
+
+    current = await run_in_threadpool(load)
+    if current is None:
+        raise HTTPException(status_code=404, detail="同步任务不存在")
+
+    async def events():
+        data = current
+        last = None
+        idle = 0.0
+        while data is not None:
+            if data != last:
+                yield f"event: progress\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                last = data
+                idle = 0.0
+            if data["status"] not in ACTIVE_STATUSES:
+                yield f"event: end\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                return
+            if idle >= STREAM_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(STREAM_INTERVAL)
+            idle += STREAM_INTERVAL
+            if await request.is_disconnected():
+                return
+            data = await run_in_threadpool(load)
+
+    # 关闭nginx的响应缓冲，保证事件实时到达客户端
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/{job_id}/cancel", response_model=dict)
+def cancel_sync_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """取消同步任务，执行中的任务在当前变更完成后停止"""
+    job = request_cancel(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="同步任务不存在")
+    return job_to_dict(job)
@@ -1,17 +1,26 @@
 from typing import Any, Dict, List, Optional
-from app.utils.youcash_ranger_v2 import run as ranger_run
+from app.utils.youcash_ranger_v2 import run as ranger_run, get_ranger_manager
+from app.utils.ranger_reconcile import reconcile
+from app.utils.ranger_coalesce import ACTION_REVOKE, sync_records
+from app.utils.ranger_async import async_reconcile, get_async_ranger_client
+from app.utils.ranger_incremental import add_tombstone, tombstone_if_changed
+from app.utils.ranger_limiter import LANE_BATCH, sync_lane
+from app.utils.sync_outbox import ACTION_UPDATE, enqueue_created, enqueue_sync
 
-from fastapi import APIRouter, Body, Depends, HTTPException, Query, status, BackgroundTasks
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.api.auth import get_current_active_user
-from app.core.db import get_db
+from app.api.auth import get_current_active_user, get_current_active_user_async
+from app.api.sync_jobs import start_sync_job
+from app.core.db import get_async_db, get_db
 from app.models.models import User, TablePermission
 from app.schemas.schemas import (
     TablePermissionCreate, TablePermissionUpdate, TablePermissionOut,
     TablePermissionFilter, PaginatedResponse, SortParam, TablePermissionBatchCreate
 )
-from app.utils.helpers import get_paginated_results, check_unique_constraint, create_item, update_item, delete_item
+from app.utils.helpers import get_paginated_results_async, check_unique_constraint, create_item, update_item, delete_item, bulk_create_items
 from app.utils.sync_helpers import with_sync_retry
 import json
 from pydantic import ValidationError
@@ -23,6 +32,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 查重字段，单条创建、更新和批量创建使用相同的字段
+CONSTRAINT_FIELDS = ("db_name", "table_name", "user_name", "role_name")
+
 def run_ranger_command(payload: dict) -> None:
     logger.info(f"[表权限模块] 执行命令参数: {payload}")
     if payload['action'] == 'sync_all_table_permissions':
@@ -37,6 +49,7 @@ def run_ranger_command(payload: dict) -> None:
             catalog=['internal', 'cdp_hive'],
             database=payload['db_name'],
             table=payload['table_name'],
+            columns=['*'],
             users=[payload['user_name']],
             groups=[],
             roles=[payload['role_name']],
@@ -49,19 +62,50 @@ def run_ranger_command(payload: dict) -> None:
         logger.error(f"[表权限模块] 执行命令失败: {e}")
         raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
 
+def sync_created_table_permissions(db: Session, permission_ids: List[int], response: Response) -> dict:
+    """只同步本次批量创建的表权限
+
+    同一策略上的授权合并为一次写入，各(服务, catalog)目标并发执行；
+    Ranger请求数、写入次数和失败记录数通过响应头返回，失败的记录写入同步发件箱由sync-worker重试
+    """
+    permissions = db.query(TablePermission).filter(TablePermission.id.in_(permission_ids)).all()
+    logger.info(f"[表权限模块] 批量同步本次创建的{len(permissions)}条记录")
+    try:
+        # 批量导入走batch通道，不占用界面单条操作的线程和Ranger请求名额
+        with sync_lane(LANE_BATCH):
+            result = sync_records("table", permissions, get_ranger_manager())
+        failed_ids = set(result["failed_ids"])
+    except Exception as e:
+        logger.error(f"[表权限模块] 批量同步失败: {e}")
+        result = {"ranger_calls": 0, "writes": 0}
+        failed_ids = set(permission_ids)
+    if failed_ids:
+        for permission in permissions:
+            if permission.id in failed_ids:
+                enqueue_sync(db, "table", permission)
+        db.commit()
+        logger.warning(f"[表权限模块] {len(failed_ids)}条记录同步失败，已加入同步发件箱重试")
+    logger.info(f"[表权限模块] 批量同步完成: Ranger请求{result['ranger_calls']}次, 写入{result['writes']}次, "
+                f"失败{len(failed_ids)}条")
+    response.headers["X-Ranger-Calls"] = str(result["ranger_calls"])
+    response.headers["X-Ranger-Writes"] = str(result["writes"])
+    response.headers["X-Sync-Failed"] = str(len(failed_ids))
+    return result
+
 @router.post("/batch", response_model=List[TablePermissionOut])
 def batch_create_table_permissions(
     *,
     db: Session = Depends(get_db),
     batch_data: Any = Body(...),  # 使用Any类型和Body，以便接受多种格式
-    background_tasks: BackgroundTasks,
+    response: Response,
     current_user: User = Depends(get_current_active_user)
 ):
     """批量创建表权限
     
     批量创建表权限记录，可选批量同步模式
-    - batch_sync=True: 所有记录一次性同步（适合大批量导入）
-    - batch_sync=False: 逐条同步（默认模式）
+    - batch_sync=True: 本次创建的记录按策略合并后一次性同步（适合大批量导入），
+      响应头X-Ranger-Calls返回实际发出的Ranger请求数
+    - batch_sync=False: 逐条写入同步发件箱，由sync-worker同步和重试（默认模式）
     """
     results = []
     errors = []
@@ -95,61 +139,31 @@ def batch_create_table_permissions(
     # 记录同步模式
     logger.info(f"[表权限模块] 批量创建表权限，同步模式: {'批量' if batch_sync else '逐条'}")
     
+    # 先校验全部数据，再按自然键一次查询检查重复、一条INSERT写入，不逐条查询和提交
+    valid_rows = []
     for i, permission_item in enumerate(items):
         try:
-            # 尝试创建 TablePermissionCreate 对象
-            try:
-                # 尝试将输入数据转换为TablePermissionCreate模型
-                permission_data = TablePermissionCreate.model_validate(permission_item)
-                
-                permission_dict = permission_data.model_dump()
-            except ValidationError as ve:
-                errors.append({
-                    "index": i,
-                    "error": f"数据验证失败: {str(ve)}",
-                    "data": permission_item.model_dump()
-                })
-                continue
-                
-            # 检查是否存在相同的权限记录
-            constraint_fields = {
-                "db_name": permission_data.db_name,
-                "table_name": permission_data.table_name,
-                "user_name": permission_data.user_name,
-                "role_name": permission_data.role_name
-            }
-            
-            if check_unique_constraint(db, TablePermission, constraint_fields):
-                errors.append({
-                    "index": i,
-                    "error": "相同的表权限记录已存在",
-                    "data": permission_dict
-                })
-                continue
-            
-            # 创建表权限记录
-            table_permission = create_item(db, TablePermission, permission_data.model_dump())
-            results.append(TablePermissionOut.model_validate(table_permission))
-            
-            # 记录需要同步的表权限 ID
-            permissions_to_sync.append(table_permission.id)
-            logger.info(f"[表权限模块] 记录待同步权限: ID={table_permission.id}")
-            
-            # 如果不是批量同步模式，则逐条添加同步任务
-            if not batch_sync:
-                background_tasks.add_task(
-                    sync_single_table_permission,
-                    table_permission.id,
-                    db=db
-                )
-            
-        except Exception as e:
+            valid_rows.append((i, TablePermissionCreate.model_validate(permission_item).model_dump()))
+        except ValidationError as ve:
             errors.append({
                 "index": i,
-                "error": str(e),
-                "data": permission_dict
+                "error": f"数据验证失败: {str(ve)}",
+                "data": permission_item
             })
     
+    created, duplicates = bulk_create_items(db, TablePermission, valid_rows, "相同的表权限记录已存在", CONSTRAINT_FIELDS)
+    errors = sorted(errors + duplicates, key=lambda error: error["index"])
+    # 响应直接由RETURNING结果生成，提交后不再逐条刷新记录
+    results = [TablePermissionOut.model_validate(table_permission) for _, table_permission in created]
+    if not batch_sync:
+        # 逐条同步模式，授权任务写入发件箱，与记录在同一事务中提交，由sync-worker执行和重试
+        enqueue_created(db, "table", [table_permission for _, table_permission in created])
+    db.commit()
+    logger.info(f"[表权限模块] 批量写入{len(created)}条记录, 失败{len(errors)}条")
+    
+    if batch_sync:
+        permissions_to_sync = [table_permission.id for table_permission in results]
+    
     # 如果有错误，回滚并返回错误信息
     if errors and not results:
         raise HTTPException(
@@ -160,26 +174,11 @@ def batch_create_table_permissions(
             }
         )
     
-    # 如果部分成功部分失败，返回成功的结果和错误信息
-    if errors:
-        # 这里我们仍然返回成功创建的记录，但在响应头中添加警告信息
-        # 如果有成功的记录且选择了批量同步模式，执行批量同步
-        if batch_sync and permissions_to_sync:
-            logger.info(f"[表权限模块] 执行批量同步，共 {len(permissions_to_sync)} 条记录")
-            background_tasks.add_task(
-                sync_table_permissions,
-                db=db
-            )
-        return results
-    
-    # 如果所有记录都创建成功且选择了批量同步模式，执行批量同步
+    # 选择了批量同步模式时，只同步本次成功创建的记录（部分失败时同样同步已创建的记录）
     if batch_sync and permissions_to_sync:
-        logger.info(f"[表权限模块] 执行批量同步，共 {len(permissions_to_sync)} 条记录")
-        background_tasks.add_task(
-            sync_table_permissions,
-            db=db
-        )
+        sync_created_table_permissions(db, permissions_to_sync, response)
     
+    # 如果部分成功部分失败，返回成功创建的记录
     return results
 
 @router.post("/", response_model=TablePermissionOut)
@@ -187,7 +186,6 @@ def create_table_permission(
     *,
     db: Session = Depends(get_db),
     table_permission_in: TablePermissionCreate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user)
 ):
     """创建表权限并自动执行同步"""
@@ -205,24 +203,20 @@ def create_table_permission(
             detail="相同的表权限记录已存在"
         )
     
-    # 创建表权限记录
-    table_permission = create_item(db, TablePermission, table_permission_in.model_dump())
-    
-    # 添加同步任务到后台执行
-    logger.info(f"[表权限模块] 添加同步任务: 新建权限记录 ID={table_permission.id}")
-    background_tasks.add_task(
-        sync_single_table_permission,
-        table_permission.id,
-        db=db
-    )
+    # 创建表权限记录，同步任务写入发件箱，与记录在同一事务中提交
+    table_permission = create_item(db, TablePermission, table_permission_in.model_dump(), commit=False)
+    enqueue_sync(db, "table", table_permission)
+    db.commit()
+    db.refresh(table_permission)
+    logger.info(f"[表权限模块] 写入同步任务: 新建权限记录 ID={table_permission.id}")
     
     return TablePermissionOut.model_validate(table_permission)
 
 @router.get("/", response_model=PaginatedResponse)
-def get_table_permissions(
-    db: Session = Depends(get_db),
+async def get_table_permissions(
+    db: AsyncSession = Depends(get_async_db),
     params: TablePermissionFilter = Depends(),
-    current_user: User = Depends(get_current_active_user),
+    current_user: User = Depends(get_current_active_user_async),
 ):
     """获取表权限列表，支持过滤、分页和排序"""
     filters = {
@@ -244,31 +238,37 @@ def get_table_permissions(
         print(f"DEBUG: 使用sorters参数: {params.sorters}")
         sorters_list = [s.model_dump() for s in params.sorters]
 
-    result = get_paginated_results(
+    result = await get_paginated_results_async(
         db, 
         TablePermission, 
         page=params.page, 
         page_size=params.page_size, 
         filters=filters,
-        sorters=sorters_list
+        sorters=sorters_list,
+        cursor=params.cursor,
+        with_total=params.with_total,
+        match=params.match
     )
     
     # 转换为JSON响应格式
     return {
         "total": result["total"],
+        "total_estimated": result["total_estimated"],
         "page": result["page"],
         "page_size": result["page_size"],
-        "items": [TablePermissionOut.model_validate(item) for item in result["items"]]
+        "items": [TablePermissionOut.model_validate(item) for item in result["items"]],
+        "next_cursor": result["next_cursor"],
+        "prev_cursor": result["prev_cursor"]
     }
 
 @router.get("/{permission_id}", response_model=TablePermissionOut)
-def get_table_permission(
+async def get_table_permission(
     permission_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
 ):
     """根据ID获取表权限"""
-    table_permission = db.query(TablePermission).filter(TablePermission.id == permission_id).first()
+    table_permission = await db.get(TablePermission, permission_id)
     if not table_permission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -282,7 +282,6 @@ def update_table_permission(
     permission_id: int,
     db: Session = Depends(get_db),
     table_permission_in: TablePermissionUpdate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user)
 ):
     """更新表权限"""
@@ -299,7 +298,7 @@ def update_table_permission(
     if any(update_data.values()):
         # 构建约束检查字段
         constraint_fields = {}
-        for field in ["db_name", "table_name", "user_name", "role_name"]:
+        for field in CONSTRAINT_FIELDS:
             if field in update_data and update_data[field] is not None:
                 constraint_fields[field] = update_data[field]
             else:
@@ -311,39 +310,27 @@ def update_table_permission(
                 detail="更新后的表权限与现有记录冲突"
             )
     
-    # 在更新前对原始数据执行删除同步
-    try:
-        # 对原始数据执行删除同步
-        logger.info(f"[表权限模块] 更新前对原始数据执行删除同步: ID={permission_id}")
-        sync_delete_table_permission(
-            permission_id=permission_id,
-            db_name=table_permission.db_name,
-            table_name=table_permission.table_name,
-            user_name=table_permission.user_name,
-            role_name=table_permission.role_name
-        )
-    except Exception as e:
-        # 如果删除同步失败，记录错误但不中断更新操作
-        logger.error(f"[表权限模块] 更新前删除同步失败: {str(e)}")
-    
+    # 授权相关字段变化时记录原值墓碑，并写入一条更新任务：原值的回收与新值的授权合并为每个策略一次写入
+    # 墓碑和同步任务与更新在同一事务中提交，由sync-worker执行
+    if tombstone_if_changed(db, "table", table_permission, update_data):
+        enqueue_sync(db, "table", table_permission, ACTION_UPDATE)
+    else:
+        enqueue_sync(db, "table", table_permission)
+    logger.info(f"[表权限模块] 写入同步任务: 更新权限记录 ID={permission_id}")
+
     # 更新记录
     updated_table_permission = update_item(db, TablePermission, permission_id, update_data)
     
-    # 添加同步任务到后台执行
-    logger.info(f"[表权限模块] 添加同步任务: 更新权限记录 ID={permission_id}")
-    background_tasks.add_task(
-        sync_single_table_permission,
-        permission_id,
-        db=db
-    )
-    
     return TablePermissionOut.model_validate(updated_table_permission)
 
-def sync_all_table_permissions(*, db: Session):
+def sync_all_table_permissions(*, db: Session, prune: bool = False):
     """同步所有表权限的内部函数，可以被后台任务调用
-    
+
+    先根据表权限记录计算期望策略，再与Ranger当前策略对比，只执行差异部分的变更
+
     参数:
         db: 数据库会话（关键字参数）
+        prune: 是否以权限表为准移除Ranger中多余的授权
     """
     # 查询所有表权限记录
     all_table_permissions = db.query(TablePermission).all()
@@ -351,72 +338,122 @@ def sync_all_table_permissions(*, db: Session):
     
     logger.info(f"[表权限模块] 开始同步所有表权限，共{total_count}条记录")
     
-    if total_count == 0:
+    if total_count == 0 and not prune:
         logger.warning("[表权限模块] 无表权限记录可同步")
         return {"message": "sync ok", "total": 0, "synced": 0}
     
-    # 先通知CLI脚本开始批量同步操作
-    batch_payload = {
-        "action": "sync_all_table_permissions",
-        "total": total_count
-    }
-    run_ranger_command(batch_payload)
-    
-    # 记录成功和失败的同步操作
-    success_count = 0
-    failed_records = []
-    
-    # 依次同步每条记录
-    for index, perm in enumerate(all_table_permissions):
-        try:
-            # 准备同步参数
-            payload = {
-                "action": "grant",
-                "id": perm.id,
-                "db_name": perm.db_name,
-                "table_name": perm.table_name,
-                "user_name": perm.user_name,
-                "role_name": perm.role_name
-            }
-            
-            # 记录同步请求
-            logger.info(f"[表权限模块] 同步记录 {index+1}/{total_count}: ID={perm.id}, 数据库=[{perm.db_name}], 表=[{perm.table_name}], 用户=[{perm.user_name}], 角色=[{perm.role_name}]")
-            
-            # 执行同步命令
-            run_ranger_command(payload)
-            success_count += 1
-            
-        except Exception as e:
-            logger.error(f"[表权限模块] 同步记录 ID={perm.id} 失败: {str(e)}")
-            failed_records.append({
-                "id": perm.id,
-                "db_name": perm.db_name,
-                "table_name": perm.table_name,
-                "error": str(e)
-            })
+    try:
+        result = reconcile("table", all_table_permissions, get_ranger_manager(), prune=prune)
+    except Exception as e:
+        logger.error(f"[表权限模块] 对账失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
+
+    return summarize_sync_result(all_table_permissions, result)
+
+def summarize_sync_result(permissions: List[TablePermission], result: dict) -> dict:
+    """把对账结果整理为同步接口的返回格式，失败的变更映射回对应的表权限记录"""
+    total_count = len(permissions)
+    failed_ids = set(result["failed_ids"])
+    errors = {record_id: error["error"] for error in result["errors"] for record_id in error["record_ids"]}
+    failed_records = [
+        {
+            "id": perm.id,
+            "db_name": perm.db_name,
+            "table_name": perm.table_name,
+            "error": errors[perm.id]
+        }
+        for perm in permissions if perm.id in failed_ids
+    ]
+    logger.info(f"[表权限模块] 同步完成，计划: {result['plan']}，失败 {len(failed_records)} 条")
     
     # 返回同步结果摘要
     return {
         "message": "sync completed", 
         "total": total_count, 
-        "synced": success_count,
+        "synced": total_count - len(failed_records),
         "failed": len(failed_records),
-        "failed_records": failed_records[:10] if failed_records else []  # 最多显示10条失败记录
+        "failed_records": failed_records[:10] if failed_records else [],  # 最多显示10条失败记录
+        "plan": result["plan"],
+        "errors": result["errors"][:10]
     }
 
-@router.post("/sync", response_model=dict)
+@router.post("/sync", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
 def sync_table_permissions(
     *,
     db: Session = Depends(get_db),
+    prune: bool = Query(False, description="是否移除Ranger中权限表之外的授权"),
+    incremental: bool = Query(False, description="只同步上次成功同步之后变更或删除的记录"),
     current_user: User = Depends(get_current_active_user)
 ):
     """同步所有表权限API端点
-    
-    自动遍历数据库中的所有表权限记录，并依次执行同步操作
+
+    创建同步任务后立即返回任务ID，由sync-worker对比表权限记录与Ranger中的策略并执行差异变更；
+    进度通过 /sync-jobs/{job_id} 轮询或 /sync-jobs/{job_id}/events 订阅
     """
-    return sync_all_table_permissions(db=db)
+    return start_sync_job(db, "table", current_user, prune=prune, incremental=incremental)
+
+@router.post("/async/sync", response_model=dict)
+async def sync_table_permissions_async(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    prune: bool = Query(False, description="是否移除Ranger中权限表之外的授权"),
+    current_user: User = Depends(get_current_active_user_async)
+):
+    """同步所有表权限API端点（异步版本）
+
+    Ranger请求全部在事件循环上并发执行，不占用线程池
+    """
+    all_table_permissions = (await db.execute(select(TablePermission))).scalars().all()
+    logger.info(f"[表权限模块] 开始异步同步所有表权限，共{len(all_table_permissions)}条记录")
+    if not all_table_permissions and not prune:
+        return {"message": "sync ok", "total": 0, "synced": 0}
+    try:
+        result = await async_reconcile("table", all_table_permissions, get_async_ranger_client(), prune=prune)
+    except Exception as e:
+        logger.error(f"[表权限模块] 异步对账失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
+    return summarize_sync_result(all_table_permissions, result)
+
+@router.post("/async/sync/{permission_id}", response_model=dict)
+async def sync_single_table_permission_async(
+    permission_id: int,
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_active_user_async)
+):
+    """同步单个表权限记录（异步版本）"""
+    table_permission = await db.get(TablePermission, permission_id)
+    if not table_permission:
+        raise HTTPException(status_code=404, detail="表权限记录不存在")
+
+    logger.info(f"[表权限模块] 异步同步单条记录: ID={permission_id}, 数据库=[{table_permission.db_name}], 表=[{table_permission.table_name}], 用户=[{table_permission.user_name}], 角色=[{table_permission.role_name}]")
+    try:
+        result = await async_reconcile("table", [table_permission], get_async_ranger_client())
+    except Exception as e:
+        logger.error(f"[表权限模块] 执行命令失败: {e}")
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {e}")
+    if result["errors"]:
+        detail = "; ".join(f"{error['service']}:{error['error']}" for error in result["errors"])
+        raise HTTPException(status_code=500, detail=f"执行命令失败: {detail}")
+
+    return {
+        "message": "sync ok",
+        "id": permission_id,
+        "db_name": table_permission.db_name,
+        "table_name": table_permission.table_name,
+        "user_name": table_permission.user_name,
+        "role_name": table_permission.role_name,
+        "plan": result["plan"]
+    }
 
 @router.post("/sync/{permission_id}", response_model=dict)
+async def sync_single_table_permission_endpoint(permission_id: int):
+    """同步单个表权限记录API端点
+
+    失败重试由重试调度器在后台执行，等待期间不占用请求线程
+    """
+    return await sync_single_table_permission.run_async(permission_id)
+
 @with_sync_retry(max_attempts=3, retry_delay=2)
 def sync_single_table_permission(
     permission_id: int,
@@ -496,7 +533,6 @@ def sync_delete_table_permission(*, permission_id: int, db_name: str, table_name
 def delete_table_permission(
     permission_id: int,
     db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = None,
     current_user: User = Depends(get_current_active_user)
 ):
     """删除表权限并同步到外部系统"""
@@ -508,13 +544,9 @@ def delete_table_permission(
             detail="表权限不存在"
         )
     
-    # 保存必要的同步信息
-    db_name = permission.db_name
-    table_name = permission.table_name
-    user_name = permission.user_name
-    role_name = permission.role_name
-    
-    # 执行删除操作
+    # 执行删除操作，墓碑和回收任务与删除在同一事务中提交
+    add_tombstone(db, "table", permission)
+    enqueue_sync(db, "table", permission, ACTION_REVOKE)
     result = delete_item(db, TablePermission, permission_id)
     if not result:
         raise HTTPException(
@@ -522,16 +554,5 @@ def delete_table_permission(
             detail="删除表权限失败"
         )
     
-    # 添加同步任务到后台执行
-    logger.info(f"[表权限模块] 添加删除同步任务: 表权限记录 ID={permission_id}")
-    if background_tasks:
-        background_tasks.add_task(
-            sync_delete_table_permission,
-            permission_id=permission_id,
-            db_name=db_name,
-            table_name=table_name,
-            user_name=user_name,
-            role_name=role_name
-        )
-    
+    logger.info(f"[表权限模块] 写入删除同步任务: 表权限记录 ID={permission_id}")
     return None
@@ -50,3 +50,13 @@ else:
 
 # 数据库配置
 SQLALCHEMY_DATABASE_URI = DATABASE_URL
+
+def to_async_database_url(url: str) -> str:
+    """把同步的PostgreSQL连接串转换为asyncpg连接串，其他连接串原样返回"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+# 只读接口使用的异步连接，未设置时由DATABASE_URL转换
+ASYNC_SQLALCHEMY_DATABASE_URI = os.getenv("ASYNC_DATABASE_URL") or to_async_database_url(DATABASE_URL)
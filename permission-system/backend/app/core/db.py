@@ -1,8 +1,15 @@
+import os
+import threading
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from app.core.config import SQLALCHEMY_DATABASE_URI
+from app.core.config import ASYNC_SQLALCHEMY_DATABASE_URI, SQLALCHEMY_DATABASE_URI
+
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "20"))        # 异步连接池大小
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20"))  # 异步连接池最大溢出连接数
 
 # 创建数据库引擎
 engine = create_engine(
@@ -27,3 +34,44 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ---------- 异步会话（只读接口） ----------
+# 列表和详情接口在事件循环中直接查询，不占用线程池，前端轮询的并发不再受线程数限制；
+# 写接口仍使用同步会话。引擎在第一次使用时创建，sync-worker等不需要异步驱动的进程不受影响
+
+_async_engine = None
+_async_session_factory = None
+_async_lock = threading.Lock()
+
+
+def get_async_session_factory() -> async_sessionmaker:
+    global _async_engine, _async_session_factory
+    if _async_session_factory is None:
+        with _async_lock:
+            if _async_session_factory is None:
+                _async_engine = create_async_engine(
+                    ASYNC_SQLALCHEMY_DATABASE_URI,
+                    pool_pre_ping=True,
+                    pool_size=ASYNC_DB_POOL_SIZE,
+                    max_overflow=ASYNC_DB_MAX_OVERFLOW,
+                    pool_recycle=3600,
+                    echo=False
+                )
+                # 提交后不过期对象，序列化响应时不会触发隐式的异步加载
+                _async_session_factory = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+    return _async_session_factory
+
+
+async def get_async_db():
+    async with get_async_session_factory()() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    """关闭异步连接池"""
+    global _async_engine, _async_session_factory
+    with _async_lock:
+        async_engine, _async_engine, _async_session_factory = _async_engine, None, None
+    if async_engine is not None:
+        await async_engine.dispose()
@@ -1,6 +1,7 @@
 from sqlalchemy import Column, Integer, String, Float, DateTime, Text
 from sqlalchemy.sql import func
 from app.core.db import Base
+from app.models.models import search_indexes
 
 class LdapUser(Base):
     """LDAP用户模型"""
@@ -15,6 +16,8 @@ class LdapUser(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     description = Column(Text, nullable=True)
+
+    __table_args__ = search_indexes('ldap_users', 'username', 'role_name', 'department_name')
     
     def to_dict(self):
         """将对象转换为字典"""
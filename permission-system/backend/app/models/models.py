@@ -1,9 +1,25 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Float, UniqueConstraint, CheckConstraint
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Float, UniqueConstraint, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from app.core.db import Base
 
+
+def search_indexes(table: str, *columns: str):
+    """列表筛选字段的搜索索引（仅PostgreSQL）
+
+    - pg_trgm GIN索引：服务包含匹配 ilike '%x%'
+    - text_pattern_ops B树索引：服务前缀匹配 like 'x%'，普通B树索引在非C排序规则下不能用于LIKE
+    精确匹配直接使用字段上已有的B树索引
+    """
+    indexes = []
+    for column in columns:
+        indexes.append(Index(f'ix_{table}_{column}_trgm', column, postgresql_using='gin',
+                             postgresql_ops={column: 'gin_trgm_ops'}).ddl_if(dialect='postgresql'))
+        indexes.append(Index(f'ix_{table}_{column}_pattern', column,
+                             postgresql_ops={column: 'text_pattern_ops'}).ddl_if(dialect='postgresql'))
+    return tuple(indexes)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -52,32 +68,36 @@ class UserRole(Base):
 class TablePermission(Base):
     __tablename__ = "table_permissions"
 
-    id = Column(Integer, primary_key=True, index=True)
-    db_name = Column(String(100), nullable=False, index=True)
-    table_name = Column(String(100), nullable=False, index=True)
-    user_name = Column(String(50), nullable=True, index=True)  # Changed here
-    role_name = Column(String(50), nullable=True, index=True)  # Changed here
+    id = Column(Integer, primary_key=True)
+    db_name = Column(String(100), nullable=False)
+    table_name = Column(String(100), nullable=False)
+    user_name = Column(String(50), nullable=True)  # Changed here
+    role_name = Column(String(50), nullable=True)  # Changed here
     create_time = Column(DateTime(timezone=True), server_default=func.now())
-    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     # 确保db_name, table_name, user_name, role_name的组合是唯一的
     __table_args__ = (
         UniqueConstraint('db_name', 'table_name', 'user_name', 'role_name', name='unique_table_permission'),
+        # 按用户/角色查询并按更新时间排序；db_name、table_name的查询由唯一约束的索引和搜索索引覆盖
+        Index('ix_table_permissions_user_name_update_time', 'user_name', 'update_time'),
+        Index('ix_table_permissions_role_name_update_time', 'role_name', 'update_time'),
+        *search_indexes('table_permissions', 'db_name', 'table_name', 'user_name', 'role_name'),
     )
 
 
 class ColumnPermission(Base):
     __tablename__ = "column_permissions"
 
-    id = Column(Integer, primary_key=True, index=True)
-    db_name = Column(String(100), nullable=False, index=True)
-    table_name = Column(String(100), nullable=False, index=True)
-    col_name = Column(String(100), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    db_name = Column(String(100), nullable=False)
+    table_name = Column(String(100), nullable=False)
+    col_name = Column(String(100), nullable=False)
     mask_type = Column(String(50), nullable=False)
-    user_name = Column(String(50), nullable=True, index=True)
-    role_name = Column(String(50), nullable=True, index=True)
+    user_name = Column(String(50), nullable=True)
+    role_name = Column(String(50), nullable=True)
     create_time = Column(DateTime(timezone=True), server_default=func.now())
-    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     # 确保mask_type的值在规定范围内
     __table_args__ = (
@@ -87,24 +107,32 @@ class ColumnPermission(Base):
         ),
         # 确保db_name, table_name, col_name, user_name, role_name的组合是唯一的
         UniqueConstraint('db_name', 'table_name', 'col_name', 'user_name', 'role_name', name='unique_column_permission'),
+        # 按用户/角色查询并按更新时间排序；db_name、table_name的查询由唯一约束的索引和搜索索引覆盖
+        Index('ix_column_permissions_user_name_update_time', 'user_name', 'update_time'),
+        Index('ix_column_permissions_role_name_update_time', 'role_name', 'update_time'),
+        *search_indexes('column_permissions', 'db_name', 'table_name', 'col_name', 'user_name', 'role_name'),
     )
 
 
 class RowPermission(Base):
     __tablename__ = "row_permissions"
 
-    id = Column(Integer, primary_key=True, index=True)
-    db_name = Column(String(100), nullable=False, index=True)
-    table_name = Column(String(100), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    db_name = Column(String(100), nullable=False)
+    table_name = Column(String(100), nullable=False)
     row_filter = Column(Text, nullable=False)
-    user_name = Column(String(50), nullable=True, index=True)
-    role_name = Column(String(50), nullable=True, index=True)
+    user_name = Column(String(50), nullable=True)
+    role_name = Column(String(50), nullable=True)
     create_time = Column(DateTime(timezone=True), server_default=func.now())
-    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    update_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     # 确保db_name, table_name, user_name, role_name的组合是唯一的
     __table_args__ = (
         UniqueConstraint('db_name', 'table_name', 'user_name', 'role_name', name='unique_row_permission'),
+        # 按用户/角色查询并按更新时间排序；db_name、table_name的查询由唯一约束的索引和搜索索引覆盖
+        Index('ix_row_permissions_user_name_update_time', 'user_name', 'update_time'),
+        Index('ix_row_permissions_role_name_update_time', 'role_name', 'update_time'),
+        *search_indexes('row_permissions', 'db_name', 'table_name', 'user_name', 'role_name'),
     )
 
 
@@ -117,6 +145,8 @@ class HdfsQuota(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = search_indexes('hdfs_quotas', 'db_name')
+
 
 class Department(Base):
     __tablename__ = "departments"
@@ -0,0 +1,131 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean, Index, text
+from sqlalchemy.sql import func
+from app.core.db import Base
+
+class SyncWatermark(Base):
+    """各权限模块增量同步的水位线
+
+    watermark之前更新过的权限记录都已成功同步到Ranger，增量同步只处理之后变更的记录
+    """
+    __tablename__ = "sync_watermarks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    module = Column(String(50), nullable=False, unique=True)
+    watermark = Column(DateTime(timezone=True), nullable=True, comment="最近一次成功同步开始时的数据库时间")
+    last_run_at = Column(DateTime(timezone=True), nullable=True)
+    last_status = Column(String(20), nullable=True)
+    last_synced = Column(Integer, nullable=True, comment="最近一次同步处理的记录数")
+    last_error = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class PermissionTombstone(Base):
+    """已删除或已修改的权限记录留下的墓碑
+
+    与权限记录的删除/修改在同一事务中写入，保存原记录的关键字段，
+    增量同步据此回收Ranger中对应的授权
+    """
+    __tablename__ = "permission_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    module = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False, comment="原权限记录的关键字段(JSON)")
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+    synced_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('ix_permission_tombstones_module_synced_at', 'module', 'synced_at'),
+    )
+
+
+class SyncOutbox(Base):
+    """权限同步发件箱
+
+    权限记录的增删改与对应的同步任务在同一事务中写入，由独立的sync-worker进程消费，
+    服务重启不会丢失同步任务
+    """
+    __tablename__ = "sync_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    module = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    action = Column(String(20), nullable=False, comment="grant/revoke/update")
+    payload = Column(Text, nullable=True, comment="回收时原权限记录的关键字段(JSON)")
+    status = Column(String(20), nullable=False, default="pending", server_default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), comment="最早可执行时间，重试时按退避推后")
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration = Column(Float, nullable=True, comment="最近一次执行耗时（秒）")
+    collapsed = Column(Integer, nullable=False, default=0, server_default="0", comment="执行前合并进来的后续变更数")
+
+    __table_args__ = (
+        Index('ix_sync_outbox_status_available_at', 'status', 'available_at'),
+        Index('ix_sync_outbox_module_record_id', 'module', 'record_id'),
+    )
+
+
+class SyncHistory(Base):
+    """同步操作历史，由SyncRecord在同步结束时批量写入，用于统计耗时分布和失败率"""
+    __tablename__ = "sync_history"
+
+    id = Column(Integer, primary_key=True, index=True)
+    module_name = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=True)
+    action = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False)
+    attempts = Column(Integer, nullable=False, default=1)
+    duration = Column(Float, nullable=False, comment="总耗时（秒），包含重试等待")
+    error_message = Column(Text, nullable=True)
+    attempt_log = Column(Text, nullable=True, comment="每次尝试的耗时与结果(JSON)")
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index('ix_sync_history_started_at', 'started_at'),
+        Index('ix_sync_history_module_action_started_at', 'module_name', 'action', 'started_at'),
+        Index('ix_sync_history_module_record_id', 'module_name', 'record_id'),
+    )
+
+
+class SyncJob(Base):
+    """全量同步任务
+
+    同步接口只创建任务并立即返回任务ID，由sync-worker执行并定期写入进度；
+    同一模块同时只允许一个待执行或执行中的任务
+    """
+    __tablename__ = "sync_job"
+
+    id = Column(Integer, primary_key=True, index=True)
+    module = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="pending", server_default="pending")
+    options = Column(Text, nullable=True, comment="同步参数(JSON)，如prune、incremental")
+    phase = Column(String(50), nullable=True, comment="当前阶段")
+    records = Column(Integer, nullable=True, comment="参与同步的记录数")
+    total = Column(Integer, nullable=True, comment="需要执行的变更数")
+    done = Column(Integer, nullable=False, default=0, server_default="0")
+    failed = Column(Integer, nullable=False, default=0, server_default="0")
+    result = Column(Text, nullable=True, comment="同步结果摘要(JSON)")
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+    created_by = Column(String(100), nullable=True)
+    worker_id = Column(String(100), nullable=True)
+    attempt = Column(Integer, nullable=False, default=0, server_default="0",
+                     comment="领取次数，任务被重新领取后原worker的进度和结果不再写入")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True, comment="执行中的worker最近一次写入进度的时间")
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # 部分唯一索引：同一模块最多一个未结束的任务
+        Index('uq_sync_job_active_module', 'module', unique=True,
+              postgresql_where=text("status IN ('pending', 'running')"),
+              sqlite_where=text("status IN ('pending', 'running')")),
+        Index('ix_sync_job_created_at', 'created_at'),
+    )
@@ -193,10 +193,15 @@ class RowPermissionOut(RowPermissionBase):
 
 # 分页响应
 class PaginatedResponse(BaseModel):
-    total: int
-    page: int
+    total: Optional[int] = None
+    # total为统计信息中的估算值时为True
+    total_estimated: bool = False
+    page: Optional[int] = None
     page_size: int
     items: List
+    # 游标分页时返回，传给cursor参数获取下一页/上一页
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
 
 # 查询过滤器
 class SortParam(BaseModel):
@@ -210,6 +215,12 @@ class TablePermissionFilter(BaseModel):
     role_name: Optional[str] = None
     page: int = 1
     page_size: int = 10
+    # 游标分页：传空字符串获取第一页，之后传上一次返回的next_cursor/prev_cursor；不传时按page分页
+    cursor: Optional[str] = None
+    # 是否返回总数，大表翻页时可关闭以省去count
+    with_total: bool = True
+    # 字符串筛选方式：contains包含（默认，不区分大小写）、prefix前缀（区分大小写）、exact精确匹配
+    match: Literal['contains', 'prefix', 'exact'] = 'contains'
     sorters: Optional[List[SortParam]] = None
     # 添加单独的排序字段和排序方向参数
     sort_field: Optional[str] = None
@@ -233,6 +244,12 @@ class ColumnPermissionFilter(BaseModel):
     role_name: Optional[str] = None
     page: int = 1
     page_size: int = 10
+    # 游标分页：传空字符串获取第一页，之后传上一次返回的next_cursor/prev_cursor；不传时按page分页
+    cursor: Optional[str] = None
+    # 是否返回总数，大表翻页时可关闭以省去count
+    with_total: bool = True
+    # 字符串筛选方式：contains包含（默认，不区分大小写）、prefix前缀（区分大小写）、exact精确匹配
+    match: Literal['contains', 'prefix', 'exact'] = 'contains'
     sorters: Optional[List[SortParam]] = None
     # 添加单独的排序字段和排序方向参数
     sort_field: Optional[str] = None
@@ -247,6 +264,12 @@ class RowPermissionFilter(BaseModel):
     role_name: Optional[str] = None
     page: int = 1
     page_size: int = 10
+    # 游标分页：传空字符串获取第一页，之后传上一次返回的next_cursor/prev_cursor；不传时按page分页
+    cursor: Optional[str] = None
+    # 是否返回总数，大表翻页时可关闭以省去count
+    with_total: bool = True
+    # 字符串筛选方式：contains包含（默认，不区分大小写）、prefix前缀（区分大小写）、exact精确匹配
+    match: Literal['contains', 'prefix', 'exact'] = 'contains'
     sorters: Optional[List[SortParam]] = None
     # 添加单独的排序字段和排序方向参数
     sort_field: Optional[str] = None
@@ -286,6 +309,12 @@ class HdfsQuotaFilter(BaseModel):
     db_name: Optional[str] = None
     page: int = 1
     page_size: int = 10
+    # 游标分页：传空字符串获取第一页，之后传上一次返回的next_cursor/prev_cursor；不传时按page分页
+    cursor: Optional[str] = None
+    # 是否返回总数，大表翻页时可关闭以省去count
+    with_total: bool = True
+    # 字符串筛选方式：contains包含（默认，不区分大小写）、prefix前缀（区分大小写）、exact精确匹配
+    match: Literal['contains', 'prefix', 'exact'] = 'contains'
     sort_field: Optional[str] = None
     sort_order: Optional[Literal['ascend', 'descend']] = None
     sorters: Optional[List[SortParam]] = None
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+from typing import Any, Dict, Optional, Tuple, Type
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 默认熔断配置，可通过CIRCUIT_BREAKER_LIMITS按依赖覆盖，例如:
+# CIRCUIT_BREAKER_LIMITS={"ldap": {"failure_threshold": 3, "reset_timeout": 60}}
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))   # 连续失败达到该次数时熔断
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))         # 熔断后经过该时间（秒）放行试探请求
+CIRCUIT_HALF_OPEN_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "1"))        # 半开状态下同时放行的试探请求数
+CIRCUIT_BREAKER_LIMITS = os.getenv("CIRCUIT_BREAKER_LIMITS", "")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 下游依赖，Ranger按服务分别熔断
+BREAKER_LDAP = "ldap"
+BREAKER_HDFS = "hdfs"
+BREAKER_HIVE = "hive"
+
+
+def ranger_breaker_name(service: Optional[str]) -> str:
+    return f"ranger:{service or 'default'}"
+
+
+class CircuitOpenError(Exception):
+    """依赖处于熔断状态，请求没有发出即失败"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"{name}熔断中，{retry_after:.0f}秒后重试")
+
+
+def is_circuit_open(error: Optional[BaseException]) -> bool:
+    """异常本身或其原因链中是否有熔断异常，同步函数通常会把底层异常包装为HTTPException"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, CircuitOpenError):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CircuitBreaker:
+    """单个下游依赖的熔断器
+
+    closed: 正常放行，连续失败达到阈值后打开；
+    open: 直接失败，不再等待连接超时和重试，经过reset_timeout后进入half_open；
+    half_open: 放行少量试探请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT, half_open_calls: int = CIRCUIT_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.probes = 0
+        self.opened_at = 0.0
+        self.opened_wall: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float:
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> None:
+        """放行一次调用，熔断中抛出CircuitOpenError"""
+        if not CIRCUIT_BREAKER_ENABLED:
+            return
+        with self._lock:
+            if self.state == STATE_OPEN:
+                wait = self.retry_after()
+                if wait > 0:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, wait)
+                self.state = STATE_HALF_OPEN
+                self.probes = 0
+                logger.info(f"[熔断] {self.name} 进入半开状态，放行试探请求")
+            if self.state == STATE_HALF_OPEN:
+                if self.probes >= self.half_open_calls:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self.probes += 1
+            self.stats["calls"] += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                logger.info(f"[熔断] {self.name} 已恢复，熔断关闭")
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.probes = 0
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.stats["failures"] += 1
+            self.failures += 1
+            if error is not None:
+                self.last_error = str(error)[:500]
+            if self.state == STATE_HALF_OPEN or (
+                    self.state == STATE_CLOSED and self.failures >= self.failure_threshold):
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+                self.opened_wall = time.time()
+                self.probes = 0
+                self.stats["opened"] += 1
+                logger.warning(f"[熔断] {self.name} 连续失败{self.failures}次，熔断{self.reset_timeout:.0f}秒: "
+                               f"{self.last_error}")
+
+    def release(self) -> None:
+        """放行的调用因与依赖无关的原因结束（如本地排队超时），归还试探名额"""
+        with self._lock:
+            if self.state == STATE_HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.probes = 0
+        logger.info(f"[熔断] {self.name} 已手动重置")
+
+    @contextlib.contextmanager
+    def guard(self, ignore: Tuple[Type[BaseException], ...] = ()):
+        """保护一次对依赖的调用
+
+        抛出异常或把outcome["ok"]置为False时记为失败；ignore中的异常与依赖健康无关，不计入结果
+        """
+        self.allow()
+        outcome = {"ok": True}
+        try:
+            yield outcome
+        except ignore:
+            self.release()
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        if outcome["ok"]:
+            self.record_success()
+        else:
+            self.record_failure(outcome.get("error"))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self.state
+            if state == STATE_OPEN and self.retry_after() <= 0:
+                # 熔断时间已过，下一次调用会作为试探请求放行
+                state = STATE_HALF_OPEN
+            return {
+                "name": self.name,
+                "state": state,
+                "consecutive_failures": self.failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "retry_after": round(self.retry_after(), 1),
+                "opened_at": self.opened_wall,
+                "last_error": self.last_error,
+                "calls": self.stats["calls"],
+                "failures": self.stats["failures"],
+                "rejected": self.stats["rejected"],
+                "opened": self.stats["opened"],
+            }
+
+
+class CircuitBreakerRegistry:
+    """按依赖名称维护熔断器"""
+
+    def __init__(self, overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.overrides = overrides or {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(name)
+                if breaker is None:
+                    # Ranger各服务可以单独配置，也可以按"ranger"统一配置
+                    options = self.overrides.get(name) or self.overrides.get(name.split(":")[0], {})
+                    breaker = self._breakers[name] = CircuitBreaker(name, **options)
+        return breaker
+
+    def find(self, name: str) -> Optional[CircuitBreaker]:
+        return self._breakers.get(name)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.snapshot() for name, breaker in sorted(self._breakers.items())}
+
+
+def _load_overrides() -> Dict[str, Dict[str, Any]]:
+    if not CIRCUIT_BREAKER_LIMITS:
+        return {}
+    try:
+        return json.loads(CIRCUIT_BREAKER_LIMITS)
+    except ValueError as e:
+        logger.error(f"[熔断] CIRCUIT_BREAKER_LIMITS配置格式错误: {e}")
+        return {}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_breaker_registry() -> CircuitBreakerRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CircuitBreakerRegistry(_load_overrides())
+    return _registry
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    return get_breaker_registry().get(name)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+COUNT_CACHE_ENABLED = os.getenv("COUNT_CACHE_ENABLED", "true").lower() == "true"
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))                   # 总数缓存时间（秒）
+COUNT_CACHE_MAX_ENTRIES = int(os.getenv("COUNT_CACHE_MAX_ENTRIES", "1000"))   # 最多缓存的过滤条件组合数
+# 无过滤条件且统计信息中的行数不少于该值时使用PostgreSQL的估算行数，-1表示不使用估算
+COUNT_ESTIMATE_THRESHOLD = int(os.getenv("COUNT_ESTIMATE_THRESHOLD", "100000"))
+
+_SESSION_KEY = "count_cache_tables"
+
+
+class CountCache:
+    """列表总数缓存
+
+    按(表名, 过滤条件)缓存count结果，过期或表有写入提交后失效。缓存在进程内，
+    其他进程（如sync-worker）的写入只能等待过期，因此TTL应保持较短
+    """
+
+    def __init__(self, ttl: float = COUNT_CACHE_TTL, max_entries: int = COUNT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, table: str, key: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get((table, key))
+            if entry is None or entry[0] <= time.monotonic():
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end((table, key))
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def set(self, table: str, key: str, value: int) -> None:
+        with self._lock:
+            self._entries[(table, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((table, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, table: str) -> None:
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == table]:
+                del self._entries[entry_key]
+            self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache: Optional[CountCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_count_cache() -> CountCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CountCache()
+    return _cache
+
+
+_ESTIMATE_SQL = text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)")
+
+
+def _valid_estimate(estimate) -> Optional[int]:
+    return int(estimate) if estimate is not None and estimate >= 0 else None
+
+
+def _active_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {key: value for key, value in (filters or {}).items() if value is not None}
+
+
+def _use_estimate(estimate: Optional[int]) -> bool:
+    return estimate is not None and estimate >= COUNT_ESTIMATE_THRESHOLD
+
+
+def _cache_key(bind, filters: Dict[str, Any]) -> str:
+    # 同一进程可能连接多个数据库，缓存键中区分连接引擎
+    return f"{id(bind)}:{json.dumps(filters, sort_keys=True, default=str, ensure_ascii=False)}"
+
+
+def estimate_rows(db: Session, table: str) -> Optional[int]:
+    """PostgreSQL统计信息中的估算行数，表未ANALYZE或不是PostgreSQL时返回None"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    try:
+        estimate = db.execute(_ESTIMATE_SQL, {"table": table}).scalar()
+    except Exception as e:
+        logger.warning(f"[总数缓存] 读取{table}估算行数失败: {e}")
+        return None
+    return _valid_estimate(estimate)
+
+
+async def estimate_rows_async(db: AsyncSession, table: str) -> Optional[int]:
+    """estimate_rows的异步版本"""
+    if db.bind.dialect.name != "postgresql":
+        return None
+    try:
+        estimate = (await db.execute(_ESTIMATE_SQL, {"table": table})).scalar()
+    except Exception as e:
+        logger.warning(f"[总数缓存] 读取{table}估算行数失败: {e}")
+        return None
+    return _valid_estimate(estimate)
+
+
+def count_rows(db: Session, query, table: str, filters: Optional[Dict[str, Any]] = None) -> Tuple[int, bool]:
+    """查询的总数，返回(总数, 是否为估算值)
+
+    无过滤条件的大表直接使用统计信息中的估算行数；其余情况执行count并按过滤条件缓存
+    """
+    filters = _active_filters(filters)
+    if not filters and COUNT_ESTIMATE_THRESHOLD >= 0:
+        estimate = estimate_rows(db, table)
+        if _use_estimate(estimate):
+            return estimate, True
+    if not COUNT_CACHE_ENABLED:
+        return query.count(), False
+    cache = get_count_cache()
+    key = _cache_key(db.get_bind(), filters)
+    total = cache.get(table, key)
+    if total is None:
+        total = query.count()
+        cache.set(table, key, total)
+    return total, False
+
+
+async def count_rows_async(db: AsyncSession, stmt, table: str,
+                           filters: Optional[Dict[str, Any]] = None) -> Tuple[int, bool]:
+    """count_rows的异步版本，stmt为select()语句，与同步查询共用同一份缓存"""
+    filters = _active_filters(filters)
+    if not filters and COUNT_ESTIMATE_THRESHOLD >= 0:
+        estimate = await estimate_rows_async(db, table)
+        if _use_estimate(estimate):
+            return estimate, True
+    count_stmt = select(func.count()).select_from(stmt.order_by(None).subquery())
+    if not COUNT_CACHE_ENABLED:
+        return await db.scalar(count_stmt), False
+    cache = get_count_cache()
+    key = _cache_key(db.bind, filters)
+    total = cache.get(table, key)
+    if total is None:
+        total = await db.scalar(count_stmt)
+        cache.set(table, key, total)
+    return total, False
+
+
+# ---------- 写入后失效 ----------
+
+def _touched(session: Session) -> set:
+    return session.info.setdefault(_SESSION_KEY, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session, flush_context):
+    tables = _touched(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            tables.add(table)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_tables(orm_execute_state):
+    # 批量INSERT/UPDATE/DELETE不经过flush，按语句的目标表记录
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _touched(orm_execute_state.session).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_tables(session):
+    tables = session.info.pop(_SESSION_KEY, None)
+    if tables and _cache is not None:
+        for table in tables:
+            _cache.invalidate(table)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_tables(session):
+    session.info.pop(_SESSION_KEY, None)
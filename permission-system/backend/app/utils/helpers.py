@@ -1,30 +1,183 @@
-from typing import Dict, Any, List, TypeVar, Generic, Optional
+import json
+import base64
+from datetime import date, datetime
+from typing import Dict, Any, List, TypeVar, Generic, Optional, Sequence, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import UniqueConstraint, and_, insert, or_, select, tuple_
 from fastapi import HTTPException, status
+from app.utils.count_cache import count_rows, count_rows_async
 from pydantic import BaseModel
 
 T = TypeVar('T')
 
-def filter_query(query, model, filters: Dict[str, Any]):
-    """根据过滤条件筛选查询"""
+# 字符串筛选的匹配方式
+MATCH_CONTAINS = "contains"   # 包含，不区分大小写，使用pg_trgm GIN索引
+MATCH_PREFIX = "prefix"       # 前缀，区分大小写，使用text_pattern_ops索引
+MATCH_EXACT = "exact"         # 精确匹配，使用普通B树索引
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def match_condition(column, value: str, match: str = MATCH_CONTAINS):
+    """字符串字段的筛选条件"""
+    if match == MATCH_EXACT:
+        return column == value
+    # 转义通配符，输入中的%和_按字面匹配；前缀匹配时整个输入都作为索引扫描的前缀
+    if match == MATCH_PREFIX:
+        return column.like(f"{_escape_like(value)}%", escape="\\")
+    return column.ilike(f"%{_escape_like(value)}%", escape="\\")
+
+def filter_query(query, model, filters: Dict[str, Any], match: str = MATCH_CONTAINS):
+    """根据过滤条件筛选查询，字符串按match指定的方式匹配"""
     for key, value in filters.items():
         if hasattr(model, key) and value is not None:
             if isinstance(value, str) and value.strip():
-                query = query.filter(getattr(model, key).ilike(f"%{value}%"))
+                query = query.filter(match_condition(getattr(model, key), value, match))
             elif value is not None:
                 query = query.filter(getattr(model, key) == value)
     return query
 
+def _sort_order(model, sorters: Optional[List[Dict[str, str]]]):
+    """解析排序参数，返回(排序字段, 是否降序)列表，忽略不存在的字段"""
+    result = []
+    for sorter in sorters or []:
+        field = sorter.get('field')
+        order = sorter.get('order')
+        if field and hasattr(model, field):
+            # 处理不同格式的排序方向参数
+            # 'descend'/'desc' 表示降序，其他情况为升序
+            result.append((field, bool(order and order.lower() in ('descend', 'desc'))))
+    return result
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """把分页位置编码为不透明的游标字符串"""
+    raw = json.dumps(payload, default=lambda value: value.isoformat(), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, dict) or "id" not in payload:
+            raise ValueError(cursor)
+        return payload
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+
+def _cursor_value(column, value):
+    """游标中的日期时间以ISO字符串保存，按列类型还原"""
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return value
+
+def _keyset_after(column, id_column, value, last_id, descending: bool):
+    """(排序列, id)位于游标之后的条件，NULL视为最大值：升序排在最后，降序排在最前"""
+    id_after = id_column < last_id if descending else id_column > last_id
+    if column is id_column:
+        return id_after
+    if value is None:
+        if descending:
+            return or_(and_(column.is_(None), id_after), column.isnot(None))
+        return and_(column.is_(None), id_after)
+    condition = or_(column < value if descending else column > value, and_(column == value, id_after))
+    if not descending:
+        condition = or_(condition, column.is_(None))
+    return condition
+
+def _keyset_order(column, id_column, descending: bool):
+    if column is id_column:
+        return [id_column.desc() if descending else id_column.asc()]
+    if descending:
+        return [column.desc().nullsfirst(), id_column.desc()]
+    return [column.asc().nullslast(), id_column.asc()]
+
+def _keyset_query(query, model, page_size: int, sorters: Optional[List[Dict[str, str]]], cursor: str):
+    """按(排序字段, id)做键集分页，返回(限定到本页的查询, 分页状态)
+
+    只用第一个排序字段，id作为稳定的次序；每页通过WHERE定位到游标之后再LIMIT，
+    不需要跳过前面的记录，任意一页的代价与第一页相同。
+    cursor传空字符串表示第一页。query可以是Query或select()语句
+    """
+    order = _sort_order(model, sorters)
+    field, descending = order[0] if order else ('id', False)
+    column = getattr(model, field)
+    id_column = model.id
+
+    backward = False
+    if cursor:
+        payload = decode_cursor(cursor)
+        if payload.get("f") != field or bool(payload.get("d")) != descending:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="分页游标与排序条件不匹配，请从第一页重新查询")
+        backward = bool(payload.get("b"))
+        # 向前翻页时按相反方向查询，再把结果倒回原来的顺序
+        query = query.filter(_keyset_after(column, id_column, _cursor_value(column, payload.get("v")),
+                                           payload["id"], descending != backward))
+
+    query = query.order_by(*_keyset_order(column, id_column, descending != backward)).limit(page_size + 1)
+    return query, (field, descending, backward)
+
+def _keyset_items(rows, page_size: int, cursor: str, keyset: Tuple[str, bool, bool]):
+    """由_keyset_query查出的记录得到本页数据和前后页游标"""
+    field, descending, backward = keyset
+    has_more = len(rows) > page_size
+    items = list(rows[:page_size])
+    if backward:
+        items.reverse()
+
+    def cursor_of(item, backward_cursor):
+        return encode_cursor({"f": field, "d": descending, "v": getattr(item, field), "id": item.id,
+                              "b": backward_cursor})
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_more or backward:
+            next_cursor = cursor_of(items[-1], False)
+        if (has_more and backward) or (cursor and not backward):
+            prev_cursor = cursor_of(items[0], True)
+    return items, next_cursor, prev_cursor
+
+def _offset_query(query, model, page: int, page_size: int, sorters: Optional[List[Dict[str, str]]]):
+    for field, descending in _sort_order(model, sorters):
+        column_to_sort = getattr(model, field)
+        query = query.order_by(column_to_sort.desc() if descending else column_to_sort.asc())
+    return query.offset((page - 1) * page_size).limit(page_size)
+
+def _page_result(total, estimated: bool, page, page_size: int, items, next_cursor=None, prev_cursor=None):
+    return {
+        "total": total,
+        "total_estimated": estimated,
+        "page": page,
+        "page_size": page_size,
+        "items": items,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    }
+
 def get_paginated_results(
     db: Session, 
     model: Any, 
     page: int = 1, 
     page_size: int = 10, 
     filters: Optional[Dict[str, Any]] = None,
-    sorters: Optional[List[Dict[str, str]]] = None
+    sorters: Optional[List[Dict[str, str]]] = None,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+    match: str = MATCH_CONTAINS
 ):
-    """获取分页结果，支持过滤和排序"""
+    """获取分页结果，支持过滤和排序
+
+    cursor不为None时使用游标分页，返回next_cursor/prev_cursor，page为None；
+    with_total为False时不执行count，total为None；total_estimated表示total是否为估算值
+    """
     if page <= 0:
         page = 1
     if page_size <= 0:
@@ -33,34 +186,53 @@ def get_paginated_results(
     query = db.query(model)
     
     if filters:
-        query = filter_query(query, model, filters)
-
-    # Sorting logic
-    if sorters:
-        for sorter in sorters:
-            field = sorter.get('field')
-            order = sorter.get('order')
-            if field and hasattr(model, field):
-                column_to_sort = getattr(model, field)
-                # 处理不同格式的排序方向参数
-                # 'descend'/'desc' 表示降序，其他情况为升序
-                if order and (order.lower() == 'descend' or order.lower() == 'desc'):
-                    query = query.order_by(column_to_sort.desc())
-                else:
-                    query = query.order_by(column_to_sort.asc())
-    
-    # 计算总数
-    total = query.count()
-    
-    # 分页查询
-    items = query.offset((page - 1) * page_size).limit(page_size).all()
-    
-    return {
-        "total": total,
-        "page": page,
-        "page_size": page_size,
-        "items": items
-    }
+        query = filter_query(query, model, filters, match)
+
+    # 计算总数，按过滤条件和匹配方式缓存，无过滤条件的大表使用估算值
+    count_key = dict(filters, match=match) if filters else None
+    total, estimated = count_rows(db, query, model.__tablename__, count_key) if with_total else (None, False)
+
+    if cursor is not None:
+        query, keyset = _keyset_query(query, model, page_size, sorters, cursor)
+        return _page_result(total, estimated, None, page_size, *_keyset_items(query.all(), page_size, cursor, keyset))
+
+    # 排序并分页查询
+    items = _offset_query(query, model, page, page_size, sorters).all()
+    return _page_result(total, estimated, page, page_size, items)
+
+async def get_paginated_results_async(
+    db: AsyncSession,
+    model: Any,
+    page: int = 1,
+    page_size: int = 10,
+    filters: Optional[Dict[str, Any]] = None,
+    sorters: Optional[List[Dict[str, str]]] = None,
+    cursor: Optional[str] = None,
+    with_total: bool = True,
+    match: str = MATCH_CONTAINS
+):
+    """get_paginated_results的异步版本，参数和返回值相同，供只读接口使用"""
+    if page <= 0:
+        page = 1
+    if page_size <= 0:
+        page_size = 10
+
+    stmt = select(model)
+
+    if filters:
+        stmt = filter_query(stmt, model, filters, match)
+
+    count_key = dict(filters, match=match) if filters else None
+    total, estimated = (await count_rows_async(db, stmt, model.__tablename__, count_key)
+                        if with_total else (None, False))
+
+    if cursor is not None:
+        stmt, keyset = _keyset_query(stmt, model, page_size, sorters, cursor)
+        rows = (await db.scalars(stmt)).all()
+        return _page_result(total, estimated, None, page_size, *_keyset_items(rows, page_size, cursor, keyset))
+
+    items = (await db.scalars(_offset_query(stmt, model, page, page_size, sorters))).all()
+    return _page_result(total, estimated, page, page_size, list(items))
 
 def check_unique_constraint(
     db: Session, 
@@ -88,14 +260,136 @@ def check_unique_constraint(
         return True
     return False
 
-def create_item(db: Session, model, data):
-    """通用创建记录函数"""
+def create_item(db: Session, model, data, commit: bool = True):
+    """通用创建记录函数
+
+    commit为False时只flush获取主键，由调用方在同一事务中写入其他数据后再提交
+    """
     db_item = model(**data)
     db.add(db_item)
+    if not commit:
+        db.flush()
+        return db_item
     db.commit()
     db.refresh(db_item)
     return db_item
 
+# 按唯一键查询已有记录时每条SQL携带的键数量，避免超出数据库的参数个数限制
+BULK_KEY_CHUNK_SIZE = 1000
+
+def unique_key_fields(model) -> Tuple[str, ...]:
+    """模型唯一约束中的字段，即记录的自然键"""
+    for constraint in model.__table__.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            return tuple(column.name for column in constraint.columns)
+    return ()
+
+def constraint_key(data: Dict[str, Any], key_fields: Sequence[str]) -> Tuple[Tuple[str, Any], ...]:
+    """记录的查重键，与check_unique_constraint的比较方式一致：值为None的字段不参与比较"""
+    return tuple((field, data.get(field)) for field in key_fields if data.get(field) is not None)
+
+def find_existing_keys(
+    db: Session,
+    model: Any,
+    keys: Sequence[Tuple[Tuple[str, Any], ...]],
+    chunk_size: int = BULK_KEY_CHUNK_SIZE
+) -> Set[Tuple[Tuple[str, Any], ...]]:
+    """批量执行check_unique_constraint，返回表中已有匹配记录的查重键
+
+    查重键按参与比较的字段分组，每组每chunk_size个键一次查询
+    """
+    groups: Dict[Tuple[str, ...], List[Tuple[Any, ...]]] = {}
+    for key in set(keys):
+        groups.setdefault(tuple(field for field, _ in key), []).append(tuple(value for _, value in key))
+    existing = set()
+    for fields, values in groups.items():
+        if not fields:
+            # 所有字段都为None时check_unique_constraint不带条件，表中有任何记录即视为重复
+            if db.query(model.id).first() is not None:
+                existing.add(())
+            continue
+        columns = [getattr(model, field) for field in fields]
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            rows = db.query(*columns).filter(tuple_(*columns).in_(chunk)).distinct().all()
+            existing.update(tuple(zip(fields, row)) for row in rows)
+    return existing
+
+def _insert_ignore_conflicts(db: Session, model):
+    """INSERT ... ON CONFLICT DO NOTHING，并发写入了相同记录时跳过而不是使整批失败"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing()
+
+def bulk_create_items(
+    db: Session,
+    model: Any,
+    rows: Sequence[Tuple[int, Dict[str, Any]]],
+    duplicate_error: str,
+    key_fields: Optional[Sequence[str]] = None
+) -> Tuple[List[Tuple[int, Any]], List[Dict[str, Any]]]:
+    """批量创建记录
+
+    rows为(序号, 数据)列表。key_fields为调用方单条创建时传给check_unique_constraint的字段，
+    批量数据内部的重复和表中已有的重复都按相同的字段和None处理方式检查，批量与单条创建接受的记录一致。
+    表中已有记录每组字段只查询一次，剩余记录用一条多行INSERT写入并通过RETURNING取回，
+    不逐条提交和刷新。返回(已创建的(序号, 记录)列表, 按序号的错误列表)，由调用方提交事务。
+    """
+    key_fields = tuple(key_fields or unique_key_fields(model))
+
+    def key_of(data):
+        return tuple(data.get(field) for field in key_fields)
+
+    def error_of(index, data, message):
+        details = ", ".join(f"{field}='{data.get(field)}'" for field in key_fields if data.get(field) is not None)
+        return {"index": index, "error": f"{message}: ({details})", "data": data}
+
+    keys = {index: constraint_key(data, key_fields) for index, data in rows}
+    patterns = {tuple(field for field, _ in key) for key in keys.values()}
+    errors = []
+    # 已接受记录在各组字段上的取值 -> 序号；取值为None的字段不会被等值条件匹配，不登记
+    accepted = {}
+    candidates = []
+    for index, data in rows:
+        if keys[index] in accepted:
+            errors.append(error_of(index, data, f"与第{accepted[keys[index]]}条数据重复"))
+            continue
+        for fields in patterns:
+            if all(data.get(field) is not None for field in fields):
+                accepted.setdefault(tuple((field, data[field]) for field in fields), index)
+        candidates.append((index, data))
+
+    existing = find_existing_keys(db, model, [keys[index] for index, _ in candidates]) if candidates else set()
+    to_insert = []
+    for index, data in candidates:
+        if keys[index] in existing:
+            errors.append(error_of(index, data, duplicate_error))
+        else:
+            to_insert.append((index, data))
+    if not to_insert:
+        errors.sort(key=lambda error: error["index"])
+        return [], errors
+
+    # render_nulls使含None字段的记录与其他记录合并到同一条多行INSERT中，而不是按字段分组执行
+    stmt = _insert_ignore_conflicts(db, model).returning(model)
+    items = db.scalars(stmt, [data for _, data in to_insert], execution_options={"render_nulls": True}).all()
+    inserted = {key_of({field: getattr(item, field) for field in key_fields}): item for item in items}
+    created = []
+    for index, data in to_insert:
+        item = inserted.get(key_of(data))
+        if item is None:
+            # 检查之后被并发请求写入了相同记录
+            errors.append(error_of(index, data, duplicate_error))
+        else:
+            created.append((index, item))
+    errors.sort(key=lambda error: error["index"])
+    return created, errors
+
 def update_item(db: Session, model, id: int, data: Dict[str, Any]):
     """通用更新记录函数"""
     db_item = db.query(model).filter(model.id == id).first()
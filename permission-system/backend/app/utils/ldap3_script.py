@@ -5,12 +5,14 @@ from ldap3 import Server, Connection, ALL, MODIFY_REPLACE, MODIFY_ADD, MODIFY_DE
 from ldap3.core.exceptions import LDAPException
 # from youcash_hash import youcash_hash
 from .youcash_ranger_v2 import run as delete_strategy
+from .circuit_breaker import BREAKER_LDAP, get_breaker
 
 # 从环境变量中获取LDAP配置
 import os
 LDAP_SERVER = os.getenv("LDAP_SERVER", "").split(",") if os.getenv("LDAP_SERVER") else []
 USER_DN = os.getenv("LDAP_USER_DN", "")
 DEFAULT_PASSWORD = os.getenv("LDAP_DEFAULT_PASSWORD", "")
+LDAP_CONNECT_TIMEOUT = int(os.getenv("LDAP_CONNECT_TIMEOUT", "5"))  # 单个LDAP服务器的连接超时（秒）
 
 import logging
 logger = logging.getLogger(__name__)
@@ -24,15 +26,21 @@ class LDAPConnection:
         self.connection = self.connect()
 
     def connect(self):
+        # 所有LDAP服务器都不可用时熔断，后续请求直接失败，不再逐个等待连接超时
+        breaker = get_breaker(BREAKER_LDAP)
+        breaker.allow()
         for server_address in self.servers:
             try:
-                server = Server(server_address, get_info=ALL)
+                server = Server(server_address, get_info=ALL, connect_timeout=LDAP_CONNECT_TIMEOUT)
                 connection = Connection(server, user=self.user_dn, password=self.password, auto_bind=True)
                 logger.info(f"Connected to {server_address}")
+                breaker.record_success()
                 return connection
             except Exception:
                 logger.warning(f"Failed to connect to {server_address}")
-        raise Exception("Failed to connect to any LDAP server")
+        error = Exception("Failed to connect to any LDAP server")
+        breaker.record_failure(error)
+        raise error
 
 class LDAPOperations:
     def __init__(self, connection):
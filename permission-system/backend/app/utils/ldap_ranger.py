@@ -3,6 +3,7 @@ import subprocess
 import os
 from .youcash_ranger_v2 import run as ranger_run
 from .ldap3_script import run as ldap_run
+from .circuit_breaker import BREAKER_HIVE, CircuitOpenError, get_breaker
 from pyhive import hive
 from app.core.config import DATABASE_URL
 
@@ -134,13 +135,18 @@ class HiveOperation:
 
     def execute_sql(self, sql):
         try:
-            with hive.Connection(host=self.host, port=self.port, username=self.username, password=self.password, auth='LDAP') as conn:
+            # 只有建立连接失败计入HiveServer2熔断，SQL本身的错误不计入
+            with get_breaker(BREAKER_HIVE).guard():
+                conn = hive.Connection(host=self.host, port=self.port, username=self.username, password=self.password, auth='LDAP')
+            with conn:
                 with conn.cursor() as cursor:
                     logger.info(f"开始执行sql:[{sql}]")
                     cursor.execute(sql)
                     logger.info(f"执行sql:[{sql}]成功")
-        except Exception:
-            logger.warning(f"Failed to connect to {server_address}")
+        except CircuitOpenError as e:
+            logger.warning(f"跳过执行sql:[{sql}]: {e}")
+        except Exception as e:
+            logger.warning(f"Failed to execute sql on {self.host}:{self.port}: {e}")
 
 def init_parse():
     parser = argparse.ArgumentParser(description='LDAP and Ranger Manager')
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from .ranger_transport import (
+    RANGER_URL, RANGER_USER, RANGER_PASSWORD, RANGER_CONNECT_TIMEOUT, RANGER_READ_TIMEOUT,
+)
+from .ranger_snapshot import RANGER_POLICY_PAGE_SIZE
+from .circuit_breaker import get_breaker, ranger_breaker_name
+from .ranger_limiter import (
+    RANGER_LIMITER_ENABLED, RangerLimitTimeout, detect_service, get_limiter_registry, is_overload_status,
+)
+from .ranger_reconcile import (
+    DESIRED_BUILDERS, SERVICES, CATALOGS, PolicySetView, compute_plan, reconcile_result,
+)
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 异步客户端的最大连接数，以及单次对账中并发执行的Ranger请求上限
+RANGER_ASYNC_MAX_CONNECTIONS = int(os.getenv("RANGER_ASYNC_MAX_CONNECTIONS", "100"))
+RANGER_ASYNC_CONCURRENCY = int(os.getenv("RANGER_ASYNC_CONCURRENCY", "20"))
+# 期望策略不超过该数量时按策略名逐个查询，否则按服务分页全量下载
+RANGER_ASYNC_NAME_LOOKUP_LIMIT = int(os.getenv("RANGER_ASYNC_NAME_LOOKUP_LIMIT", "50"))
+
+URI_BASE = "service/public/v2/api"
+
+
+class RangerAsyncError(Exception):
+    """异步Ranger请求返回了非预期的状态码"""
+
+    def __init__(self, method: str, path: str, status_code: int, message: str):
+        self.method = method
+        self.path = path
+        self.status_code = status_code
+        super().__init__(f"{method} {path} 返回{status_code}: {message}")
+
+
+class AsyncRangerClient:
+    """基于httpx的异步Ranger客户端
+
+    覆盖RangerPolicyManager与RangerRoleManager用到的接口，返回值均为普通dict/list。
+    与同步RangerClient不同，按名称查询不存在的策略/角色时返回None而不是抛异常。
+    """
+
+    def __init__(self, url: str = RANGER_URL, auth: Optional[Tuple[str, str]] = None,
+                 connect_timeout: float = RANGER_CONNECT_TIMEOUT, read_timeout: float = RANGER_READ_TIMEOUT,
+                 max_connections: int = RANGER_ASYNC_MAX_CONNECTIONS, transport=None, limiters=None):
+        self.url = url.rstrip("/")
+        # 与同步会话共用按服务的限流器，保证两条路径合计不超过Ranger的承受能力
+        self.limiters = limiters if limiters is not None else (
+            get_limiter_registry() if RANGER_LIMITER_ENABLED else None)
+        self.http = httpx.AsyncClient(
+            base_url=self.url,
+            auth=auth if auth is not None else (RANGER_USER, RANGER_PASSWORD),
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    async def _call(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                    body: Any = None, allow_404: bool = False):
+        service = detect_service(f"/{path}", body)
+        # 与同步会话共用按服务的熔断器
+        with get_breaker(ranger_breaker_name(service)).guard(ignore=(RangerLimitTimeout,)) as health:
+            if self.limiters is None:
+                response = await self.http.request(method, f"/{path}", params=params, json=body)
+            else:
+                async with self.limiters.get(service).async_slot() as outcome:
+                    response = await self.http.request(method, f"/{path}", params=params, json=body)
+                    outcome["ok"] = not is_overload_status(response.status_code)
+            if is_overload_status(response.status_code):
+                health["ok"] = False
+                health["error"] = f"HTTP {response.status_code}"
+        if response.status_code == 404 and allow_404:
+            return None
+        if response.status_code >= 400:
+            raise RangerAsyncError(method, path, response.status_code, response.text[:500])
+        if response.status_code == 204 or not response.content:
+            return None
+        return response.json()
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    # ---------- 服务与策略 ----------
+
+    async def get_service(self, service: str) -> Optional[Dict[str, Any]]:
+        return await self._call("GET", f"{URI_BASE}/service/name/{service}", allow_404=True)
+
+    async def get_policy(self, service: str, name: str) -> Optional[Dict[str, Any]]:
+        return await self._call("GET", f"{URI_BASE}/service/{service}/policy/{name}", allow_404=True)
+
+    async def get_policy_by_id(self, policy_id: int) -> Optional[Dict[str, Any]]:
+        return await self._call("GET", f"{URI_BASE}/policy/{policy_id}", allow_404=True)
+
+    async def get_policies_in_service(self, service: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return await self._call("GET", f"{URI_BASE}/service/{service}/policy", params=params) or []
+
+    async def get_all_policies_in_service(self, service: str, page_size: int = RANGER_POLICY_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """分页下载服务下的全部策略"""
+        policies = []
+        start_index = 0
+        while True:
+            page = await self.get_policies_in_service(service, {"startIndex": start_index, "pageSize": page_size})
+            policies.extend(page)
+            if len(page) < page_size:
+                return policies
+            start_index += len(page)
+
+    async def find_policies(self, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return await self._call("GET", f"{URI_BASE}/policy", params=filters) or []
+
+    async def find_policies_by_entity(self, services: Iterable[str], entity_type: str, entity_value: str) -> List[Dict[str, Any]]:
+        """按用户/用户组/角色查询各服务下的策略，各服务并发查询"""
+        results = await asyncio.gather(*(
+            self.get_policies_in_service(service, {entity_type: entity_value}) for service in services
+        ))
+        return [policy for policies in results for policy in policies]
+
+    async def create_policy(self, policy: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("POST", f"{URI_BASE}/policy", body=policy)
+
+    async def update_policy_by_id(self, policy_id: int, policy: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("PUT", f"{URI_BASE}/policy/{policy_id}", body=policy)
+
+    async def delete_policy_by_id(self, policy_id: int) -> None:
+        await self._call("DELETE", f"{URI_BASE}/policy/{policy_id}")
+
+    # ---------- 角色 ----------
+
+    async def get_role(self, role_name: str, exec_user: str, service: str) -> Optional[Dict[str, Any]]:
+        return await self._call("GET", f"{URI_BASE}/roles/name/{role_name}",
+                                params={"execUser": exec_user, "serviceName": service}, allow_404=True)
+
+    async def find_roles(self, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return await self._call("GET", f"{URI_BASE}/roles", params=filters) or []
+
+    async def search_roles_with_user(self, user_name: str) -> List[Dict[str, Any]]:
+        return await self.find_roles({"userName": user_name})
+
+    async def get_user_roles(self, user_name: str) -> List[str]:
+        return await self._call("GET", f"{URI_BASE}/roles/user/{user_name}") or []
+
+    async def create_role(self, service: str, role: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("POST", f"{URI_BASE}/roles", params={"serviceName": service}, body=role)
+
+    async def update_role(self, role_id: int, role: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("PUT", f"{URI_BASE}/roles/{role_id}", body=role)
+
+    async def delete_role_by_id(self, role_id: int) -> None:
+        await self._call("DELETE", f"{URI_BASE}/roles/{role_id}")
+
+
+_clients: Dict[int, AsyncRangerClient] = {}
+
+
+def get_async_ranger_client() -> AsyncRangerClient:
+    """获取当前事件循环共享的异步客户端
+
+    httpx的连接池绑定在创建它的事件循环上，因此按事件循环分别缓存
+    """
+    loop_id = id(asyncio.get_running_loop())
+    client = _clients.get(loop_id)
+    if client is None:
+        client = _clients[loop_id] = AsyncRangerClient()
+    return client
+
+
+async def close_async_ranger_client() -> None:
+    client = _clients.pop(id(asyncio.get_running_loop()), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _bounded(semaphore: asyncio.Semaphore, coro):
+    async with semaphore:
+        return await coro
+
+
+async def async_reconcile(kind: str, perms, client: AsyncRangerClient, prune: bool = False,
+                          services=SERVICES, catalogs=CATALOGS,
+                          concurrency: int = RANGER_ASYNC_CONCURRENCY) -> Dict[str, Any]:
+    """reconcile的异步版本，所有Ranger请求在事件循环上并发执行，不占用线程"""
+    started = time.time()
+    semaphore = asyncio.Semaphore(concurrency)
+    desired = DESIRED_BUILDERS[kind](perms, services, catalogs)
+
+    if prune or len(desired) > RANGER_ASYNC_NAME_LOOKUP_LIMIT:
+        pages = await asyncio.gather(*(
+            _bounded(semaphore, client.get_all_policies_in_service(service)) for service in services
+        ))
+        current = [policy for page in pages for policy in page]
+    else:
+        found = await asyncio.gather(*(
+            _bounded(semaphore, client.get_policy(service, name)) for service, name in desired
+        ))
+        current = [policy for policy in found if policy]
+
+    plan = compute_plan(desired, PolicySetView(current), prune=prune, kind=kind)
+    logger.info(f"[权限对账] 异步{kind}权限期望策略{len(desired)}条, 计划: {plan.summary()}")
+
+    async def apply(action):
+        if action["op"] == "create":
+            await client.create_policy(action["policy"])
+        elif action["op"] == "update":
+            await client.update_policy_by_id(action["policy_id"], action["policy"])
+        else:
+            await client.delete_policy_by_id(action["policy_id"])
+
+    actions = plan.actions
+    outcomes = await asyncio.gather(*(_bounded(semaphore, apply(action)) for action in actions),
+                                    return_exceptions=True)
+    done = {"create": 0, "update": 0, "delete": 0}
+    errors = []
+    for action, outcome in zip(actions, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"[权限对账] {action['op']} service:[{action['service']}] policy_name:[{action['name']}] 失败: {outcome}")
+            errors.append({
+                "op": action["op"],
+                "service": action["service"],
+                "name": action["name"],
+                "record_ids": action["record_ids"],
+                "error": str(outcome),
+            })
+        else:
+            done[action["op"]] += 1
+
+    if actions:
+        _invalidate_policy_cache(actions)
+    return reconcile_result(plan, {"applied": done, "errors": errors}, started)
+
+
+def _invalidate_policy_cache(actions: List[Dict[str, Any]]) -> None:
+    """异步路径绕过了同步快照，写入后让同步快照重新检查版本"""
+    from .youcash_ranger_v2 import get_ranger_manager
+    policy_manager = get_ranger_manager().policy
+    if policy_manager.policy_cache is not None:
+        for service in {action["service"] for action in actions}:
+            policy_manager.policy_cache.invalidate(service)
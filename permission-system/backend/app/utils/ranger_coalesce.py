@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .circuit_breaker import is_circuit_open
+from .ranger_fanout import get_fanout_executor
+from .ranger_limiter import ranger_service_context
+from .ranger_transport import count_ranger_calls
+from .ranger_reconcile import (
+    DESIRED_BUILDERS, ITEM_KEYS, SERVICES, CATALOGS, DesiredPolicy,
+    current_grants, is_covered, item_signature,
+)
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 合并窗口（秒）：窗口内针对同一策略的授权/回收合并为一次写入
+RANGER_COALESCE_WINDOW = float(os.getenv("RANGER_COALESCE_WINDOW", "0.5"))
+
+ACTION_GRANT = "grant"
+ACTION_REVOKE = "revoke"
+
+
+class CoalescedWrite:
+    """一次提交的写意图的结果句柄，flush完成后可获取执行结果"""
+
+    def __init__(self, record_id: Optional[int]):
+        self.record_id = record_id
+        self.errors: List[str] = []
+        self.circuit_open = 0
+        self._done = threading.Event()
+
+    def resolve(self, error: Optional[str] = None, circuit_open: bool = False) -> None:
+        if error:
+            self.errors.append(error)
+            self.circuit_open += circuit_open
+
+    @property
+    def deferred(self) -> bool:
+        """失败全部由依赖熔断导致，请求没有发出"""
+        return bool(self.errors) and self.circuit_open == len(self.errors)
+
+    def finish(self) -> None:
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待flush完成，返回是否全部成功"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"等待策略写入超时: ID={self.record_id}")
+        return not self.errors
+
+
+class _PendingPolicy:
+    """同一(服务, 策略名)下待合并的授权与回收"""
+
+    def __init__(self, template: DesiredPolicy):
+        self.template = template
+        self.grants: Set[Tuple[Any, str, str]] = set()
+        self.revokes: Set[Tuple[Any, str, str]] = set()
+        self.handles: List[CoalescedWrite] = []
+        self.intents = 0
+
+
+def fold_policy(policy: Optional[Dict[str, Any]], template: DesiredPolicy,
+                grants: Set[Tuple[Any, str, str]], revokes: Set[Tuple[Any, str, str]]):
+    """把一组授权和回收折叠到同一份策略文档上
+
+    返回(操作, 策略)，操作为create/update/delete，无需变更时为None
+    """
+    if policy is None:
+        grants = grants - revokes
+        if not grants:
+            return None, None
+        template.grants = grants
+        return "create", template.render_policy()
+
+    item_key = ITEM_KEYS[template.policy_type]
+    items = list(policy.get(item_key) or [])
+    changed = False
+
+    # 回收：与逐条revoke一致，从签名匹配的条目中移除实体，空条目整体删除
+    if revokes:
+        kept = []
+        for item in items:
+            signature = item_signature(template.policy_type, item)
+            for entity_type in ("user", "group", "role"):
+                values = item.get(entity_type + "s") or []
+                remaining = [v for v in values if (signature, entity_type, v) not in revokes]
+                if len(remaining) != len(values):
+                    item[entity_type + "s"] = remaining
+                    changed = True
+            if item.get("users") or item.get("groups") or item.get("roles"):
+                kept.append(item)
+        emptied = not kept and bool(items)
+        items = kept
+
+    # 授权：只补齐尚未覆盖的授权，新增条目放在最前面
+    existing = current_grants({item_key: items}, template.policy_type)
+    missing = {g for g in grants - revokes if not is_covered(template.policy_type, g, existing)}
+    # 回收后没有剩余条目且没有新授权时删除策略；更新时旧授权被新授权替换，仍是一次update
+    if revokes and emptied and not missing:
+        return "delete", policy
+    if missing:
+        items = template.render_items(missing) + items
+        changed = True
+
+    if not changed:
+        return None, policy
+    policy[item_key] = items
+    return "update", policy
+
+
+class PolicyWriteCoalescer:
+    """Ranger写入合并器
+
+    按(服务, 策略名)归并窗口内的授权/回收意图，每个策略在一次flush中只读一次快照、
+    只写一次，避免批量导入时对同一策略的重复读写和相互覆盖。
+    """
+
+    def __init__(self, manager_factory=None, window: float = RANGER_COALESCE_WINDOW,
+                 services=SERVICES, catalogs=CATALOGS):
+        self.manager_factory = manager_factory
+        self.window = window
+        self.services = services
+        self.catalogs = catalogs
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], _PendingPolicy] = {}
+        self._timer: Optional[threading.Timer] = None
+        self.stats = {"intents": 0, "writes": 0, "flushes": 0}
+
+    def _manager(self):
+        if self.manager_factory is not None:
+            return self.manager_factory()
+        from .youcash_ranger_v2 import get_ranger_manager
+        return get_ranger_manager()
+
+    def submit(self, kind: str, record, action: str = ACTION_GRANT) -> CoalescedWrite:
+        """提交一条权限记录的授权或回收意图，由后台定时flush统一写入"""
+        handle = CoalescedWrite(getattr(record, "id", None))
+        desired = DESIRED_BUILDERS[kind]([record], self.services, self.catalogs)
+        with self._lock:
+            for key, policy in desired.items():
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = _PendingPolicy(
+                        DesiredPolicy(policy.service, policy.catalog, policy.name, policy.policy_type,
+                                      policy.database, policy.table, policy.column))
+                target = pending.grants if action == ACTION_GRANT else pending.revokes
+                opposite = pending.revokes if action == ACTION_GRANT else pending.grants
+                # 窗口内后到的意图覆盖先到的相反意图
+                opposite -= policy.grants
+                target |= policy.grants
+                pending.template.record_ids |= policy.record_ids
+                pending.handles.append(handle)
+                pending.intents += 1
+            self.stats["intents"] += 1
+            # window为None时不自动flush，由调用方显式调用flush
+            if self._timer is None and self.window is not None and self.window > 0:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if self.window is not None and self.window <= 0:
+            self.flush()
+        return handle
+
+    def _write(self, policy_manager, key: Tuple[str, str], item: "_PendingPolicy") -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """把一个策略上归并后的意图写入Ranger，返回(是否发生写入, 错误信息)"""
+        service, name = key
+        try:
+            current = policy_manager.get_existing_policy(service, name)
+            op, policy = fold_policy(current, item.template, item.grants, item.revokes)
+            if op == "create":
+                policy_manager.create_policy(policy)
+            elif op == "update":
+                policy_manager.update_policy_by_id(policy["id"], policy)
+            elif op == "delete":
+                policy_manager.delete_policy_by_id(policy["id"], raise_error=True)
+            logger.info(f"[策略合并] service:[{service}] policy_name:[{name}] 合并{item.intents}个意图, 操作={op}")
+            return bool(op), None
+        except Exception as e:
+            error = f"service:[{service}] policy_name:[{name}] 写入失败: {e}"
+            logger.error(f"[策略合并] {error}")
+            for handle in item.handles:
+                handle.resolve(error, is_circuit_open(e))
+            return False, {"service": service, "name": name, "record_ids": sorted(item.template.record_ids),
+                           "error": str(e), "circuit_open": is_circuit_open(e)}
+
+    def _write_group(self, policy_manager, items: List[Tuple[Tuple[str, str], "_PendingPolicy"]]):
+        writes = 0
+        errors = []
+        with ranger_service_context(items[0][0][0]):
+            for key, item in items:
+                wrote, error = self._write(policy_manager, key, item)
+                writes += wrote
+                if error:
+                    errors.append(error)
+        return writes, errors
+
+    def flush(self, parallel: bool = False) -> Dict[str, Any]:
+        """执行当前窗口内的所有写意图，每个策略最多一次写入
+
+        parallel=True时按(服务, catalog)目标分组，各目标在共享线程池上并发写入，目标内按顺序写入
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return {"policies": 0, "writes": 0, "errors": []}
+
+        started = time.time()
+        groups: Dict[Tuple[str, Optional[str]], List] = {}
+        for key, item in pending.items():
+            target = (key[0], item.template.catalog) if parallel else (key[0], None)
+            groups.setdefault(target, []).append((key, item))
+        writes = 0
+        errors = []
+        try:
+            with self._flush_lock:
+                policy_manager = self._manager().policy
+                if parallel and len(groups) > 1:
+                    executor = get_fanout_executor()
+                    # 线程池在提交方上下文的副本中执行任务，请求计数等上下文变量同样生效
+                    futures = [executor.submit(self._write_group, policy_manager, items) for items in groups.values()]
+                    outcomes = [future.result() for future in futures]
+                else:
+                    outcomes = [self._write_group(policy_manager, items) for items in groups.values()]
+                for group_writes, group_errors in outcomes:
+                    writes += group_writes
+                    errors.extend(group_errors)
+        except Exception as e:
+            logger.error(f"[策略合并] flush失败: {e}")
+            for item in pending.values():
+                for handle in item.handles:
+                    handle.resolve(str(e), is_circuit_open(e))
+            raise
+        finally:
+            # 无论成功与否都要唤醒等待方
+            handles = {id(h): h for item in pending.values() for h in item.handles}
+            for handle in handles.values():
+                handle.finish()
+        with self._lock:
+            self.stats["writes"] += writes
+            self.stats["flushes"] += 1
+        logger.info(f"[策略合并] flush完成: 策略{len(pending)}个, 写入{writes}次, 失败{len(errors)}个, "
+                    f"耗时={time.time() - started:.2f}秒")
+        return {"policies": len(pending), "writes": writes, "errors": errors}
+
+
+def sync_records(kind: str, records, manager=None) -> Dict[str, Any]:
+    """只同步给定的权限记录
+
+    同一策略上的授权合并为一次写入，不同(服务, catalog)目标并发执行，
+    返回写入次数以及实际发出的Ranger请求数
+    """
+    started = time.time()
+    coalescer = PolicyWriteCoalescer(manager_factory=(lambda: manager) if manager is not None else None, window=None)
+    for record in records:
+        coalescer.submit(kind, record)
+    with count_ranger_calls() as counter:
+        result = coalescer.flush(parallel=True)
+    failed_ids = sorted({record_id for error in result["errors"] for record_id in error["record_ids"]})
+    return {
+        "records": len(records),
+        "policies": result["policies"],
+        "writes": result["writes"],
+        "ranger_calls": counter.calls,
+        "failed_ids": failed_ids,
+        "errors": result["errors"],
+        "duration": round(time.time() - started, 3),
+    }
+
+
+def sync_update(kind: str, old_record, record, manager=None) -> Dict[str, Any]:
+    """把一条权限记录的授权从旧值更新为新值
+
+    回收旧值与授予新值在同一次flush中折叠，每个受影响的策略只读写一次，
+    例如只修改用户时同一策略上一次update完成替换，不会出现旧授权已回收、新授权尚未写入的空窗；
+    old_record为None时只授予新值
+    """
+    started = time.time()
+    coalescer = PolicyWriteCoalescer(manager_factory=(lambda: manager) if manager is not None else None, window=None)
+    if old_record is not None:
+        coalescer.submit(kind, old_record, ACTION_REVOKE)
+    coalescer.submit(kind, record, ACTION_GRANT)
+    with count_ranger_calls() as counter:
+        result = coalescer.flush(parallel=True)
+    return {
+        "policies": result["policies"],
+        "writes": result["writes"],
+        "ranger_calls": counter.calls,
+        "errors": result["errors"],
+        "duration": round(time.time() - started, 3),
+    }
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_policy_coalescer() -> PolicyWriteCoalescer:
+    """获取进程内共享的写入合并器"""
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = PolicyWriteCoalescer()
+    return _coalescer
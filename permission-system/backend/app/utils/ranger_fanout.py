@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import argparse
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .circuit_breaker import is_circuit_open
+from .ranger_limiter import (
+    LANE_BATCH, LANE_INTERACTIVE, LANE_RECONCILE, LANES, LaneStats, current_sync_lane,
+    ranger_service_context, resolve_lane,
+)
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 并发执行Ranger服务/doris catalog目标的线程数上限，交互请求使用
+RANGER_FANOUT_WORKERS = int(os.getenv("RANGER_FANOUT_WORKERS", "4"))
+# 批量导入、全量同步/对账各自独立的线程数，不与交互请求争抢线程
+RANGER_BATCH_WORKERS = int(os.getenv("RANGER_BATCH_WORKERS", "4"))
+RANGER_RECONCILE_WORKERS = int(os.getenv("RANGER_RECONCILE_WORKERS", "4"))
+
+LANE_WORKERS = {
+    LANE_INTERACTIVE: RANGER_FANOUT_WORKERS,
+    LANE_BATCH: RANGER_BATCH_WORKERS,
+    LANE_RECONCILE: RANGER_RECONCILE_WORKERS,
+}
+
+
+class RangerFanoutError(Exception):
+    """部分目标执行失败，errors按目标记录各自的错误信息"""
+
+    def __init__(self, errors: Dict[str, str], result: Dict[str, Any]):
+        self.errors = errors
+        self.result = result
+        detail = "; ".join(f"[{target}] {error}" for target, error in errors.items())
+        super().__init__(f"{len(errors)}/{len(result['targets'])}个目标执行失败: {detail}")
+
+
+def target_label(service: str, catalog: Optional[str]) -> str:
+    return f"{service}.{catalog}" if catalog else service
+
+
+def split_targets(args: argparse.Namespace) -> List[Tuple[str, argparse.Namespace]]:
+    """把一次权限操作按(服务, catalog)拆分为互相独立的子操作
+
+    每个子操作持有独立的列表参数副本，避免doris对accesses的扩展影响其他目标
+    """
+    catalogs = getattr(args, "catalog", None) or []
+    targets = []
+    for service in args.service or []:
+        for catalog in (catalogs if service == "doris" and catalogs else [None]):
+            sub_args = argparse.Namespace(**{
+                key: list(value) if isinstance(value, list) else value
+                for key, value in vars(args).items()
+            })
+            sub_args.service = [service]
+            sub_args.catalog = [catalog] if catalog else list(catalogs)
+            targets.append((target_label(service, catalog), sub_args))
+    return targets
+
+
+class LaneExecutor(ThreadPoolExecutor):
+    """属于一个同步通道的有界线程池
+
+    任务在提交方上下文的副本中执行并标记所属通道，其中的Ranger请求按该通道限流；
+    记录任务从提交到开始执行的排队时间
+    """
+
+    def __init__(self, lane: str, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix=f"ranger-{lane}")
+        self.lane = lane
+        self.workers = max_workers
+        self.queued = 0
+        self.stats = LaneStats()
+        self._queued_lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        context = contextvars.copy_context()
+        context.run(current_sync_lane.set, self.lane)
+        submitted = time.monotonic()
+        with self._queued_lock:
+            self.queued += 1
+
+        def run():
+            with self._queued_lock:
+                self.queued -= 1
+            self.stats.observe(time.monotonic() - submitted)
+            return context.run(fn, *args, **kwargs)
+
+        return super().submit(run)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(workers=self.workers, queued=self.queued, **self.stats.snapshot())
+
+
+_executors: Dict[str, LaneExecutor] = {}
+_executor_lock = threading.Lock()
+
+
+def get_fanout_executor(lane: Optional[str] = None) -> LaneExecutor:
+    """获取进程内共享的有界线程池，每个同步通道一个，默认取当前上下文所属的通道"""
+    lane = resolve_lane(lane)
+    executor = _executors.get(lane)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(lane)
+            if executor is None:
+                executor = _executors[lane] = LaneExecutor(lane, LANE_WORKERS[lane])
+    return executor
+
+
+def fanout_snapshot() -> Dict[str, Dict[str, Any]]:
+    """各通道线程池的线程数、排队任务数和排队时间"""
+    return {lane: _executors[lane].snapshot() for lane in LANES if lane in _executors}
+
+
+def _timed(func: Callable, sub_args) -> Tuple[float, Optional[Exception]]:
+    started = time.time()
+    try:
+        # 标记当前目标服务，按/policy/{id}这类不带服务名的请求也能归到对应服务限流
+        with ranger_service_context(sub_args.service[0]):
+            func(sub_args)
+        return time.time() - started, None
+    except Exception as e:
+        return time.time() - started, e
+
+
+def fan_out(func: Callable[[argparse.Namespace], Any], args: argparse.Namespace,
+            executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+    """在有界线程池上并发执行各目标的子操作
+
+    所有目标执行完毕后汇总结果；任一目标失败时抛出RangerFanoutError，其余目标的变更照常生效
+    """
+    started = time.time()
+    targets = split_targets(args)
+    if len(targets) <= 1:
+        outcomes = [_timed(func, sub_args) for _, sub_args in targets]
+    else:
+        executor = executor or get_fanout_executor()
+        futures = [executor.submit(_timed, func, sub_args) for _, sub_args in targets]
+        outcomes = [future.result() for future in futures]
+
+    result = {"targets": {}, "duration": 0.0}
+    errors = {}
+    open_circuits = []
+    for (label, _), (duration, error) in zip(targets, outcomes):
+        result["targets"][label] = {
+            "status": "failed" if error else "success",
+            "duration": round(duration, 3),
+            "error": str(error) if error else None,
+        }
+        if error:
+            errors[label] = str(error)
+            if is_circuit_open(error):
+                open_circuits.append(error)
+    result["duration"] = round(time.time() - started, 3)
+
+    logger.info(f"[并发下发] {getattr(args, 'command', '')} {getattr(args, 'policy_type', '')} "
+                f"目标{len(targets)}个, 失败{len(errors)}个, 总耗时={result['duration']:.3f}秒, "
+                f"各目标耗时={ {k: v['duration'] for k, v in result['targets'].items()} }")
+    if errors:
+        if len(open_circuits) == len(errors):
+            # 失败的目标全部处于熔断中，保留原因供调用方改为延后同步
+            raise RangerFanoutError(errors, result) from open_circuits[0]
+        raise RangerFanoutError(errors, result)
+    return result
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from app.models.models import TablePermission, ColumnPermission, RowPermission
+from app.models.ranger_sync import SyncWatermark, PermissionTombstone
+from .ranger_reconcile import reconcile
+from .ranger_coalesce import ACTION_REVOKE, PolicyWriteCoalescer
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 定时增量同步的间隔（秒），0表示不启用；由sync-worker按间隔创建增量同步任务
+RANGER_INCREMENTAL_SYNC_INTERVAL = int(os.getenv("RANGER_INCREMENTAL_SYNC_INTERVAL", "0"))
+# 水位线回看时间（秒）：覆盖水位线附近仍未提交的长事务，重复同步是幂等的
+RANGER_INCREMENTAL_OVERLAP = int(os.getenv("RANGER_INCREMENTAL_OVERLAP", "60"))
+# 已同步墓碑的保留天数
+RANGER_TOMBSTONE_RETENTION_DAYS = int(os.getenv("RANGER_TOMBSTONE_RETENTION_DAYS", "30"))
+
+SYNC_MODULES = {
+    "table": TablePermission,
+    "column": ColumnPermission,
+    "row": RowPermission,
+}
+
+# 墓碑中保存的字段，回收授权时据此还原原记录
+TOMBSTONE_FIELDS = {
+    "table": ("db_name", "table_name", "user_name", "role_name"),
+    "column": ("db_name", "table_name", "col_name", "mask_type", "user_name", "role_name"),
+    "row": ("db_name", "table_name", "row_filter", "user_name", "role_name"),
+}
+
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+
+# 各模块的PostgreSQL咨询锁键，保证多个进程中同一模块的增量同步不会同时执行
+_ADVISORY_LOCK_BASE = 72310
+_local_locks = {kind: threading.Lock() for kind in SYNC_MODULES}
+
+
+def add_tombstone(db: Session, kind: str, record) -> None:
+    """为即将删除或修改的权限记录写入墓碑（不提交，随调用方的事务一起提交）"""
+    payload = {field: getattr(record, field) for field in TOMBSTONE_FIELDS[kind]}
+    db.add(PermissionTombstone(module=kind, record_id=record.id, payload=json.dumps(payload, ensure_ascii=False)))
+
+
+def tombstone_if_changed(db: Session, kind: str, record, update_data: Dict[str, Any]) -> bool:
+    """更新会改变Ranger授权的字段时，为原值写入墓碑，返回是否写入"""
+    if any(field in update_data and update_data[field] is not None and update_data[field] != getattr(record, field)
+           for field in TOMBSTONE_FIELDS[kind]):
+        add_tombstone(db, kind, record)
+        return True
+    return False
+
+
+def is_live_grant(db: Session, kind: str, payload: Dict[str, Any]) -> bool:
+    """墓碑对应的授权是否仍由某条现存记录提供（例如删除后又重新创建）"""
+    model = SYNC_MODULES[kind]
+    query = db.query(model.id)
+    for field, value in payload.items():
+        column = getattr(model, field)
+        query = query.filter(column.is_(None) if value is None else column == value)
+    return query.first() is not None
+
+
+def _revoke_tombstones(db: Session, kind: str, tombstones: List[PermissionTombstone], manager) -> Dict[str, Any]:
+    """回收墓碑对应的授权，同一策略上的多条回收合并为一次写入"""
+    coalescer = PolicyWriteCoalescer(manager_factory=lambda: manager, window=None)
+    handles = []
+    skipped = []
+    for tombstone in tombstones:
+        payload = json.loads(tombstone.payload)
+        if is_live_grant(db, kind, payload):
+            skipped.append(tombstone)
+            continue
+        record = SimpleNamespace(id=tombstone.record_id, **payload)
+        handles.append((tombstone, coalescer.submit(kind, record, ACTION_REVOKE)))
+    result = coalescer.flush()
+
+    done = skipped + [tombstone for tombstone, handle in handles if handle.wait()]
+    return {"done": done, "revoked": len(handles), "skipped": len(skipped),
+            "writes": result["writes"], "errors": result["errors"]}
+
+
+def incremental_sync(kind: str, db: Session, manager) -> Dict[str, Any]:
+    """按水位线增量同步一个权限模块
+
+    1. 回收水位线之后产生的墓碑对应的授权
+    2. 只对update_time晚于水位线（减去回看时间）的记录做对账
+    3. 全部成功时把水位线推进到本次开始时的数据库时间，否则保持不变，下次重试
+    首次执行没有水位线，等同于一次不移除多余授权的全量同步
+    """
+    started = time.time()
+    model = SYNC_MODULES[kind]
+    mark = db.query(SyncWatermark).filter(SyncWatermark.module == kind).first()
+    if mark is None:
+        mark = SyncWatermark(module=kind)
+        db.add(mark)
+    # 以数据库时间为准，避免应用服务器与数据库时钟不一致
+    run_at = db.execute(select(func.now())).scalar()
+    since = mark.watermark - timedelta(seconds=RANGER_INCREMENTAL_OVERLAP) if mark.watermark else None
+
+    tombstones = db.query(PermissionTombstone).filter(
+        PermissionTombstone.module == kind, PermissionTombstone.synced_at.is_(None)
+    ).order_by(PermissionTombstone.id).all()
+    query = db.query(model)
+    if since is not None:
+        query = query.filter(model.update_time > since)
+    changed = query.all()
+    logger.info(f"[增量同步] {kind}权限 水位线={mark.watermark}, 变更记录{len(changed)}条, 待回收墓碑{len(tombstones)}条")
+
+    errors = []
+    revoke = {"revoked": 0, "skipped": 0, "writes": 0, "done": []}
+    if tombstones:
+        revoke = _revoke_tombstones(db, kind, tombstones, manager)
+        errors.extend(revoke["errors"])
+        for tombstone in revoke["done"]:
+            tombstone.synced_at = run_at
+
+    result = None
+    if changed:
+        result = reconcile(kind, changed, manager)
+        errors.extend(result["errors"])
+
+    mark.last_run_at = run_at
+    mark.last_synced = len(changed) + len(tombstones)
+    if errors:
+        mark.last_status = STATUS_FAILED
+        mark.last_error = "; ".join(f"{error['service']}:{error['name']}:{error['error']}" for error in errors)[:2000]
+    else:
+        mark.watermark = run_at
+        mark.last_status = STATUS_SUCCESS
+        mark.last_error = None
+    _purge_tombstones(db, kind, run_at)
+    db.commit()
+
+    failed_ids = sorted({record_id for error in errors for record_id in error["record_ids"]})
+    logger.info(f"[增量同步] {kind}权限同步完成: 变更{len(changed)}条, 回收{revoke['revoked']}条, "
+                f"失败{len(failed_ids)}条, 耗时={time.time() - started:.2f}秒")
+    return {
+        "message": "sync completed" if not errors else "sync partially failed",
+        "mode": "incremental",
+        "since": since.isoformat() if since else None,
+        "watermark": mark.watermark.isoformat() if mark.watermark else None,
+        "changed": len(changed),
+        "tombstones": len(tombstones),
+        "revoked": revoke["revoked"],
+        "plan": result["plan"] if result else None,
+        "failed_ids": failed_ids[:10],
+        "errors": errors[:10],
+        "duration": round(time.time() - started, 3),
+    }
+
+
+def _purge_tombstones(db: Session, kind: str, now) -> None:
+    cutoff = now - timedelta(days=RANGER_TOMBSTONE_RETENTION_DAYS)
+    db.query(PermissionTombstone).filter(
+        PermissionTombstone.module == kind,
+        PermissionTombstone.synced_at.isnot(None),
+        PermissionTombstone.synced_at < cutoff,
+    ).delete(synchronize_session=False)
+
+
+class IncrementalSyncBusy(Exception):
+    """同一模块的增量同步正在其他线程或进程中执行"""
+
+
+def run_incremental_sync(kind: str, db: Session, manager=None) -> Dict[str, Any]:
+    """加锁执行增量同步，同一模块同一时间只有一个执行者"""
+    if manager is None:
+        from .youcash_ranger_v2 import get_ranger_manager
+        manager = get_ranger_manager()
+    local_lock = _local_locks[kind]
+    if not local_lock.acquire(blocking=False):
+        raise IncrementalSyncBusy(f"{kind}权限增量同步正在执行")
+    try:
+        bind = db.get_bind()
+        if bind.dialect.name != "postgresql":
+            return incremental_sync(kind, db, manager)
+        # 咨询锁占用单独的连接，不受同步过程中事务提交的影响
+        key = _ADVISORY_LOCK_BASE + list(SYNC_MODULES).index(kind)
+        with bind.connect() as conn:
+            if not conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar():
+                raise IncrementalSyncBusy(f"{kind}权限增量同步正在其他进程中执行")
+            try:
+                return incremental_sync(kind, db, manager)
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                conn.commit()
+    finally:
+        local_lock.release()
+
+
+def get_watermarks(db: Session) -> List[Dict[str, Any]]:
+    marks = {mark.module: mark for mark in db.query(SyncWatermark).all()}
+    pending = dict(db.query(PermissionTombstone.module, func.count(PermissionTombstone.id)).filter(
+        PermissionTombstone.synced_at.is_(None)
+    ).group_by(PermissionTombstone.module).all())
+    result = []
+    for kind in SYNC_MODULES:
+        mark = marks.get(kind)
+        result.append({
+            "module": kind,
+            "watermark": mark.watermark.isoformat() if mark and mark.watermark else None,
+            "last_run_at": mark.last_run_at.isoformat() if mark and mark.last_run_at else None,
+            "last_status": mark.last_status if mark else None,
+            "last_synced": mark.last_synced if mark else None,
+            "last_error": mark.last_error if mark else None,
+            "pending_tombstones": pending.get(kind, 0),
+        })
+    return result
@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import threading
+import contextlib
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 默认限流配置，可通过RANGER_SERVICE_LIMITS按服务覆盖，例如:
+# RANGER_SERVICE_LIMITS={"doris": {"rate": 10, "burst": 20, "max_concurrency": 4}}
+RANGER_LIMITER_ENABLED = os.getenv("RANGER_LIMITER_ENABLED", "true").lower() == "true"
+RANGER_RATE_LIMIT = float(os.getenv("RANGER_RATE_LIMIT", "50"))                  # 每秒请求数
+RANGER_BURST = int(os.getenv("RANGER_BURST", "100"))                             # 令牌桶容量
+RANGER_MIN_CONCURRENCY = int(os.getenv("RANGER_MIN_CONCURRENCY", "1"))
+RANGER_MAX_CONCURRENCY = int(os.getenv("RANGER_MAX_CONCURRENCY", "16"))
+RANGER_INITIAL_CONCURRENCY = int(os.getenv("RANGER_INITIAL_CONCURRENCY", "4"))
+RANGER_LATENCY_TOLERANCE = float(os.getenv("RANGER_LATENCY_TOLERANCE", "2.0"))   # 超过基线延迟的倍数视为过载
+RANGER_BACKOFF_RATIO = float(os.getenv("RANGER_BACKOFF_RATIO", "0.5"))           # 过载时并发上限的乘性缩减比例
+RANGER_ACQUIRE_TIMEOUT = float(os.getenv("RANGER_ACQUIRE_TIMEOUT", "60"))        # 排队等待的最长时间（秒）
+RANGER_SERVICE_LIMITS = os.getenv("RANGER_SERVICE_LIMITS", "")
+
+# 同步优先级通道，按优先级从高到低排列
+LANE_INTERACTIVE = "interactive"    # 界面上对单条记录的增删改
+LANE_BATCH = "batch"                # 批量导入
+LANE_RECONCILE = "reconcile"        # 全量同步、定时增量同步和对账
+LANES = (LANE_INTERACTIVE, LANE_BATCH, LANE_RECONCILE)
+# 各通道连同更低优先级通道合计最多占用的并发上限比例，其余名额为更高优先级通道保留
+RANGER_LANE_SHARES = {
+    LANE_INTERACTIVE: 1.0,
+    LANE_BATCH: float(os.getenv("RANGER_BATCH_SHARE", "0.75")),
+    LANE_RECONCILE: float(os.getenv("RANGER_RECONCILE_SHARE", "0.5")),
+}
+# 每个通道保留的最近排队时间样本数，用于估算分位数
+LANE_WAIT_SAMPLES = 1000
+
+DEFAULT_SERVICE = "default"
+# 延迟比基线至少高出该值（秒）才视为过载，避免毫秒级抖动触发退避
+LATENCY_MIN_DELTA = 0.05
+
+# 当前线程/协程正在操作的Ranger服务，请求URL和请求体中都取不到服务名时使用
+current_ranger_service: ContextVar[Optional[str]] = ContextVar("current_ranger_service", default=None)
+# 当前线程/协程所属的同步通道，未声明时按交互请求处理
+current_sync_lane: ContextVar[str] = ContextVar("current_sync_lane", default=LANE_INTERACTIVE)
+
+_SERVICE_PATTERNS = [
+    re.compile(r"/service/name/([^/?]+)"),
+    re.compile(r"/policies/download/([^/?]+)"),
+    re.compile(r"/service/(?!name/)([^/?]+)/policy"),
+]
+
+
+class RangerLimitTimeout(Exception):
+    """排队等待Ranger请求配额超时"""
+
+
+def resolve_lane(lane: Optional[str] = None) -> str:
+    lane = lane or current_sync_lane.get()
+    return lane if lane in LANES else LANE_INTERACTIVE
+
+
+class LaneStats:
+    """单个通道的排队时间统计，保留最近的样本估算分位数"""
+
+    def __init__(self, samples: int = LANE_WAIT_SAMPLES):
+        self.requests = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self._samples: Deque[float] = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def observe(self, wait: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._samples.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._samples)
+            requests, wait_time, max_wait = self.requests, self.wait_time, self.max_wait
+
+        def quantile(q: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 4)
+
+        return {
+            "requests": requests,
+            "avg_wait": round(wait_time / requests, 4) if requests else None,
+            "p50_wait": quantile(0.5),
+            "p99_wait": quantile(0.99),
+            "max_wait": round(max_wait, 4),
+        }
+
+
+class TokenBucket:
+    """令牌桶：限制平均请求速率，允许一定突发"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        """尝试取一个令牌，成功返回0，否则返回需要等待的秒数（调用方需持有锁）"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 0.1
+
+
+class AdaptiveLimiter:
+    """单个Ranger服务的自适应限流器
+
+    令牌桶控制请求速率；并发上限按AIMD调整：请求成功且延迟正常时加性增加，
+    遇到5xx/超时或延迟明显超过基线时乘性减少。
+    名额按同步通道分级分配，批量导入和对账不会占满名额，交互请求不必排在整批任务之后。
+    """
+
+    def __init__(self, service: str, rate: float = RANGER_RATE_LIMIT, burst: int = RANGER_BURST,
+                 min_concurrency: int = RANGER_MIN_CONCURRENCY, max_concurrency: int = RANGER_MAX_CONCURRENCY,
+                 initial_concurrency: int = RANGER_INITIAL_CONCURRENCY,
+                 latency_tolerance: float = RANGER_LATENCY_TOLERANCE, backoff_ratio: float = RANGER_BACKOFF_RATIO):
+        self.service = service
+        self.bucket = TokenBucket(rate, burst)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self.waiting = 0
+        self.baseline_latency: Optional[float] = None
+        self.last_backoff = 0.0
+        self.stats = {"requests": 0, "failures": 0, "backoffs": 0, "wait_time": 0.0}
+        self.lane_in_flight = dict.fromkeys(LANES, 0)
+        self.lane_waiting = dict.fromkeys(LANES, 0)
+        self.lane_stats = {lane: LaneStats() for lane in LANES}
+        self._cond = threading.Condition()
+
+    # ---------- 配额 ----------
+
+    def _lane_blocked(self, lane: str) -> bool:
+        """低优先级通道的准入控制（调用方需持有锁）
+
+        每个通道至少可以占用一个名额，不会被完全饿死；超出部分在更高优先级通道有请求排队时让出，
+        即在请求边界上被抢占，且该通道连同更低优先级通道合计不超过并发上限的对应比例
+        """
+        index = LANES.index(lane)
+        if index == 0 or self.lane_in_flight[lane] == 0:
+            return False
+        if any(self.lane_waiting[higher] for higher in LANES[:index]):
+            return True
+        in_flight = sum(self.lane_in_flight[lower] for lower in LANES[index:])
+        return in_flight >= max(1, int(self.limit * RANGER_LANE_SHARES[lane]))
+
+    def _try_enter(self, lane: str = LANE_INTERACTIVE) -> float:
+        """尝试占用一个并发名额和令牌，成功返回0，否则返回建议等待的秒数（调用方需持有锁）"""
+        if self.in_flight >= int(self.limit) or self._lane_blocked(lane):
+            return 0.05
+        wait = self.bucket.try_take()
+        if wait:
+            return wait
+        self.in_flight += 1
+        self.lane_in_flight[lane] += 1
+        return 0.0
+
+    def acquire(self, timeout: float = RANGER_ACQUIRE_TIMEOUT, lane: Optional[str] = None) -> str:
+        """占用一个请求名额，返回所属通道，释放时需传回"""
+        lane = resolve_lane(lane)
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            self.waiting += 1
+            self.lane_waiting[lane] += 1
+            try:
+                while True:
+                    wait = self._try_enter(lane)
+                    if not wait:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RangerLimitTimeout(f"service:[{self.service}] 等待Ranger请求配额超时({timeout}秒)")
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                self.waiting -= 1
+                self.lane_waiting[lane] -= 1
+            waited = time.monotonic() - started
+            self.stats["wait_time"] += waited
+        self.lane_stats[lane].observe(waited)
+        return lane
+
+    async def acquire_async(self, timeout: float = RANGER_ACQUIRE_TIMEOUT, lane: Optional[str] = None) -> str:
+        """异步版本，等待期间让出事件循环而不占用线程"""
+        lane = resolve_lane(lane)
+        started = time.monotonic()
+        deadline = started + timeout
+        with self._cond:
+            self.waiting += 1
+            self.lane_waiting[lane] += 1
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_enter(lane)
+                if not wait:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RangerLimitTimeout(f"service:[{self.service}] 等待Ranger请求配额超时({timeout}秒)")
+                await asyncio.sleep(min(wait, remaining))
+        finally:
+            with self._cond:
+                self.waiting -= 1
+                self.lane_waiting[lane] -= 1
+                self.stats["wait_time"] += time.monotonic() - started
+        self.lane_stats[lane].observe(time.monotonic() - started)
+        return lane
+
+    def release(self, latency: float, ok: bool, lane: str = LANE_INTERACTIVE) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self.lane_in_flight[lane] -= 1
+            self.stats["requests"] += 1
+            if not ok:
+                self.stats["failures"] += 1
+                self._backoff("请求失败")
+            elif self.baseline_latency is not None and latency > max(self.baseline_latency * self.latency_tolerance,
+                                                                     self.baseline_latency + LATENCY_MIN_DELTA):
+                self._backoff(f"延迟{latency:.2f}秒超过基线{self.baseline_latency:.2f}秒")
+            else:
+                # 加性增加：每个并发窗口内全部成功时上限约增加1
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / max(self.limit, 1.0))
+            if ok:
+                # 基线延迟取成功请求延迟的滑动平均，快速跟随下降、缓慢跟随上升
+                if self.baseline_latency is None or latency < self.baseline_latency:
+                    self.baseline_latency = latency
+                else:
+                    self.baseline_latency = self.baseline_latency * 0.95 + latency * 0.05
+            self._cond.notify_all()
+
+    def _backoff(self, reason: str) -> None:
+        now = time.monotonic()
+        # 同一时刻大量失败只缩减一次，避免上限瞬间降到最低
+        if now - self.last_backoff < (self.baseline_latency or 0.1):
+            return
+        self.last_backoff = now
+        old_limit = self.limit
+        self.limit = max(self.min_concurrency, self.limit * self.backoff_ratio)
+        self.stats["backoffs"] += 1
+        logger.warning(f"[Ranger限流] service:[{self.service}] {reason}, 并发上限 {old_limit:.1f} -> {self.limit:.1f}")
+
+    @contextlib.contextmanager
+    def slot(self):
+        """占用一个请求名额，退出时根据是否抛出异常和耗时调整并发上限"""
+        lane = self.acquire()
+        started = time.monotonic()
+        outcome = {"ok": True}
+        try:
+            yield outcome
+        except Exception:
+            outcome["ok"] = False
+            raise
+        finally:
+            self.release(time.monotonic() - started, outcome["ok"], lane)
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self):
+        lane = await self.acquire_async()
+        started = time.monotonic()
+        outcome = {"ok": True}
+        try:
+            yield outcome
+        except Exception:
+            outcome["ok"] = False
+            raise
+        finally:
+            self.release(time.monotonic() - started, outcome["ok"], lane)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            self.bucket._refill(time.monotonic())
+            return {
+                "service": self.service,
+                "concurrency_limit": round(self.limit, 2),
+                "min_concurrency": self.min_concurrency,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "rate": self.bucket.rate,
+                "burst": self.bucket.burst,
+                "tokens": round(self.bucket.tokens, 2),
+                "baseline_latency": round(self.baseline_latency, 4) if self.baseline_latency is not None else None,
+                "requests": self.stats["requests"],
+                "failures": self.stats["failures"],
+                "backoffs": self.stats["backoffs"],
+                "wait_time": round(self.stats["wait_time"], 3),
+                "lanes": {lane: dict(in_flight=self.lane_in_flight[lane], queue_depth=self.lane_waiting[lane],
+                                     **self.lane_stats[lane].snapshot()) for lane in LANES},
+            }
+
+
+def is_overload_status(status_code: int) -> bool:
+    """5xx和429视为Ranger过载，需要退避"""
+    return status_code >= 500 or status_code == 429
+
+
+def detect_service(url: str, body: Any = None) -> str:
+    """从请求URL、请求体或当前上下文中识别目标Ranger服务"""
+    for pattern in _SERVICE_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    if body:
+        try:
+            data = json.loads(body) if isinstance(body, (str, bytes)) else body
+            if isinstance(data, dict) and isinstance(data.get("service"), str):
+                return data["service"]
+        except (ValueError, TypeError):
+            pass
+    return current_ranger_service.get() or DEFAULT_SERVICE
+
+
+class RangerLimiterRegistry:
+    """按服务维护自适应限流器"""
+
+    def __init__(self, overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.overrides = overrides or {}
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, service: Optional[str]) -> AdaptiveLimiter:
+        service = service or DEFAULT_SERVICE
+        limiter = self._limiters.get(service)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(service)
+                if limiter is None:
+                    limiter = self._limiters[service] = AdaptiveLimiter(service, **self.overrides.get(service, {}))
+        return limiter
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {service: limiter.snapshot() for service, limiter in list(self._limiters.items())}
+
+
+def _load_overrides() -> Dict[str, Dict[str, Any]]:
+    if not RANGER_SERVICE_LIMITS:
+        return {}
+    try:
+        return json.loads(RANGER_SERVICE_LIMITS)
+    except ValueError as e:
+        logger.error(f"[Ranger限流] RANGER_SERVICE_LIMITS配置格式错误: {e}")
+        return {}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_limiter_registry() -> RangerLimiterRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = RangerLimiterRegistry(_load_overrides())
+    return _registry
+
+
+@contextlib.contextmanager
+def sync_lane(lane: str):
+    """声明当前操作所属的同步通道，其中的Ranger请求和提交到共享线程池的任务按该通道排队"""
+    token = current_sync_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_sync_lane.reset(token)
+
+
+@contextlib.contextmanager
+def ranger_service_context(service: Optional[str]):
+    """声明当前操作的目标服务，供无法从请求本身识别服务的调用使用"""
+    token = current_ranger_service.set(service)
+    try:
+        yield
+    finally:
+        current_ranger_service.reset(token)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.models import HdfsQuota
+from .ranger_fanout import get_fanout_executor
+from .ranger_incremental import SYNC_MODULES
+from .ranger_limiter import ranger_service_context
+from .ranger_reconcile import DESIRED_BUILDERS, SERVICES, apply_action, compute_plan
+from .ranger_snapshot import RangerPolicyCache
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 执行顺序：先下发normal授权，再下发脱敏和行过滤策略
+STAGES = ("table", "column", "row")
+
+
+class _Progress:
+    """汇总各阶段的进度，在调用线程中回调progress(已成功, 已失败, 总数)"""
+
+    def __init__(self, total: int, callback: Optional[Callable[[int, int, int], None]]):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.callback = callback
+        if callback:
+            callback(0, 0, total)
+
+    def step(self, ok: bool) -> None:
+        if ok:
+            self.done += 1
+        else:
+            self.failed += 1
+        if self.callback:
+            self.callback(self.done, self.failed, self.total)
+
+
+def _run_stage(items: List[Any], func: Callable[[Any], Optional[Dict[str, Any]]],
+               executor: ThreadPoolExecutor, progress: _Progress) -> List[Dict[str, Any]]:
+    """在共享线程池上并发执行一个阶段，全部完成后才进入下一阶段
+
+    progress回调抛出异常（如任务被取消）时撤销尚未开始的变更，已开始的变更照常完成
+    """
+    futures = [executor.submit(func, item) for item in items]
+    errors = []
+    try:
+        for future in as_completed(futures):
+            error = future.result()
+            if error:
+                errors.append(error)
+            progress.step(error is None)
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    return errors
+
+
+def _ranger_action(policy_manager) -> Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    def run(action: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # 按/policy/{id}写入时请求本身不带服务名，标记服务后归到对应服务的限流器
+        with ranger_service_context(action["service"]):
+            return apply_action(action, policy_manager)
+    return run
+
+
+def apply_hdfs_quota(quota) -> Optional[Dict[str, Any]]:
+    """设置一个数据库的HDFS配额，成功返回None，失败返回错误信息"""
+    # HDFS配额通过hdfs dfsadmin设置，命令封装在HDFS配额模块中
+    from app.api.hdfs_quota import run_ranger_command
+    try:
+        run_ranger_command({"action": "grant", "id": quota.id, "db_name": quota.db_name,
+                            "hdfs_quota": quota.hdfs_quota})
+        return None
+    except Exception as e:
+        return {"id": quota.id, "db_name": quota.db_name, "error": getattr(e, "detail", None) or str(e)}
+
+
+def reconcile_all(db: Session, manager, prune: bool = False, include_hdfs: bool = True,
+                  progress: Optional[Callable[[int, int, int], None]] = None,
+                  executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+    """表/字段/行权限和HDFS配额的统一对账
+
+    1. 一次性加载四类记录，每个Ranger服务只刷新一次策略快照
+    2. 基于同一份快照计算三类权限的变更计划
+    3. 按normal -> mask -> row filter -> HDFS配额的顺序分阶段执行，阶段内在共享线程池上并发，
+       每个Ranger服务的请求速率和并发仍受自适应限流器约束
+    """
+    started = time.time()
+    sources = {kind: db.query(model).all() for kind, model in SYNC_MODULES.items()}
+    quotas = db.query(HdfsQuota).all() if include_hdfs else []
+
+    policy_manager = manager.policy
+    cache = policy_manager.policy_cache or RangerPolicyCache(manager.client)
+    for service in SERVICES:
+        cache.snapshot(service).invalidate()
+        cache.snapshot(service).ensure_fresh()
+
+    plans = {}
+    for kind in STAGES:
+        desired = DESIRED_BUILDERS[kind](sources[kind])
+        plans[kind] = compute_plan(desired, cache, prune=prune, kind=kind)
+        logger.info(f"[统一对账] {kind}权限记录{len(sources[kind])}条, 期望策略{len(desired)}条, 计划: {plans[kind].summary()}")
+
+    tracker = _Progress(sum(len(plan.actions) for plan in plans.values()) + len(quotas), progress)
+    executor = executor or get_fanout_executor()
+    apply = _ranger_action(policy_manager)
+    result = {"records": {kind: len(perms) for kind, perms in sources.items()}, "plan": {}, "applied": {},
+              "failed_ids": {}, "errors": []}
+    for kind in STAGES:
+        stage_started = time.time()
+        actions = plans[kind].actions
+        errors = _run_stage(actions, apply, executor, tracker)
+        applied = {"create": 0, "update": 0, "delete": 0}
+        failed_names = {(error["service"], error["name"]) for error in errors}
+        for action in actions:
+            if (action["service"], action["name"]) not in failed_names:
+                applied[action["op"]] += 1
+        result["plan"][kind] = plans[kind].summary()
+        result["applied"][kind] = applied
+        result["failed_ids"][kind] = sorted({record_id for error in errors for record_id in error["record_ids"]})
+        result["errors"].extend(dict(error, module=kind) for error in errors)
+        logger.info(f"[统一对账] {kind}权限执行{len(actions)}个变更, 失败{len(errors)}个, "
+                    f"耗时={time.time() - stage_started:.2f}秒")
+
+    if include_hdfs:
+        result["records"]["hdfs"] = len(quotas)
+        hdfs_errors = _run_stage(quotas, apply_hdfs_quota, executor, tracker)
+        result["hdfs"] = {"total": len(quotas), "synced": len(quotas) - len(hdfs_errors),
+                          "failed": len(hdfs_errors), "failed_records": hdfs_errors[:10]}
+
+    result["duration"] = round(time.time() - started, 3)
+    logger.info(f"[统一对账] 完成: 成功{tracker.done}个, 失败{tracker.failed}个, 耗时={result['duration']:.2f}秒")
+    return result
@@ -0,0 +1,472 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .ranger_snapshot import RangerPolicyCache
+from .youcash_ranger_v2 import to_ranger_mask_type
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 权限同步的目标服务和doris catalog，与各模块run_ranger_command保持一致
+SERVICES = ['cm_hive', 'doris']
+CATALOGS = ['internal', 'cdp_hive']
+
+# 策略类型及对应的条目字段
+POLICY_TYPE_NORMAL = 0
+POLICY_TYPE_MASK = 1
+POLICY_TYPE_ROW_FILTER = 2
+
+ITEM_KEYS = {
+    POLICY_TYPE_NORMAL: "policyItems",
+    POLICY_TYPE_MASK: "dataMaskPolicyItems",
+    POLICY_TYPE_ROW_FILTER: "rowFilterPolicyItems",
+}
+
+# 新建策略的描述，与youcash_ranger_v2逐条授权时保持一致
+POLICY_DESCRIPTIONS = {
+    POLICY_TYPE_NORMAL: "Create normal policy: {name} auto",
+    POLICY_TYPE_MASK: "Create data mask policy: {name} auto",
+    POLICY_TYPE_ROW_FILTER: "Create policy: {name} auto",
+}
+
+ENTITY_TYPES = ("user", "group", "role")
+
+
+def mask_value_expr(service: str, col_name: str, ranger_mask_type: str) -> Optional[str]:
+    if service == "doris":
+        return f"upper(md5(`{col_name}`))"
+    return f"default.uppermd5(`{col_name}`)" if ranger_mask_type == 'CUSTOM' else None
+
+
+def row_filter_policy_name(db_name: str, table_name: str, user_name: Optional[str], role_name: Optional[str]) -> str:
+    """行权限的策略名，每个(库, 表, 用户, 角色)对应一个row_filter策略"""
+    return f"row_filter_{db_name}_{table_name}_{user_name}_{role_name}".replace(' ', '_')
+
+
+def policy_targets(services: Iterable[str] = SERVICES, catalogs: Iterable[str] = CATALOGS) -> List[Tuple[str, Optional[str]]]:
+    """展开(服务, catalog)目标，doris服务按catalog拆分"""
+    targets = []
+    for service in services:
+        if service == "doris":
+            targets.extend((service, catalog) for catalog in catalogs)
+        else:
+            targets.append((service, None))
+    return targets
+
+
+def target_policy_name(service: str, catalog: Optional[str], base_name: str) -> str:
+    return f'{service}.{catalog}.{base_name}' if service == "doris" else base_name
+
+
+def normal_accesses(service: str, accesses: Iterable[str]) -> Tuple[str, ...]:
+    """计算normal策略在目标服务上的实际权限列表，与create_or_update_normal_policy一致"""
+    accesses = list(accesses)
+    if service == "doris" and set(accesses) & {"all", "select"}:
+        if accesses == ["all"]:
+            from .youcash_ranger_v2 import RANGER_ALL_PRIVILEDGE
+            accesses = list(RANGER_ALL_PRIVILEDGE)
+        elif accesses == ["select"]:
+            accesses = accesses + ["show"]
+    return tuple(sorted({a.upper() for a in accesses}))
+
+
+def _resource(values):
+    return {"values": list(values), "isExcludes": False, "isRecursive": False}
+
+
+class DesiredPolicy:
+    """由权限表计算得到的一条期望策略
+
+    grants中的每个元素为(签名, 实体类型, 实体名)：
+    - normal策略的签名是权限类型元组
+    - mask策略的签名是dataMaskType
+    - row_filter策略的签名是过滤表达式
+    """
+
+    def __init__(self, service: str, catalog: Optional[str], name: str, policy_type: int,
+                 database: str, table: str, column: Optional[str] = None):
+        self.service = service
+        self.catalog = catalog
+        self.name = name
+        self.policy_type = policy_type
+        self.database = database
+        self.table = table
+        self.column = column
+        self.grants: Set[Tuple[Any, str, str]] = set()
+        self.record_ids: Set[int] = set()
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.service, self.name
+
+    def add(self, record_id: int, signature, users=(), groups=(), roles=()) -> None:
+        self.record_ids.add(record_id)
+        for entity_type, values in (("user", users), ("group", groups), ("role", roles)):
+            for value in values:
+                if value:
+                    self.grants.add((signature, entity_type, value))
+
+    def render_item(self, signature, users, groups, roles) -> Dict[str, Any]:
+        access_type = "SELECT" if self.service == "doris" else "select"
+        item = {"users": sorted(users), "groups": sorted(groups), "roles": sorted(roles)}
+        if self.policy_type == POLICY_TYPE_NORMAL:
+            item["accesses"] = [{"type": a if self.service == "doris" else a.lower(), "isAllowed": True}
+                                for a in signature]
+        elif self.policy_type == POLICY_TYPE_MASK:
+            item["accesses"] = [{"type": access_type, "isAllowed": True}]
+            item["dataMaskInfo"] = {
+                "dataMaskType": signature,
+                "valueExpr": mask_value_expr(self.service, self.column, signature),
+                "maskCondition": None,
+                "description": None,
+            }
+        else:
+            item["accesses"] = [{"type": access_type, "isAllowed": True}]
+            item["rowFilterInfo"] = {"filterExpr": signature}
+        return item
+
+    def render_items(self, grants: Iterable[Tuple[Any, str, str]]) -> List[Dict[str, Any]]:
+        """将授权集合按签名合并为最少的策略条目"""
+        grouped: Dict[Any, Dict[str, Set[str]]] = {}
+        for signature, entity_type, value in grants:
+            grouped.setdefault(signature, {t: set() for t in ENTITY_TYPES})[entity_type].add(value)
+        return [
+            self.render_item(signature, entities["user"], entities["group"], entities["role"])
+            for signature, entities in sorted(grouped.items(), key=lambda kv: str(kv[0]))
+        ]
+
+    def render_policy(self) -> Dict[str, Any]:
+        resources = {"database": _resource([self.database]), "table": _resource([self.table])}
+        if self.policy_type != POLICY_TYPE_ROW_FILTER:
+            resources["column"] = _resource([self.column or "*"])
+        if self.service == "doris":
+            resources["catalog"] = _resource([self.catalog])
+        return {
+            "service": self.service,
+            "name": self.name,
+            "policyType": self.policy_type,
+            "description": POLICY_DESCRIPTIONS[self.policy_type].format(name=self.name),
+            "resources": resources,
+            ITEM_KEYS[self.policy_type]: self.render_items(self.grants),
+        }
+
+
+def item_signature(policy_type: int, item: Dict[str, Any]):
+    if policy_type == POLICY_TYPE_NORMAL:
+        return tuple(sorted({a["type"].upper() for a in item.get("accesses") or []}))
+    if policy_type == POLICY_TYPE_MASK:
+        return (item.get("dataMaskInfo") or {}).get("dataMaskType")
+    return ((item.get("rowFilterInfo") or {}).get("filterExpr") or "").strip()
+
+
+def current_grants(policy: Dict[str, Any], policy_type: int) -> Set[Tuple[Any, str, str]]:
+    """提取Ranger中已有策略的授权集合，格式与DesiredPolicy.grants一致"""
+    grants = set()
+    for item in policy.get(ITEM_KEYS[policy_type]) or []:
+        signature = item_signature(policy_type, item)
+        for entity_type in ENTITY_TYPES:
+            for value in item.get(entity_type + "s") or []:
+                grants.add((signature, entity_type, value))
+    return grants
+
+
+def is_covered(policy_type: int, grant, existing: Set[Tuple[Any, str, str]]) -> bool:
+    signature, entity_type, value = grant
+    if policy_type != POLICY_TYPE_NORMAL:
+        return grant in existing
+    # normal策略只要已有条目的权限包含所需权限即视为已授权
+    return any(e_type == entity_type and e_value == value and set(signature) <= set(e_sig)
+               for e_sig, e_type, e_value in existing)
+
+
+# ---------- 由权限表构建期望状态 ----------
+
+def _entities(perm) -> Tuple[List[str], List[str]]:
+    return [perm.user_name] if perm.user_name else [], [perm.role_name] if perm.role_name else []
+
+
+def _get_or_add(desired: Dict, policy: DesiredPolicy) -> DesiredPolicy:
+    return desired.setdefault(policy.key, policy)
+
+
+def desired_from_table_permissions(perms, services=SERVICES, catalogs=CATALOGS) -> Dict[Tuple[str, str], DesiredPolicy]:
+    desired = {}
+    for perm in perms:
+        users, roles = _entities(perm)
+        table_str = perm.table_name if perm.table_name != "*" else "all"
+        base_name = f'{perm.db_name}.{table_str}.all.normal'
+        for service, catalog in policy_targets(services, catalogs):
+            policy = _get_or_add(desired, DesiredPolicy(
+                service, catalog, target_policy_name(service, catalog, base_name),
+                POLICY_TYPE_NORMAL, perm.db_name, perm.table_name, "*"))
+            policy.add(perm.id, normal_accesses(service, ["select"]), users=users, roles=roles)
+    return desired
+
+
+def desired_from_column_permissions(perms, services=SERVICES, catalogs=CATALOGS) -> Dict[Tuple[str, str], DesiredPolicy]:
+    desired = {}
+    for perm in perms:
+        mask_type = to_ranger_mask_type(perm.mask_type)
+        if mask_type is None:
+            # '原文'不脱敏，不写mask策略；prune时移除已有的对应授权
+            continue
+        users, roles = _entities(perm)
+        base_name = f'{perm.db_name}.{perm.table_name}.{perm.col_name}.mask'
+        for service, catalog in policy_targets(services, catalogs):
+            policy = _get_or_add(desired, DesiredPolicy(
+                service, catalog, target_policy_name(service, catalog, base_name),
+                POLICY_TYPE_MASK, perm.db_name, perm.table_name, perm.col_name))
+            policy.add(perm.id, mask_type, users=users, roles=roles)
+    return desired
+
+
+def desired_from_row_permissions(perms, services=SERVICES, catalogs=CATALOGS) -> Dict[Tuple[str, str], DesiredPolicy]:
+    desired = {}
+    for perm in perms:
+        users, roles = _entities(perm)
+        base_name = row_filter_policy_name(perm.db_name, perm.table_name, perm.user_name, perm.role_name)
+        for service, catalog in policy_targets(services, catalogs):
+            policy = _get_or_add(desired, DesiredPolicy(
+                service, catalog, target_policy_name(service, catalog, base_name),
+                POLICY_TYPE_ROW_FILTER, perm.db_name, perm.table_name))
+            policy.add(perm.id, perm.row_filter.strip(), users=users, roles=roles)
+    return desired
+
+
+DESIRED_BUILDERS = {
+    "table": desired_from_table_permissions,
+    "column": desired_from_column_permissions,
+    "row": desired_from_row_permissions,
+}
+
+
+def _strip_target_prefix(name: str) -> str:
+    if name.startswith("doris."):
+        return name.split(".", 2)[-1]
+    return name
+
+
+def is_managed_policy(kind: str, policy: Dict[str, Any]) -> bool:
+    """判断Ranger中的策略是否由对应权限模块管理（仅用于prune模式下的删除）"""
+    name = _strip_target_prefix(policy.get("name") or "")
+    resources = policy.get("resources") or {}
+    if kind == "table":
+        tables = (resources.get("table") or {}).get("values") or []
+        return policy.get("policyType", 0) == POLICY_TYPE_NORMAL and name.endswith(".all.normal") and "*" not in tables
+    if kind == "column":
+        return policy.get("policyType") == POLICY_TYPE_MASK and name.endswith(".mask")
+    if kind == "row":
+        return policy.get("policyType") == POLICY_TYPE_ROW_FILTER and name.startswith("row_filter_")
+    return False
+
+
+# ---------- 计划与执行 ----------
+
+class ReconcilePlan:
+    """一次对账得到的最小变更计划"""
+
+    def __init__(self):
+        self.creates: List[Dict[str, Any]] = []
+        self.updates: List[Dict[str, Any]] = []
+        self.deletes: List[Dict[str, Any]] = []
+        self.unchanged = 0
+
+    @property
+    def actions(self) -> List[Dict[str, Any]]:
+        return self.creates + self.updates + self.deletes
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "create": len(self.creates),
+            "update": len(self.updates),
+            "delete": len(self.deletes),
+            "unchanged": self.unchanged,
+        }
+
+
+def compute_plan(desired: Dict[Tuple[str, str], DesiredPolicy], cache: RangerPolicyCache,
+                 prune: bool = False, kind: Optional[str] = None) -> ReconcilePlan:
+    """对比期望状态与Ranger快照，计算最小的create/update/delete计划
+
+    - 默认只补齐缺失的授权，不会移除Ranger中已有的其他授权
+    - prune=True时以权限表为准：移除多余授权，并删除权限表中已不存在的受管策略
+    """
+    plan = ReconcilePlan()
+    for (service, name), want in desired.items():
+        current = cache.get_policy(service, name)
+        base = {"service": service, "name": name, "record_ids": sorted(want.record_ids)}
+        if current is None:
+            if want.grants:
+                plan.creates.append(dict(base, op="create", policy=want.render_policy()))
+            continue
+
+        item_key = ITEM_KEYS[want.policy_type]
+        existing = current_grants(current, want.policy_type)
+        if prune:
+            if existing == want.grants:
+                plan.unchanged += 1
+                continue
+            if not want.grants:
+                plan.deletes.append(dict(base, op="delete", policy_id=current["id"], version=current.get("version"),
+                                         replan=(want, prune)))
+                continue
+            current[item_key] = want.render_items(want.grants)
+        else:
+            missing = {g for g in want.grants if not is_covered(want.policy_type, g, existing)}
+            if not missing:
+                plan.unchanged += 1
+                continue
+            # 新增条目放在最前面，与逐条授权时的行为一致
+            current[item_key] = want.render_items(missing) + list(current.get(item_key) or [])
+        # version为计算计划时的策略版本，执行前与Ranger中的最新版本比较
+        plan.updates.append(dict(base, op="update", policy_id=current["id"], policy=current,
+                                 version=current.get("version"), replan=(want, prune)))
+
+    if prune and kind:
+        services = {service for service, _ in desired} or set(SERVICES)
+        for service in services:
+            for policy in cache.snapshot(service).policies():
+                if (service, policy["name"]) in desired or not is_managed_policy(kind, policy):
+                    continue
+                plan.deletes.append({"service": service, "name": policy["name"], "record_ids": [],
+                                     "op": "delete", "policy_id": policy["id"], "version": policy.get("version"),
+                                     "replan": None})
+    return plan
+
+
+class PolicySetView:
+    """compute_plan所需的只读策略视图，由直接从Ranger读取的策略构建"""
+
+    class _Snapshot:
+        def __init__(self, policies):
+            self._policies = policies
+
+        def policies(self):
+            return list(self._policies)
+
+    def __init__(self, policies: Iterable[Dict[str, Any]]):
+        self._by_service: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_name: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for policy in policies:
+            self._by_service.setdefault(policy["service"], []).append(policy)
+            self._by_name[(policy["service"], policy["name"])] = policy
+
+    def get_policy(self, service: str, name: str) -> Optional[Dict[str, Any]]:
+        return self._by_name.get((service, name))
+
+    def snapshot(self, service: str):
+        return self._Snapshot(self._by_service.get(service, []))
+
+
+def _fresh_action(action: Dict[str, Any], policy_manager) -> Optional[Dict[str, Any]]:
+    """update/delete基于快照计算，执行前确认策略版本
+
+    读取前按写入检查间隔确认服务的policyVersion（未变化时Ranger返回304），不逐条按ID读取。
+    Ranger按ID更新时不校验版本，版本已变化（其他进程或Ranger控制台修改过）时，
+    基于最新内容重新计算这一条变更，避免用旧内容覆盖别人的修改；返回None表示已无需变更
+    """
+    current = policy_manager.get_policy_by_id(action["policy_id"], action["service"])
+    if current is not None and current.get("version") == action.get("version"):
+        return action
+    logger.info(f"[权限对账] service:[{action['service']}] policy_name:[{action['name']}] 计划后已被修改, "
+                f"计划版本={action.get('version')}, 最新版本={current.get('version') if current else None}, 重新计算")
+    if action.get("replan") is None:
+        # 清理不再受管的策略，只要策略还在就照常删除
+        return action if current is not None else None
+    if current is None:
+        current = policy_manager.get_existing_policy(action["service"], action["name"])
+    want, prune = action["replan"]
+    actions = compute_plan({(action["service"], action["name"]): want},
+                           PolicySetView([current] if current else []), prune=prune).actions
+    return actions[0] if actions else None
+
+
+def apply_action(action: Dict[str, Any], policy_manager) -> Optional[Dict[str, Any]]:
+    """执行计划中的一条变更，成功返回None，失败返回错误信息"""
+    try:
+        if action["op"] != "create":
+            fresh = _fresh_action(action, policy_manager)
+            if fresh is None:
+                logger.info(f"[权限对账] service:[{action['service']}] policy_name:[{action['name']}] 最新内容已无需变更")
+                return None
+            action = fresh
+        if action["op"] == "create":
+            policy_manager.create_policy(action["policy"])
+        elif action["op"] == "update":
+            policy_manager.update_policy_by_id(action["policy_id"], action["policy"])
+        else:
+            policy_manager.delete_policy_by_id(action["policy_id"], raise_error=True)
+        logger.info(f"[权限对账] {action['op']} service:[{action['service']}] policy_name:[{action['name']}] 成功")
+        return None
+    except Exception as e:
+        logger.error(f"[权限对账] {action['op']} service:[{action['service']}] policy_name:[{action['name']}] 失败: {e}")
+        return {
+            "op": action["op"],
+            "service": action["service"],
+            "name": action["name"],
+            "record_ids": action["record_ids"],
+            "error": str(e),
+        }
+
+
+def apply_plan(plan: ReconcilePlan, policy_manager, progress: Optional[Callable[[int, int, int], None]] = None) -> Dict[str, Any]:
+    """执行计划中的变更，单条失败不影响其他变更
+
+    progress(已成功, 已失败, 总数)在开始前和每条变更后调用，回调抛出的异常会中止后续变更
+    """
+    done = {"create": 0, "update": 0, "delete": 0}
+    errors = []
+    total = len(plan.actions)
+    if progress:
+        progress(0, 0, total)
+    for index, action in enumerate(plan.actions):
+        error = apply_action(action, policy_manager)
+        if error:
+            errors.append(error)
+        else:
+            done[action["op"]] += 1
+        if progress:
+            progress(index + 1 - len(errors), len(errors), total)
+    return {"applied": done, "errors": errors}
+
+
+def reconcile(kind: str, perms, manager, prune: bool = False,
+              services=SERVICES, catalogs=CATALOGS,
+              progress: Optional[Callable[[int, int, int], None]] = None) -> Dict[str, Any]:
+    """权限表到Ranger的对账入口
+
+    1. 由权限表记录构建期望策略集合
+    2. 通过策略快照批量获取Ranger当前策略
+    3. 计算最小的create/update/delete计划
+    4. 只执行计划中的变更
+    """
+    started = time.time()
+    desired = DESIRED_BUILDERS[kind](perms, services, catalogs)
+
+    policy_manager = manager.policy
+    cache = policy_manager.policy_cache or RangerPolicyCache(manager.client)
+    for service in services:
+        # 对账前强制检查一次版本，保证计划基于最新的策略
+        cache.snapshot(service).invalidate()
+        cache.snapshot(service).ensure_fresh()
+
+    plan = compute_plan(desired, cache, prune=prune, kind=kind)
+    logger.info(f"[权限对账] {kind}权限期望策略{len(desired)}条, 计划: {plan.summary()}")
+    result = apply_plan(plan, policy_manager, progress)
+    return reconcile_result(plan, result, started)
+
+
+def reconcile_result(plan: ReconcilePlan, result: Dict[str, Any], started: float) -> Dict[str, Any]:
+    """汇总对账结果，失败的变更映射回对应的权限记录ID"""
+    failed_ids = sorted({record_id for error in result["errors"] for record_id in error["record_ids"]})
+    return {
+        "plan": plan.summary(),
+        "applied": result["applied"],
+        "errors": result["errors"],
+        "failed_ids": failed_ids,
+        "duration": round(time.time() - started, 3),
+    }
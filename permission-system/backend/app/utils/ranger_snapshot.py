@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import json
+import time
+import threading
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .ranger_transport import RANGER_URL, get_ranger_session
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 策略快照配置
+RANGER_POLICY_CACHE_ENABLED = os.getenv("RANGER_POLICY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RANGER_POLICY_CACHE_TTL = float(os.getenv("RANGER_POLICY_CACHE_TTL", "30"))       # 版本检查间隔（秒）
+RANGER_POLICY_PAGE_SIZE = int(os.getenv("RANGER_POLICY_PAGE_SIZE", "1000"))       # 全量下载时的分页大小
+# 写入前的版本检查间隔（秒）：读-改-写以快照为基础，写入前确认服务的policyVersion，
+# 间隔内同一服务的多次写入共用一次检查
+RANGER_POLICY_WRITE_CHECK_INTERVAL = float(os.getenv("RANGER_POLICY_WRITE_CHECK_INTERVAL", "1"))
+
+# Ranger策略增量(policyDeltas)中的变更类型
+CHANGE_TYPE_POLICY_CREATE = 0
+CHANGE_TYPE_POLICY_UPDATE = 1
+CHANGE_TYPE_POLICY_DELETE = 2
+
+# 策略中所有带users/groups/roles的条目列表
+POLICY_ITEM_KEYS = (
+    "policyItems", "denyPolicyItems", "allowExceptions", "denyExceptions",
+    "dataMaskPolicyItems", "rowFilterPolicyItems",
+)
+
+ENTITY_TYPES = ("user", "group", "role")
+
+
+def _plain(policy) -> Dict[str, Any]:
+    """将RangerPolicy等对象转换为普通dict，便于缓存和深拷贝"""
+    return json.loads(json.dumps(policy))
+
+
+def _resource_values(policy: Dict[str, Any], name: str) -> List[Optional[str]]:
+    resource = (policy.get("resources") or {}).get(name)
+    if not resource or not resource.get("values"):
+        return [None]
+    return list(resource["values"])
+
+
+def resource_keys(policy: Dict[str, Any]) -> Set[Tuple[Optional[str], Optional[str], Optional[str]]]:
+    """计算策略覆盖的(database, table, column)资源键"""
+    keys = set()
+    for database in _resource_values(policy, "database"):
+        for table in _resource_values(policy, "table"):
+            for column in _resource_values(policy, "column"):
+                keys.add((database, table, column))
+    return keys
+
+
+def entity_keys(policy: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    """计算策略引用到的(实体类型, 实体名)，实体类型为user/group/role"""
+    keys = set()
+    for item_key in POLICY_ITEM_KEYS:
+        for item in policy.get(item_key) or []:
+            for entity_type in ENTITY_TYPES:
+                for value in item.get(entity_type + "s") or []:
+                    keys.add((entity_type, value))
+    return keys
+
+
+class ServicePolicySnapshot:
+    """单个Ranger服务的策略快照
+
+    一次性批量下载服务下的全部策略，在内存中按策略名、库、(库, 表)、(库, 表, 字段)资源、
+    用户/组/角色建立索引，并通过Ranger的policyVersion做增量刷新。
+    只读查询允许落后TTL秒；写入方传入max_age=RANGER_POLICY_WRITE_CHECK_INTERVAL，
+    读取前确认服务的policyVersion未变化（Ranger返回304），快照即可作为读-改-写的基础。
+    下载在锁外进行，完成后在锁内替换索引，下载期间读取方继续读取旧快照
+    """
+
+    def __init__(self, client, service: str, ttl: float = RANGER_POLICY_CACHE_TTL,
+                 page_size: int = RANGER_POLICY_PAGE_SIZE):
+        self.client = client
+        self.service = service
+        self.ttl = ttl
+        self.page_size = page_size
+        self.policy_version = None
+        self.loaded = False
+        self.last_checked = 0.0
+        self._lock = threading.RLock()
+        # 同一时间只有一个线程下载，下载期间不持有_lock
+        self._refresh_lock = threading.Lock()
+        # 下载期间本进程写入的策略（None表示已删除），下载结果替换索引后重新应用
+        self._written_during_download: Optional[Dict[int, Optional[Dict[str, Any]]]] = None
+        self._policies: Dict[int, Dict[str, Any]] = {}
+        self._by_name: Dict[str, int] = {}
+        self._by_database: Dict[Optional[str], Set[int]] = {}
+        self._by_table: Dict[Tuple, Set[int]] = {}
+        self._by_resource: Dict[Tuple, Set[int]] = {}
+        self._by_entity: Dict[Tuple[str, str], Set[int]] = {}
+
+    # ---------- 索引维护 ----------
+
+    @staticmethod
+    def _add(index: Dict, key, policy_id: int) -> None:
+        index.setdefault(key, set()).add(policy_id)
+
+    @staticmethod
+    def _discard(index: Dict, key, policy_id: int) -> None:
+        ids = index.get(key)
+        if ids:
+            ids.discard(policy_id)
+            if not ids:
+                del index[key]
+
+    def _index(self, policy: Dict[str, Any]) -> None:
+        policy_id = policy["id"]
+        self._policies[policy_id] = policy
+        self._by_name[policy["name"]] = policy_id
+        for key in resource_keys(policy):
+            self._add(self._by_database, key[0], policy_id)
+            self._add(self._by_table, key[:2], policy_id)
+            self._add(self._by_resource, key, policy_id)
+        for key in entity_keys(policy):
+            self._add(self._by_entity, key, policy_id)
+
+    def _unindex(self, policy_id: int) -> None:
+        policy = self._policies.pop(policy_id, None)
+        if policy is None:
+            return
+        if self._by_name.get(policy["name"]) == policy_id:
+            del self._by_name[policy["name"]]
+        for key in resource_keys(policy):
+            self._discard(self._by_database, key[0], policy_id)
+            self._discard(self._by_table, key[:2], policy_id)
+            self._discard(self._by_resource, key, policy_id)
+        for key in entity_keys(policy):
+            self._discard(self._by_entity, key, policy_id)
+
+    def _put(self, policy: Dict[str, Any]) -> None:
+        """替换一条策略，不用较旧版本覆盖较新版本（下载开始后本进程又写入过的策略）"""
+        existing = self._policies.get(policy["id"])
+        if existing is not None and None not in (existing.get("version"), policy.get("version")) \
+                and policy["version"] < existing["version"]:
+            return
+        self._unindex(policy["id"])
+        self._index(policy)
+
+    def _replace_all(self, policies: Iterable[Dict[str, Any]]) -> None:
+        self._policies.clear()
+        self._by_name.clear()
+        self._by_database.clear()
+        self._by_table.clear()
+        self._by_resource.clear()
+        self._by_entity.clear()
+        for policy in policies:
+            self._index(policy)
+
+    def _reapply_own_writes(self) -> None:
+        """下载结果应用后，重新应用下载期间本进程的写入"""
+        for policy_id, policy in list((self._written_during_download or {}).items()):
+            if policy is None:
+                self._unindex(policy_id)
+            else:
+                self._put(policy)
+
+    def upsert(self, policy) -> None:
+        """写入或替换快照中的一条策略（用于本进程自身的写操作）"""
+        policy = _plain(policy)
+        if policy.get("id") is None:
+            self.invalidate()
+            return
+        with self._lock:
+            self._put(policy)
+            if self._written_during_download is not None:
+                self._written_during_download[policy["id"]] = policy
+
+    def remove(self, policy_id: int) -> bool:
+        """从快照中移除一条策略，返回快照中是否存在该策略"""
+        with self._lock:
+            exists = policy_id in self._policies
+            self._unindex(policy_id)
+            if self._written_during_download is not None:
+                self._written_during_download[policy_id] = None
+            return exists
+
+    def invalidate(self) -> None:
+        """使快照在下次读取时强制检查版本"""
+        with self._lock:
+            self.last_checked = 0.0
+
+    # ---------- 加载与刷新 ----------
+
+    def _fetch_service_version(self):
+        service = self.client.get_service(self.service)
+        return service.get("policyVersion") if service else None
+
+    def full_load(self) -> None:
+        """全量分页下载服务下的所有策略并重建索引"""
+        started = time.time()
+        # 先取版本再下载，下载期间发生的变更会在下次刷新时被发现
+        version = self._fetch_service_version()
+        policies = []
+        start_index = 0
+        while True:
+            page = self.client.get_policies_in_service(
+                self.service, {"startIndex": start_index, "pageSize": self.page_size}
+            ) or []
+            policies.extend(_plain(policy) for policy in page)
+            if len(page) < self.page_size:
+                break
+            start_index += len(page)
+        with self._lock:
+            self._replace_all(policies)
+            self._reapply_own_writes()
+            self.policy_version = version
+            self.loaded = True
+            self.last_checked = time.time()
+        logger.info(f"[策略快照] 全量加载service:[{self.service}] 策略{len(policies)}条, "
+                    f"policyVersion={version}, 耗时={time.time() - started:.2f}秒")
+
+    def _download_deltas(self) -> Optional[Dict[str, Any]]:
+        """按lastKnownVersion下载策略增量，返回None表示版本未变化"""
+        url = f"{RANGER_URL}/service/plugins/secure/policies/download/{self.service}"
+        params = {
+            "lastKnownVersion": self.policy_version if self.policy_version is not None else -1,
+            "supportsPolicyDeltas": "true",
+            "pluginId": "permission-system",
+        }
+        response = get_ranger_session().get(url, params=params)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def _apply_download(self, data: Dict[str, Any]) -> bool:
+        """应用下载结果，无法增量应用时返回False"""
+        deltas = data.get("policyDeltas")
+        if deltas:
+            if any(d.get("changeType") not in (CHANGE_TYPE_POLICY_CREATE, CHANGE_TYPE_POLICY_UPDATE,
+                                               CHANGE_TYPE_POLICY_DELETE) for d in deltas):
+                return False
+            with self._lock:
+                for delta in deltas:
+                    policy = delta.get("policy") or {}
+                    if policy.get("service") not in (None, self.service):
+                        continue
+                    if delta["changeType"] == CHANGE_TYPE_POLICY_DELETE:
+                        self._unindex(policy.get("id"))
+                    elif policy.get("id") is not None:
+                        self._put(_plain(policy))
+                self._reapply_own_writes()
+                self.policy_version = data.get("policyVersion", self.policy_version)
+            logger.info(f"[策略快照] service:[{self.service}] 应用增量{len(deltas)}条, policyVersion={self.policy_version}")
+            return True
+        if data.get("policies") is not None:
+            policies = [_plain(p) for p in data["policies"] if p.get("service") in (None, self.service)]
+            with self._lock:
+                self._replace_all(policies)
+                self._reapply_own_writes()
+                self.policy_version = data.get("policyVersion", self.policy_version)
+            logger.info(f"[策略快照] service:[{self.service}] 下载到全量策略{len(policies)}条, policyVersion={self.policy_version}")
+            return True
+        return False
+
+    def refresh(self) -> None:
+        """基于policyVersion增量刷新，失败时退化为全量加载"""
+        try:
+            data = self._download_deltas()
+            if data is None or self._apply_download(data):
+                self.last_checked = time.time()
+                return
+        except Exception as e:
+            logger.warning(f"[策略快照] service:[{self.service}] 增量刷新失败，改为比较版本号: {e}")
+            try:
+                if self.loaded and self._fetch_service_version() == self.policy_version:
+                    self.last_checked = time.time()
+                    return
+            except Exception as ve:
+                logger.warning(f"[策略快照] service:[{self.service}] 获取版本号失败: {ve}")
+        self.full_load()
+
+    def _is_stale(self, max_age: float) -> bool:
+        return not self.loaded or time.time() - self.last_checked >= max_age
+
+    def ensure_fresh(self, max_age: Optional[float] = None) -> None:
+        """快照距上次确认版本超过max_age秒（默认TTL）时刷新
+
+        下载不持有_lock，其他线程照常读取当前快照；需要刷新的线程在_refresh_lock上等待同一次下载
+        """
+        max_age = self.ttl if max_age is None else max_age
+        if not self._is_stale(max_age):
+            return
+        with self._refresh_lock:
+            if not self._is_stale(max_age):
+                return
+            with self._lock:
+                self._written_during_download = {}
+            try:
+                if not self.loaded:
+                    self.full_load()
+                else:
+                    self.refresh()
+            finally:
+                self._written_during_download = None
+
+    # ---------- 查询 ----------
+
+    def _copies(self, ids: Iterable[int]) -> List[Dict[str, Any]]:
+        return [copy.deepcopy(self._policies[i]) for i in sorted(ids) if i in self._policies]
+
+    def get_by_name(self, name: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        self.ensure_fresh(max_age)
+        with self._lock:
+            policy_id = self._by_name.get(name)
+            return copy.deepcopy(self._policies[policy_id]) if policy_id is not None else None
+
+    def get_by_id(self, policy_id: int, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        self.ensure_fresh(max_age)
+        with self._lock:
+            policy = self._policies.get(policy_id)
+            return copy.deepcopy(policy) if policy is not None else None
+
+    def find_by_resource(self, database: str, table: Optional[str] = None, column: Optional[str] = None,
+                         catalog: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按(库, 表, 字段)查找策略，table/column为None时匹配该层级下的所有策略"""
+        self.ensure_fresh()
+        with self._lock:
+            if table is not None and column is not None:
+                ids = self._by_resource.get((database, table, column), set())
+            elif table is not None:
+                ids = self._by_table.get((database, table), set())
+            else:
+                ids = self._by_database.get(database, set())
+                if column is not None:
+                    ids = {i for i in ids if any(key[0] == database and key[2] == column
+                                                 for key in resource_keys(self._policies[i]))}
+            policies = self._copies(ids)
+        if catalog is not None:
+            policies = [p for p in policies if catalog in _resource_values(p, "catalog")]
+        return policies
+
+    def find_by_entity(self, entity_type: str, entity_value: str,
+                       max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        self.ensure_fresh(max_age)
+        with self._lock:
+            return self._copies(self._by_entity.get((entity_type, entity_value), set()))
+
+    def policies(self) -> List[Dict[str, Any]]:
+        self.ensure_fresh()
+        with self._lock:
+            return self._copies(self._policies.keys())
+
+    def __len__(self):
+        return len(self._policies)
+
+
+class RangerPolicyCache:
+    """按服务管理策略快照的进程级缓存"""
+
+    def __init__(self, client, ttl: float = RANGER_POLICY_CACHE_TTL, page_size: int = RANGER_POLICY_PAGE_SIZE):
+        self.client = client
+        self.ttl = ttl
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, ServicePolicySnapshot] = {}
+
+    def snapshot(self, service: str) -> ServicePolicySnapshot:
+        snapshot = self._snapshots.get(service)
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshots.get(service)
+                if snapshot is None:
+                    snapshot = ServicePolicySnapshot(self.client, service, self.ttl, self.page_size)
+                    self._snapshots[service] = snapshot
+        return snapshot
+
+    def get_policy(self, service: str, name: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self.snapshot(service).get_by_name(name, max_age)
+
+    def get_policy_by_id(self, service: str, policy_id: int,
+                         max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        return self.snapshot(service).get_by_id(policy_id, max_age)
+
+    def find_by_entity(self, services: Iterable[str], entity_type: str, entity_value: str,
+                       max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        policies = []
+        for service in services:
+            policies.extend(self.snapshot(service).find_by_entity(entity_type, entity_value, max_age))
+        return policies
+
+    def upsert(self, policy) -> None:
+        service = policy.get("service") if policy else None
+        if service:
+            self.snapshot(service).upsert(policy)
+
+    def remove(self, policy_id: int) -> None:
+        # 策略ID在Ranger中全局唯一，删除时不需要知道所属服务
+        for snapshot in list(self._snapshots.values()):
+            if snapshot.remove(policy_id):
+                return
+
+    def invalidate(self, service: Optional[str] = None) -> None:
+        for name, snapshot in list(self._snapshots.items()):
+            if service is None or name == service:
+                snapshot.invalidate()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import logging
+import contextlib
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from apache_ranger.client.ranger_client import RangerClient
+
+from .circuit_breaker import get_breaker, ranger_breaker_name
+from .ranger_limiter import (
+    RANGER_LIMITER_ENABLED, RangerLimitTimeout, detect_service, get_limiter_registry, is_overload_status,
+)
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+# 从环境变量中获取Ranger配置
+RANGER_URL = os.getenv("RANGER_URL", "")
+RANGER_USER = os.getenv("RANGER_USER", "")
+RANGER_PASSWORD = os.getenv("RANGER_PASSWORD", "")
+
+# 连接池与超时配置
+RANGER_CONNECT_TIMEOUT = float(os.getenv("RANGER_CONNECT_TIMEOUT", "5"))    # 建立连接超时（秒）
+RANGER_READ_TIMEOUT = float(os.getenv("RANGER_READ_TIMEOUT", "30"))         # 读取响应超时（秒）
+RANGER_POOL_CONNECTIONS = int(os.getenv("RANGER_POOL_CONNECTIONS", "10"))   # 连接池数量（按host）
+RANGER_POOL_MAXSIZE = int(os.getenv("RANGER_POOL_MAXSIZE", "20"))           # 每个连接池的最大连接数
+
+
+class RangerCallCounter:
+    """统计一次操作实际发出的Ranger请求数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.by_method: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, method: str) -> None:
+        with self._lock:
+            self.calls += 1
+            self.by_method[method.upper()] = self.by_method.get(method.upper(), 0) + 1
+
+
+# 当前线程/协程所属操作的请求计数器，提交到线程池时需通过contextvars.copy_context传递
+_call_counter: ContextVar[Optional[RangerCallCounter]] = ContextVar("ranger_call_counter", default=None)
+
+
+@contextlib.contextmanager
+def count_ranger_calls():
+    """在with块内统计经共享会话发出的Ranger请求"""
+    counter = RangerCallCounter()
+    token = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(token)
+
+
+class RangerSession(requests.Session):
+    """带默认超时的requests会话
+
+    requests本身没有全局超时设置，这里在每次请求时补上默认的(connect, read)超时，
+    调用方显式传入timeout时以调用方为准
+    """
+
+    def __init__(self, timeout=(RANGER_CONNECT_TIMEOUT, RANGER_READ_TIMEOUT), limiters=None):
+        super().__init__()
+        self.timeout = timeout
+        self.limiters = limiters
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        counter = _call_counter.get()
+        if counter is not None:
+            counter.add(method)
+        service = detect_service(url, kwargs.get("data") or kwargs.get("json"))
+        # 服务熔断中时直接失败，不占用限流名额，也不等待连接超时；本地排队超时与Ranger健康无关
+        with get_breaker(ranger_breaker_name(service)).guard(ignore=(RangerLimitTimeout,)) as health:
+            if self.limiters is None:
+                response = super().request(method, url, **kwargs)
+            else:
+                # 按目标服务限流，5xx/超时和延迟升高时自动降低并发
+                with self.limiters.get(service).slot() as outcome:
+                    response = super().request(method, url, **kwargs)
+                    outcome["ok"] = not is_overload_status(response.status_code)
+            if response is not None and is_overload_status(response.status_code):
+                health["ok"] = False
+                health["error"] = f"HTTP {response.status_code}"
+            return response
+
+
+def build_ranger_session(
+    auth=None,
+    connect_timeout: float = RANGER_CONNECT_TIMEOUT,
+    read_timeout: float = RANGER_READ_TIMEOUT,
+    pool_connections: int = RANGER_POOL_CONNECTIONS,
+    pool_maxsize: int = RANGER_POOL_MAXSIZE,
+) -> RangerSession:
+    """创建一个启用keep-alive连接池的Ranger会话"""
+    limiters = get_limiter_registry() if RANGER_LIMITER_ENABLED else None
+    session = RangerSession(timeout=(connect_timeout, read_timeout), limiters=limiters)
+    session.auth = auth if auth is not None else (RANGER_USER, RANGER_PASSWORD)
+    session.headers.update({'Content-Type': 'application/json'})
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_lock = threading.Lock()
+_session: Optional[RangerSession] = None
+_client: Optional[RangerClient] = None
+
+
+def get_ranger_session() -> RangerSession:
+    """获取进程内共享的Ranger会话"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = build_ranger_session()
+                logger.info(
+                    f"初始化Ranger连接池: url={RANGER_URL}, 超时=({RANGER_CONNECT_TIMEOUT}, {RANGER_READ_TIMEOUT})秒, "
+                    f"pool_connections={RANGER_POOL_CONNECTIONS}, pool_maxsize={RANGER_POOL_MAXSIZE}"
+                )
+    return _session
+
+
+def get_ranger_client() -> RangerClient:
+    """获取进程内共享的RangerClient，底层复用共享会话"""
+    global _client
+    if _client is None:
+        session = get_ranger_session()
+        with _lock:
+            if _client is None:
+                client = RangerClient(RANGER_URL, (RANGER_USER, RANGER_PASSWORD))
+                client.session = session
+                _client = client
+    return _client
+
+
+def reset_ranger_transport() -> None:
+    """关闭并丢弃共享会话和客户端，下次使用时重新创建"""
+    global _session, _client
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _client = None
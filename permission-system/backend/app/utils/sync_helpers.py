@@ -1,15 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import heapq
+import random
+import asyncio
 import functools
+import itertools
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 import logging
-from typing import Any, Callable, Dict, Optional, TypeVar, cast
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar, cast
 
 from sqlalchemy.orm import Session
 
 from app.core.db import SessionLocal
+from app.utils.circuit_breaker import is_circuit_open
+from app.utils.sync_history import record_sync_history
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -17,6 +27,15 @@ logger = logging.getLogger(__name__)
 # 定义类型变量
 F = TypeVar('F', bound=Callable[..., Any])
 
+# 执行同步尝试的线程数
+SYNC_RETRY_WORKERS = int(os.getenv("SYNC_RETRY_WORKERS", "8"))
+# 单次重试的最长等待时间（秒）
+SYNC_RETRY_MAX_DELAY = float(os.getenv("SYNC_RETRY_MAX_DELAY", "30"))
+# 重试预算：窗口（秒）内重试次数不超过请求数的比例，以及窗口内保底可重试的次数
+SYNC_RETRY_BUDGET_RATIO = float(os.getenv("SYNC_RETRY_BUDGET_RATIO", "0.2"))
+SYNC_RETRY_BUDGET_MIN = int(os.getenv("SYNC_RETRY_BUDGET_MIN", "10"))
+SYNC_RETRY_BUDGET_WINDOW = float(os.getenv("SYNC_RETRY_BUDGET_WINDOW", "60"))
+
 # 同步状态常量
 SYNC_STATUS = {
     'SUCCESS': '成功',
@@ -37,18 +56,38 @@ class SyncRecord:
         self.status = None
         self.attempts = 0
         self.error_message = None
+        self.attempt_log: List[Dict[str, Any]] = []  # 每次尝试的耗时与结果
+        self._attempt_started: Optional[float] = None
     
     def start(self) -> None:
         """开始记录同步操作"""
         self.start_time = datetime.now()
         logger.info(f"[{self.module_name}] 开始{self.action}同步: ID={self.record_id}, 时间={self.start_time}")
     
+    def begin_attempt(self) -> None:
+        """记录一次尝试的开始"""
+        self.attempts += 1
+        self._attempt_started = time.monotonic()
+    
+    def end_attempt(self, error: Optional[Exception] = None) -> float:
+        """记录一次尝试的结束，返回本次尝试耗时（秒）"""
+        latency = time.monotonic() - self._attempt_started if self._attempt_started is not None else 0.0
+        self.attempt_log.append({
+            "attempt": self.attempts,
+            "latency": round(latency, 3),
+            "ok": error is None,
+            "error": str(error) if error is not None else None,
+        })
+        self._attempt_started = None
+        return latency
+    
     def success(self) -> None:
         """标记同步操作成功"""
         self.end_time = datetime.now()
         self.status = SYNC_STATUS['SUCCESS']
         duration = (self.end_time - self.start_time).total_seconds()
-        logger.info(f"[{self.module_name}] {self.action}同步成功: ID={self.record_id}, 耗时={duration:.2f}秒")
+        logger.info(f"[{self.module_name}] {self.action}同步成功: ID={self.record_id}, 耗时={duration:.2f}秒, 尝试={self.attempts}次")
+        self._persist()
     
     def fail(self, error: Exception) -> None:
         """标记同步操作失败"""
@@ -56,91 +95,280 @@ class SyncRecord:
         self.status = SYNC_STATUS['FAILED']
         self.error_message = str(error)
         duration = (self.end_time - self.start_time).total_seconds()
-        logger.error(f"[{self.module_name}] {self.action}同步失败: ID={self.record_id}, 耗时={duration:.2f}秒, 错误={self.error_message}")
+        logger.error(f"[{self.module_name}] {self.action}同步失败: ID={self.record_id}, 耗时={duration:.2f}秒, 尝试={self.attempts}次, 错误={self.error_message}")
+        self._persist()
+    
+    def _persist(self) -> None:
+        """结果放入同步历史的批量写入队列"""
+        record_sync_history(self.module_name, self.record_id, self.action, self.status,
+                            self.start_time, self.end_time, attempts=max(self.attempts, 1),
+                            error_message=self.error_message, attempt_log=self.attempt_log)
     
-    def retry(self, attempt: int, max_attempts: int, error: Exception) -> None:
+    def retry(self, attempt: int, max_attempts: int, error: Exception, delay: float = 0.0) -> None:
         """记录重试操作"""
-        self.attempts = attempt
         self.status = SYNC_STATUS['RETRYING']
         self.error_message = str(error)
-        logger.warning(f"[{self.module_name}] {self.action}同步重试: ID={self.record_id}, 尝试={attempt}/{max_attempts}, 错误={self.error_message}")
+        logger.warning(f"[{self.module_name}] {self.action}同步重试: ID={self.record_id}, 尝试={attempt}/{max_attempts}, {delay:.2f}秒后执行, 错误={self.error_message}")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "module_name": self.module_name,
+            "record_id": self.record_id,
+            "action": self.action,
+            "status": self.status,
+            "attempts": self.attempts,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "error_message": self.error_message,
+            "attempt_log": list(self.attempt_log),
+        }
+
+
+class RetryBudget:
+    """单个外部依赖的重试预算
+
+    在滑动窗口内，重试次数不超过首次请求数的一定比例（另有少量保底额度），
+    依赖整体故障时大部分请求快速失败，避免重试流量放大故障
+    """
+    
+    def __init__(self, ratio: float = SYNC_RETRY_BUDGET_RATIO, min_retries: int = SYNC_RETRY_BUDGET_MIN,
+                 window: float = SYNC_RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+    
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+    
+    def record_request(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+    
+    def try_spend(self) -> bool:
+        """申请一次重试额度，预算耗尽时返回False"""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._retries) >= max(self.min_retries, self.ratio * len(self._requests)):
+                return False
+            self._retries.append(now)
+            return True
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {"requests": len(self._requests), "retries": len(self._retries),
+                    "ratio": self.ratio, "min_retries": self.min_retries, "window": self.window}
+
+
+_budgets: Dict[str, RetryBudget] = {}
+_budgets_lock = threading.Lock()
+
+
+def get_retry_budget(dependency: str) -> RetryBudget:
+    budget = _budgets.get(dependency)
+    if budget is None:
+        with _budgets_lock:
+            budget = _budgets.setdefault(dependency, RetryBudget())
+    return budget
+
+
+def retry_budget_snapshot() -> Dict[str, Dict[str, Any]]:
+    return {dependency: budget.snapshot() for dependency, budget in list(_budgets.items())}
+
+
+def backoff_delay(attempt: int, base: float, max_delay: float = SYNC_RETRY_MAX_DELAY) -> float:
+    """第attempt次失败后的等待时间：指数退避，在[一半, 全部]之间随机抖动，避免重试同时到达"""
+    delay = min(max_delay, base * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryScheduler:
+    """非阻塞重试调度器
+
+    每次尝试在共享线程池中执行；失败后按退避时间放入定时堆，由单个调度线程到期后再提交，
+    等待重试期间不占用任何工作线程
+    """
+    
+    def __init__(self, workers: int = SYNC_RETRY_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync-retry")
+        self._heap: List[Tuple[float, int, Callable[[], None]]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+    
+    def submit(self, fn: Callable[[], None]) -> None:
+        self.executor.submit(fn)
+    
+    def call_later(self, delay: float, fn: Callable[[], None]) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), fn))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="sync-retry-timer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+    
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+    
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, fn = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+            self.executor.submit(fn)
+
+
+_scheduler: Optional[RetryScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_retry_scheduler() -> RetryScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RetryScheduler()
+    return _scheduler
+
+
+def _is_retryable(error: Exception) -> bool:
+    """4xx类的HTTPException（如记录不存在）重试也不会成功；依赖熔断中时立即失败，不再等待重试"""
+    if is_circuit_open(error):
+        return False
+    status_code = getattr(error, "status_code", None)
+    return not (isinstance(status_code, int) and 400 <= status_code < 500)
+
 
+def _to_http_exception(error: Exception, module_name: str, action: str) -> Exception:
+    # 导入 HTTPException，确保可以正确抛出错误
+    try:
+        from fastapi import HTTPException
+    except ImportError:
+        # 如果无法导入 HTTPException，则抛出原始异常
+        return error
+    # 依赖熔断中返回503，原异常保留在原因链中，调用方可据此改为写入同步发件箱
+    if is_circuit_open(error):
+        wrapped = HTTPException(status_code=503, detail=f"{module_name}{action}失败: {getattr(error, 'detail', None) or error}")
+        wrapped.__cause__ = error
+        return wrapped
+    # 如果原始异常已经是 HTTPException，直接抛出
+    if isinstance(error, HTTPException):
+        return error
+    # 否则，将异常包装为 HTTPException 以便前端显示
+    wrapped = HTTPException(status_code=500, detail=f"{module_name}{action}失败: {str(error)}")
+    wrapped.__cause__ = error
+    return wrapped
 
-def with_sync_retry(max_attempts: int = 3, retry_delay: int = 2):
+
+class _RetryTask:
+    """一次带重试的同步调用，结果通过future返回"""
+    
+    def __init__(self, func, args, kwargs, max_attempts: int, retry_delay: float, dependency: str,
+                 scheduler: RetryScheduler):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.budget = get_retry_budget(dependency)
+        self.scheduler = scheduler
+        self.module_name = kwargs.get('module_name', '未知模块')
+        self.action = kwargs.get('action', '同步')
+        self.record = SyncRecord(self.module_name, kwargs.get('record_id', args[0] if args else 0), self.action)
+        self.future: Future = Future()
+        self.future.sync_record = self.record
+        
+        # 获取数据库会话 - 如果没有传入则创建一个新的
+        self.local_db = kwargs.get('db') is None
+        if self.local_db:
+            self.kwargs['db'] = SessionLocal()
+    
+    def start(self) -> Future:
+        self.record.start()
+        self.budget.record_request()
+        self.scheduler.submit(self.run)
+        return self.future
+    
+    def run(self) -> None:
+        self.record.begin_attempt()
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.record.end_attempt(e)
+            self._handle_error(e)
+            return
+        self.record.end_attempt()
+        self.record.success()
+        self._close()
+        self.future.set_result(result)
+    
+    def _handle_error(self, error: Exception) -> None:
+        attempt = self.record.attempts
+        if attempt < self.max_attempts and _is_retryable(error):
+            if self.budget.try_spend():
+                delay = backoff_delay(attempt, self.retry_delay)
+                self.record.retry(attempt + 1, self.max_attempts, error, delay)
+                # 会话在下次尝试前回滚，避免沿用失败事务的状态
+                self.kwargs['db'].rollback()
+                self.scheduler.call_later(delay, self.run)
+                return
+            logger.warning(f"[{self.module_name}] 重试预算已用尽，放弃重试: ID={self.record.record_id}")
+        self.record.fail(error)
+        self._close()
+        self.future.set_exception(_to_http_exception(error, self.module_name, self.action))
+    
+    def _close(self) -> None:
+        # 如果是本地创建的数据库会话，关闭它
+        if self.local_db:
+            self.kwargs['db'].close()
+
+
+def with_sync_retry(max_attempts: int = 3, retry_delay: float = 2, dependency: str = "ranger"):
     """同步函数重试装饰器
     
-    为同步函数添加重试逻辑和日志记录
+    为同步函数添加重试逻辑和日志记录。重试由RetryScheduler调度：两次尝试之间不占用线程，
+    等待时间按指数退避加随机抖动计算，并受所属外部依赖的重试预算限制。
+    
+    被装饰的函数:
+        直接调用时等待最终结果（与原来的行为一致）；
+        func.submit(...) 立即返回concurrent.futures.Future，future.sync_record为同步记录；
+        await func.run_async(...) 在事件循环中等待结果，不占用线程。
     
     参数:
         max_attempts: 最大尝试次数，默认为3次
-        retry_delay: 重试间隔时间(秒)，默认为2秒
+        retry_delay: 首次重试的基础等待时间(秒)，默认为2秒，之后每次翻倍
+        dependency: 外部依赖名称，同一依赖共享重试预算，如 "ranger"、"hdfs"
     """
     def decorator(func: F) -> F:
+        def submit(*args, **kwargs) -> Future:
+            task = _RetryTask(func, args, dict(kwargs), max_attempts, retry_delay, dependency,
+                              get_retry_scheduler())
+            return task.start()
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # 提取模块名、记录ID和操作类型
-            module_name = kwargs.get('module_name', '未知模块')
-            record_id = kwargs.get('record_id', args[0] if args else 0)
-            action = kwargs.get('action', '同步')
-            
-            # 创建同步记录
-            sync_record = SyncRecord(module_name, record_id, action)
-            
-            # 获取数据库会话 - 如果没有传入则创建一个新的
-            db = kwargs.get('db')
-            local_db = False
-            if db is None:
-                db = SessionLocal()
-                kwargs['db'] = db
-                local_db = True
-            
-            attempt = 0
-            last_error = None
-            
-            while attempt < max_attempts:
-                attempt += 1
-                try:
-                    if attempt == 1:
-                        sync_record.start()
-                    else:
-                        sync_record.retry(attempt, max_attempts, last_error)
-                    
-                    result = func(*args, **kwargs)
-                    sync_record.success()
-                    
-                    # 如果是本地创建的数据库会话，关闭它
-                    if local_db:
-                        db.close()
-                    
-                    return result
-                
-                except Exception as e:
-                    last_error = e
-                    if attempt < max_attempts:
-                        # 重试前等待一段时间
-                        time.sleep(retry_delay)
-                    else:
-                        sync_record.fail(e)
-                        # 如果是本地创建的数据库会话，关闭它
-                        if local_db:
-                            db.close()
-                        
-                        # 导入 HTTPException，确保可以正确抛出错误
-                        try:
-                            from fastapi import HTTPException
-                            # 如果原始异常已经是 HTTPException，直接抛出
-                            if isinstance(e, HTTPException):
-                                raise e
-                            # 否则，将异常包装为 HTTPException 以便前端显示
-                            error_msg = f"{module_name}{action}失败: {str(e)}"
-                            raise HTTPException(status_code=500, detail=error_msg) from e
-                        except ImportError:
-                            # 如果无法导入 HTTPException，则抛出原始异常
-                            raise e
-            
-            # 这里正常不会到达，但为了类型检查完整性
-            raise last_error
+            return submit(*args, **kwargs).result()
+        
+        async def run_async(*args, **kwargs):
+            return await asyncio.wrap_future(submit(*args, **kwargs))
         
+        wrapper.submit = submit
+        wrapper.run_async = run_async
         return cast(F, wrapper)
     
     return decorator
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from sqlalchemy import and_, case, desc, func, insert
+from sqlalchemy.orm import Session
+
+from app.models.ranger_sync import SyncHistory
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+SYNC_HISTORY_ENABLED = os.getenv("SYNC_HISTORY_ENABLED", "true").lower() == "true"
+SYNC_HISTORY_BATCH_SIZE = int(os.getenv("SYNC_HISTORY_BATCH_SIZE", "200"))
+SYNC_HISTORY_FLUSH_INTERVAL = float(os.getenv("SYNC_HISTORY_FLUSH_INTERVAL", "5"))
+SYNC_HISTORY_MAX_QUEUE = int(os.getenv("SYNC_HISTORY_MAX_QUEUE", "10000"))     # 数据库不可用时最多缓存的条数
+
+# 耗时直方图的桶上界（秒），最后一个桶为+Inf
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STATUS_SUCCESS = "成功"
+STATUS_FAILED = "失败"
+
+
+class SyncHistoryWriter:
+    """同步历史批量写入器
+
+    SyncRecord结束时只把结果放入内存队列，后台线程按批量或时间间隔写入数据库，
+    不在同步路径上增加数据库往返；数据库写入失败时保留队列，超过上限丢弃最旧的记录
+    """
+
+    def __init__(self, session_factory=None, batch_size: int = SYNC_HISTORY_BATCH_SIZE,
+                 flush_interval: float = SYNC_HISTORY_FLUSH_INTERVAL, max_queue: int = SYNC_HISTORY_MAX_QUEUE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Deque[Dict[str, Any]] = deque(maxlen=max_queue)
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"written": 0, "dropped": 0, "failures": 0}
+
+    def submit(self, entry: Dict[str, Any]) -> None:
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.stats["dropped"] += 1
+            self._queue.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="sync-history-writer", daemon=True)
+                self._thread.start()
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> int:
+        """把队列中的记录写入数据库，返回写入条数"""
+        with self._flush_lock:
+            with self._cond:
+                batch = list(self._queue)
+                self._queue.clear()
+            if not batch:
+                return 0
+            session_factory = self.session_factory
+            if session_factory is None:
+                from app.core.db import SessionLocal
+                session_factory = SessionLocal
+            db = session_factory()
+            try:
+                for start in range(0, len(batch), self.batch_size):
+                    db.execute(insert(SyncHistory), batch[start:start + self.batch_size])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self.stats["failures"] += 1
+                logger.warning(f"[同步历史] 写入{len(batch)}条记录失败，稍后重试: {e}")
+                with self._cond:
+                    # 放回队列头部，保持时间顺序
+                    self._queue.extendleft(reversed(batch))
+                return 0
+            finally:
+                db.close()
+            self.stats["written"] += len(batch)
+            return len(batch)
+
+
+_writer: Optional[SyncHistoryWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_history_writer() -> SyncHistoryWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SyncHistoryWriter()
+    return _writer
+
+
+def record_sync_history(module_name: str, record_id: Optional[int], action: str, status: str,
+                        started_at: datetime, finished_at: datetime, attempts: int = 1,
+                        error_message: Optional[str] = None,
+                        attempt_log: Optional[List[Dict[str, Any]]] = None) -> None:
+    """记录一次同步结果，异步批量写入sync_history"""
+    if not SYNC_HISTORY_ENABLED:
+        return
+    get_history_writer().submit({
+        "module_name": module_name,
+        "record_id": record_id if isinstance(record_id, int) else None,
+        "action": action,
+        "status": status,
+        "attempts": attempts,
+        "duration": round((finished_at - started_at).total_seconds(), 3),
+        "error_message": error_message[:2000] if error_message else None,
+        "attempt_log": json.dumps(attempt_log, ensure_ascii=False) if attempt_log else None,
+        "started_at": started_at,
+        "finished_at": finished_at,
+    })
+
+
+# ---------- 查询 ----------
+
+def _filtered(query, start: Optional[datetime], end: Optional[datetime],
+              module_name: Optional[str] = None, action: Optional[str] = None):
+    if start is not None:
+        query = query.filter(SyncHistory.started_at >= start)
+    if end is not None:
+        query = query.filter(SyncHistory.started_at < end)
+    if module_name:
+        query = query.filter(SyncHistory.module_name == module_name)
+    if action:
+        query = query.filter(SyncHistory.action == action)
+    return query
+
+
+def _bucket_label(index: int) -> str:
+    return f"le_{DURATION_BUCKETS[index]}" if index < len(DURATION_BUCKETS) else "le_inf"
+
+
+def histogram_quantile(q: float, buckets: Sequence[int], max_value: Optional[float]) -> Optional[float]:
+    """根据各桶计数估算分位数，桶内按线性分布插值；落在+Inf桶时用最大值兜底"""
+    total = sum(buckets)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(buckets):
+        if cumulative + count >= rank and count > 0:
+            lower = DURATION_BUCKETS[index - 1] if index > 0 else 0.0
+            upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else max_value
+            if upper is None:
+                return lower
+            return round(lower + (upper - lower) * (rank - cumulative) / count, 3)
+        cumulative += count
+    return max_value
+
+
+def duration_stats(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   module_name: Optional[str] = None, action: Optional[str] = None) -> List[Dict[str, Any]]:
+    """按模块和动作聚合耗时直方图、分位数和失败数，直方图在数据库中一次聚合完成"""
+    bucket_columns = []
+    for index in range(len(DURATION_BUCKETS) + 1):
+        lower = DURATION_BUCKETS[index - 1] if index > 0 else None
+        upper = DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else None
+        condition = []
+        if lower is not None:
+            condition.append(SyncHistory.duration > lower)
+        if upper is not None:
+            condition.append(SyncHistory.duration <= upper)
+        bucket_columns.append(func.sum(case((and_(*condition), 1), else_=0)))
+    query = db.query(
+        SyncHistory.module_name,
+        SyncHistory.action,
+        func.count(SyncHistory.id),
+        func.sum(case((SyncHistory.status == STATUS_FAILED, 1), else_=0)),
+        func.sum(SyncHistory.attempts),
+        func.avg(SyncHistory.duration),
+        func.max(SyncHistory.duration),
+        *bucket_columns,
+    )
+    rows = _filtered(query, start, end, module_name, action).group_by(
+        SyncHistory.module_name, SyncHistory.action).all()
+
+    result = []
+    for row in rows:
+        module, act, count, failed, attempts, avg, max_duration = row[:7]
+        buckets = [int(value or 0) for value in row[7:]]
+        failed = int(failed or 0)
+        result.append({
+            "module_name": module,
+            "action": act,
+            "count": count,
+            "failed": failed,
+            "failure_rate": round(failed / count, 4) if count else 0,
+            "retries": int(attempts or 0) - count,
+            "avg": round(avg, 3) if avg is not None else None,
+            "max": round(max_duration, 3) if max_duration is not None else None,
+            "p50": histogram_quantile(0.5, buckets, max_duration),
+            "p90": histogram_quantile(0.9, buckets, max_duration),
+            "p99": histogram_quantile(0.99, buckets, max_duration),
+            "histogram": {_bucket_label(index): count for index, count in enumerate(buckets)},
+        })
+    return result
+
+
+def slowest_records(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    module_name: Optional[str] = None, action: Optional[str] = None,
+                    limit: int = 20) -> List[Dict[str, Any]]:
+    rows = _filtered(db.query(SyncHistory), start, end, module_name, action).order_by(
+        desc(SyncHistory.duration)).limit(limit).all()
+    return [{
+        "id": row.id,
+        "module_name": row.module_name,
+        "record_id": row.record_id,
+        "action": row.action,
+        "status": row.status,
+        "attempts": row.attempts,
+        "duration": row.duration,
+        "started_at": row.started_at.isoformat() if row.started_at else None,
+        "attempt_log": json.loads(row.attempt_log) if row.attempt_log else [],
+    } for row in rows]
+
+
+def failing_records(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    module_name: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """失败次数最多的记录"""
+    failures = func.count(SyncHistory.id).label("failures")
+    rows = _filtered(
+        db.query(SyncHistory.module_name, SyncHistory.record_id, failures,
+                 func.max(SyncHistory.started_at).label("last_failed_at")),
+        start, end, module_name,
+    ).filter(
+        SyncHistory.status == STATUS_FAILED, SyncHistory.record_id.isnot(None)
+    ).group_by(SyncHistory.module_name, SyncHistory.record_id).order_by(desc(failures)).limit(limit).all()
+
+    result = []
+    for module, record_id, count, last_failed_at in rows:
+        last_error = db.query(SyncHistory.error_message).filter(
+            SyncHistory.module_name == module, SyncHistory.record_id == record_id,
+            SyncHistory.status == STATUS_FAILED,
+        ).order_by(desc(SyncHistory.started_at)).limit(1).scalar()
+        result.append({
+            "module_name": module,
+            "record_id": record_id,
+            "failures": count,
+            "last_failed_at": last_failed_at.isoformat() if last_failed_at else None,
+            "last_error": last_error,
+        })
+    return result
@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from app.models.models import HdfsQuota
+from app.models.ranger_sync import SyncJob
+from .ranger_incremental import RANGER_INCREMENTAL_SYNC_INTERVAL, SYNC_MODULES, run_incremental_sync
+from .ranger_limiter import LANE_RECONCILE, sync_lane
+from .ranger_pipeline import apply_hdfs_quota, reconcile_all
+from .ranger_reconcile import reconcile
+from .sync_outbox import default_worker_id
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+SYNC_JOB_POLL_INTERVAL = float(os.getenv("SYNC_JOB_POLL_INTERVAL", "2"))
+SYNC_JOB_PROGRESS_INTERVAL = float(os.getenv("SYNC_JOB_PROGRESS_INTERVAL", "1"))   # 进度写入数据库的间隔（秒）
+SYNC_JOB_LEASE = int(os.getenv("SYNC_JOB_LEASE", "120"))                          # 超过该时间没有心跳视为worker已退出
+# 每天在该小时（数据库时间）自动创建一次统一对账任务，-1表示不启用
+SYNC_NIGHTLY_RECONCILE_HOUR = int(os.getenv("SYNC_NIGHTLY_RECONCILE_HOUR", "-1"))
+
+# all为表/字段/行权限和HDFS配额的统一对账
+MODULE_ALL = "all"
+JOB_MODULES = ("table", "column", "row", "hdfs", MODULE_ALL)
+NIGHTLY_CREATOR = "nightly"
+INCREMENTAL_CREATOR = "incremental"
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+# run_job的返回值：任务已被其他worker重新领取，本worker放弃执行且不写入结果
+LEASE_LOST = "lost"
+
+# 创建和领取任务时持有的PostgreSQL事务级咨询锁，冲突检查与写入在同一把锁内完成
+_JOB_ADVISORY_LOCK_KEY = 72320
+
+PHASE_LOADING = "加载记录"
+PHASE_PLANNING = "计算差异"
+PHASE_APPLYING = "执行变更"
+PHASE_INCREMENTAL = "增量同步"
+
+
+class SyncJobConflict(Exception):
+    """同一模块已有未结束的同步任务"""
+
+    def __init__(self, job: SyncJob):
+        super().__init__(f"{job.module}同步任务ID={job.id}尚未结束")
+        self.job = job
+
+
+class SyncJobCancelled(Exception):
+    """任务已被取消"""
+
+
+class SyncJobLeaseLost(SyncJobCancelled):
+    """任务心跳超时后已被其他worker重新领取"""
+
+
+def _now(db: Session):
+    return db.execute(select(func.now())).scalar()
+
+
+def _lock_jobs(db: Session) -> None:
+    """在当前事务内串行化任务的创建和领取，事务提交或回滚时释放"""
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _JOB_ADVISORY_LOCK_KEY})
+
+
+def get_active_job(db: Session, module: str) -> Optional[SyncJob]:
+    """返回与该模块冲突的未结束任务：统一对账与任何模块的任务都互斥"""
+    query = db.query(SyncJob).filter(SyncJob.status.in_(ACTIVE_STATUSES))
+    if module != MODULE_ALL:
+        query = query.filter(SyncJob.module.in_((module, MODULE_ALL)))
+    return query.order_by(SyncJob.id).first()
+
+
+def create_job(db: Session, module: str, options: Optional[Dict[str, Any]] = None,
+               created_by: Optional[str] = None) -> SyncJob:
+    """创建同步任务，同一模块已有待执行或执行中的任务时抛出SyncJobConflict"""
+    for _ in range(2):
+        # 部分唯一索引只约束同一模块，统一对账与各模块任务的互斥由咨询锁保证检查和写入不被并发穿插
+        _lock_jobs(db)
+        existing = get_active_job(db, module)
+        if existing is not None:
+            raise SyncJobConflict(existing)
+        job = SyncJob(module=module, status=STATUS_PENDING, options=json.dumps(options or {}),
+                      done=0, failed=0, cancel_requested=False, created_by=created_by)
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # 并发创建时由部分唯一索引兜底，回滚后返回已存在的任务
+            db.rollback()
+            continue
+        db.refresh(job)
+        logger.info(f"[同步任务] 创建{module}同步任务ID={job.id}, 参数={options}")
+        return job
+    raise SyncJobConflict(get_active_job(db, module))
+
+
+def claim_job(db: Session, worker_id: str) -> Optional[SyncJob]:
+    """领取最早的一个可执行的待执行任务
+
+    领取在咨询锁内串行进行，与执行中的任务冲突（同一模块，或任一方为统一对账）的任务留在队列中，
+    即使冲突的任务绕过创建时的检查进入了队列也不会同时执行。
+    每次领取递增attempt，原worker据此发现任务已被重新领取
+    """
+    _lock_jobs(db)
+    now = _now(db)
+    # 心跳超时的任务：执行它的worker已经退出，重新排队（对账是幂等的，重新执行即可）
+    stale = db.query(SyncJob).filter(
+        SyncJob.status == STATUS_RUNNING,
+        SyncJob.heartbeat_at < now - timedelta(seconds=SYNC_JOB_LEASE),
+    ).update({SyncJob.status: STATUS_PENDING, SyncJob.worker_id: None}, synchronize_session=False)
+    if stale:
+        logger.warning(f"[同步任务] {stale}个任务心跳超时，重新排队")
+
+    running = aliased(SyncJob)
+    conflicting = select(running.id).where(
+        running.status == STATUS_RUNNING,
+        or_(running.module == SyncJob.module, running.module == MODULE_ALL, SyncJob.module == MODULE_ALL),
+    ).exists()
+    job = db.query(SyncJob).filter(SyncJob.status == STATUS_PENDING, ~conflicting).order_by(
+        SyncJob.id).with_for_update(skip_locked=True).first()
+    if job is not None:
+        job.status = STATUS_RUNNING
+        job.worker_id = worker_id
+        job.attempt = (job.attempt or 0) + 1
+        job.phase = PHASE_LOADING
+        job.started_at = now
+        job.heartbeat_at = now
+        job.done = 0
+        job.failed = 0
+        job.total = None
+        job.error = None
+    db.commit()
+    return job
+
+
+def request_cancel(db: Session, job_id: int) -> Optional[SyncJob]:
+    """取消任务：待执行的任务直接取消，执行中的任务设置取消标记，由worker在下一次写入进度时停止"""
+    job = db.query(SyncJob).filter(SyncJob.id == job_id).with_for_update().first()
+    if job is None:
+        return None
+    if job.status == STATUS_PENDING:
+        job.status = STATUS_CANCELLED
+        job.finished_at = func.now()
+    elif job.status == STATUS_RUNNING:
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    logger.info(f"[同步任务] 请求取消任务ID={job_id}, 当前状态={job.status}")
+    return job
+
+
+class JobProgress:
+    """执行中任务的进度
+
+    作为对账的progress回调只更新内存中的计数；后台线程按固定间隔把进度和心跳写入数据库，
+    同时读取取消标记和领取次数，回调发现已取消或已被重新领取时抛出异常中止后续变更
+    """
+
+    def __init__(self, session_factory, job_id: int, attempt: Optional[int] = None,
+                 interval: float = SYNC_JOB_PROGRESS_INTERVAL, lease: Optional[float] = None):
+        self.session_factory = session_factory
+        self.job_id = job_id
+        self.attempt = attempt
+        self.interval = interval
+        self.lease = SYNC_JOB_LEASE if lease is None else lease
+        self.phase = PHASE_LOADING
+        self.records: Optional[int] = None
+        self.total: Optional[int] = None
+        self.done = 0
+        self.failed = 0
+        self.cancelled = threading.Event()
+        self.lost = threading.Event()
+        # 最近一次在数据库中确认任务仍归本worker所有的时间（time.monotonic）
+        self._confirmed_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __call__(self, done: int, failed: int, total: int) -> None:
+        self.phase = PHASE_APPLYING
+        self.done = done
+        self.failed = failed
+        self.total = total
+        self.check_cancelled()
+
+    def check_cancelled(self) -> None:
+        """每一步执行前调用：任务已取消或已不归本worker所有时抛出异常
+
+        距上次确认超过租约的一半时先同步写入一次心跳；超过租约仍无法确认时放弃执行，
+        此时任务可能已被其他worker重新领取
+        """
+        if self._confirmed_at is None or time.monotonic() - self._confirmed_at >= self.lease / 2:
+            self.save()
+        if self.lost.is_set():
+            raise SyncJobLeaseLost(f"同步任务ID={self.job_id}已被其他worker重新领取")
+        if self._confirmed_at is None or time.monotonic() - self._confirmed_at >= self.lease:
+            self.lost.set()
+            raise SyncJobLeaseLost(f"同步任务ID={self.job_id}超过{self.lease}秒未能确认归属")
+        if self.cancelled.is_set():
+            raise SyncJobCancelled(f"同步任务ID={self.job_id}已取消")
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name=f"sync-job-{self.job_id}-progress", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.save()
+
+    def save(self) -> None:
+        started = time.monotonic()
+        db = self.session_factory()
+        try:
+            job = db.query(SyncJob).filter(SyncJob.id == self.job_id).with_for_update().first()
+            if job is None or job.status != STATUS_RUNNING or \
+                    (self.attempt is not None and job.attempt != self.attempt):
+                # 心跳超时后任务已被重新领取（或已结束），不再覆盖新执行者的进度
+                self.lost.set()
+                db.rollback()
+                return
+            job.phase = self.phase
+            job.records = self.records
+            job.total = self.total
+            job.done = self.done
+            job.failed = self.failed
+            job.heartbeat_at = func.now()
+            if job.cancel_requested:
+                self.cancelled.set()
+            db.commit()
+            self._confirmed_at = started
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[同步任务] 写入任务ID={self.job_id}进度失败: {e}")
+        finally:
+            db.close()
+
+
+def _permission_runner(kind: str) -> Callable:
+    def run(db: Session, options: Dict[str, Any], manager_factory, progress: JobProgress) -> Dict[str, Any]:
+        if options.get("incremental"):
+            progress.phase = PHASE_INCREMENTAL
+            return run_incremental_sync(kind, db, manager_factory())
+        perms = db.query(SYNC_MODULES[kind]).all()
+        progress.records = len(perms)
+        progress.phase = PHASE_PLANNING
+        progress.check_cancelled()
+        result = reconcile(kind, perms, manager_factory(), prune=bool(options.get("prune")), progress=progress)
+        return {
+            "records": len(perms),
+            "plan": result["plan"],
+            "applied": result["applied"],
+            "failed_ids": result["failed_ids"][:10],
+            "errors": result["errors"][:10],
+            "duration": result["duration"],
+        }
+    return run
+
+
+def _run_hdfs_job(db: Session, options: Dict[str, Any], manager_factory, progress: JobProgress) -> Dict[str, Any]:
+    started = time.time()
+    quotas = db.query(HdfsQuota).all()
+    progress.records = len(quotas)
+    failed_records = []
+    progress(0, 0, len(quotas))
+    for index, quota in enumerate(quotas):
+        error = apply_hdfs_quota(quota)
+        if error:
+            failed_records.append(error)
+        progress(index + 1 - len(failed_records), len(failed_records), len(quotas))
+    return {
+        "records": len(quotas),
+        "synced": len(quotas) - len(failed_records),
+        "failed": len(failed_records),
+        "failed_records": failed_records[:10],
+        "duration": round(time.time() - started, 3),
+    }
+
+
+def _run_all_job(db: Session, options: Dict[str, Any], manager_factory, progress: JobProgress) -> Dict[str, Any]:
+    progress.phase = PHASE_PLANNING
+    result = reconcile_all(db, manager_factory(), prune=bool(options.get("prune")),
+                           include_hdfs=options.get("hdfs", True), progress=progress)
+    progress.records = sum(result["records"].values())
+    result["failed_ids"] = {kind: ids[:10] for kind, ids in result["failed_ids"].items()}
+    result["errors"] = result["errors"][:10]
+    return result
+
+
+JOB_RUNNERS = {kind: _permission_runner(kind) for kind in SYNC_MODULES}
+JOB_RUNNERS["hdfs"] = _run_hdfs_job
+JOB_RUNNERS[MODULE_ALL] = _run_all_job
+
+
+def schedule_nightly_reconcile(db: Session, hour: int = SYNC_NIGHTLY_RECONCILE_HOUR) -> Optional[SyncJob]:
+    """到达设定的小时且当天还没有创建过时，创建统一对账任务"""
+    if hour < 0:
+        return None
+    now = _now(db)
+    if now.hour < hour:
+        return None
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    exists = db.query(SyncJob.id).filter(
+        SyncJob.module == MODULE_ALL, SyncJob.created_by == NIGHTLY_CREATOR, SyncJob.created_at >= today
+    ).first()
+    if exists:
+        return None
+    try:
+        return create_job(db, MODULE_ALL, {"prune": False, "hdfs": True}, created_by=NIGHTLY_CREATOR)
+    except SyncJobConflict as e:
+        logger.info(f"[同步任务] 跳过每日统一对账: {e}")
+        return None
+
+
+def schedule_incremental_sync(db: Session, interval: int = RANGER_INCREMENTAL_SYNC_INTERVAL) -> List[SyncJob]:
+    """距上次定时增量同步超过interval秒的权限模块，各创建一个增量同步任务
+
+    由sync-worker在领取任务前调用，多个worker同时创建时由同一模块只有一个未结束任务的约束去重
+    """
+    if interval <= 0:
+        return []
+    since = _now(db) - timedelta(seconds=interval)
+    jobs = []
+    for kind in SYNC_MODULES:
+        recent = db.query(SyncJob.id).filter(
+            SyncJob.module == kind, SyncJob.created_by == INCREMENTAL_CREATOR, SyncJob.created_at >= since
+        ).first()
+        if recent:
+            continue
+        try:
+            jobs.append(create_job(db, kind, {"incremental": True}, created_by=INCREMENTAL_CREATOR))
+        except SyncJobConflict as e:
+            logger.info(f"[同步任务] 跳过{kind}权限定时增量同步: {e}")
+    return jobs
+
+
+def run_job(session_factory, job_id: int, manager_factory, attempt: Optional[int] = None) -> str:
+    """执行一个已领取的任务，返回最终状态；任务已被重新领取时返回LEASE_LOST
+
+    attempt为领取时的领取次数，为None时取任务当前的领取次数
+    """
+    result = None
+    error = None
+    db = session_factory()
+    try:
+        job = db.get(SyncJob, job_id)
+        module = job.module
+        options = json.loads(job.options or "{}")
+        if attempt is None:
+            attempt = job.attempt
+        progress = JobProgress(session_factory, job_id, attempt)
+        logger.info(f"[同步任务] 开始执行{module}同步任务ID={job_id}, 第{attempt}次领取, 参数={options}")
+        progress.start()
+        try:
+            progress.check_cancelled()
+            # 后台任务走reconcile通道，界面上的单条操作优先获得线程和Ranger请求名额
+            with sync_lane(LANE_RECONCILE):
+                result = JOB_RUNNERS[module](db, options, manager_factory, progress)
+            status = STATUS_DONE
+        except SyncJobLeaseLost as e:
+            status = LEASE_LOST
+            logger.warning(f"[同步任务] 任务ID={job_id}停止执行: {e}")
+        except SyncJobCancelled:
+            status = STATUS_CANCELLED
+        except Exception as e:
+            db.rollback()
+            status = STATUS_FAILED
+            error = str(e)
+            logger.error(f"[同步任务] 任务ID={job_id}执行失败: {e}")
+        finally:
+            progress.stop()
+    finally:
+        db.close()
+
+    if status == LEASE_LOST:
+        return LEASE_LOST
+    # 写入最终进度和结果，只在任务仍归本次领取所有时生效
+    progress.save()
+    db = session_factory()
+    try:
+        updated = db.query(SyncJob).filter(
+            SyncJob.id == job_id, SyncJob.attempt == attempt, SyncJob.status == STATUS_RUNNING
+        ).update({
+            SyncJob.status: status,
+            SyncJob.phase: None,
+            SyncJob.result: json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+            SyncJob.error: error[:2000] if error else None,
+            SyncJob.finished_at: func.now(),
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if not updated:
+        logger.warning(f"[同步任务] 任务ID={job_id}已被其他worker重新领取，不写入本次结果")
+        return LEASE_LOST
+    logger.info(f"[同步任务] 任务ID={job_id}结束: 状态={status}, 成功{progress.done}, 失败{progress.failed}")
+    return status
+
+
+def job_to_dict(job: SyncJob) -> Dict[str, Any]:
+    """任务信息，速率和预计剩余时间按已执行的变更数和已用时间估算"""
+    processed = (job.done or 0) + (job.failed or 0)
+    elapsed = None
+    rate = None
+    eta = None
+    if job.started_at is not None:
+        end = job.finished_at or job.heartbeat_at or job.started_at
+        elapsed = max((end - job.started_at).total_seconds(), 0.0)
+        if elapsed and processed:
+            rate = processed / elapsed
+            if job.status == STATUS_RUNNING and job.total is not None:
+                eta = max(job.total - processed, 0) / rate
+    return {
+        "id": job.id,
+        "module": job.module,
+        "status": job.status,
+        "phase": job.phase,
+        "options": json.loads(job.options) if job.options else {},
+        "records": job.records,
+        "total": job.total,
+        "done": job.done,
+        "failed": job.failed,
+        "percent": round(processed * 100 / job.total, 1) if job.total else None,
+        "rate": round(rate, 2) if rate is not None else None,
+        "eta": round(eta, 1) if eta is not None else None,
+        "elapsed": round(elapsed, 1) if elapsed is not None else None,
+        "cancel_requested": job.cancel_requested,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_by": job.created_by,
+        "worker_id": job.worker_id,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def list_jobs(db: Session, module: Optional[str] = None, status: Optional[str] = None,
+              limit: int = 20) -> List[SyncJob]:
+    query = db.query(SyncJob)
+    if module:
+        query = query.filter(SyncJob.module == module)
+    if status:
+        query = query.filter(SyncJob.status == status)
+    return query.order_by(SyncJob.id.desc()).limit(limit).all()
+
+
+class SyncJobWorker:
+    """同步任务执行者，在sync-worker进程中与发件箱消费者并行运行"""
+
+    def __init__(self, session_factory=None, manager=None, worker_id: Optional[str] = None,
+                 poll_interval: float = SYNC_JOB_POLL_INTERVAL, nightly_hour: int = SYNC_NIGHTLY_RECONCILE_HOUR,
+                 incremental_interval: int = RANGER_INCREMENTAL_SYNC_INTERVAL):
+        if session_factory is None:
+            from app.core.db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.manager = manager
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = poll_interval
+        self.nightly_hour = nightly_hour
+        self.incremental_interval = incremental_interval
+        self.running = False
+
+    def _manager(self):
+        if self.manager is None:
+            from .youcash_ranger_v2 import get_ranger_manager
+            self.manager = get_ranger_manager()
+        return self.manager
+
+    def run_once(self) -> Optional[str]:
+        """领取并执行一个任务，没有任务时返回None"""
+        db = self.session_factory()
+        try:
+            schedule_nightly_reconcile(db, self.nightly_hour)
+            schedule_incremental_sync(db, self.incremental_interval)
+            job = claim_job(db, self.worker_id)
+            job_id = job.id if job is not None else None
+            attempt = job.attempt if job is not None else None
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[同步任务] worker[{self.worker_id}] 领取任务失败: {e}")
+            return None
+        finally:
+            db.close()
+        if job_id is None:
+            return None
+        try:
+            return run_job(self.session_factory, job_id, self._manager, attempt)
+        except Exception as e:
+            logger.error(f"[同步任务] worker[{self.worker_id}] 执行任务ID={job_id}失败: {e}")
+            return STATUS_FAILED
+
+    def run_forever(self) -> None:
+        self.running = True
+        logger.info(f"[同步任务] worker[{self.worker_id}] 启动")
+        while self.running:
+            if self.run_once() is None:
+                time.sleep(self.poll_interval)
+        logger.info(f"[同步任务] worker[{self.worker_id}] 已停止")
+
+    def stop(self, *args) -> None:
+        self.running = False
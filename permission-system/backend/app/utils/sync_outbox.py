@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import socket
+import logging
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session, aliased
+
+from app.models.ranger_sync import SyncOutbox
+from .circuit_breaker import CIRCUIT_RESET_TIMEOUT
+from .ranger_coalesce import ACTION_GRANT, ACTION_REVOKE, PolicyWriteCoalescer
+from .ranger_incremental import SYNC_MODULES, TOMBSTONE_FIELDS, is_live_grant
+from .sync_history import STATUS_FAILED as HISTORY_FAILED, STATUS_SUCCESS as HISTORY_SUCCESS, record_sync_history
+
+# 设置日志
+logger = logging.getLogger(__name__)
+
+SYNC_OUTBOX_BATCH_SIZE = int(os.getenv("SYNC_OUTBOX_BATCH_SIZE", "100"))
+SYNC_OUTBOX_POLL_INTERVAL = float(os.getenv("SYNC_OUTBOX_POLL_INTERVAL", "1"))
+SYNC_OUTBOX_MAX_ATTEMPTS = int(os.getenv("SYNC_OUTBOX_MAX_ATTEMPTS", "5"))
+SYNC_OUTBOX_RETRY_DELAY = float(os.getenv("SYNC_OUTBOX_RETRY_DELAY", "5"))       # 首次重试等待（秒），之后按2倍递增
+SYNC_OUTBOX_MAX_RETRY_DELAY = float(os.getenv("SYNC_OUTBOX_MAX_RETRY_DELAY", "300"))
+SYNC_OUTBOX_LEASE = int(os.getenv("SYNC_OUTBOX_LEASE", "300"))                    # 领取后超过该时间未完成视为worker已退出
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# 更新任务：回收payload中保存的原值并授予记录的最新内容，两者在同一次flush中合并写入
+ACTION_UPDATE = "update"
+
+# 同步历史中使用的模块名和动作，与SyncRecord保持一致
+HISTORY_MODULES = {"table": "表权限模块", "column": "字段权限模块", "row": "行权限模块"}
+HISTORY_ACTIONS = {ACTION_GRANT: "发件箱授权", ACTION_REVOKE: "发件箱回收", ACTION_UPDATE: "发件箱更新"}
+
+
+def enqueue_sync(db: Session, kind: str, record, action: str = ACTION_GRANT) -> SyncOutbox:
+    """写入一条同步任务（不提交，随权限记录的变更在同一事务中提交）
+
+    授权任务执行时读取记录的最新内容；回收和更新任务保存记录当前的关键字段，记录删除或修改后仍可回收，
+    因此更新任务需在修改记录之前写入。
+    同一记录已有尚未开始执行的任务时合并到该任务中，不再新增任务
+    """
+    payload = None
+    if action in (ACTION_REVOKE, ACTION_UPDATE):
+        payload = json.dumps({field: getattr(record, field) for field in TOMBSTONE_FIELDS[kind]}, ensure_ascii=False)
+    pending = _pending_item(db, kind, record.id)
+    if pending is not None:
+        _collapse(pending, action, payload)
+        logger.info(f"[同步发件箱] {kind}权限 记录ID={record.id} 的{action}任务合并到待执行任务ID={pending.id}, "
+                    f"合并后动作={pending.action}, 累计合并{pending.collapsed}次")
+        return pending
+    item = SyncOutbox(module=kind, record_id=record.id, action=action, payload=payload,
+                      status=STATUS_PENDING, attempts=0)
+    db.add(item)
+    return item
+
+
+def enqueue_created(db: Session, kind: str, records) -> List[SyncOutbox]:
+    """为批量新建的记录写入授权任务（不提交，与记录在同一事务中提交）
+
+    新记录不会有待执行的任务，不逐条查询合并
+    """
+    items = [SyncOutbox(module=kind, record_id=record.id, action=ACTION_GRANT, payload=None,
+                        status=STATUS_PENDING, attempts=0) for record in records]
+    db.add_all(items)
+    return items
+
+
+def _pending_item(db: Session, kind: str, record_id: Optional[int]) -> Optional[SyncOutbox]:
+    """同一记录最新的一条可合并任务：从未执行过的授权或更新任务
+
+    加行锁并跳过已被锁定的任务，worker正在领取的任务和等待重试的任务不参与合并，新变更另起一条任务排在其后
+    """
+    if record_id is None:
+        return None
+    return db.query(SyncOutbox).filter(
+        SyncOutbox.module == kind,
+        SyncOutbox.record_id == record_id,
+        SyncOutbox.status == STATUS_PENDING,
+        SyncOutbox.attempts == 0,
+        SyncOutbox.action.in_([ACTION_GRANT, ACTION_UPDATE]),
+    ).order_by(SyncOutbox.id.desc()).with_for_update(skip_locked=True).first()
+
+
+def _collapse(item: SyncOutbox, action: str, payload: Optional[str]) -> None:
+    """把一次新的变更合并到尚未执行的任务中
+
+    执行时总是读取记录的最新内容，只需确定动作和需要回收的原值：
+    Ranger中现有的授权对应最早一条未执行任务之前的状态，因此已保存的原值优先于新的原值
+    """
+    if action == ACTION_REVOKE:
+        item.action = ACTION_REVOKE
+    elif action == ACTION_UPDATE:
+        item.action = ACTION_UPDATE
+    if item.payload is None:
+        item.payload = payload
+    item.collapsed = (item.collapsed or 0) + 1
+
+
+def _now(db: Session):
+    return db.execute(select(func.now())).scalar()
+
+
+def claim_batch(db: Session, worker_id: str, limit: int = SYNC_OUTBOX_BATCH_SIZE) -> List[SyncOutbox]:
+    """领取一批待执行的同步任务
+
+    使用SELECT ... FOR UPDATE SKIP LOCKED，多个worker并发领取时互不阻塞也不会重复领取；
+    同一条权限记录存在更早的未完成任务时不领取，保证单条记录的任务按写入顺序执行
+    """
+    now = _now(db)
+    # 回收租约过期的任务：领取它们的worker已经退出
+    db.query(SyncOutbox).filter(
+        SyncOutbox.status == STATUS_RUNNING,
+        SyncOutbox.locked_at < now - timedelta(seconds=SYNC_OUTBOX_LEASE),
+    ).update({SyncOutbox.status: STATUS_PENDING, SyncOutbox.locked_by: None}, synchronize_session=False)
+
+    earlier = aliased(SyncOutbox)
+    blocked = select(earlier.id).where(and_(
+        earlier.module == SyncOutbox.module,
+        earlier.record_id == SyncOutbox.record_id,
+        earlier.id < SyncOutbox.id,
+        earlier.status.in_([STATUS_PENDING, STATUS_RUNNING]),
+    )).exists()
+    items = db.query(SyncOutbox).filter(
+        SyncOutbox.status == STATUS_PENDING,
+        SyncOutbox.available_at <= now,
+        ~blocked,
+    ).order_by(SyncOutbox.id).limit(limit).with_for_update(skip_locked=True).all()
+
+    for item in items:
+        item.status = STATUS_RUNNING
+        item.locked_by = worker_id
+        item.locked_at = now
+        item.started_at = now
+        item.attempts += 1
+    db.commit()
+    return items
+
+
+def process_batch(db: Session, items: List[SyncOutbox], manager) -> Dict[str, int]:
+    """执行一批同步任务，同一策略上的授权/回收合并为一次Ranger写入"""
+    started = time.time()
+    coalescer = PolicyWriteCoalescer(manager_factory=lambda: manager, window=None)
+    handles = []
+    finished = []
+    for item in items:
+        model = SYNC_MODULES[item.module]
+        item_handles = []
+        if item.action in (ACTION_REVOKE, ACTION_UPDATE):
+            payload = json.loads(item.payload)
+            # 原值仍由其他现存记录提供时不回收
+            if not is_live_grant(db, item.module, payload):
+                old = SimpleNamespace(id=item.record_id, **payload)
+                item_handles.append(coalescer.submit(item.module, old, ACTION_REVOKE))
+        if item.action in (ACTION_GRANT, ACTION_UPDATE):
+            record = db.query(model).filter(model.id == item.record_id).first()
+            # 记录在同步前已被删除时，删除时写入的回收任务会处理
+            if record is not None:
+                item_handles.append(coalescer.submit(item.module, record, ACTION_GRANT))
+        if item_handles:
+            handles.append((item, item_handles))
+        else:
+            finished.append(item)
+
+    try:
+        coalescer.flush()
+    except Exception as e:
+        logger.error(f"[同步发件箱] 批量写入Ranger失败: {e}")
+
+    now = _now(db)
+    duration = time.time() - started
+    counts = {"done": 0, "retry": 0, "failed": 0, "deferred": 0}
+    for item in finished:
+        _finish(item, now, duration)
+        counts["done"] += 1
+    for item, item_handles in handles:
+        try:
+            ok = all([handle.wait(timeout=0) for handle in item_handles])
+        except TimeoutError:
+            ok = False
+        error = "; ".join(e for handle in item_handles for e in handle.errors) or "写入未完成"
+        if ok:
+            _finish(item, now, duration)
+            counts["done"] += 1
+        elif all(handle.deferred for handle in item_handles if handle.errors):
+            _defer(item, now, error)
+            counts["deferred"] += 1
+        else:
+            counts[_fail(item, now, duration, error)] += 1
+    db.commit()
+    logger.info(f"[同步发件箱] 处理{len(items)}条任务: 成功{counts['done']}条, 待重试{counts['retry']}条, "
+                f"失败{counts['failed']}条, 熔断延后{counts['deferred']}条, 耗时={duration:.2f}秒")
+    return counts
+
+
+def _record_history(item: SyncOutbox, now, status: str) -> None:
+    record_sync_history(HISTORY_MODULES.get(item.module, item.module), item.record_id,
+                        HISTORY_ACTIONS.get(item.action, item.action), status,
+                        item.started_at or now, now, error_message=item.last_error)
+
+
+def _finish(item: SyncOutbox, now, duration: float) -> None:
+    item.status = STATUS_DONE
+    item.finished_at = now
+    item.duration = round(duration, 3)
+    item.last_error = None
+    item.locked_by = None
+    _record_history(item, now, HISTORY_SUCCESS)
+
+
+def _fail(item: SyncOutbox, now, duration: float, error: str) -> str:
+    item.finished_at = now
+    item.duration = round(duration, 3)
+    item.last_error = error[:2000]
+    item.locked_by = None
+    _record_history(item, now, HISTORY_FAILED)
+    if item.attempts >= SYNC_OUTBOX_MAX_ATTEMPTS:
+        item.status = STATUS_FAILED
+        logger.error(f"[同步发件箱] 任务ID={item.id} {item.module}权限 记录ID={item.record_id} {item.action} "
+                     f"重试{item.attempts}次后失败: {error}")
+        return "failed"
+    delay = min(SYNC_OUTBOX_RETRY_DELAY * 2 ** (item.attempts - 1), SYNC_OUTBOX_MAX_RETRY_DELAY)
+    item.status = STATUS_PENDING
+    item.available_at = now + timedelta(seconds=delay)
+    logger.warning(f"[同步发件箱] 任务ID={item.id} 第{item.attempts}次执行失败，{delay:.0f}秒后重试: {error}")
+    return "retry"
+
+
+def _defer(item: SyncOutbox, now, error: str) -> None:
+    """Ranger熔断中请求没有发出，不计入尝试次数，等熔断时间过后再执行"""
+    item.status = STATUS_PENDING
+    item.attempts -= 1
+    item.available_at = now + timedelta(seconds=CIRCUIT_RESET_TIMEOUT)
+    item.last_error = error[:2000]
+    item.locked_by = None
+
+
+def retry_failed(db: Session, item_ids: Optional[List[int]] = None) -> int:
+    """把失败的任务重新置为待执行"""
+    query = db.query(SyncOutbox).filter(SyncOutbox.status == STATUS_FAILED)
+    if item_ids:
+        query = query.filter(SyncOutbox.id.in_(item_ids))
+    count = query.update({SyncOutbox.status: STATUS_PENDING, SyncOutbox.attempts: 0,
+                          SyncOutbox.available_at: func.now()}, synchronize_session=False)
+    db.commit()
+    return count
+
+
+def outbox_item_to_dict(item: SyncOutbox) -> Dict[str, Any]:
+    return {
+        "id": item.id,
+        "module": item.module,
+        "record_id": item.record_id,
+        "action": item.action,
+        "status": item.status,
+        "attempts": item.attempts,
+        "last_error": item.last_error,
+        "available_at": item.available_at.isoformat() if item.available_at else None,
+        "locked_by": item.locked_by,
+        "created_at": item.created_at.isoformat() if item.created_at else None,
+        "started_at": item.started_at.isoformat() if item.started_at else None,
+        "finished_at": item.finished_at.isoformat() if item.finished_at else None,
+        "duration": item.duration,
+        "collapsed": item.collapsed,
+    }
+
+
+def outbox_stats(db: Session) -> Dict[str, Any]:
+    """各模块各状态的任务数量、执行前被合并的变更数，以及最早一条待执行任务的等待时间"""
+    counts: Dict[str, Dict[str, int]] = {}
+    collapsed: Dict[str, int] = {}
+    for module, status, count, merged in db.query(
+            SyncOutbox.module, SyncOutbox.status, func.count(SyncOutbox.id), func.sum(SyncOutbox.collapsed)
+    ).group_by(SyncOutbox.module, SyncOutbox.status).all():
+        counts.setdefault(module, {})[status] = count
+        collapsed[module] = collapsed.get(module, 0) + int(merged or 0)
+    oldest = db.query(func.min(SyncOutbox.created_at)).filter(SyncOutbox.status == STATUS_PENDING).scalar()
+    avg_duration = db.query(func.avg(SyncOutbox.duration)).filter(SyncOutbox.status == STATUS_DONE).scalar()
+    lag = None
+    if oldest is not None:
+        lag = round((_now(db) - oldest).total_seconds(), 1)
+    return {
+        "counts": counts,
+        "collapsed": collapsed,
+        "oldest_pending_age": lag,
+        "avg_duration": round(avg_duration, 3) if avg_duration is not None else None,
+    }
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class OutboxWorker:
+    """同步发件箱消费者，可在多个进程/主机上同时运行"""
+
+    def __init__(self, session_factory=None, manager=None, worker_id: Optional[str] = None,
+                 batch_size: int = SYNC_OUTBOX_BATCH_SIZE, poll_interval: float = SYNC_OUTBOX_POLL_INTERVAL):
+        if session_factory is None:
+            from app.core.db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.manager = manager
+        self.worker_id = worker_id or default_worker_id()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.running = False
+
+    def _manager(self):
+        if self.manager is None:
+            from .youcash_ranger_v2 import get_ranger_manager
+            self.manager = get_ranger_manager()
+        return self.manager
+
+    def run_once(self) -> int:
+        """领取并执行一批任务，返回处理的任务数"""
+        db = self.session_factory()
+        try:
+            items = claim_batch(db, self.worker_id, self.batch_size)
+            if items:
+                process_batch(db, items, self._manager())
+            return len(items)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[同步发件箱] worker[{self.worker_id}] 处理失败: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def run_forever(self) -> None:
+        self.running = True
+        logger.info(f"[同步发件箱] worker[{self.worker_id}] 启动, 批大小={self.batch_size}")
+        while self.running:
+            if self.run_once() == 0:
+                time.sleep(self.poll_interval)
+        logger.info(f"[同步发件箱] worker[{self.worker_id}] 已停止")
+
+    def stop(self, *args) -> None:
+        self.running = False
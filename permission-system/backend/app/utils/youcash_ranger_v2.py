@@ -9,30 +9,71 @@ RANGER_PASSWORD = os.getenv("RANGER_PASSWORD", "")
 
 RANGER_ALL_PRIVILEDGE = ["SHOW_VIEW","SHOW","LOAD","ALTER","CREATE","ALTER_CREATE","SELECT","DROP","ALTER_CREATE_DROP"]
 
+# 字段权限表中的脱敏类型到Ranger dataMaskType的映射：
+# 各业务类型统一使用uppermd5自定义脱敏（CUSTOM）；'原文'表示不脱敏，不创建mask策略
+MASK_TYPE_MAPPING = {
+    '手机号': 'CUSTOM',
+    '身份证': 'CUSTOM',
+    '银行卡号': 'CUSTOM',
+    '座机号': 'CUSTOM',
+    '姓名': 'CUSTOM',
+    '原文': None,
+}
+RANGER_MASK_TYPES = ('MASK_HASH', 'MASK_NONE', 'CUSTOM')
+
+
+def to_ranger_mask_type(mask_type):
+    """将字段权限表中的脱敏类型转换为Ranger的dataMaskType，不需要mask策略时返回None"""
+    if mask_type in RANGER_MASK_TYPES:
+        return mask_type
+    if mask_type not in MASK_TYPE_MAPPING:
+        raise Exception(f"未知的脱敏类型:[{mask_type}]")
+    return MASK_TYPE_MAPPING[mask_type]
+
+from .ranger_transport import get_ranger_client, get_ranger_session
+from .ranger_snapshot import RangerPolicyCache, RANGER_POLICY_CACHE_ENABLED, RANGER_POLICY_WRITE_CHECK_INTERVAL
+from .ranger_fanout import fan_out
+
+import threading
 import logging
 logger = logging.getLogger(__name__)
 
+def _status_code(error):
+    """提取Ranger异常中的HTTP状态码"""
+    return getattr(error, "statusCode", None) or getattr(error, "status_code", None)
+
+
 class RangerManager:
-    def __init__(self, ranger_url, ranger_user, ranger_password):
-        self.client = RangerClient(ranger_url, (ranger_user, ranger_password))
+    def __init__(self, ranger_url=None, ranger_user=None, ranger_password=None, client=None, policy_cache=None):
+        self.client = client or RangerClient(ranger_url, (ranger_user, ranger_password))
         self.role = RangerRoleManager(self.client)
-        self.policy = RangerPolicyManager(self.client)
+        self.policy = RangerPolicyManager(self.client, policy_cache)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_ranger_manager():
+    """获取进程内共享的RangerManager，所有模块复用同一个客户端和连接池"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                client = get_ranger_client()
+                policy_cache = RangerPolicyCache(client) if RANGER_POLICY_CACHE_ENABLED else None
+                _manager = RangerManager(client=client, policy_cache=policy_cache)
+    return _manager
 
 class RangerRoleManager:
     def __init__(self, client):
         self.client = client
 
     def search_roles_with_user(self, user_name):
-        import requests
-        auth = (RANGER_USER, RANGER_PASSWORD)
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
         url = f'{RANGER_URL}/service/public/v2/api/roles'
         roles = []
         try:
-            response = requests.get(url, headers=headers, auth=auth, params={'userName':f'{user_name}'})
+            response = get_ranger_session().get(url, params={'userName':f'{user_name}'})
             response.raise_for_status()
             roles.extend(response.json())
         except Exception as e:
@@ -187,17 +228,54 @@ class RangerRoleManager:
 
 
 class RangerPolicyManager:
-    def __init__(self, client):
+    def __init__(self, client, policy_cache=None):
         self.client = client
+        # 策略快照缓存，为None时所有读取直接访问Ranger
+        self.policy_cache = policy_cache
+
+    def get_policy_by_id(self, policy_id, service=None):
+        """按ID读取策略，策略已不存在时返回None
+
+        有快照且给出服务名时读取快照，读取前按写入检查间隔确认服务的policyVersion
+        """
+        if self.policy_cache is not None and service:
+            try:
+                return self.policy_cache.get_policy_by_id(service, policy_id, RANGER_POLICY_WRITE_CHECK_INTERVAL)
+            except Exception as e:
+                logger.warning(f"Error reading policy snapshot: {e} in service:[{service}] for id:{policy_id}, fallback to ranger")
+        try:
+            return self.client.get_policy_by_id(policy_id)
+        except Exception as e:
+            if _status_code(e) == 404:
+                return None
+            raise
 
     def get_existing_policy(self, service, name):
+        """读取读-改-写的基础策略
+
+        有快照时直接使用快照：读取前确认服务的policyVersion（未变化时Ranger返回304），
+        写入检查间隔内同一服务的多次写入共用一次检查，不再逐个策略向Ranger读取。
+        快照中没有该名称即视为不存在；创建时若同名策略已存在（400/409）由create_policy合并，
+        按ID更新时的404/409由_repair_update按名称重新定位
+        """
+        if self.policy_cache is not None:
+            try:
+                return self.policy_cache.get_policy(service, name, RANGER_POLICY_WRITE_CHECK_INTERVAL)
+            except Exception as e:
+                logger.warning(f"Error reading policy snapshot: {e} in service:[{service}] for name:[{name}], fallback to ranger")
         try:
-            policy = self.client.get_policy(service, name)
-            return policy
+            return self.client.get_policy(service, name)
         except Exception as e:
+            if _status_code(e) == 404:
+                return None
             logger.warning(f"Error fetching policies: {e} in service:[{service}] for name:[{name}]")
             return None
 
+    def _refresh_ref(self, policy):
+        """用从Ranger读到的策略刷新快照"""
+        if self.policy_cache is not None:
+            self.policy_cache.upsert(policy)
+
     @staticmethod
     def check_basic(args):
         if not (args.users or args.groups or args.roles):
@@ -207,12 +285,14 @@ class RangerPolicyManager:
 
     def grant_access(self, args):
         self.check_basic(args)
-        if args.policy_type == 'normal':
-            self.create_or_update_normal_policy(args)
-        elif args.policy_type == 'mask':
-            self.create_or_update_data_mask_policy(args)
-        elif args.policy_type == 'row-filter':
-            self.create_or_update_row_filter_policy(args)
+        handlers = {
+            'normal': self.create_or_update_normal_policy,
+            'mask': self.create_or_update_data_mask_policy,
+            'row-filter': self.create_or_update_row_filter_policy,
+        }
+        if args.policy_type in handlers:
+            # 各服务/catalog互相独立，并发下发
+            return fan_out(handlers[args.policy_type], args)
 
     def create_or_update_normal_policy(self, args):
         if args.accesses and set(args.accesses) - {'drop', 'all', 'select', 'read', 'rwstorage', 'update', 'index',
@@ -277,7 +357,7 @@ class RangerPolicyManager:
                         if add_item:
                             # add item should insert at the front of the list
                             existing_policy["policyItems"].insert(0, add_item)
-                            self.client.update_policy_by_id(existing_policy["id"], existing_policy)
+                            self.update_policy_by_id(existing_policy["id"], existing_policy)
                             logger.info(f"Updated Policy: {existing_policy} in service:[{service}] catalog:[{catalog_name}]")
                         else:
                             logger.info(f"No updates needed for Policy: {existing_policy['name']} in service:[{service}] catalog:[{catalog_name}]")
@@ -302,11 +382,11 @@ class RangerPolicyManager:
                         }
                         if service == "doris":
                             policy_data["resources"]["catalog"] ={"values": [catalog_name], "isExcludes": False, "isRecursive": False}
-                        self.client.create_policy(policy_data)
+                        self.create_policy(policy_data)
                         logger.info(f"Created Policy: {policy_data} in service:[{service}] catalog:[{catalog_name}]")
 
     def create_or_update_data_mask_policy(self, args):
-        if args.mask_type not in ('MASK_HASH', 'MASK_NONE', 'CUSTOM'):
+        if args.mask_type not in RANGER_MASK_TYPES:
             raise Exception(f"mask类型应该是MASK_HASH/MASK_NONE/CUSTOM，实际是:[{args.mask_type}]")
 
         if args.database == '*' or args.table == '*':
@@ -367,7 +447,7 @@ class RangerPolicyManager:
                         if add_item:
                             # add item should insert at the front of the list
                             existing_policy["dataMaskPolicyItems"].insert(0, add_item)
-                            self.client.update_policy_by_id(existing_policy["id"], existing_policy)
+                            self.update_policy_by_id(existing_policy["id"], existing_policy)
                             logger.info(f"Updated Policy: {existing_policy} in service:[{service}] catalog:[{catalog_name}]")
                         else:
                             logger.info(f"No updates needed for Policy: {existing_policy['name']} in service:[{service}] catalog:[{catalog_name}]")
@@ -400,7 +480,7 @@ class RangerPolicyManager:
                         }
                         if service == "doris":
                             policy_data["resources"]["catalog"] = {"values": [catalog_name], "isExcludes": False, "isRecursive": False}
-                        self.client.create_policy(policy_data)
+                        self.create_policy(policy_data)
                         logger.info(f"Created Data Mask Policy: {policy_data} in service:[{service}] catalog:[{catalog_name}]")
 
     def create_or_update_row_filter_policy(self, args):
@@ -458,7 +538,7 @@ class RangerPolicyManager:
 
                     if add_item:
                         existing_policy["rowFilterPolicyItems"].insert(0, add_item)
-                        self.client.update_policy_by_id(existing_policy["id"], existing_policy)
+                        self.update_policy_by_id(existing_policy["id"], existing_policy)
                         logger.info(f"Updated Policy: {existing_policy} in service:[{service}] catalog:[{catalog_name}]")
                     else:
                         logger.info(f"No updates needed for Policy: {existing_policy['name']} in service:[{service}] catalog:[{catalog_name}]")
@@ -485,18 +565,18 @@ class RangerPolicyManager:
                     }
                     if service == "doris":
                         policy_data["resources"]["catalog"] = {"values": [catalog_name], "isExcludes": False, "isRecursive": False}
-                    self.client.create_policy(policy_data)
+                    self.create_policy(policy_data)
                     logger.info(f"Created Row Filter Policy: {policy_data} in service:[{service}] catalog:[{catalog_name}]")
 
     def revoke_access(self, args):
         self.check_basic(args)
-
-        if args.policy_type == 'normal':
-            self.revoke_normal_policy(args)
-        elif args.policy_type == 'mask':
-            self.revoke_data_mask_policy(args)
-        elif args.policy_type == 'row-filter':
-            self.revoke_row_filter_policy(args)
+        handlers = {
+            'normal': self.revoke_normal_policy,
+            'mask': self.revoke_data_mask_policy,
+            'row-filter': self.revoke_row_filter_policy,
+        }
+        if args.policy_type in handlers:
+            return fan_out(handlers[args.policy_type], args)
 
     def revoke_normal_policy(self, args):
         for col_name in args.columns or ['*']:
@@ -555,7 +635,7 @@ class RangerPolicyManager:
                                 continue
                             for index in sorted(items_to_remove, reverse=True):
                                 del existing_policy["policyItems"][index]
-                        self.client.update_policy_by_id(existing_policy["id"], existing_policy)
+                        self.update_policy_by_id(existing_policy["id"], existing_policy)
                         logger.info(f"Updated Policy: {existing_policy} in service:[{service}]]")
                     else:
                         logger.info(f"No policy found with name: {policy_name} in service:[{service}]")
@@ -610,7 +690,7 @@ class RangerPolicyManager:
                                 continue
                             for index in sorted(items_to_remove, reverse=True):
                                 del existing_policy["dataMaskPolicyItems"][index]
-                            self.client.update_policy_by_id(existing_policy["id"], existing_policy)
+                            self.update_policy_by_id(existing_policy["id"], existing_policy)
                             logger.info(f"Updated Policy: {existing_policy} in service:[{service}] catalog:[{args.catalog}]")
                     else:
                         logger.info(f"No policy found with name: {policy_name} in service:[{service}] catalog:[{args.catalog}]")
@@ -666,7 +746,7 @@ class RangerPolicyManager:
                             del existing_policy["rowFilterPolicyItems"][index]
 
                     if need_update:
-                        self.client.update_policy_by_id(existing_policy["id"], existing_policy)
+                        self.update_policy_by_id(existing_policy["id"], existing_policy)
                         logger.info(f"Updated Policy: {existing_policy} in service:[{service}]")
                 else:
                     logger.info(f"No policy found with name: {policy_name} in service:[{service}]")
@@ -681,7 +761,8 @@ class RangerPolicyManager:
         else:
             entity_type, entity_value = self.get_non_empty_argument(args, 'user', 'group', 'role')
             logger.info(f"service={args.service} entity_type={entity_type} entiry_value={entity_value}")
-            policies = self.find_policies_by_entity(args.service, entity_type, entity_value)
+            policies = self.find_policies_by_entity(args.service, entity_type, entity_value,
+                                                    max_age=RANGER_POLICY_WRITE_CHECK_INTERVAL)
 
             if policies:
                 logger.info(f"Found {len(policies)} policies for type:[{entity_type}] with value:[{entity_value}]")
@@ -707,7 +788,9 @@ class RangerPolicyManager:
                             policy["rowFilterPolicyItems"].remove(item)
 
                     if not is_find:
-                        raise Exception("user doesn't not grant to access to this policy!'")
+                        # 实体只出现在deny/例外条目中，没有需要移除的授权
+                        logger.info(f"Policy id:{policy['id']} no longer grants {entity_type}:[{entity_value}], skip")
+                        continue
 
                     is_deleted = True
                     # 遍历policyItems, dataMaskPolicyItems, rowFilterPolicyItems检查是否所有的users,groups,roles是否有非空的
@@ -735,13 +818,17 @@ class RangerPolicyManager:
             else:
                 logger.info(f"No policy found with name: {args.policy_name} in service:[{service}]")
 
-    def delete_policy_by_id(self, policy_id):
+    def delete_policy_by_id(self, policy_id, raise_error=False):
         logger.info(f"Deleting Policy with id: {policy_id}")
         try:
             self.client.delete_policy_by_id(policy_id)
+            if self.policy_cache is not None:
+                self.policy_cache.remove(policy_id)
             logger.info(f"Deleted Policy id: {policy_id}")
         except Exception as e:
             logger.warning(f"Failed to delete policy id:{policy_id} with errors: {e}")
+            if raise_error:
+                raise
 
     def search_entity_policy(self, args):
         if len([item for item in [args.user, args.group, args.role] if item]) != 1:
@@ -764,28 +851,94 @@ class RangerPolicyManager:
                 return arg_name, getattr(args, arg_name)
         raise Exception("Exactly one of the following arguments must be provided: {}".format(", ".join(args_names)))
 
-    def find_policies_by_entity(self, services, entity_type, entity_value):
-        import requests
+    def find_policies_by_entity(self, services, entity_type, entity_value, max_age=None):
+        if self.policy_cache is not None:
+            try:
+                return self.policy_cache.find_by_entity(services, entity_type, entity_value, max_age)
+            except Exception as e:
+                logger.warning(f"Error reading policy snapshot: {e}, fallback to ranger")
 
-        auth = (RANGER_USER, RANGER_PASSWORD)
-        headers = {
-            'Content-Type': 'application/json'
-        }
+        session = get_ranger_session()
         policies = []
 
         try:
             for service in services:
                 url = f'{RANGER_URL}/service/public/v2/api/service/{service}/policy?{entity_type}={entity_value}'
                 logger.info(url)
-                response = requests.get(url, headers=headers, auth=auth)
+                response = session.get(url)
                 response.raise_for_status()
                 policies.extend(response.json())
         except Exception as e:
             logger.warning(f"Error fetching policies: {e}")
         return policies
 
+    def _written(self, policy, result):
+        if result:
+            self._refresh_ref(result)
+        elif self.policy_cache is not None:
+            self.policy_cache.invalidate(policy.get("service"))
+
+    def create_policy(self, policy):
+        try:
+            created = self.client.create_policy(policy)
+        except Exception as e:
+            if self.policy_cache is None or _status_code(e) not in (400, 409):
+                raise
+            # 同名策略已存在（快照缺失或过期），改为合并到已有策略
+            existing = self.client.get_policy(policy["service"], policy["name"])
+            if not existing:
+                raise
+            logger.warning(f"Policy {policy['name']} already exists in service:[{policy['service']}], merge into id:{existing['id']}")
+            for key in ("policyItems", "dataMaskPolicyItems", "rowFilterPolicyItems"):
+                if policy.get(key):
+                    existing[key] = list(policy[key]) + list(existing.get(key) or [])
+            return self.update_policy_by_id(existing["id"], existing)
+        self._written(policy, created)
+        return created
+
     def update_policy_by_id(self, policy_id, policy):
-        self.client.update_policy_by_id(policy_id, policy)
+        try:
+            updated = self.client.update_policy_by_id(policy_id, policy)
+        except Exception as e:
+            if self.policy_cache is None or _status_code(e) not in (404, 409):
+                raise
+            updated = self._repair_update(policy_id, policy, e)
+            if self.policy_cache is not None:
+                self.policy_cache.invalidate(policy.get("service"))
+            return updated
+        self._written(policy, updated)
+        self._check_version_skew(policy_id, policy, updated)
+        return updated
+
+    def _check_version_skew(self, policy_id, policy, updated):
+        """Ranger按ID更新不校验版本，返回的版本不是基础版本+1时说明基础快照期间有其他写入，
+        本次写入可能覆盖了其他写入方的修改，记录告警并让快照在下次读取时重新确认版本"""
+        expected = policy.get("version")
+        actual = updated.get("version") if updated else None
+        if self.policy_cache is None or expected is None or actual is None or actual == expected + 1:
+            return
+        logger.warning(f"Policy id:{policy_id} in service:[{policy.get('service')}] was based on version:{expected} "
+                       f"but ranger saved version:{actual}, it was changed outside this process")
+        self.policy_cache.invalidate(policy.get("service"))
+
+    def _repair_update(self, policy_id, policy, error):
+        """按ID更新失败（策略已被删除或版本冲突）时，按名称重新定位策略后重试一次"""
+        service, name = policy.get("service"), policy.get("name")
+        logger.warning(f"Update policy id:{policy_id} failed: {error}, re-resolve by name:[{name}] in service:[{service}]")
+        self.policy_cache.remove(policy_id)
+        try:
+            current = self.client.get_policy(service, name)
+        except Exception:
+            current = None
+        if not current:
+            recreated = dict(policy)
+            recreated.pop("id", None)
+            recreated.pop("version", None)
+            return self.create_policy(recreated)
+        retry = dict(policy, id=current["id"], version=current.get("version"))
+        updated = self.client.update_policy_by_id(current["id"], retry)
+        self._written(retry, updated)
+        return updated
 
 
 def init_parse():
@@ -872,7 +1025,7 @@ def init_parse():
 
 
 def run(args):
-    manager = RangerManager(RANGER_URL, RANGER_USER, RANGER_PASSWORD)
+    manager = get_ranger_manager()
 
     command_map = {
         'grant': manager.policy.grant_access,
@@ -888,7 +1041,7 @@ def run(args):
     logger.info(args)
     command = args.command
     if command in command_map:
-        command_map[command](args)
+        return command_map[command](args)
     else:
         logger.warning(f"Unknown command: {command}")
 
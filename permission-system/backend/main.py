@@ -5,10 +5,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import api_router
 from app.core.config import API_V1_STR, BACKEND_CORS_ORIGINS
+from app.core.db import dispose_async_engine
 import logging
 import sys
 import os
 from app.utils.log_config import CompressedTimedRotatingFileHandler
+from app.utils.ranger_async import close_async_ranger_client
+from app.utils.sync_history import get_history_writer
 
 # 配置日志系统
 def setup_logging():
@@ -73,6 +76,8 @@ if BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # 批量导入时返回的同步统计
+        expose_headers=["X-Ranger-Calls", "X-Ranger-Writes", "X-Sync-Failed", "X-Sync-Deferred"],
     )
 
 # 包含所有API路由
@@ -85,6 +90,13 @@ async def startup_event():
     logger.info(f"API版本前缀: {API_V1_STR}")
     logger.info(f"CORS配置: {BACKEND_CORS_ORIGINS}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """FastAPI应用关闭时写入剩余的同步历史并释放异步Ranger客户端和异步数据库的连接"""
+    get_history_writer().flush()
+    await close_async_ranger_client()
+    await dispose_async_engine()
+
 # 添加中间件记录所有API请求
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi import Request
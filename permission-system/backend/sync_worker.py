@@ -0,0 +1,68 @@
+"""权限同步worker
+
+消费sync_outbox中的同步任务并写入Ranger，可在多台机器上启动多个进程，
+各进程通过SELECT ... FOR UPDATE SKIP LOCKED领取互不重叠的任务。
+同时在独立线程中执行全量同步接口创建的sync_job任务，并按RANGER_INCREMENTAL_SYNC_INTERVAL创建定时增量同步任务。
+
+用法:
+    python sync_worker.py                 # 持续运行
+    python sync_worker.py --once          # 处理一批后退出
+    python sync_worker.py --no-jobs       # 只消费发件箱，不执行全量同步任务
+"""
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+from app.utils.sync_outbox import OutboxWorker, SYNC_OUTBOX_BATCH_SIZE, SYNC_OUTBOX_POLL_INTERVAL
+from app.utils.sync_history import get_history_writer
+from app.utils.sync_jobs import SyncJobWorker
+
+
+def setup_logging():
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="权限同步worker")
+    parser.add_argument("--worker-id", help="worker标识，默认为主机名:进程号")
+    parser.add_argument("--batch-size", type=int, default=SYNC_OUTBOX_BATCH_SIZE, help="每次领取的任务数")
+    parser.add_argument("--poll-interval", type=float, default=SYNC_OUTBOX_POLL_INTERVAL, help="无任务时的轮询间隔（秒）")
+    parser.add_argument("--once", action="store_true", help="只处理一批任务后退出")
+    parser.add_argument("--no-jobs", action="store_true", help="不执行全量同步任务")
+    args = parser.parse_args()
+
+    setup_logging()
+    worker = OutboxWorker(worker_id=args.worker_id, batch_size=args.batch_size, poll_interval=args.poll_interval)
+    job_worker = None if args.no_jobs else SyncJobWorker(worker_id=args.worker_id)
+    try:
+        if args.once:
+            worker.run_once()
+            if job_worker:
+                job_worker.run_once()
+            return
+
+        def stop(*_):
+            worker.stop()
+            if job_worker:
+                job_worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        if job_worker:
+            threading.Thread(target=job_worker.run_forever, name="sync-job-worker", daemon=True).start()
+        worker.run_forever()
+    finally:
+        get_history_writer().flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import table_perm
+from app.core import db as core_db
+from app.core.config import to_async_database_url
+from app.models.models import TablePermission
+from app.schemas.schemas import TablePermissionFilter
+from app.utils.helpers import MATCH_PREFIX, create_item, get_paginated_results, get_paginated_results_async
+
+
+def test_async_database_url():
+    assert to_async_database_url("postgresql://u:p@db:5432/perm") == "postgresql+asyncpg://u:p@db:5432/perm"
+    assert to_async_database_url("postgresql+psycopg2://u:p@db/perm") == "postgresql+asyncpg://u:p@db/perm"
+    assert to_async_database_url("sqlite+aiosqlite:///perm.db") == "sqlite+aiosqlite:///perm.db"
+
+
+def test_async_pagination_matches_sync(tmp_path):
+    path = tmp_path / "perm.db"
+    engine = create_engine(f"sqlite:///{path}")
+    TablePermission.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    for i in range(7):
+        create_item(db, TablePermission, {"db_name": "db", "table_name": f"t{i}", "user_name": f"u{i % 2}"})
+
+    kwargs = {"page_size": 3, "filters": {"user_name": "u0"}, "match": MATCH_PREFIX,
+              "sorters": [{"field": "table_name", "order": "descend"}]}
+
+    async def fetch(**extra):
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with async_sessionmaker(async_engine)() as async_db:
+                return await get_paginated_results_async(async_db, TablePermission, **kwargs, **extra)
+        finally:
+            await async_engine.dispose()
+
+    def summary(result):
+        return dict(result, items=[item.id for item in result["items"]])
+
+    for extra in ({"page": 2}, {"cursor": ""}):
+        expected = get_paginated_results(db, TablePermission, **kwargs, **extra)
+        assert summary(asyncio.run(fetch(**extra))) == summary(expected)
+    # 游标翻页结果一致
+    next_cursor = get_paginated_results(db, TablePermission, cursor="", **kwargs)["next_cursor"]
+    expected = get_paginated_results(db, TablePermission, cursor=next_cursor, **kwargs)
+    assert summary(asyncio.run(fetch(cursor=next_cursor))) == summary(expected)
+
+
+def test_read_endpoints_use_async_session(tmp_path, monkeypatch):
+    path = tmp_path / "perm.db"
+    engine = create_engine(f"sqlite:///{path}")
+    TablePermission.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    items = [create_item(db, TablePermission, {"db_name": "db", "table_name": f"t{i}", "user_name": "alice"})
+             for i in range(3)]
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        # 与get_async_session_factory创建的工厂配置一致
+        monkeypatch.setattr(core_db, "_async_session_factory",
+                            async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False))
+        try:
+            session_gen = core_db.get_async_db()
+            async_db = await session_gen.__anext__()
+            try:
+                page = await table_perm.get_table_permissions(
+                    db=async_db, params=TablePermissionFilter(table_name="t1", page_size=2), current_user=None)
+                item = await table_perm.get_table_permission(items[2].id, db=async_db, current_user=None)
+                with pytest.raises(HTTPException) as exc:
+                    await table_perm.get_table_permission(999, db=async_db, current_user=None)
+                return page, item, exc.value.status_code
+            finally:
+                await session_gen.aclose()
+        finally:
+            await async_engine.dispose()
+
+    page, item, missing_status = asyncio.run(run())
+    assert page["total"] == 1 and [i.table_name for i in page["items"]] == ["t1"]
+    assert item.table_name == "t2" and missing_status == 404
+
+
+def test_async_sync_endpoints_read_with_async_session(tmp_path, monkeypatch):
+    path = tmp_path / "perm.db"
+    engine = create_engine(f"sqlite:///{path}")
+    TablePermission.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    items = [create_item(db, TablePermission, {"db_name": "db", "table_name": f"t{i}", "user_name": "alice"})
+             for i in range(2)]
+    reconciled = []
+
+    async def fake_reconcile(kind, perms, client, prune=False):
+        reconciled.append([perm.table_name for perm in perms])
+        return {"plan": {"create": len(perms)}, "errors": [], "failed_ids": []}
+
+    monkeypatch.setattr(table_perm, "async_reconcile", fake_reconcile)
+    monkeypatch.setattr(table_perm, "get_async_ranger_client", lambda: None)
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with async_sessionmaker(async_engine, expire_on_commit=False)() as async_db:
+                summary = await table_perm.sync_table_permissions_async(db=async_db, prune=False, current_user=None)
+                single = await table_perm.sync_single_table_permission_async(items[1].id, db=async_db, current_user=None)
+                with pytest.raises(HTTPException) as exc:
+                    await table_perm.sync_single_table_permission_async(999, db=async_db, current_user=None)
+                return summary, single, exc.value.status_code
+        finally:
+            await async_engine.dispose()
+
+    summary, single, missing_status = asyncio.run(run())
+    assert reconciled == [["t0", "t1"], ["t1"]]
+    assert summary["total"] == 2
+    assert single["table_name"] == "t1" and missing_status == 404
@@ -0,0 +1,93 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+from fastapi import HTTPException
+
+from app.utils import circuit_breaker, sync_helpers
+from app.utils.circuit_breaker import (
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError,
+    is_circuit_open,
+)
+from app.utils.ranger_transport import build_ranger_session
+from app.utils.sync_helpers import RetryScheduler, with_sync_retry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = CircuitBreakerRegistry({"ranger": {"failure_threshold": 2, "reset_timeout": 60}})
+    monkeypatch.setattr(circuit_breaker, "_registry", registry)
+    return registry
+
+
+def test_opens_after_consecutive_failures_and_closes_after_probe():
+    breaker = CircuitBreaker("ldap", failure_threshold=2, reset_timeout=0.05, half_open_calls=1)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            with breaker.guard():
+                raise ConnectionError("refused")
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.snapshot()["state"] == STATE_HALF_OPEN
+    breaker.allow()
+    # 半开状态只放行一个试探请求
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.snapshot()["rejected"] == 2
+
+    # 试探失败时重新打开
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+
+def test_open_ranger_service_fails_fast_without_request(registry, monkeypatch):
+    sent = []
+
+    def fake_request(self, method, url, **kwargs):
+        sent.append(url)
+        raise requests.ConnectionError("connect timeout")
+
+    monkeypatch.setattr(requests.Session, "request", fake_request)
+    session = build_ranger_session(auth=("u", "p"))
+    session.limiters = None
+    url = "http://r/service/public/v2/api/service/cm_hive/policy/db.t.all.normal"
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            session.request("GET", url)
+    with pytest.raises(CircuitOpenError):
+        session.request("GET", url)
+    assert len(sent) == 2
+    # 其他服务不受影响
+    with pytest.raises(requests.ConnectionError):
+        session.request("GET", "http://r/service/public/v2/api/service/doris/policy/db.t.all.normal")
+    assert registry.snapshot()["ranger:cm_hive"]["state"] == STATE_OPEN
+    assert registry.snapshot()["ranger:doris"]["state"] == STATE_CLOSED
+
+
+def test_circuit_open_is_not_retried_and_maps_to_503(monkeypatch):
+    monkeypatch.setattr(sync_helpers, "_scheduler", RetryScheduler(workers=1))
+    calls = []
+
+    @with_sync_retry(max_attempts=3, retry_delay=0.01, dependency="test-circuit")
+    def sync(record_id, *, db=None, module_name="测试模块", action="同步"):
+        calls.append(record_id)
+        try:
+            raise CircuitOpenError("ranger:cm_hive", 30)
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=500, detail=str(e)) from e
+
+    with pytest.raises(HTTPException) as info:
+        sync(1, db=SimpleNamespace(rollback=lambda: None, close=lambda: None))
+    assert calls == [1]
+    assert info.value.status_code == 503
+    assert is_circuit_open(info.value)
@@ -0,0 +1,50 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.models import TablePermission
+from app.utils import count_cache
+from app.utils.helpers import bulk_create_items, create_item, get_paginated_results
+
+
+def build():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    TablePermission.__table__.create(engine)
+    counts = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: counts.append(statement) if "count(" in statement else None)
+    return sessionmaker(bind=engine)(), counts
+
+
+def test_count_is_cached_per_filter_and_invalidated_on_commit():
+    db, counts = build()
+    for i in range(3):
+        create_item(db, TablePermission, {"db_name": "db", "table_name": f"t{i}", "user_name": "alice"})
+
+    filters = {"table_name": "t"}
+    assert get_paginated_results(db, TablePermission, filters=filters)["total"] == 3
+    assert get_paginated_results(db, TablePermission, filters=filters)["total"] == 3
+    assert len(counts) == 1
+    # 不同的过滤条件分别缓存
+    assert get_paginated_results(db, TablePermission, filters={"table_name": "t1"})["total"] == 1
+    assert len(counts) == 2
+
+    # 批量写入提交后失效
+    bulk_create_items(db, TablePermission, [(0, {"db_name": "db", "table_name": "t9", "user_name": "bob"})], "已存在")
+    db.commit()
+    result = get_paginated_results(db, TablePermission, filters=filters)
+    assert result["total"] == 4 and result["total_estimated"] is False
+    assert len(counts) == 3
+
+
+def test_unfiltered_count_uses_planner_estimate_for_large_tables(monkeypatch):
+    db, counts = build()
+    monkeypatch.setattr(count_cache, "estimate_rows", lambda db, table: 2000000)
+    result = get_paginated_results(db, TablePermission)
+    assert result["total"] == 2000000 and result["total_estimated"] is True
+    assert counts == []
+
+    # 小表仍然精确计数
+    monkeypatch.setattr(count_cache, "estimate_rows", lambda db, table: 10)
+    result = get_paginated_results(db, TablePermission)
+    assert result["total"] == 0 and result["total_estimated"] is False
@@ -0,0 +1,127 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api import row_perm, table_perm
+from app.models.models import RowPermission, TablePermission
+from app.utils.helpers import (
+    bulk_create_items, check_unique_constraint, create_item, encode_cursor, get_paginated_results,
+)
+
+
+def test_bulk_create_reports_duplicates_by_index_with_one_insert():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    TablePermission.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    create_item(db, TablePermission, {"db_name": "db", "table_name": "t0", "user_name": "alice"})
+
+    statements = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    rows = [(i, {"db_name": "db", "table_name": f"t{i % 3}", "user_name": "alice", "role_name": None})
+            for i in range(5)]
+    rows.append((5, {"db_name": "db", "table_name": "t0", "user_name": None, "role_name": "analyst"}))
+    created, errors = bulk_create_items(db, TablePermission, rows, "相同的表权限记录已存在")
+
+    assert [index for index, _ in created] == [1, 2, 5]
+    # 主键和服务端默认值由RETURNING取回
+    assert all(item.id and item.create_time for _, item in created)
+    assert [(error["index"], error["error"].split(":")[0]) for error in errors] == [
+        (0, "相同的表权限记录已存在"), (3, "与第0条数据重复"), (4, "与第1条数据重复")]
+    # 每组参与比较的字段一次查询已有记录，一条INSERT写入
+    assert sum(statement.lstrip().upper().startswith("INSERT") for statement in statements) == 1
+    assert sum(statement.lstrip().upper().startswith("SELECT") for statement in statements) == 2
+    db.commit()
+    assert db.query(TablePermission).count() == 4
+
+
+@pytest.mark.parametrize("model, fields, rows", [
+    (TablePermission, table_perm.CONSTRAINT_FIELDS, [
+        {"db_name": "db", "table_name": "t", "user_name": "alice", "role_name": None},
+        {"db_name": "db", "table_name": "t", "user_name": "", "role_name": None},
+        {"db_name": "db", "table_name": "t", "user_name": None, "role_name": "r"},
+        {"db_name": "db", "table_name": "t", "user_name": None, "role_name": ""},
+        {"db_name": "db", "table_name": "t", "user_name": "alice", "role_name": "r"},
+        {"db_name": "db", "table_name": "t", "user_name": "", "role_name": "r"},
+        {"db_name": "db", "table_name": "t", "user_name": None, "role_name": None},
+    ]),
+    (RowPermission, row_perm.CONSTRAINT_FIELDS, [
+        {"db_name": "db", "table_name": "t", "row_filter": "id > 0", "user_name": "alice", "role_name": None},
+        {"db_name": "db", "table_name": "t", "row_filter": "id > 1", "user_name": "alice", "role_name": None},
+        {"db_name": "db", "table_name": "t", "row_filter": "id > 0", "user_name": "alice", "role_name": ""},
+        {"db_name": "db", "table_name": "t", "row_filter": "id > 0", "user_name": None, "role_name": "r"},
+        {"db_name": "db", "table_name": "t2", "row_filter": "id > 0", "user_name": "alice", "role_name": "r"},
+        {"db_name": "db", "table_name": "t2", "row_filter": "id > 0", "user_name": "alice", "role_name": None},
+    ]),
+])
+def test_bulk_and_single_create_accept_the_same_rows(model, fields, rows):
+    def new_session():
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        model.__table__.create(engine)
+        return sessionmaker(bind=engine)()
+
+    # 单条创建：逐条check_unique_constraint后写入，数据库约束拒绝的也视为未接受
+    db = new_session()
+    single = []
+    for index, data in enumerate(rows):
+        if check_unique_constraint(db, model, {field: data[field] for field in fields}):
+            continue
+        try:
+            create_item(db, model, data)
+        except IntegrityError:
+            db.rollback()
+            continue
+        single.append(index)
+
+    db = new_session()
+    created, _ = bulk_create_items(db, model, list(enumerate(rows)), "记录已存在", fields)
+    assert [index for index, _ in created] == single
+
+    # 分成两批提交时，第二批按表中已有记录查重的结果也一致
+    db = new_session()
+    half = len(rows) // 2
+    first, _ = bulk_create_items(db, model, list(enumerate(rows))[:half], "记录已存在", fields)
+    db.commit()
+    second, _ = bulk_create_items(db, model, list(enumerate(rows))[half:], "记录已存在", fields)
+    assert [index for index, _ in first + second] == single
+
+
+def test_keyset_pages_cover_all_rows_in_both_directions():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    TablePermission.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    for i in range(11):
+        # 排序字段有重复值和NULL，由id保证次序稳定
+        create_item(db, TablePermission, {"db_name": "db", "table_name": f"t{i}",
+                                          "user_name": None if i % 4 == 0 else f"u{i % 3}",
+                                          "role_name": "r" if i % 4 == 0 else None})
+
+    for order in ("ascend", "descend"):
+        sorters = [{"field": "user_name", "order": order}]
+        pages, cursor = [], ""
+        while cursor is not None:
+            result = get_paginated_results(db, TablePermission, page_size=3, sorters=sorters,
+                                           cursor=cursor, with_total=False)
+            assert result["total"] is None
+            pages.append(([item.id for item in result["items"]], result["prev_cursor"]))
+            cursor = result["next_cursor"]
+        ids = [item_id for page, _ in pages for item_id in page]
+        # NULL视为最大值
+        users = {item.id: item.user_name for item in db.query(TablePermission)}
+        assert ids == sorted(users, key=lambda i: (users[i] is None, users[i] or "", i), reverse=order == "descend")
+        assert len(pages) == 4 and pages[0][1] is None
+
+        # 从最后一页依次向前翻页，得到与向后翻页相同的各页
+        cursor = pages[-1][1]
+        for page, prev_cursor in reversed(pages[:-1]):
+            result = get_paginated_results(db, TablePermission, page_size=3, sorters=sorters, cursor=cursor)
+            assert [item.id for item in result["items"]] == page
+            cursor = result["prev_cursor"]
+        assert cursor is None
+
+    with pytest.raises(HTTPException):
+        get_paginated_results(db, TablePermission, sorters=[{"field": "db_name", "order": "ascend"}],
+                              cursor=encode_cursor({"f": "user_name", "d": False, "v": "u1", "id": 3}))
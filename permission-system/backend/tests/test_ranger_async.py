@@ -0,0 +1,59 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+
+from app.utils.ranger_async import AsyncRangerClient, async_reconcile
+
+
+class FakeRanger:
+    """用内存字典模拟Ranger策略接口"""
+
+    def __init__(self):
+        self.policies = {}
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path))
+        path = request.url.path.replace("/service/public/v2/api", "")
+        if request.method == "GET" and path.startswith("/service/") and "/policy/" in path:
+            service, name = path[len("/service/"):].split("/policy/")
+            for policy in self.policies.values():
+                if policy["service"] == service and policy["name"] == name:
+                    return httpx.Response(200, json=policy)
+            return httpx.Response(404, text="not found")
+        if request.method == "POST" and path == "/policy":
+            policy = dict(json.loads(request.content), id=len(self.policies) + 1)
+            self.policies[policy["id"]] = policy
+            return httpx.Response(200, json=policy)
+        if request.method == "PUT" and path.startswith("/policy/"):
+            policy = json.loads(request.content)
+            self.policies[int(path.rsplit("/", 1)[1])] = policy
+            return httpx.Response(200, json=policy)
+        return httpx.Response(400, text=f"unexpected {request.method} {path}")
+
+
+def test_async_single_sync_creates_then_noops():
+    ranger = FakeRanger()
+    perm = SimpleNamespace(id=1, db_name="db", table_name="tbl", user_name="alice", role_name=None)
+
+    async def scenario():
+        client = AsyncRangerClient(url="http://ranger", auth=("u", "p"),
+                                   transport=httpx.MockTransport(ranger.handle))
+        try:
+            first = await async_reconcile("table", [perm], client)
+            second = await async_reconcile("table", [perm], client)
+        finally:
+            await client.aclose()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["applied"]["create"] == 3
+    assert first["errors"] == []
+    names = sorted(p["name"] for p in ranger.policies.values())
+    assert names == ["db.tbl.all.normal", "doris.cdp_hive.db.tbl.all.normal", "doris.internal.db.tbl.all.normal"]
+    doris = next(p for p in ranger.policies.values() if p["service"] == "doris")
+    assert {a["type"] for a in doris["policyItems"][0]["accesses"]} == {"SELECT", "SHOW"}
+    assert second["plan"]["unchanged"] == 3
+    assert not any(method != "GET" for method, _ in ranger.requests[-3:])
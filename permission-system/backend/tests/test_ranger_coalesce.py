@@ -0,0 +1,105 @@
+import threading
+from types import SimpleNamespace
+
+import requests
+
+from app.utils.ranger_coalesce import ACTION_REVOKE, PolicyWriteCoalescer, sync_records, sync_update
+from app.utils.ranger_transport import RangerSession
+from app.utils.ranger_snapshot import RangerPolicyCache
+from app.utils.youcash_ranger_v2 import RangerManager
+from tests.test_ranger_snapshot import FakeClient
+
+
+class CountingClient(FakeClient):
+    def __init__(self, policies):
+        super().__init__(policies)
+        self.writes = 0
+
+    def create_policy(self, policy):
+        self.writes += 1
+        return super().create_policy(policy)
+
+    def update_policy_by_id(self, policy_id, policy):
+        self.writes += 1
+        return super().update_policy_by_id(policy_id, policy)
+
+
+def build_coalescer(policies=()):
+    client = CountingClient(list(policies))
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    coalescer = PolicyWriteCoalescer(manager_factory=lambda: manager, window=60, services=["cm_hive"])
+    return client, coalescer
+
+
+def table_perm(perm_id, user_name):
+    return SimpleNamespace(id=perm_id, db_name="db", table_name="tbl", user_name=user_name, role_name=None)
+
+
+def test_grants_on_same_policy_are_written_once():
+    client, coalescer = build_coalescer()
+    handles = [coalescer.submit("table", table_perm(i, f"user{i}")) for i in range(10)]
+
+    result = coalescer.flush()
+    assert result["writes"] == client.writes == 1
+    assert all(handle.wait(timeout=1) for handle in handles)
+    policy = next(iter(client.policies.values()))
+    assert policy["name"] == "db.tbl.all.normal"
+    assert policy["policyItems"][0]["users"] == sorted(f"user{i}" for i in range(10))
+
+
+def test_grant_and_revoke_fold_into_one_update():
+    client, coalescer = build_coalescer()
+    coalescer.submit("table", table_perm(1, "alice"))
+    coalescer.submit("table", table_perm(2, "bob"))
+    coalescer.flush()
+
+    coalescer.submit("table", table_perm(1, "alice"), action=ACTION_REVOKE)
+    coalescer.submit("table", table_perm(3, "carol"))
+    coalescer.flush()
+    assert client.writes == 2
+    users = {u for item in next(iter(client.policies.values()))["policyItems"] for u in item["users"]}
+    assert users == {"bob", "carol"}
+
+
+def test_sync_update_replaces_user_with_one_write_per_policy():
+    client = CountingClient([])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    created = sync_records("table", [table_perm(1, "alice")], manager)
+    ids = set(client.policies)
+
+    # 每个策略上只有alice一个授权，替换为bob时不能先删除策略再重建
+    result = sync_update("table", table_perm(1, "alice"), table_perm(1, "bob"), manager)
+    assert result["errors"] == []
+    assert result["writes"] == result["policies"] == created["policies"]
+    assert client.writes == created["writes"] + result["writes"]
+    assert set(client.policies) == ids
+    assert all([item["users"] for item in p["policyItems"]] == [["bob"]] for p in client.policies.values())
+
+
+class HttpCountingClient(FakeClient):
+    """写入时经RangerSession发出请求，用于验证请求计数在线程池中同样生效"""
+
+    def __init__(self, policies):
+        super().__init__(policies)
+        self.session = RangerSession(limiters=None)
+        self.lock = threading.Lock()
+
+    def create_policy(self, policy):
+        self.session.request("POST", "http://ranger/service/public/v2/api/policy")
+        with self.lock:
+            return super().create_policy(policy)
+
+
+def test_sync_records_coalesces_and_counts_ranger_calls(monkeypatch):
+    monkeypatch.setattr(requests.Session, "request", lambda self, method, url, **kwargs: None)
+    client = HttpCountingClient([])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    records = [table_perm(i, f"user{i}") for i in range(50)]
+
+    result = sync_records("table", records, manager)
+    # 50条记录都落在同一张表上：cm_hive一个策略，doris两个catalog各一个策略
+    assert result["records"] == 50
+    assert result["policies"] == result["writes"] == 3
+    assert result["ranger_calls"] == 3
+    assert result["failed_ids"] == []
+    assert len(client.policies) == 3
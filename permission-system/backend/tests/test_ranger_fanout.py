@@ -0,0 +1,57 @@
+import argparse
+import threading
+import time
+
+import pytest
+
+from app.utils.ranger_fanout import RangerFanoutError, fan_out, fanout_snapshot, get_fanout_executor, split_targets
+from app.utils.ranger_limiter import LANE_INTERACTIVE, LANE_RECONCILE, current_sync_lane, sync_lane
+
+
+def make_args():
+    return argparse.Namespace(command="grant", policy_type="normal", service=["cm_hive", "doris"],
+                              catalog=["internal", "cdp_hive"], accesses=["select"])
+
+
+def test_split_targets_copies_list_arguments():
+    targets = split_targets(make_args())
+    assert [label for label, _ in targets] == ["cm_hive", "doris.internal", "doris.cdp_hive"]
+    targets[1][1].accesses.append("show")
+    assert targets[0][1].accesses == ["select"]
+    assert targets[2][1].catalog == ["cdp_hive"]
+
+
+def test_targets_run_concurrently_and_errors_are_per_target():
+    barrier = threading.Barrier(3, timeout=2)
+
+    def handler(args):
+        # 三个目标必须同时在执行中才能通过屏障
+        barrier.wait()
+        time.sleep(0.05)
+        if args.catalog == ["cdp_hive"] and args.service == ["doris"]:
+            raise Exception("catalog不存在")
+
+    with pytest.raises(RangerFanoutError) as exc_info:
+        fan_out(handler, make_args())
+    error = exc_info.value
+    assert list(error.errors) == ["doris.cdp_hive"]
+    assert error.result["targets"]["cm_hive"]["status"] == "success"
+    assert error.result["duration"] < 0.15
+
+
+def test_each_lane_has_its_own_executor_and_tasks_inherit_the_lane():
+    with sync_lane(LANE_RECONCILE):
+        executor = get_fanout_executor()
+    assert executor is get_fanout_executor(LANE_RECONCILE)
+    assert executor is not get_fanout_executor()
+
+    # 对账线程全部被占用时，交互请求的任务仍可立即执行
+    release = threading.Event()
+    blocked = [executor.submit(release.wait, 2) for _ in range(executor.workers)]
+    assert get_fanout_executor().submit(current_sync_lane.get).result(timeout=1) == LANE_INTERACTIVE
+    queued = executor.submit(current_sync_lane.get)
+    release.set()
+    for future in blocked:
+        future.result(timeout=2)
+    assert queued.result(timeout=2) == LANE_RECONCILE
+    assert fanout_snapshot()[LANE_RECONCILE]["requests"] >= executor.workers
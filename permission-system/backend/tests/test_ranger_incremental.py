@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.models import TablePermission
+from app.models.ranger_sync import PermissionTombstone, SyncWatermark
+from app.utils.ranger_incremental import add_tombstone, incremental_sync
+from app.utils.ranger_snapshot import RangerPolicyCache
+from app.utils.youcash_ranger_v2 import RangerManager
+from tests.test_ranger_snapshot import FakeClient
+
+
+def utcnow():
+    # SQLite的CURRENT_TIMESTAMP为不带时区的UTC时间
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def build_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (TablePermission, SyncWatermark, PermissionTombstone):
+        model.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_only_changed_rows_and_tombstones_are_synced(monkeypatch):
+    db = build_session()
+    old = utcnow() - timedelta(days=1)
+    for i in range(20):
+        db.add(TablePermission(id=i + 1, db_name="db", table_name=f"t{i}", user_name="u1", update_time=old))
+    db.add(SyncWatermark(module="table", watermark=utcnow() - timedelta(hours=1)))
+    db.commit()
+
+    changed = db.get(TablePermission, 3)
+    changed.user_name = "u2"
+    changed.update_time = utcnow() - timedelta(seconds=5)
+    add_tombstone(db, "table", db.get(TablePermission, 5))
+    db.delete(db.get(TablePermission, 5))
+    db.commit()
+
+    client = FakeClient([])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    reconciled = []
+    import app.utils.ranger_incremental as incremental
+    monkeypatch.setattr(incremental, "reconcile", lambda kind, perms, mgr: reconciled.extend(perms) or {
+        "plan": {}, "errors": [], "failed_ids": []})
+
+    result = incremental_sync("table", db, manager)
+    assert [perm.id for perm in reconciled] == [3]
+    assert result["changed"] == 1 and result["tombstones"] == 1
+    assert db.query(PermissionTombstone).one().synced_at is not None
+    assert db.query(SyncWatermark).one().last_status == "success"
+
+    # 第二次执行时水位线已推进，回看窗口之外没有新的变更
+    monkeypatch.setattr(incremental, "RANGER_INCREMENTAL_OVERLAP", 0)
+    reconciled.clear()
+    assert incremental_sync("table", db, manager)["changed"] == 0
+    assert reconciled == []
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.ranger_limiter import (
+    LANE_BATCH, LANE_INTERACTIVE, LANE_RECONCILE, AdaptiveLimiter, RangerLimiterRegistry, RangerLimitTimeout,
+    detect_service, ranger_service_context, sync_lane,
+)
+
+
+def test_detect_service_from_url_body_and_context():
+    assert detect_service("http://r/service/public/v2/api/service/cm_hive/policy/db.t.all.normal") == "cm_hive"
+    assert detect_service("http://r/service/public/v2/api/service/name/doris") == "doris"
+    assert detect_service("http://r/service/public/v2/api/policy", '{"service": "doris"}') == "doris"
+    with ranger_service_context("cm_hive"):
+        assert detect_service("http://r/service/public/v2/api/policy/12") == "cm_hive"
+    assert detect_service("http://r/service/public/v2/api/policy/12") == "default"
+
+
+def test_aimd_backs_off_on_failure_and_ramps_up_when_healthy():
+    limiter = AdaptiveLimiter("cm_hive", rate=1000, burst=1000, min_concurrency=1,
+                              max_concurrency=8, initial_concurrency=4)
+    for _ in range(20):
+        with limiter.slot():
+            pass
+    assert limiter.limit > 4
+
+    raised = limiter.limit
+    try:
+        with limiter.slot():
+            raise TimeoutError("read timeout")
+    except TimeoutError:
+        pass
+    assert limiter.limit == raised * 0.5
+    assert limiter.snapshot()["failures"] == 1
+
+
+def test_concurrency_limit_queues_excess_requests():
+    registry = RangerLimiterRegistry({"doris": {"rate": 1000, "burst": 1000, "max_concurrency": 2,
+                                                "initial_concurrency": 2}})
+    limiter = registry.get("doris")
+    peak = []
+    lock = threading.Lock()
+    active = [0]
+
+    def call():
+        with limiter.slot():
+            with lock:
+                active[0] += 1
+                peak.append(active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.005)
+    assert registry.snapshot()["doris"]["queue_depth"] > 0
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2
+    assert registry.get("cm_hive") is not limiter
+
+
+def test_bulk_lanes_leave_capacity_for_interactive_requests():
+    limiter = AdaptiveLimiter("cm_hive", rate=1000, burst=1000, max_concurrency=4, initial_concurrency=4)
+    with sync_lane(LANE_RECONCILE):
+        assert limiter.acquire(timeout=0.1) == LANE_RECONCILE
+        limiter.acquire(timeout=0.1)
+        # 对账通道最多占用一半名额
+        with pytest.raises(RangerLimitTimeout):
+            limiter.acquire(timeout=0.1)
+    limiter.acquire(timeout=0.1, lane=LANE_BATCH)
+    # 批量导入连同对账合计最多占用3/4名额，剩余名额留给交互请求
+    with pytest.raises(RangerLimitTimeout):
+        limiter.acquire(timeout=0.1, lane=LANE_BATCH)
+    assert limiter.acquire(timeout=0.1) == LANE_INTERACTIVE
+
+    lanes = limiter.snapshot()["lanes"]
+    assert lanes[LANE_RECONCILE]["in_flight"] == 2 and lanes[LANE_BATCH]["in_flight"] == 1
+    assert lanes[LANE_INTERACTIVE]["requests"] == 1 and lanes[LANE_INTERACTIVE]["p99_wait"] is not None
+
+
+def test_reconcile_lane_yields_freed_slot_to_waiting_interactive_request():
+    limiter = AdaptiveLimiter("cm_hive", rate=1000, burst=1000, max_concurrency=4, initial_concurrency=4)
+    limiter.acquire(lane=LANE_RECONCILE)
+    for _ in range(3):
+        limiter.acquire()
+    acquired = []
+
+    def wait(lane):
+        try:
+            limiter.acquire(timeout=0.3, lane=lane)
+            acquired.append(lane)
+        except RangerLimitTimeout:
+            pass
+
+    # 对账请求先开始排队，交互请求后到
+    threads = [threading.Thread(target=wait, args=(lane,)) for lane in (LANE_RECONCILE, LANE_INTERACTIVE)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    limiter.release(0.01, True, LANE_INTERACTIVE)
+    for thread in threads:
+        thread.join()
+    assert acquired[0] == LANE_INTERACTIVE
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.models import ColumnPermission, HdfsQuota, RowPermission, TablePermission
+from app.utils import ranger_pipeline
+from app.utils.ranger_reconcile import POLICY_TYPE_MASK, POLICY_TYPE_NORMAL, POLICY_TYPE_ROW_FILTER
+from app.utils.ranger_snapshot import RangerPolicyCache
+from app.utils.youcash_ranger_v2 import RangerManager
+from tests.test_ranger_snapshot import FakeClient
+
+
+class OrderedClient(FakeClient):
+    """记录写入顺序，并发创建时保证策略ID不重复"""
+
+    def __init__(self, policies):
+        super().__init__(policies)
+        self.lock = threading.Lock()
+        self.created_types = []
+
+    def create_policy(self, policy):
+        with self.lock:
+            self.created_types.append(policy.get("policyType", POLICY_TYPE_NORMAL))
+            return super().create_policy(policy)
+
+
+def build_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (TablePermission, ColumnPermission, RowPermission, HdfsQuota):
+        model.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    for i in range(3):
+        db.add(TablePermission(db_name="db", table_name=f"t{i}", user_name="alice"))
+        db.add(ColumnPermission(db_name="db", table_name=f"t{i}", col_name="phone", mask_type="手机号",
+                                user_name="alice"))
+        db.add(RowPermission(db_name="db", table_name=f"t{i}", row_filter="org_id = 1", user_name="alice"))
+    db.add(HdfsQuota(db_name="db", hdfs_quota=100))
+    db.commit()
+    return db
+
+
+def test_reconcile_all_shares_snapshot_and_orders_stages(monkeypatch):
+    db = build_session()
+    client = OrderedClient([])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    quotas = []
+    monkeypatch.setattr(ranger_pipeline, "apply_hdfs_quota", lambda quota: quotas.append(quota.db_name))
+    progress = []
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        result = ranger_pipeline.reconcile_all(db, manager, progress=lambda *args: progress.append(args),
+                                               executor=executor)
+
+    # 每个服务只加载一次快照
+    assert client.list_calls == 2
+    # 每条记录在cm_hive和doris两个catalog上各对应一个策略
+    assert result["plan"]["table"]["create"] == 9
+    assert result["plan"]["column"]["create"] == 9
+    assert result["plan"]["row"]["create"] == 9
+    assert result["records"] == {"table": 3, "column": 3, "row": 3, "hdfs": 1}
+    assert result["hdfs"]["synced"] == 1 and quotas == ["db"]
+    assert client.created_types == [POLICY_TYPE_NORMAL] * 9 + [POLICY_TYPE_MASK] * 9 + [POLICY_TYPE_ROW_FILTER] * 9
+    assert progress[0] == (0, 0, 28) and progress[-1] == (28, 0, 28)
+
+    # 再次对账时没有需要执行的变更
+    again = ranger_pipeline.reconcile_all(db, manager, include_hdfs=False)
+    assert all(plan["create"] == 0 and plan["update"] == 0 for plan in again["plan"].values())
@@ -0,0 +1,115 @@
+import copy
+from types import SimpleNamespace
+
+from app.utils.ranger_reconcile import (
+    apply_plan, compute_plan, desired_from_column_permissions, desired_from_table_permissions,
+    reconcile,
+)
+from app.utils import youcash_ranger_v2
+from app.utils.ranger_snapshot import RangerPolicyCache
+from app.utils.youcash_ranger_v2 import RangerManager, to_ranger_mask_type
+from tests.test_ranger_snapshot import FakeClient, serve_downloads
+
+
+def table_perm(perm_id, db_name, table_name, user_name=None, role_name=None):
+    return SimpleNamespace(id=perm_id, db_name=db_name, table_name=table_name,
+                           user_name=user_name, role_name=role_name)
+
+
+def hive_normal(policy_id, name, users):
+    return {
+        "id": policy_id,
+        "service": "cm_hive",
+        "name": name,
+        "policyType": 0,
+        "resources": {"database": {"values": ["db"]}, "table": {"values": [name.split(".")[1]]},
+                      "column": {"values": ["*"]}},
+        "policyItems": [{"accesses": [{"type": "select", "isAllowed": True}],
+                         "users": users, "groups": [], "roles": []}],
+    }
+
+
+def test_plan_only_touches_drifted_policies():
+    client = FakeClient([
+        hive_normal(1, "db.t1.all.normal", ["alice"]),
+        hive_normal(2, "db.t2.all.normal", ["alice"]),
+        hive_normal(3, "db.gone.all.normal", ["bob"]),
+    ])
+    cache = RangerPolicyCache(client, ttl=3600)
+    perms = [
+        table_perm(1, "db", "t1", user_name="alice"),
+        table_perm(2, "db", "t2", user_name="alice"),
+        table_perm(3, "db", "t2", user_name="bob"),
+        table_perm(4, "db", "t3", role_name="analyst"),
+    ]
+    desired = desired_from_table_permissions(perms, services=["cm_hive"])
+
+    plan = compute_plan(desired, cache)
+    assert plan.summary() == {"create": 1, "update": 1, "delete": 0, "unchanged": 1}
+    # 同一策略的多条授权合并为一个条目
+    assert plan.updates[0]["policy"]["policyItems"][0]["users"] == ["bob"]
+    assert plan.updates[0]["record_ids"] == [2, 3]
+
+    plan = compute_plan(desired, cache, prune=True, kind="table")
+    assert [d["policy_id"] for d in plan.deletes] == [3]
+
+
+def test_apply_replans_policies_changed_after_planning(monkeypatch):
+    serve_downloads(monkeypatch)
+    monkeypatch.setattr(youcash_ranger_v2, "RANGER_POLICY_WRITE_CHECK_INTERVAL", 0)
+    client = FakeClient([hive_normal(1, "db.t1.all.normal", ["alice"])])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    desired = desired_from_table_permissions([table_perm(1, "db", "t1", user_name="bob")], services=["cm_hive"])
+    plan = compute_plan(desired, manager.policy.policy_cache)
+
+    # 计划计算后其他写入方修改了策略
+    changed = copy.deepcopy(client.policies[1])
+    changed["policyItems"][0]["users"].append("carol")
+    client.update_policy_by_id(1, changed)
+
+    # 执行前的版本检查发现策略已变化，基于最新内容重新计算
+    result = apply_plan(plan, manager.policy)
+    assert result["errors"] == []
+    assert [item["users"] for item in client.policies[1]["policyItems"]] == [["bob"], ["alice", "carol"]]
+    assert client.get_by_id_calls == 0
+
+
+def test_reconcile_applies_plan_and_converges():
+    client = FakeClient([])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    perms = [SimpleNamespace(id=1, db_name="db", table_name="t", col_name="phone", mask_type="手机号",
+                             user_name="alice", role_name=None)]
+
+    result = reconcile("column", perms, manager, services=["cm_hive", "doris"], catalogs=["internal"])
+    assert result["applied"]["create"] == 2
+    assert result["errors"] == []
+    created = {p["name"]: p for p in client.policies.values()}
+    mask_info = created["db.t.phone.mask"]["dataMaskPolicyItems"][0]["dataMaskInfo"]
+    assert mask_info["dataMaskType"] == to_ranger_mask_type("手机号") == "CUSTOM"
+    assert "doris.internal.db.t.phone.mask" in created
+
+    # 再次对账时Ranger已一致，不产生任何写操作
+    desired = desired_from_column_permissions(perms, services=["cm_hive", "doris"], catalogs=["internal"])
+    result = reconcile("column", perms, manager, services=["cm_hive", "doris"], catalogs=["internal"])
+    assert result["plan"] == {"create": 0, "update": 0, "delete": 0, "unchanged": len(desired)}
+
+
+def test_plain_mask_type_writes_no_policy_and_prune_removes_legacy_grants():
+    client = FakeClient([])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    perms = [SimpleNamespace(id=1, db_name="db", table_name="t", col_name="phone", mask_type="原文",
+                             user_name="alice", role_name=None)]
+    assert to_ranger_mask_type("原文") is None
+    assert desired_from_column_permissions(perms, services=["cm_hive"], catalogs=["internal"]) == {}
+
+    # 之前写入的MASK_NONE授权在prune对账时随权限表移除
+    legacy = [SimpleNamespace(id=2, db_name="db", table_name="t", col_name="phone", mask_type="MASK_NONE",
+                              user_name="alice", role_name=None),
+              SimpleNamespace(id=3, db_name="db", table_name="t", col_name="phone", mask_type="手机号",
+                              user_name="bob", role_name=None)]
+    reconcile("column", legacy, manager, services=["cm_hive"], catalogs=["internal"])
+    perms.append(legacy[1])
+    result = reconcile("column", perms, manager, services=["cm_hive"], catalogs=["internal"], prune=True)
+    assert result["errors"] == []
+    items = next(iter(client.policies.values()))["dataMaskPolicyItems"]
+    assert [(item["users"], item["dataMaskInfo"]["dataMaskType"]) for item in items] == [(["bob"], "CUSTOM")]
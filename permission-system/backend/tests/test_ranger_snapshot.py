@@ -0,0 +1,265 @@
+import argparse
+import copy
+import threading
+
+from app.utils import youcash_ranger_v2
+from app.utils.ranger_snapshot import RangerPolicyCache, ServicePolicySnapshot
+from app.utils.youcash_ranger_v2 import RangerPolicyManager
+
+
+def make_policy(policy_id, name, database, table, column=None, users=None, roles=None, service="cm_hive"):
+    resources = {
+        "database": {"values": [database]},
+        "table": {"values": [table]},
+    }
+    if column:
+        resources["column"] = {"values": [column]}
+    return {
+        "id": policy_id,
+        "service": service,
+        "name": name,
+        "resources": resources,
+        "version": 1,
+        "policyItems": [{"accesses": [{"type": "select", "isAllowed": True}],
+                         "users": users or [], "groups": [], "roles": roles or []}],
+    }
+
+
+def not_found():
+    error = Exception("policy not found")
+    error.statusCode = 404
+    return error
+
+
+class FakeClient:
+    """记录调用次数的Ranger客户端替身，写入时与Ranger一样递增策略和服务的版本"""
+
+    def __init__(self, policies):
+        self.policies = {p["id"]: p for p in policies}
+        self.list_calls = 0
+        self.get_calls = 0
+        self.get_by_id_calls = 0
+        self.download_calls = 0
+        self.policy_version = 1
+        self.next_id = 100
+
+    def get_service(self, service):
+        return {"name": service, "policyVersion": self.policy_version}
+
+    def get_policies_in_service(self, service, params=None):
+        self.list_calls += 1
+        start = params["startIndex"]
+        items = [p for p in self.policies.values() if p["service"] == service]
+        return items[start:start + params["pageSize"]]
+
+    def get_policy(self, service, name):
+        self.get_calls += 1
+        for policy in self.policies.values():
+            if policy["service"] == service and policy["name"] == name:
+                return copy.deepcopy(policy)
+        raise not_found()
+
+    def get_policy_by_id(self, policy_id):
+        self.get_by_id_calls += 1
+        if policy_id not in self.policies:
+            raise not_found()
+        return copy.deepcopy(self.policies[policy_id])
+
+    def create_policy(self, policy):
+        created = dict(copy.deepcopy(policy), id=self.next_id, version=1)
+        self.next_id += 1
+        self.policies[created["id"]] = created
+        self.policy_version += 1
+        return copy.deepcopy(created)
+
+    def update_policy_by_id(self, policy_id, policy):
+        if policy_id not in self.policies:
+            raise not_found()
+        updated = dict(copy.deepcopy(policy), id=policy_id, version=(self.policies[policy_id].get("version") or 0) + 1)
+        self.policies[policy_id] = updated
+        self.policy_version += 1
+        return copy.deepcopy(updated)
+
+    def delete_policy_by_id(self, policy_id):
+        self.policies.pop(policy_id)
+        self.policy_version += 1
+
+
+def serve_downloads(monkeypatch):
+    """让快照的版本检查走FakeClient：版本未变化时相当于Ranger返回304，变化时返回服务下的全部策略"""
+    def download(snapshot):
+        snapshot.client.download_calls += 1
+        if snapshot.policy_version == snapshot.client.policy_version:
+            return None
+        return {"policyVersion": snapshot.client.policy_version,
+                "policies": [copy.deepcopy(p) for p in snapshot.client.policies.values()
+                             if p["service"] == snapshot.service]}
+    monkeypatch.setattr(ServicePolicySnapshot, "_download_deltas", download)
+
+
+def build_cache(policies):
+    client = FakeClient(policies)
+    return client, RangerPolicyCache(client, ttl=3600, page_size=2)
+
+
+def test_snapshot_indexes_by_name_resource_and_entity():
+    client, cache = build_cache([
+        make_policy(1, "db.tbl.all.normal", "db", "tbl", "*", users=["alice"]),
+        make_policy(2, "db.tbl.phone.mask", "db", "tbl", "phone", roles=["analyst"]),
+        make_policy(3, "db.other.row_filter", "db", "other", users=["alice"]),
+    ])
+    snapshot = cache.snapshot("cm_hive")
+
+    assert cache.get_policy("cm_hive", "db.tbl.phone.mask")["id"] == 2
+    assert cache.get_policy("cm_hive", "missing") is None
+    assert [p["id"] for p in snapshot.find_by_resource("db", "tbl")] == [1, 2]
+    assert [p["id"] for p in snapshot.find_by_resource("db", "tbl", "phone")] == [2]
+    assert [p["id"] for p in snapshot.find_by_resource("db")] == [1, 2, 3]
+    assert [p["id"] for p in snapshot.find_by_resource("db", column="phone")] == [2]
+    assert [p["id"] for p in cache.find_by_entity(["cm_hive"], "user", "alice")] == [1, 3]
+    # 分页大小为2，3条策略需要两次列表调用，之后全部读缓存
+    assert client.list_calls == 2
+    assert client.get_calls == 0
+
+
+def test_download_runs_outside_the_snapshot_lock(monkeypatch):
+    client, cache = build_cache([make_policy(1, "db.tbl.all.normal", "db", "tbl", "*", users=["alice"])])
+    snapshot = cache.snapshot("cm_hive")
+    snapshot.ensure_fresh()
+    started, release = threading.Event(), threading.Event()
+
+    def slow_download(self):
+        started.set()
+        release.wait(5)
+        return {"policyVersion": 2, "policies": [make_policy(1, "db.tbl.all.normal", "db", "tbl", "*")]}
+    monkeypatch.setattr(ServicePolicySnapshot, "_download_deltas", slow_download)
+
+    refresher = threading.Thread(target=snapshot.ensure_fresh, kwargs={"max_age": 0})
+    refresher.start()
+    assert started.wait(5)
+    # 下载期间读取和本进程的写入不被阻塞，写入在下载结果替换索引后保留
+    assert snapshot.get_by_name("db.tbl.all.normal")["id"] == 1
+    snapshot.upsert(dict(make_policy(1, "db.tbl.all.normal", "db", "tbl", "*", users=["bob"]), version=2))
+    release.set()
+    refresher.join(5)
+    assert snapshot.policy_version == 2
+    assert [p["id"] for p in snapshot.find_by_entity("user", "bob")] == [1]
+
+
+def test_policy_manager_writes_through_snapshot():
+    client, cache = build_cache([make_policy(1, "db.tbl.all.normal", "db", "tbl", "*", users=["alice"])])
+    manager = RangerPolicyManager(client, cache)
+
+    policy = manager.get_existing_policy("cm_hive", "db.tbl.all.normal")
+    policy["policyItems"][0]["users"].append("bob")
+    # 返回的是副本，未写回前缓存不受影响
+    assert cache.find_by_entity(["cm_hive"], "user", "bob") == []
+
+    manager.update_policy_by_id(1, policy)
+    assert [p["id"] for p in cache.find_by_entity(["cm_hive"], "user", "bob")] == [1]
+
+    created = manager.create_policy(make_policy(None, "db.t2.all.normal", "db", "t2", "*", users=["bob"]))
+    assert manager.get_existing_policy("cm_hive", "db.t2.all.normal")["id"] == created["id"]
+
+    manager.delete_policy_by_id(1)
+    assert manager.get_existing_policy("cm_hive", "db.tbl.all.normal") is None
+    assert client.list_calls == 1
+
+
+def test_writes_use_snapshot_after_version_check(monkeypatch):
+    serve_downloads(monkeypatch)
+    monkeypatch.setattr(youcash_ranger_v2, "RANGER_POLICY_WRITE_CHECK_INTERVAL", 0)
+    client, cache = build_cache([make_policy(1, "db.tbl.all.normal", "db", "tbl", "*", users=["alice"])])
+    manager = RangerPolicyManager(client, cache)
+    cache.snapshot("cm_hive").ensure_fresh()
+    # 快照TTL内，其他进程修改了策略并新建了一条策略
+    changed = copy.deepcopy(client.policies[1])
+    changed["policyItems"][0]["users"].append("carol")
+    client.update_policy_by_id(1, changed)
+    client.policies[5] = make_policy(5, "db.new.all.normal", "db", "new", "*", users=["dave"])
+    client.policy_version += 1
+
+    # 写入前的版本检查发现服务版本已变化，快照先刷新再作为读-改-写的基础
+    policy = manager.get_existing_policy("cm_hive", "db.tbl.all.normal")
+    policy["policyItems"][0]["users"].append("bob")
+    manager.update_policy_by_id(1, policy)
+    assert client.policies[1]["policyItems"][0]["users"] == ["alice", "carol", "bob"]
+    assert manager.get_existing_policy("cm_hive", "db.new.all.normal")["id"] == 5
+    # 没有逐个策略的读取，只有服务级的版本检查
+    assert client.get_calls == client.get_by_id_calls == 0
+    assert client.download_calls == 2
+
+
+def test_update_based_on_outdated_version_invalidates_snapshot(monkeypatch):
+    serve_downloads(monkeypatch)
+    client, cache = build_cache([make_policy(1, "db.tbl.all.normal", "db", "tbl", "*", users=["alice"])])
+    manager = RangerPolicyManager(client, cache)
+    policy = manager.get_existing_policy("cm_hive", "db.tbl.all.normal")
+    # 版本检查间隔内其他进程修改了策略，本次写入基于的版本已不是最新
+    client.update_policy_by_id(1, copy.deepcopy(client.policies[1]))
+
+    policy["policyItems"][0]["users"].append("bob")
+    assert manager.update_policy_by_id(1, policy)["version"] == 3
+    assert cache.snapshot("cm_hive").last_checked == 0.0
+    manager.get_existing_policy("cm_hive", "db.tbl.all.normal")
+    assert client.download_calls == 1
+
+
+def grant_args():
+    return argparse.Namespace(command="grant", policy_type="normal", service=["cm_hive", "doris"],
+                              catalog=["internal", "hive_catalog"], name=None, database="db", table="tbl",
+                              columns=["c1", "c2", "c3"], accesses=["select"],
+                              users=["bob"], groups=[], roles=[])
+
+
+def grant_policies():
+    policies = []
+    for index, column in enumerate(["c1", "c2", "c3"]):
+        policies.append(make_policy(10 + index, f"db.tbl.{column}.normal", "db", "tbl", column, users=["alice"]))
+        for offset, catalog in enumerate(["internal", "hive_catalog"]):
+            policy = make_policy(20 + index * 2 + offset, f"doris.{catalog}.db.tbl.{column}.normal",
+                                 "db", "tbl", column, users=["alice"], service="doris")
+            policy["resources"]["catalog"] = {"values": [catalog]}
+            policies.append(policy)
+    return policies
+
+
+def test_grant_round_trips_with_and_without_snapshot(monkeypatch):
+    serve_downloads(monkeypatch)
+    monkeypatch.setattr(youcash_ranger_v2, "RANGER_POLICY_WRITE_CHECK_INTERVAL", 60)
+    targets = 3 * (1 + 2)
+
+    # 无快照：每个目标策略按名称读取一次
+    client = FakeClient(grant_policies())
+    RangerPolicyManager(client).grant_access(grant_args())
+    before = client.get_calls + client.get_by_id_calls
+    assert before == targets
+
+    # 有快照：快照已加载，写入前每个服务只做一次版本检查
+    client = FakeClient(grant_policies())
+    cache = RangerPolicyCache(client, ttl=3600)
+    for service in ("cm_hive", "doris"):
+        cache.snapshot(service).ensure_fresh()
+    cache.invalidate()
+    RangerPolicyManager(client, cache).grant_access(grant_args())
+    after = client.get_calls + client.get_by_id_calls
+    print(f"grant {targets}个目标策略的读取次数: 无快照={before}, 有快照={after}+版本检查{client.download_calls}")
+    assert after == 0
+    assert client.download_calls == 2
+    assert all(["bob"] in [item["users"] for item in p["policyItems"]] for p in client.policies.values())
+
+
+def test_update_with_stale_snapshot_id_is_repaired_by_name():
+    policy = make_policy(7, "db.t.all.normal", "db", "t", users=["u1"])
+    client, cache = build_cache([policy])
+    manager = RangerPolicyManager(client, cache)
+    stale = cache.get_policy("cm_hive", "db.t.all.normal")
+
+    # Ranger侧策略被重建，快照中的ID已失效，更新返回404后按名称重新定位并重试
+    client.policies = {8: dict(copy.deepcopy(policy), id=8)}
+    stale["policyItems"][0]["users"].append("u2")
+    updated = manager.update_policy_by_id(stale["id"], stale)
+
+    assert updated["id"] == 8
+    assert client.policies[8]["policyItems"][0]["users"] == ["u1", "u2"]
+    assert cache.get_policy("cm_hive", "db.t.all.normal")["version"] == 2
@@ -0,0 +1,21 @@
+from app.utils import ranger_transport
+from app.utils.youcash_ranger_v2 import get_ranger_manager
+
+
+def test_shared_client_and_session():
+    ranger_transport.reset_ranger_transport()
+    client = ranger_transport.get_ranger_client()
+    # 多次获取得到的是同一个客户端，且底层复用共享会话
+    assert ranger_transport.get_ranger_client() is client
+    assert client.session is ranger_transport.get_ranger_session()
+    assert get_ranger_manager() is get_ranger_manager()
+
+
+def test_session_default_timeout_and_pool():
+    session = ranger_transport.build_ranger_session(
+        auth=("u", "p"), connect_timeout=1, read_timeout=2, pool_connections=3, pool_maxsize=4
+    )
+    assert session.timeout == (1, 2)
+    adapter = session.get_adapter("http://ranger.example.com")
+    assert adapter._pool_connections == 3
+    assert adapter._pool_maxsize == 4
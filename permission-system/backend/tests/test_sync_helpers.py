@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils import sync_helpers
+from app.utils.sync_helpers import RetryBudget, RetryScheduler, with_sync_retry
+
+
+def fake_db():
+    return SimpleNamespace(rollback=lambda: None, close=lambda: None)
+
+
+def test_retries_run_off_thread_and_record_each_attempt(monkeypatch):
+    scheduler = RetryScheduler(workers=1)
+    monkeypatch.setattr(sync_helpers, "_scheduler", scheduler)
+    calls = []
+    first_failed = threading.Event()
+
+    @with_sync_retry(max_attempts=3, retry_delay=0.2, dependency="test-ok")
+    def flaky(record_id, *, db=None, module_name="测试模块", action="同步"):
+        calls.append(record_id)
+        first_failed.set()
+        if len(calls) < 3:
+            raise RuntimeError("ranger timeout")
+        return {"id": record_id}
+
+    future = flaky.submit(7, db=fake_db())
+    assert first_failed.wait(timeout=1)
+    # 等待重试期间调度堆中有任务，执行线程空闲，可以处理其他调用
+    assert scheduler.executor.submit(lambda: "free").result(timeout=0.1) == "free"
+
+    assert future.result(timeout=5) == {"id": 7}
+    log = future.sync_record.attempt_log
+    assert [entry["ok"] for entry in log] == [False, False, True]
+    assert all(entry["latency"] >= 0 for entry in log)
+
+    assert asyncio.run(flaky.run_async(8, db=fake_db())) == {"id": 8}
+
+
+def test_exhausted_budget_and_client_errors_are_not_retried(monkeypatch):
+    monkeypatch.setattr(sync_helpers, "_scheduler", RetryScheduler(workers=1))
+    monkeypatch.setitem(sync_helpers._budgets, "test-budget", RetryBudget(ratio=0, min_retries=0))
+    calls = []
+
+    @with_sync_retry(max_attempts=3, retry_delay=0.01, dependency="test-budget")
+    def failing(record_id, *, db=None, module_name="测试模块", action="同步"):
+        calls.append(record_id)
+        if record_id == 404:
+            raise HTTPException(status_code=404, detail="记录不存在")
+        raise RuntimeError("ranger down")
+
+    with pytest.raises(HTTPException) as exc:
+        failing(1, db=fake_db())
+    assert exc.value.status_code == 500 and calls == [1]
+
+    monkeypatch.setitem(sync_helpers._budgets, "test-budget", RetryBudget(ratio=1, min_retries=10))
+    with pytest.raises(HTTPException) as exc:
+        failing(404, db=fake_db())
+    assert exc.value.status_code == 404 and calls == [1, 404]
+
+
+def test_row_permission_endpoints_wait_for_sync_without_request_session(monkeypatch):
+    from fastapi import Response
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from app.api import row_perm
+    from app.models.models import RowPermission
+    from app.models.ranger_sync import PermissionTombstone
+    from app.schemas.schemas import RowPermissionCreate, RowPermissionUpdate
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (RowPermission, PermissionTombstone):
+        model.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    calls = []
+
+    def fake_sync(error=None):
+        async def run_async(*args, **kwargs):
+            calls.append((args, kwargs))
+            if error:
+                raise error
+            return {"message": "sync ok"}
+        return SimpleNamespace(run_async=run_async)
+
+    monkeypatch.setattr(row_perm, "sync_single_row_permission", fake_sync())
+    monkeypatch.setattr(row_perm, "sync_update_row_permission", fake_sync())
+    payload = {"db_name": "db", "table_name": "t", "row_filter": "id > 0", "user_name": "u"}
+    created = asyncio.run(row_perm.create_row_permission(
+        db=db, row_permission_in=RowPermissionCreate(**payload), response=Response(), current_user=None))
+    updated = asyncio.run(row_perm.update_row_permission(
+        permission_id=created.id, db=db, row_permission_in=RowPermissionUpdate(user_name="v"),
+        response=Response(), current_user=None))
+    assert updated.user_name == "v"
+    # 同步由重试调度器使用自有会话执行，不传入请求会话
+    assert [args for args, _ in calls] == [(created.id,), (created.id, dict(payload, user_name="u", role_name=None))]
+    assert all("db" not in kwargs for _, kwargs in calls)
+
+    # 同步失败时删除新建记录
+    monkeypatch.setattr(row_perm, "sync_single_row_permission", fake_sync(HTTPException(status_code=500, detail="ranger down")))
+    with pytest.raises(HTTPException):
+        asyncio.run(row_perm.create_row_permission(
+            db=db, row_permission_in=RowPermissionCreate(**dict(payload, table_name="t2")),
+            response=Response(), current_user=None))
+    assert db.query(RowPermission).count() == 1
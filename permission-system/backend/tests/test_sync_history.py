@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.ranger_sync import SyncHistory
+from app.utils.sync_history import (
+    STATUS_FAILED, STATUS_SUCCESS, SyncHistoryWriter, duration_stats, failing_records, histogram_quantile,
+    slowest_records,
+)
+
+
+def build():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SyncHistory.__table__.create(engine)
+    return sessionmaker(bind=engine)
+
+
+def entry(record_id, duration, status=STATUS_SUCCESS, module_name="表权限模块", action="同步", started_at=None):
+    started_at = started_at or datetime(2024, 1, 1, 12, 0, 0)
+    return {
+        "module_name": module_name, "record_id": record_id, "action": action, "status": status,
+        "attempts": 1 if status == STATUS_SUCCESS else 3, "duration": duration,
+        "error_message": "ranger unavailable" if status == STATUS_FAILED else None, "attempt_log": None,
+        "started_at": started_at, "finished_at": started_at + timedelta(seconds=duration),
+    }
+
+
+def test_writer_flushes_in_batches():
+    session_factory = build()
+    writer = SyncHistoryWriter(session_factory, batch_size=2, flush_interval=3600)
+    for record_id in range(5):
+        writer.submit(entry(record_id, 0.1))
+
+    assert writer.flush() == 5
+    assert writer.flush() == 0
+    db = session_factory()
+    assert db.query(SyncHistory).count() == 5
+
+
+def test_duration_stats_histogram_and_percentiles():
+    session_factory = build()
+    writer = SyncHistoryWriter(session_factory, flush_interval=3600)
+    for record_id in range(90):
+        writer.submit(entry(record_id, 0.05))
+    for record_id in range(90, 100):
+        writer.submit(entry(record_id, 3.0, STATUS_FAILED))
+    writer.submit(entry(1, 0.2, action="删除同步"))
+    writer.flush()
+
+    db = session_factory()
+    stats = duration_stats(db, datetime(2024, 1, 1), datetime(2024, 1, 2), action="同步")
+    assert len(stats) == 1
+    item = stats[0]
+    assert item["count"] == 100
+    assert item["failed"] == 10
+    assert item["retries"] == 20
+    assert item["histogram"]["le_0.1"] == 90
+    assert item["histogram"]["le_5"] == 10
+    assert item["p50"] <= 0.1
+    assert 2.5 < item["p99"] <= 5
+
+    assert duration_stats(db, datetime(2024, 1, 2), datetime(2024, 1, 3)) == []
+    assert slowest_records(db, limit=1)[0]["duration"] == 3.0
+
+
+def test_failing_records_ranked_by_failures():
+    session_factory = build()
+    writer = SyncHistoryWriter(session_factory, flush_interval=3600)
+    base = datetime(2024, 1, 1, 12, 0, 0)
+    for minute in range(3):
+        writer.submit(entry(7, 1.0, STATUS_FAILED, started_at=base + timedelta(minutes=minute)))
+    writer.submit(entry(8, 1.0, STATUS_FAILED))
+    writer.submit(entry(9, 1.0))
+    writer.flush()
+
+    records = failing_records(session_factory())
+    assert [(r["record_id"], r["failures"]) for r in records] == [(7, 3), (8, 1)]
+    assert records[0]["last_error"] == "ranger unavailable"
+
+
+def test_histogram_quantile_uses_max_for_overflow_bucket():
+    assert histogram_quantile(0.5, [0] * 10, None) is None
+    assert histogram_quantile(0.99, [0] * 9 + [4], 120.0) <= 120.0
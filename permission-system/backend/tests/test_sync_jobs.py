@@ -0,0 +1,173 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.models import TablePermission
+from app.models.ranger_sync import SyncJob
+from app.utils import sync_jobs
+from app.utils.ranger_snapshot import RangerPolicyCache
+from app.utils.sync_jobs import (
+    LEASE_LOST, SyncJobConflict, SyncJobWorker, claim_job, create_job, job_to_dict, request_cancel, run_job,
+    schedule_incremental_sync,
+)
+from app.utils.youcash_ranger_v2 import RangerManager
+from tests.test_ranger_snapshot import FakeClient
+
+
+def build():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (TablePermission, SyncJob):
+        model.__table__.create(engine)
+    session_factory = sessionmaker(bind=engine)
+    client = FakeClient([])
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    return session_factory, client, SyncJobWorker(session_factory, manager, worker_id="w1")
+
+
+def test_only_one_active_job_per_module():
+    session_factory, _, _ = build()
+    db = session_factory()
+    job = create_job(db, "table", {"prune": False})
+    with pytest.raises(SyncJobConflict) as conflict:
+        create_job(db, "table")
+    assert conflict.value.job.id == job.id
+    # 其他模块不受影响
+    create_job(db, "column")
+
+    # 统一对账与任何模块的任务互斥
+    with pytest.raises(SyncJobConflict):
+        create_job(db, "all")
+
+    request_cancel(db, job.id)
+    assert db.get(SyncJob, job.id).status == "cancelled"
+    assert create_job(db, "table").id != job.id
+
+
+def test_worker_runs_job_and_records_progress():
+    session_factory, client, worker = build()
+    db = session_factory()
+    for i in range(5):
+        db.add(TablePermission(db_name="db", table_name=f"t{i}", user_name="u1"))
+    db.commit()
+    job = create_job(db, "table", {"prune": False})
+
+    assert worker.run_once() == "done"
+    assert worker.run_once() is None
+
+    db.expire_all()
+    info = job_to_dict(db.get(SyncJob, job.id))
+    assert info["status"] == "done"
+    assert info["records"] == 5
+    # 每张表在cm_hive和doris的两个catalog各创建一个策略
+    assert info["total"] == 15 and info["done"] == 15 and info["failed"] == 0
+    assert info["percent"] == 100.0
+    assert info["result"]["plan"]["create"] == 15
+    assert len(client.policies) == 15
+
+
+def test_running_job_stops_after_cancel(monkeypatch):
+    session_factory, _, worker = build()
+    db = session_factory()
+    job = create_job(db, "table")
+
+    def runner(db, options, manager_factory, progress):
+        progress(1, 0, 10)
+        request_cancel(db, job.id)
+        progress.save()
+        progress(2, 0, 10)
+        raise AssertionError("取消后不应继续执行")
+
+    monkeypatch.setitem(sync_jobs.JOB_RUNNERS, "table", runner)
+    assert worker.run_once() == "cancelled"
+    db.expire_all()
+    info = job_to_dict(db.get(SyncJob, job.id))
+    assert info["status"] == "cancelled"
+    assert info["done"] == 2 and info["eta"] is None
+    # 任务结束后可以再次创建
+    create_job(db, "table")
+
+
+def test_claim_skips_when_nothing_pending():
+    session_factory, _, _ = build()
+    assert claim_job(session_factory(), "w1") is None
+
+
+def test_incremental_sync_is_scheduled_as_jobs_once_per_interval(monkeypatch):
+    session_factory, _, _ = build()
+    db = session_factory()
+    runs = []
+    monkeypatch.setitem(sync_jobs.JOB_RUNNERS, "table",
+                        lambda db, options, manager_factory, progress: runs.append(options) or {})
+    worker = SyncJobWorker(session_factory, worker_id="w1", incremental_interval=3600)
+
+    assert [job.module for job in schedule_incremental_sync(db, 3600)] == ["table", "column", "row"]
+    # 间隔内不重复创建，未结束的任务也不会被重复创建
+    assert schedule_incremental_sync(db, 3600) == []
+    assert worker.run_once() == "done"
+    assert runs == [{"incremental": True}]
+    assert schedule_incremental_sync(db, 3600) == []
+    # 未启用定时增量同步时不创建任务
+    assert schedule_incremental_sync(db, 0) == []
+
+
+def expire_heartbeat(db, job_id):
+    job = db.get(SyncJob, job_id)
+    job.heartbeat_at = job.heartbeat_at - timedelta(seconds=sync_jobs.SYNC_JOB_LEASE + 1)
+    db.commit()
+
+
+def test_reclaimed_job_stops_original_worker(monkeypatch):
+    session_factory, _, _ = build()
+    db = session_factory()
+    job = create_job(db, "table")
+    first = claim_job(db, "w1")
+    assert first.attempt == 1
+    steps = []
+
+    def runner(db, options, manager_factory, progress):
+        progress(1, 0, 10)
+        steps.append(1)
+        # w1卡住超过租约，任务被w2重新领取
+        expire_heartbeat(db, job.id)
+        assert claim_job(db, "w2").attempt == 2
+        monkeypatch.setattr(progress, "lease", 0)
+        progress(2, 0, 10)
+        steps.append(2)
+
+    monkeypatch.setitem(sync_jobs.JOB_RUNNERS, "table", runner)
+    assert run_job(session_factory, job.id, None, attempt=1) == LEASE_LOST
+    assert steps == [1]
+    db.expire_all()
+    # 原worker不覆盖新执行者的状态
+    stored = db.get(SyncJob, job.id)
+    assert (stored.status, stored.worker_id, stored.attempt) == ("running", "w2", 2)
+
+    # 已被重新领取的任务，原worker不再开始执行
+    assert run_job(session_factory, job.id, None, attempt=1) == LEASE_LOST
+
+
+def test_all_job_never_runs_alongside_module_jobs():
+    session_factory, _, _ = build()
+    db = session_factory()
+    table_job = create_job(db, "table")
+    assert claim_job(db, "w1").id == table_job.id
+    # 模拟并发创建绕过了应用层检查，统一对账任务与执行中的表权限任务同时在队列中
+    db.add(SyncJob(module="all", status="pending", options="{}"))
+    column_job = SyncJob(module="column", status="pending", options="{}")
+    db.add(column_job)
+    db.commit()
+
+    # 统一对账需等待，其他模块不受影响
+    assert claim_job(db, "w2").id == column_job.id
+    assert claim_job(db, "w3") is None
+    for job in db.query(SyncJob).filter(SyncJob.status == "running"):
+        job.status = "done"
+    db.commit()
+    all_job = claim_job(db, "w3")
+    assert all_job.module == "all"
+    db.add(SyncJob(module="row", status="pending", options="{}"))
+    db.commit()
+    assert claim_job(db, "w4") is None
@@ -0,0 +1,127 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.models import TablePermission
+from app.models.ranger_sync import SyncOutbox
+from app.utils.ranger_coalesce import ACTION_REVOKE
+from app.utils.ranger_snapshot import RangerPolicyCache
+from app.utils.helpers import bulk_create_items, create_item
+from app.utils.sync_outbox import ACTION_UPDATE, OutboxWorker, claim_batch, enqueue_created, enqueue_sync, outbox_stats
+from app.utils.youcash_ranger_v2 import RangerManager
+from tests.test_ranger_snapshot import FakeClient
+
+
+class FlakyClient(FakeClient):
+    def __init__(self, policies, failures=0):
+        super().__init__(policies)
+        self.failures = failures
+
+    def create_policy(self, policy):
+        if self.failures:
+            self.failures -= 1
+            raise Exception("ranger unavailable")
+        return super().create_policy(policy)
+
+
+def build(failures=0):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    for model in (TablePermission, SyncOutbox):
+        model.__table__.create(engine)
+    session_factory = sessionmaker(bind=engine)
+    client = FlakyClient([], failures)
+    manager = RangerManager(client=client, policy_cache=RangerPolicyCache(client, ttl=3600))
+    return session_factory, client, OutboxWorker(session_factory, manager, worker_id="w1")
+
+
+def add_permission(db, user_name):
+    perm = create_item(db, TablePermission, {"db_name": "db", "table_name": "t", "user_name": user_name}, commit=False)
+    enqueue_sync(db, "table", perm)
+    db.commit()
+    return perm
+
+
+def test_worker_drains_outbox_and_records_status():
+    session_factory, client, worker = build()
+    db = session_factory()
+    for user in ("u1", "u2", "u3"):
+        add_permission(db, user)
+
+    assert worker.run_once() == 3
+    items = db.query(SyncOutbox).all()
+    assert {item.status for item in items} == {"done"}
+    assert all(item.attempts == 1 and item.duration is not None for item in items)
+    users = [p["policyItems"][0]["users"] for p in client.policies.values() if p["service"] == "cm_hive"]
+    assert sorted(sum(users, [])) == ["u1", "u2", "u3"]
+
+
+def test_bulk_created_records_are_enqueued_in_same_commit():
+    session_factory, client, worker = build(failures=1)
+    db = session_factory()
+    rows = [(i, {"db_name": "db", "table_name": f"t{i}", "user_name": "u1", "role_name": None}) for i in range(3)]
+    created, _ = bulk_create_items(db, TablePermission, rows, "相同的表权限记录已存在")
+    enqueue_created(db, "table", [perm for _, perm in created])
+    db.rollback()
+    # 回滚时记录和任务一起撤销
+    assert db.query(SyncOutbox).count() == 0
+
+    created, _ = bulk_create_items(db, TablePermission, rows, "相同的表权限记录已存在")
+    enqueue_created(db, "table", [perm for _, perm in created])
+    db.commit()
+    assert worker.run_once() == 3
+    # Ranger暂时不可用的任务保留在发件箱中等待重试
+    statuses = sorted(item.status for item in db.query(SyncOutbox))
+    assert statuses == ["done", "done", "pending"]
+
+
+def test_failed_item_is_rescheduled_and_later_items_of_same_record_wait():
+    session_factory, client, worker = build(failures=10)
+    db = session_factory()
+    perm = add_permission(db, "u1")
+    assert worker.run_once() == 1
+    # 第一条任务已执行过，之后的变更不再合并进去
+    enqueue_sync(db, "table", perm, ACTION_REVOKE)
+    db.commit()
+
+    first, second = db.query(SyncOutbox).order_by(SyncOutbox.id).all()
+    assert first.status == "pending" and first.attempts == 1 and "ranger unavailable" in first.last_error
+    assert second.attempts == 0
+    # 重试时间未到，且同一记录更早的任务未完成，两条都不会被领取
+    assert claim_batch(db, "w2") == []
+
+
+def test_update_item_replaces_old_grant_in_one_task():
+    session_factory, client, worker = build()
+    db = session_factory()
+    perm = add_permission(db, "u1")
+    worker.run_once()
+
+    enqueue_sync(db, "table", perm, ACTION_UPDATE)
+    perm.user_name = "u2"
+    db.commit()
+
+    assert worker.run_once() == 1
+    assert db.query(SyncOutbox).order_by(SyncOutbox.id.desc()).first().status == "done"
+    policies = [p for p in client.policies.values() if p["service"] == "cm_hive"]
+    assert [item["users"] for p in policies for item in p["policyItems"]] == [["u2"]]
+
+
+def test_pending_changes_of_same_record_collapse_into_one_task():
+    session_factory, client, worker = build()
+    db = session_factory()
+    perm = add_permission(db, "u1")
+    for user in ("u2", "u3"):
+        enqueue_sync(db, "table", perm, ACTION_UPDATE)
+        perm.user_name = user
+        db.commit()
+    enqueue_sync(db, "table", perm)
+    db.commit()
+
+    item = db.query(SyncOutbox).one()
+    assert item.action == ACTION_UPDATE and item.collapsed == 3
+    assert outbox_stats(db)["collapsed"] == {"table": 3}
+
+    # 合并后的任务读取记录最新内容，只授予u3
+    assert worker.run_once() == 1
+    policies = [p for p in client.policies.values() if p["service"] == "cm_hive"]
+    assert [item["users"] for p in policies for item in p["policyItems"]] == [["u3"]]
@@ -108,7 +108,7 @@ const ColumnPermissionList = () => {
   const handleSync = async () => {
     try {
       await syncColumnPermissions();
-      message.success('同步成功');
+      message.success('同步任务已提交，正在后台执行');
       fetchColumnPermissions();
     } catch (error) {
       console.error('同步字段权限失败:', error);
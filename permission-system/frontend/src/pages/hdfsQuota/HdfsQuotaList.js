@@ -111,7 +111,7 @@ const HdfsQuotaList = () => {
     try {
       setSyncLoading(true);
       await syncHdfsQuotas();
-      message.success('同步成功');
+      message.success('同步任务已提交，正在后台执行');
       fetchHdfsQuotas();
     } catch (error) {
       console.error('同步HDFS配额失败:', error);
@@ -100,7 +100,7 @@ const RowPermissionList = () => {
   const handleSync = async () => {
     try {
       await syncRowPermissions();
-      message.success('同步成功');
+      message.success('同步任务已提交，正在后台执行');
       fetchRowPermissions();
     } catch (error) {
       console.error('同步行权限失败:', error);
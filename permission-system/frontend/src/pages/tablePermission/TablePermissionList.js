@@ -99,7 +99,7 @@ const TablePermissionList = () => {
   const handleSync = async () => {
     try {
       await syncTablePermissions();
-      message.success('同步成功');
+      message.success('同步任务已提交，正在后台执行');
       fetchTablePermissions();
     } catch (error) {
       console.error('同步表权限失败:', error);